@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.gis.admin import GISModelAdmin
 
-from .models import ForestDensityCell
+from .models import ForestDensityCell, ForestDensityGrid, ForestDensityGridCell, ForestDensitySavedAOI
 
 
 @admin.register(ForestDensityCell)
@@ -9,4 +9,43 @@ class ForestDensityCellAdmin(GISModelAdmin):
     list_display = ("id", "canopy_pct", "source", "tile_id", "updated_at")
     list_filter = ("source",)
     search_fields = ("tile_id",)
-    readonly_fields = ("updated_at",)
+    readonly_fields = ("area_m2", "updated_at")
+
+
+@admin.register(ForestDensityGrid)
+class ForestDensityGridAdmin(admin.ModelAdmin):
+    list_display = ("name", "west", "north", "cell_size", "width", "height", "created_at")
+    readonly_fields = ("created_at",)
+
+
+@admin.register(ForestDensityGridCell)
+class ForestDensityGridCellAdmin(admin.ModelAdmin):
+    list_display = ("id", "canopy_pct", "source", "tile", "grid", "row", "col")
+    list_filter = ("source", "grid")
+    list_select_related = ("source", "tile", "grid")
+    search_fields = ("tile__name",)
+    raw_id_fields = ("tile",)
+    readonly_fields = ("bounds",)
+    show_full_result_count = False
+
+    @admin.display(description="Bounds (xmin, ymin, xmax, ymax)")
+    def bounds(self, obj):
+        if obj.grid_id is None or obj.row is None or obj.col is None:
+            return "-"
+        return obj.grid.cell_bounds(obj.row, obj.col)
+
+
+@admin.register(ForestDensitySavedAOI)
+class ForestDensitySavedAOIAdmin(GISModelAdmin):
+    """
+    Saved AOIs are created through the API (canopy.services.saved_aoi.save_aoi),
+    which derives the pieces, bbox, hash and vertex count from the geometry,
+    so the geometry cannot be added or edited here; only the name can.
+    """
+
+    list_display = ("id", "name", "num_coords", "area_m2", "created_at")
+    search_fields = ("name",)
+    readonly_fields = ("geom", "bbox", "geometry_hash", "num_coords", "area_m2", "created_at")
+
+    def has_add_permission(self, request):
+        return False
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CanopyConfig(AppConfig):
     name = 'canopy'
+
+    def ready(self):
+        # Connect signal receivers that keep derived data in sync with loads.
+        from canopy.services import cog, pyramid, stats_cache, tile_cache  # noqa: F401
@@ -0,0 +1,243 @@
+import io
+import json
+import platform
+import shutil
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, List
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from canopy.models import ForestDensityCell, ForestDensityGridCell
+from canopy.services.benchmark import (
+    DEFAULT_MAX_REGRESSION,
+    DISTRIBUTIONS,
+    SyntheticGrid,
+    benchmark_aoi,
+    compare_results,
+    metric,
+    time_calls,
+    write_synthetic_ndjson,
+)
+from canopy.services.forest_density import compute_stats
+from canopy.services.grid_snapshot import build_snapshot, compute_snapshot_distribution, snapshot_dir
+from canopy.services.ingest import WRITERS, peak_rss_mib
+from canopy.services.stats_cache import dataset_version
+from canopy.services.tile_cache import source_dir_name
+from canopy.signals import cells_loaded
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark ingest and stats on a synthetic grid in the configured database, write the results "
+        "as JSON and optionally fail on regressions against a baseline. Rows of --source are replaced."
+    )
+
+    def add_arguments(self, parser):
+        defaults = SyntheticGrid()
+        parser.add_argument("--width", type=int, default=defaults.width, help="Grid columns. Defaults to 200.")
+        parser.add_argument("--height", type=int, default=defaults.height, help="Grid rows. Defaults to 200.")
+        parser.add_argument(
+            "--resolution", type=float, default=defaults.resolution, help="Cell size in degrees. Defaults to 0.01."
+        )
+        parser.add_argument("--west", type=float, default=defaults.west, help="Grid west edge. Defaults to 100.")
+        parser.add_argument("--south", type=float, default=defaults.south, help="Grid south edge. Defaults to -2.")
+        parser.add_argument(
+            "--distribution",
+            choices=DISTRIBUTIONS,
+            default=defaults.distribution,
+            help="Canopy value distribution. Defaults to 'patchy'.",
+        )
+        parser.add_argument("--seed", type=int, default=defaults.seed, help="Random seed. Defaults to 0.")
+        parser.add_argument(
+            "--source",
+            default="benchmark_synthetic",
+            help="Source label for the synthetic cells; its rows are deleted before and after the run.",
+        )
+        parser.add_argument(
+            "--mode", choices=sorted(WRITERS), default="copy", help="Ingest write engine. Defaults to 'copy'."
+        )
+        parser.add_argument("--workers", type=int, default=1, help="Ingest worker processes. Defaults to 1.")
+        parser.add_argument(
+            "--sizes",
+            default="0.05,0.2,0.5",
+            help="AOI diameters as fractions of the grid's shorter side. Defaults to '0.05,0.2,0.5'.",
+        )
+        parser.add_argument(
+            "--vertices", default="5,64,1024", help="AOI vertex counts to time. Defaults to '5,64,1024'."
+        )
+        parser.add_argument("--repeats", type=int, default=5, help="Timed runs per stats case. Defaults to 5.")
+        parser.add_argument(
+            "--snapshot",
+            action="store_true",
+            help="Also build a grid snapshot and time the snapshot stats backend.",
+        )
+        parser.add_argument(
+            "--skip-ingest",
+            action="store_true",
+            help="Reuse rows already loaded for --source (from a previous --keep run) instead of ingesting.",
+        )
+        parser.add_argument("--keep", action="store_true", help="Keep the synthetic rows after the run.")
+        parser.add_argument(
+            "--output", default="benchmark-results.json", help="Results file. Defaults to benchmark-results.json."
+        )
+        parser.add_argument("--baseline", default=None, help="Baseline results file to compare against.")
+        parser.add_argument(
+            "--max-regression",
+            type=float,
+            default=DEFAULT_MAX_REGRESSION,
+            help="Allowed slowdown as a fraction of the baseline before the run fails. Defaults to 0.10.",
+        )
+
+    def handle(self, *args, **options):
+        sizes = self._parse_list(options["sizes"], float, "--sizes")
+        vertices = self._parse_list(options["vertices"], int, "--vertices")
+        if any(not 0 < size <= 1 for size in sizes):
+            raise CommandError("--sizes must be fractions in (0, 1].")
+        if any(count < 3 for count in vertices):
+            raise CommandError("--vertices must be at least 3.")
+        if options["repeats"] < 1:
+            raise CommandError("--repeats must be at least 1.")
+
+        grid = SyntheticGrid(
+            west=options["west"],
+            south=options["south"],
+            width=options["width"],
+            height=options["height"],
+            resolution=options["resolution"],
+            distribution=options["distribution"],
+            seed=options["seed"],
+        )
+        source = options["source"]
+        metrics: Dict[str, Dict[str, Any]] = {}
+
+        try:
+            if not options["skip_ingest"]:
+                self._clear(source)
+                metrics.update(self._bench_ingest(grid, source, options["mode"], options["workers"]))
+            elif not ForestDensityCell.objects.filter(source=source).exists():
+                raise CommandError(f"--skip-ingest needs rows for {source}; run once with --keep first.")
+
+            metrics.update(self._bench_stats(grid, source, sizes, vertices, options["repeats"]))
+            if options["snapshot"]:
+                metrics.update(self._bench_snapshot(grid, source, sizes, vertices, options["repeats"]))
+            metrics["process.peak_rss_mib"] = metric(peak_rss_mib(), "MiB")
+            metrics["process.children_peak_rss_mib"] = metric(peak_rss_mib(children=True), "MiB")
+        finally:
+            if not options["keep"]:
+                self._clear(source)
+
+        results = {
+            "created_at": timezone.now().isoformat(),
+            "environment": self._environment(),
+            "grid": grid._asdict(),
+            "options": {key: options[key] for key in ("mode", "workers", "repeats")},
+            "metrics": metrics,
+        }
+        output = Path(options["output"])
+        output.write_text(json.dumps(results, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(metrics)} metrics to {output}."))
+
+        if options["baseline"]:
+            self._compare(results, Path(options["baseline"]), options["max_regression"])
+
+    def _bench_ingest(self, grid: SyntheticGrid, source: str, mode: str, workers: int) -> Dict[str, Dict[str, Any]]:
+        with TemporaryDirectory(prefix="forest_density_bench_") as workdir:
+            path = Path(workdir) / "cells.ndjson"
+            rows = write_synthetic_ndjson(grid, path, source)
+            self.stdout.write(f"Ingesting {rows} synthetic cells ({mode} mode, {workers} worker(s)) ...")
+            started = time.perf_counter()
+            call_command("load_forest_density", file=str(path), mode=mode, workers=workers, stdout=io.StringIO())
+            elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"  {rows / elapsed:,.0f} rows/s")
+        return {
+            "ingest.rows_per_s": metric(rows / elapsed, "rows/s", better="higher"),
+            "ingest.seconds": metric(elapsed, "s"),
+            # RSS high-water marks never drop, so the per-phase values are cumulative up to that phase.
+            "ingest.cumulative_peak_rss_mib": metric(peak_rss_mib(), "MiB"),
+            "ingest.workers_peak_rss_mib": metric(peak_rss_mib(children=True), "MiB"),
+        }
+
+    def _bench_stats(
+        self, grid: SyntheticGrid, source: str, sizes: List[float], vertices: List[int], repeats: int
+    ) -> Dict[str, Dict[str, Any]]:
+        metrics = {}
+        for size in sizes:
+            for count in vertices:
+                aoi = benchmark_aoi(grid, size, count)
+                # compute_stats bypasses the result cache, so every call runs the query.
+                timings = time_calls(lambda: compute_stats(aoi, source=source), repeats)
+                metrics.update(self._stats_metrics("stats.sql", size, count, timings))
+        metrics["stats.sql.cumulative_peak_rss_mib"] = metric(peak_rss_mib(), "MiB")
+        return metrics
+
+    def _bench_snapshot(
+        self, grid: SyntheticGrid, source: str, sizes: List[float], vertices: List[int], repeats: int
+    ) -> Dict[str, Dict[str, Any]]:
+        version = dataset_version(source)
+        started = time.perf_counter()
+        build_snapshot(source, version)
+        metrics = {"snapshot.build_seconds": metric(time.perf_counter() - started, "s")}
+        for size in sizes:
+            for count in vertices:
+                aoi = benchmark_aoi(grid, size, count)
+                timings = time_calls(lambda: compute_snapshot_distribution(aoi, source, version), repeats)
+                metrics.update(self._stats_metrics("stats.snapshot", size, count, timings))
+        metrics["stats.snapshot.cumulative_peak_rss_mib"] = metric(peak_rss_mib(), "MiB")
+        return metrics
+
+    def _stats_metrics(
+        self, prefix: str, size: float, count: int, timings: Dict[str, float]
+    ) -> Dict[str, Dict[str, Any]]:
+        name = f"{prefix}.size_{size:g}.vertices_{count}"
+        self.stdout.write(f"  {name}: median {timings['median_ms']:.1f} ms, p95 {timings['p95_ms']:.1f} ms")
+        return {f"{name}.{key}": metric(value, "ms") for key, value in timings.items()}
+
+    def _compare(self, results: Dict[str, Any], baseline_path: Path, max_regression: float) -> None:
+        if not baseline_path.exists():
+            raise CommandError(f"Baseline not found: {baseline_path}")
+        baseline = json.loads(baseline_path.read_text())
+        regressions = compare_results(results, baseline, max_regression)
+        shared = len(set(results["metrics"]) & set(baseline.get("metrics", {})))
+        if not regressions:
+            self.stdout.write(
+                self.style.SUCCESS(f"No regressions beyond {max_regression:.0%} across {shared} shared metrics.")
+            )
+            return
+        for item in regressions:
+            self.stderr.write(
+                f"  {item['name']}: {item['baseline']:.4g} -> {item['value']:.4g} ({item['change']:+.1%} worse)"
+            )
+        raise CommandError(f"{len(regressions)} of {shared} metrics regressed by more than {max_regression:.0%}.")
+
+    def _clear(self, source: str) -> None:
+        shutil.rmtree(snapshot_dir() / source_dir_name(source), ignore_errors=True)
+        deleted, _ = ForestDensityCell.objects.filter(source=source).delete()
+        compacted, _ = ForestDensityGridCell.objects.filter(source__name=source).delete()
+        if deleted or compacted:
+            # Same invalidation as a load: stats cache versions and tiles of the source.
+            cells_loaded.send(sender=self.__class__, sources={source})
+
+    @staticmethod
+    def _environment() -> Dict[str, Any]:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT version(), PostGIS_Full_Version()")
+            postgres, postgis = cursor.fetchone()
+        return {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "postgres": postgres,
+            "postgis": postgis,
+        }
+
+    @staticmethod
+    def _parse_list(value: str, cast, flag: str) -> list:
+        try:
+            return [cast(part) for part in value.split(",") if part.strip()]
+        except ValueError as exc:
+            raise CommandError(f"Invalid {flag} value: {value}") from exc
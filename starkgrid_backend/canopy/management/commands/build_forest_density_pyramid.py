@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from canopy.services.pyramid import build_level
+
+
+class Command(BaseCommand):
+    help = "Build coarse canopy histogram levels used by compute_stats for large AOIs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            default="",
+            help="Source to aggregate. Defaults to all sources (used by stats requests without a source).",
+        )
+        parser.add_argument(
+            "--cell-sizes",
+            default="0.01,0.1,1.0",
+            help="Comma-separated aggregate cell sizes in degrees. Defaults to '0.01,0.1,1.0'.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            cell_sizes = sorted({float(value) for value in options["cell_sizes"].split(",") if value.strip()})
+        except ValueError as exc:
+            raise CommandError(f"Invalid --cell-sizes value: {options['cell_sizes']}") from exc
+        if not cell_sizes or cell_sizes[0] <= 0:
+            raise CommandError("Provide at least one positive cell size.")
+
+        label = options["source"] or "all sources"
+        for cell_size in cell_sizes:
+            started = time.perf_counter()
+            level = build_level(cell_size, source=options["source"])
+            count = level.cells.count()
+            self.stdout.write(
+                f"Built {cell_size}° level for {label}: {count} aggregate cells "
+                f"in {time.perf_counter() - started:.1f}s."
+            )
+            if level.cell_size <= 2 * level.base_cell_size:
+                self.stderr.write(
+                    f"Level {cell_size}° is not coarser than 2x the fine cells ({level.base_cell_size}°); "
+                    "compute_stats will not use it."
+                )
+
+        self.stdout.write(self.style.SUCCESS("Done."))
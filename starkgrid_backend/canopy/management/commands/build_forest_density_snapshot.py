@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from canopy.services.grid_snapshot import build_snapshot
+from canopy.services.ingest import peak_rss_mib
+from canopy.services.stats_cache import dataset_version
+
+
+class Command(BaseCommand):
+    help = "Build the memory-mapped grid snapshot used by the 'snapshot' stats backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            default=None,
+            help="Source to snapshot. Defaults to all sources (answers stats requests without a source).",
+        )
+        parser.add_argument(
+            "--resolution",
+            type=float,
+            default=None,
+            help="Pixel size in degrees. Defaults to the smallest cell edge.",
+        )
+
+    def handle(self, *args, **options):
+        if options["resolution"] is not None and options["resolution"] <= 0:
+            raise CommandError("--resolution must be positive.")
+
+        source = options["source"]
+        label = source or "all sources"
+        self.stdout.write(f"Snapshotting cells for {label} ...")
+        started = time.perf_counter()
+        # Read the version first: a load racing the build leaves the snapshot stale, not wrong.
+        result = build_snapshot(source, dataset_version(source), resolution=options["resolution"])
+        if result is None:
+            raise CommandError(f"No cells found for {label}.")
+
+        path, grid = result
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {path} ({grid.width}x{grid.height} px at {grid.res_x:g}° x {grid.res_y:g}°) "
+                f"in {time.perf_counter() - started:.1f}s."
+            )
+        )
+        self.stdout.write(f"Peak memory (RSS high-water mark): {peak_rss_mib():.1f} MiB")
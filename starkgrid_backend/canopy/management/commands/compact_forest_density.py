@@ -0,0 +1,97 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from canopy.models import ForestDensityGrid, ForestDensitySource
+from canopy.services.cog import grid_spec
+from canopy.services.grid_storage import STORAGE_CELLS, compact_cells
+from canopy.services.ingest import peak_rss_mib
+from canopy.signals import cells_loaded
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert ForestDensityCell rows into compact grid cells (row/col on a registered grid), "
+        "used when FOREST_DENSITY_STORAGE = 'grid'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grid",
+            required=True,
+            help="Name of the grid to write to. A new grid is registered from the extent of the cells.",
+        )
+        parser.add_argument(
+            "--source",
+            default=None,
+            help="Source to convert. Defaults to all sources.",
+        )
+        parser.add_argument(
+            "--cell-size",
+            type=float,
+            default=None,
+            help="Cell edge in degrees when registering a new grid. Defaults to the smallest cell edge.",
+        )
+        parser.add_argument(
+            "--delete-cells",
+            action="store_true",
+            help="Delete converted rows from ForestDensityCell to reclaim their space.",
+        )
+
+    def handle(self, *args, **options):
+        if options["cell_size"] is not None and options["cell_size"] <= 0:
+            raise CommandError("--cell-size must be positive.")
+
+        source = options["source"]
+        label = source or "all sources"
+        started = time.perf_counter()
+        # A grid registered for sources that turn out to live on another grid is rolled back too.
+        with transaction.atomic():
+            grid = ForestDensityGrid.objects.filter(name=options["grid"]).first()
+            if grid is None:
+                grid = self._register_grid(options["grid"], source, options["cell_size"])
+            elif options["cell_size"] is not None and abs(options["cell_size"] - grid.cell_size) > 1e-12:
+                raise CommandError(f"Grid {grid.name} already exists with a cell size of {grid.cell_size:g}°.")
+
+            self.stdout.write(f"Compacting cells for {label} onto {grid} ...")
+            try:
+                result = compact_cells(grid, source=source, delete=options["delete_cells"])
+            except ValueError as exc:
+                raise CommandError(str(exc)) from exc
+
+        if result.converted:
+            sources = {source} if source else set(ForestDensitySource.objects.values_list("name", flat=True))
+            cells_loaded.send(sender=self.__class__, sources=sources)
+        if result.skipped:
+            self.stderr.write(
+                f"Skipped {result.skipped} cells that are not exactly one cell of {grid.name}; "
+                "they are only visible with FOREST_DENSITY_STORAGE = 'cells'."
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done. Compacted {result.converted} cells in {time.perf_counter() - started:.1f}s."
+            )
+        )
+        self.stdout.write(f"Peak memory (RSS high-water mark): {peak_rss_mib():.1f} MiB")
+
+    def _register_grid(self, name: str, source, cell_size) -> ForestDensityGrid:
+        # The grid is fitted to the cells being converted, whatever layout the readers use.
+        spec = grid_spec(source, resolution=cell_size, layout=STORAGE_CELLS)
+        if spec is None:
+            raise CommandError(f"No cells found for {source or 'all sources'}.")
+        if abs(spec.res_x - spec.res_y) > 1e-9 * spec.res_x:
+            raise CommandError(
+                f"Cells are {spec.res_x:g}° x {spec.res_y:g}°; compact grids need square cells, pass --cell-size."
+            )
+        grid = ForestDensityGrid.objects.create(
+            name=name,
+            west=spec.west,
+            north=spec.north,
+            cell_size=spec.res_x,
+            width=spec.width,
+            height=spec.height,
+        )
+        self.stdout.write(f"Registered grid {grid}.")
+        return grid
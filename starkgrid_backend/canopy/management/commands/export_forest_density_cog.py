@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from canopy.services.cog import export_cog
+from canopy.services.ingest import peak_rss_mib
+
+
+class Command(BaseCommand):
+    help = "Rasterise forest density cells into a Cloud-Optimized GeoTIFF used by the PNG tile endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            default=None,
+            help="Source to rasterise. Defaults to all sources (later rows win where sources overlap).",
+        )
+        parser.add_argument(
+            "--resolution",
+            type=float,
+            default=None,
+            help="Pixel size in degrees. Defaults to the smallest cell edge.",
+        )
+        parser.add_argument(
+            "--output",
+            default=None,
+            help="Output path. Defaults to FOREST_DENSITY_COG_DIR/<source>.tif, which the tile endpoint reads.",
+        )
+
+    def handle(self, *args, **options):
+        if options["resolution"] is not None and options["resolution"] <= 0:
+            raise CommandError("--resolution must be positive.")
+
+        label = options["source"] or "all sources"
+        self.stdout.write(f"Rasterising cells for {label} ...")
+        started = time.perf_counter()
+        result = export_cog(options["source"], resolution=options["resolution"], dst_path=options["output"])
+        if result is None:
+            raise CommandError(f"No cells found for {label}.")
+
+        path, grid = result
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {path} ({grid.width}x{grid.height} px at {grid.res_x:g}° x {grid.res_y:g}°) "
+                f"in {time.perf_counter() - started:.1f}s."
+            )
+        )
+        self.stdout.write(f"Peak memory (RSS high-water mark): {peak_rss_mib():.1f} MiB")
@@ -1,13 +1,50 @@
 import gzip
 import json
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
-from typing import Any, Dict, Iterator, List, Optional
+from queue import Empty
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
-from django.contrib.gis.geos import GEOSGeometry
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
+from django.db import connections, transaction
 
 from canopy.models import ForestDensityCell
+from canopy.signals import cells_loaded
+from canopy.services.columnar_ingest import ColumnarInputError, columnar_format, iter_columnar_rows
+from canopy.services.geojson_stream import iter_geojson_features
+from canopy.services.grid_storage import sync_grid_cells
+from canopy.services.ingest import (
+    DEFAULT_BATCH_SIZES,
+    WRITERS,
+    CellRow,
+    Extent,
+    SkipFeature,
+    changed_tiles,
+    delete_tile_cells,
+    drop_secondary_indexes,
+    feature_to_row,
+    format_stage_timings,
+    hash_tiles,
+    peak_rss_mib,
+    restore_indexes,
+    save_tile_hashes,
+    union_extent,
+)
+from canopy.services.parallel_ingest import (
+    IngestOptions,
+    ShardResult,
+    ShardSpec,
+    byte_range_shards,
+    init_worker,
+    load_shard,
+    spool_tile_shards,
+)
+
+
+PROGRESS_INTERVAL_SECONDS = 2.0
 
 
 class Command(BaseCommand):
@@ -18,7 +55,10 @@ class Command(BaseCommand):
             "--file",
             "-f",
             required=True,
-            help="Path to GeoJSON/NDJSON of polygons with canopy_pct property (optionally gzip compressed).",
+            help=(
+                "Path to GeoJSON/NDJSON of polygons with canopy_pct property (optionally gzip compressed), "
+                "or a GeoParquet (.parquet) / FlatGeobuf (.fgb) file with WKB polygons and a canopy_pct column."
+            ),
         )
         parser.add_argument(
             "--source",
@@ -28,24 +68,68 @@ class Command(BaseCommand):
         parser.add_argument(
             "--tile-id-field",
             default="tile_id",
-            help="Feature property containing tile/scene id. Defaults to 'tile_id'.",
+            help="Feature property (or column) containing tile/scene id. Defaults to 'tile_id'.",
         )
         parser.add_argument(
             "--canopy-field",
             default="canopy_pct",
-            help="Feature property containing canopy percentage value. Defaults to 'canopy_pct'.",
+            help="Feature property (or column) containing canopy percentage value. Defaults to 'canopy_pct'.",
         )
         parser.add_argument(
             "--batch-size",
             type=int,
-            default=500,
-            help="Bulk insert batch size. Defaults to 500.",
+            default=None,
+            help="Rows per write transaction. Defaults to 500 for orm mode and 50000 for copy mode.",
         )
         parser.add_argument(
             "--srid",
             type=int,
             default=4326,
-            help="SRID of incoming geometries. Defaults to 4326 (WGS84).",
+            help="SRID of incoming geometries. Defaults to 4326 (WGS84). Columnar files use their declared CRS.",
+        )
+        parser.add_argument(
+            "--bbox",
+            default=None,
+            help=(
+                "Only load GeoParquet/FlatGeobuf rows whose bbox intersects 'xmin,ymin,xmax,ymax' "
+                "(in the file's coordinates). Pushed down to the FlatGeobuf R-tree and GeoParquet bbox columns."
+            ),
+        )
+        parser.add_argument(
+            "--mode",
+            choices=sorted(WRITERS),
+            default="orm",
+            help="Write engine: 'orm' (bulk_create) or 'copy' (PostgreSQL COPY, no model instances). Defaults to 'orm'.",
+        )
+        parser.add_argument(
+            "--drop-indexes",
+            action="store_true",
+            help="Drop secondary indexes before loading and rebuild them afterwards. Useful for very large loads.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Worker processes for parsing, validation and writes. Defaults to 1 (serial).",
+        )
+        parser.add_argument(
+            "--shard-count",
+            type=int,
+            default=None,
+            help="Number of shards to split the input into when --workers > 1. Defaults to 4 per worker.",
+        )
+        parser.add_argument(
+            "--shards",
+            default=None,
+            help="Comma-separated shard numbers to (re)load, e.g. to retry failed shards. Requires the same --shard-count.",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "Hash each (source, tile_id) and skip tiles unchanged since the last load; changed tiles are "
+                "replaced atomically. Reads the input twice."
+            ),
         )
 
     def handle(self, *args, **options):
@@ -56,66 +140,312 @@ class Command(BaseCommand):
         source_override = options["source"]
         tile_field = options["tile_id_field"]
         canopy_field = options["canopy_field"]
-        batch_size = options["batch_size"]
         srid = options["srid"]
+        mode = options["mode"]
+        batch_size = options["batch_size"] or DEFAULT_BATCH_SIZES[mode]
+        workers = options["workers"]
+        if workers < 1:
+            raise CommandError("--workers must be at least 1.")
+        if options["shards"] and workers == 1:
+            raise CommandError("--shards only applies to parallel loads; pass --workers as well.")
+        columnar = columnar_format(path)
+        if columnar and workers > 1:
+            raise CommandError(f"{columnar} inputs are read as record batches by a single worker; omit --workers.")
+        bbox = self._parse_bbox(options["bbox"])
+        if bbox is not None and not columnar:
+            raise CommandError("--bbox only applies to GeoParquet and FlatGeobuf inputs.")
+        if bbox is not None and options["incremental"]:
+            # Tile hashes would cover only the rows inside the bbox, and changed tiles are replaced whole.
+            raise CommandError("--bbox cannot be combined with --incremental.")
+
+        dropped_indexes = []
+        if options["drop_indexes"]:
+            dropped_indexes = drop_secondary_indexes(ForestDensityCell._meta.db_table)
+            self.stdout.write(f"Dropped {len(dropped_indexes)} secondary indexes.")
+
+        self.stdout.write(f"Loading features from {path} ({mode} mode, {workers} worker(s)) ...")
+        started = time.perf_counter()
+
+        ingest_options = IngestOptions(
+            source_override,
+            tile_field,
+            canopy_field,
+            srid,
+            mode,
+            batch_size,
+            incremental=options["incremental"],
+            bbox=bbox,
+        )
+        failed: List[int] = []
+        stages: Dict[str, float] = {}
+        # Extents of cells deleted by incremental loads, per source, for the tile cache.
+        self.replaced: Dict[str, Extent] = {}
+        try:
+            if workers > 1:
+                written, tiles, failed = self._load_parallel(path, ingest_options, workers, options, started, stages)
+            elif ingest_options.incremental:
+                written, tiles = self._load_incremental(path, ingest_options, started, stages)
+            else:
+                written, tiles = self._load_serial(path, ingest_options, started, stages)
+        finally:
+            if dropped_indexes:
+                self.stdout.write(f"Rebuilding {len(dropped_indexes)} indexes ...")
+                rebuild_started = time.perf_counter()
+                restore_indexes(dropped_indexes)
+                stages["index rebuild"] = time.perf_counter() - rebuild_started
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"Done. Upserted {written} rows in {elapsed:.1f}s ({self._rate(written, started)}).")
+        )
+        self.stdout.write(f"Stage timings: {format_stage_timings(stages)}")
+        self.stdout.write(f"Peak memory (RSS high-water mark): {peak_rss_mib():.1f} MiB")
 
-        created = 0
-        batch: List[ForestDensityCell] = []
+        if written or self.replaced:
+            self._sync_grid(tiles)
+            cells_loaded.send(
+                sender=self.__class__, sources=set(tiles) | set(self.replaced), tiles=tiles, replaced=self.replaced
+            )
+
+        if failed:
+            shard_list = ",".join(str(index) for index in failed)
+            raise CommandError(
+                f"{len(failed)} shard(s) failed and were rolled back. Retry them with "
+                f"--workers {workers} --shard-count {options['shard_count'] or workers * 4} --shards {shard_list}"
+            )
 
-        self.stdout.write(f"Loading features from {path} ...")
+    def _sync_grid(self, tiles: Dict[str, Set[str]]) -> None:
+        # Compacted sources must not keep serving the previous version of the reloaded tiles.
+        synced = sync_grid_cells(tiles)
+        if synced.converted or synced.skipped:
+            self.stdout.write(f"Re-synced {synced.converted} compact grid cells ({synced.skipped} not grid-aligned).")
 
+    def _load_serial(
+        self, path: Path, options: IngestOptions, started: float, stages: Dict[str, float]
+    ) -> Tuple[int, Dict[str, Set[str]]]:
+        writer = WRITERS[options.mode](options.batch_size)
+        try:
+            for row in self._iter_rows(path, options):
+                if writer.add(row):
+                    self.stdout.write(f"Upserted {writer.written} rows ({self._rate(writer.written, started)})...")
+            writer.close()
+        finally:
+            # The writer times its database calls; everything else is reading and validation.
+            stages["parse"] = time.perf_counter() - started - writer.write_seconds
+            stages["write"] = writer.write_seconds
+        return writer.written, writer.tiles
+
+    def _load_incremental(
+        self, path: Path, options: IngestOptions, started: float, stages: Dict[str, float]
+    ) -> Tuple[int, Dict[str, Set[str]]]:
+        digests = hash_tiles(self._iter_rows(path, options, report_skipped=False))
+        changed = changed_tiles(digests)
+        stages["hash"] = time.perf_counter() - started
+        self.stdout.write(f"{len(changed)} of {len(digests)} tiles changed; skipping {len(digests) - len(changed)}.")
+        if not changed:
+            return 0, {}
+
+        writer = WRITERS[options.mode](options.batch_size)
+        write_started = time.perf_counter()
+        try:
+            # One transaction, so readers see either the old or the new version of every changed tile.
+            with transaction.atomic():
+                deleted = delete_tile_cells(changed)
+                self.replaced = deleted.extents
+                self.stdout.write(f"Replacing {deleted.count} cells of the changed tiles ...")
+                for row in self._iter_rows(path, options):
+                    if (row.source, row.tile_id) in changed and writer.add(row):
+                        self.stdout.write(f"Upserted {writer.written} rows ({self._rate(writer.written, started)})...")
+                writer.close()
+                save_tile_hashes({key: digests[key] for key in changed})
+        finally:
+            stages["parse"] = time.perf_counter() - write_started - writer.write_seconds
+            stages["write"] = writer.write_seconds
+        return writer.written, writer.tiles
+
+    def _iter_rows(self, path: Path, options: IngestOptions, report_skipped: bool = True) -> Iterator[CellRow]:
+        if columnar_format(path):
+            yield from self._iter_columnar_rows(path, options, report_skipped)
+            return
         for feature in self._iter_features(path):
-            geom = feature.get("geometry")
-            if not geom:
-                self.stderr.write("Skipping feature with no geometry.")
-                continue
+            if report_skipped:
+                row = self._feature_to_row(feature, options)
+            else:
+                try:
+                    row = feature_to_row(
+                        feature, options.source_override, options.tile_field, options.canopy_field, options.srid
+                    )
+                except SkipFeature:
+                    row = None
+            if row is not None:
+                yield row
 
-            props: Dict[str, Any] = feature.get("properties") or {}
-            canopy_pct = props.get(canopy_field)
-            if canopy_pct is None:
-                self.stderr.write("Skipping feature with no canopy percentage value.")
-                continue
+    def _load_parallel(
+        self,
+        path: Path,
+        options: IngestOptions,
+        workers: int,
+        cli_options: Dict[str, Any],
+        started: float,
+        stages: Dict[str, float],
+    ) -> Tuple[int, Dict[str, Set[str]], List[int]]:
+        shard_count = cli_options["shard_count"] or workers * 4
+        selected = self._parse_shard_list(cli_options["shards"], shard_count)
 
-            tile_id = props.get(tile_field, "")
-            row_source = source_override or props.get("source") or "unknown"
+        with TemporaryDirectory(prefix="forest_density_shards_") as spool_dir:
+            # Incremental loads need every tile in a single shard, so they always spool by tile.
+            if path.suffix.lower() in {".ndjson", ".jsonl"} and not options.incremental:
+                shards = byte_range_shards(path, shard_count)
+                if selected is not None:
+                    shards = [spec for spec in shards if spec.index in selected]
+                self.stdout.write(f"Split input into {shard_count} byte-range shards.")
+            else:
+                # gzip and FeatureCollection inputs cannot be split by offset; group by tile instead.
+                self.stdout.write(f"Spooling features into {shard_count} tile shards ...")
+                shards = spool_tile_shards(
+                    self._iter_features(path), options.tile_field, shard_count, Path(spool_dir), selected
+                )
+            stages["split"] = time.perf_counter() - started
+            results = self._run_shards(shards, options, workers, shard_count, started)
 
+        written = sum(result.rows for result in results if not result.error)
+        tiles: Dict[str, Set[str]] = {}
+        for result in results:
+            if not result.error:
+                for source, tile_id in result.tiles:
+                    tiles.setdefault(source, set()).add(tile_id)
+                for source, *extent in result.replaced:
+                    self.replaced[source] = union_extent(self.replaced.get(source), tuple(extent))
+        failed = sorted(result.index for result in results if result.error)
+        skipped = sum(result.skipped for result in results if not result.error)
+        if skipped:
+            self.stderr.write(f"Skipped {skipped} features with no usable geometry or canopy value.")
+        if options.incremental:
+            unchanged = sum(result.unchanged_tiles for result in results if not result.error)
+            self.stdout.write(f"Skipped {unchanged} unchanged tiles.")
+        # Shard stages are summed over workers, so they exceed wall time when shards overlap.
+        write_seconds = sum(result.write_seconds for result in results)
+        stages["parse (worker total)"] = sum(result.seconds for result in results) - write_seconds
+        stages["write (worker total)"] = write_seconds
+        if results:
+            worker_peak = max(result.peak_rss_mib for result in results)
+            self.stdout.write(f"Peak worker memory (RSS high-water mark): {worker_peak:.1f} MiB")
+        return written, tiles, failed
+
+    def _run_shards(
+        self, shards: List[ShardSpec], options: IngestOptions, workers: int, shard_count: int, started: float
+    ) -> List[ShardResult]:
+        # Workers open their own connections; never share the parent's socket.
+        database_name = connections["default"].settings_dict["NAME"]
+        connections.close_all()
+        context = multiprocessing.get_context("spawn")
+        shard_rows: Dict[int, int] = {}
+        finished: Set[int] = set()
+        results: List[ShardResult] = []
+        reported = -1
+
+        with context.Manager() as manager, ProcessPoolExecutor(
+            max_workers=workers, mp_context=context, initializer=init_worker, initargs=(database_name,)
+        ) as pool:
+            progress = manager.Queue()
+            pending = {pool.submit(load_shard, spec, options, progress): spec for spec in shards}
+            while pending:
+                done, _ = wait(pending, timeout=PROGRESS_INTERVAL_SECONDS, return_when=FIRST_COMPLETED)
+                self._drain_progress(progress, shard_rows, finished)
+                for future in done:
+                    spec = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as exc:  # e.g. a worker process died
+                        result = ShardResult(spec.index, 0, 0, 0.0, 0.0, error=f"{type(exc).__name__}: {exc}")
+                    finished.add(result.index)
+                    results.append(result)
+                    if result.error:
+                        shard_rows[result.index] = 0
+                        self.stderr.write(f"Shard {result.index}/{shard_count} failed: {result.error}")
+                    else:
+                        shard_rows[result.index] = result.rows
+                        self.stdout.write(
+                            f"Shard {result.index}/{shard_count} done: {result.rows} rows, "
+                            f"{result.skipped} skipped, {result.seconds:.1f}s."
+                        )
+                total = sum(shard_rows.values())
+                if total != reported:
+                    reported = total
+                    self.stdout.write(
+                        f"Upserted {total} rows across {len(finished)}/{len(shards)} shards "
+                        f"({self._rate(total, started)})..."
+                    )
+        return results
+
+    @staticmethod
+    def _drain_progress(progress, shard_rows: Dict[int, int], finished: Set[int]) -> None:
+        while True:
             try:
-                geom_obj = GEOSGeometry(json.dumps(geom), srid=srid)
-            except Exception as exc:  # pragma: no cover - safety net
-                self.stderr.write(f"Skipping invalid geometry: {exc}")
-                continue
-
-            batch.append(
-                ForestDensityCell(
-                    geom=geom_obj,
-                    canopy_pct=canopy_pct,
-                    source=row_source,
-                    tile_id=tile_id,
-                )
-            )
+                index, rows = progress.get_nowait()
+            except Empty:
+                return
+            # Late messages from a failed (rolled back) shard must not count.
+            if index not in finished:
+                shard_rows[index] = rows
 
-            if len(batch) >= batch_size:
-                self._bulk_insert(batch)
-                created += len(batch)
-                self.stdout.write(f"Inserted {created} rows...")
-                batch = []
+    def _iter_columnar_rows(self, path: Path, options: IngestOptions, report_skipped: bool) -> Iterator[CellRow]:
+        batches = iter_columnar_rows(
+            path, options.source_override, options.tile_field, options.canopy_field, options.srid, bbox=options.bbox
+        )
+        try:
+            for batch in batches:
+                if batch.skipped and report_skipped:
+                    self.stderr.write(f"Skipped {batch.skipped} rows with no usable geometry or canopy value.")
+                yield from batch.rows
+        except ColumnarInputError as exc:
+            raise CommandError(str(exc)) from exc
+
+    @staticmethod
+    def _parse_bbox(value: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+        if not value:
+            return None
+        try:
+            xmin, ymin, xmax, ymax = (float(part) for part in value.split(","))
+        except ValueError as exc:
+            raise CommandError(f"Invalid --bbox value: {value}. Expected 'xmin,ymin,xmax,ymax'.") from exc
+        if xmin > xmax or ymin > ymax:
+            raise CommandError(f"Invalid --bbox value: {value}. Minimums must not exceed maximums.")
+        return xmin, ymin, xmax, ymax
 
-        if batch:
-            self._bulk_insert(batch)
-            created += len(batch)
+    @staticmethod
+    def _parse_shard_list(value: Optional[str], shard_count: int) -> Optional[Set[int]]:
+        if not value:
+            return None
+        try:
+            selected = {int(part) for part in value.split(",") if part.strip()}
+        except ValueError as exc:
+            raise CommandError(f"Invalid --shards value: {value}") from exc
+        out_of_range = sorted(index for index in selected if not 0 <= index < shard_count)
+        if out_of_range:
+            raise CommandError(f"Shard numbers out of range for --shard-count {shard_count}: {out_of_range}")
+        return selected
 
-        self.stdout.write(self.style.SUCCESS(f"Done. Inserted {created} rows."))
+    def _feature_to_row(self, feature: Dict[str, Any], options: IngestOptions) -> Optional[CellRow]:
+        try:
+            return feature_to_row(
+                feature, options.source_override, options.tile_field, options.canopy_field, options.srid
+            )
+        except SkipFeature as exc:
+            self.stderr.write(str(exc))
+            return None
 
-    def _bulk_insert(self, batch: List[ForestDensityCell]) -> None:
-        # Bulk create inside a transaction to keep batches atomic.
-        with transaction.atomic():
-            ForestDensityCell.objects.bulk_create(batch, ignore_conflicts=True)
+    @staticmethod
+    def _rate(rows: int, started: float) -> str:
+        elapsed = time.perf_counter() - started
+        return f"{rows / elapsed:,.0f} rows/s" if elapsed > 0 else "n/a rows/s"
 
     def _iter_features(self, path: Path) -> Iterator[Dict[str, Any]]:
         """
         Yields GeoJSON features from a GeoJSON FeatureCollection file
         or newline-delimited GeoJSON (NDJSON). Supports gzip-compressed
-        inputs when the filename ends with '.gz'.
+        inputs when the filename ends with '.gz'. FeatureCollections are
+        parsed incrementally, so memory does not grow with file size.
         """
         is_gz = path.suffix == ".gz"
         opener = gzip.open if is_gz else open
@@ -131,12 +461,8 @@ class Command(BaseCommand):
                     yield feature
                 return
 
-            # Otherwise treat as standard GeoJSON FeatureCollection.
-            data = json.load(handle)
-            if data.get("type") == "FeatureCollection":
-                for feature in data.get("features", []):
-                    yield feature
-            elif data.get("type") == "Feature":
-                yield data
-            else:
-                raise CommandError("Unrecognized GeoJSON structure; expected Feature or FeatureCollection.")
+            # Otherwise stream a standard GeoJSON FeatureCollection feature by feature.
+            try:
+                yield from iter_geojson_features(handle)
+            except ValueError as exc:
+                raise CommandError(str(exc)) from exc
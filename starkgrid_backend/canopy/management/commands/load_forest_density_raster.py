@@ -0,0 +1,178 @@
+import time
+from pathlib import Path
+
+import rasterio
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from canopy.services.grid_storage import sync_grid_cells
+from canopy.services.ingest import (
+    DEFAULT_BATCH_SIZES,
+    EMPTY_TILE,
+    WRITERS,
+    delete_tile_cells,
+    format_stage_timings,
+    hash_tiles,
+    peak_rss_mib,
+    save_tile_hashes,
+    stored_tile_hashes,
+    union_extent,
+)
+from canopy.services.raster_ingest import aggregation_factor, iter_raster_blocks, pixel_size_m
+from canopy.signals import cells_loaded
+
+
+class Command(BaseCommand):
+    help = "Aggregate a canopy-cover GeoTIFF/COG into forest density grid cells."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--file",
+            "-f",
+            required=True,
+            help="Path or URL of a canopy-cover raster (GeoTIFF/COG) with values 0-100.",
+        )
+        parser.add_argument(
+            "--source",
+            required=True,
+            help="Dataset/source label to store, e.g. 'hansen_v1'.",
+        )
+        parser.add_argument(
+            "--band",
+            type=int,
+            default=1,
+            help="Raster band holding canopy cover. Defaults to 1.",
+        )
+        parser.add_argument(
+            "--cell-size",
+            type=float,
+            default=100.0,
+            help="Target cell size in metres; rounded to a whole number of pixels. Defaults to 100.",
+        )
+        parser.add_argument(
+            "--factor",
+            type=int,
+            default=None,
+            help="Pixels per cell side. Overrides --cell-size when given.",
+        )
+        parser.add_argument(
+            "--min-valid-fraction",
+            type=float,
+            default=0.5,
+            help="Minimum share of non-nodata pixels for a cell to be stored. Defaults to 0.5.",
+        )
+        parser.add_argument(
+            "--tile-prefix",
+            default=None,
+            help="Prefix for generated tile ids ('<prefix>:<row>:<col>'). Defaults to the file stem.",
+        )
+        parser.add_argument(
+            "--mode",
+            choices=sorted(WRITERS),
+            default="copy",
+            help="Write engine: 'orm' (bulk_create) or 'copy' (PostgreSQL COPY). Defaults to 'copy'.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Rows per write transaction. Defaults to 500 for orm mode and 50000 for copy mode.",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Skip windows whose cells are unchanged since the last load; changed ones are replaced atomically.",
+        )
+
+    def handle(self, *args, **options):
+        location = options["file"]
+        band = options["band"]
+        mode = options["mode"]
+        writer = WRITERS[mode](options["batch_size"] or DEFAULT_BATCH_SIZES[mode])
+        tile_prefix = options["tile_prefix"] or Path(location).name.split(".")[0]
+
+        if not 0 < options["min_valid_fraction"] <= 1:
+            raise CommandError("--min-valid-fraction must be in (0, 1].")
+
+        try:
+            src = rasterio.open(location)
+        except rasterio.errors.RasterioIOError as exc:
+            raise CommandError(f"Cannot open raster {location}: {exc}") from exc
+
+        with src:
+            if not 1 <= band <= src.count:
+                raise CommandError(f"Band {band} does not exist; raster has {src.count} band(s).")
+            if src.crs is None:
+                raise CommandError("Raster has no CRS; cannot place cells.")
+
+            factor = options["factor"] or aggregation_factor(src, options["cell_size"])
+            self.stdout.write(
+                f"Aggregating {src.width}x{src.height} px ({src.crs}) into cells of {factor}x{factor} px "
+                f"(~{factor * pixel_size_m(src):.0f} m, {mode} mode) ..."
+            )
+
+            started = time.perf_counter()
+            pixels = 0
+            stored = stored_tile_hashes([options["source"]]) if options["incremental"] else None
+            unchanged = replaced = 0
+            replaced_extents = {}
+            for block in iter_raster_blocks(
+                src,
+                band=band,
+                factor=factor,
+                source=options["source"],
+                tile_prefix=tile_prefix,
+                min_valid_fraction=options["min_valid_fraction"],
+            ):
+                pixels += block.pixels_read
+                flushed = 0
+                if stored is not None:
+                    key = (options["source"], block.tile_id)
+                    digest = hash_tiles(block.rows).get(key, EMPTY_TILE)
+                    if stored.get(key, EMPTY_TILE) == digest:
+                        unchanged += 1
+                        continue
+                    # Replace the window's cells in one transaction; it may also have lost cells.
+                    with transaction.atomic():
+                        deleted = delete_tile_cells([key])
+                        for row in block.rows:
+                            flushed += writer.add(row)
+                        flushed += writer.flush()
+                        save_tile_hashes({key: digest})
+                    for source, extent in deleted.extents.items():
+                        replaced_extents[source] = union_extent(replaced_extents.get(source), extent)
+                    writer.sources.add(options["source"])
+                    writer.tiles.setdefault(options["source"], set()).add(block.tile_id)
+                    replaced += 1
+                else:
+                    for row in block.rows:
+                        flushed += writer.add(row)
+                if flushed:
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"Upserted {writer.written} rows from {pixels:,} pixels "
+                        f"({writer.written / elapsed:,.0f} rows/s)..."
+                    )
+            writer.close()
+
+        elapsed = time.perf_counter() - started
+        rate = writer.written / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(
+            self.style.SUCCESS(f"Done. Upserted {writer.written} rows in {elapsed:.1f}s ({rate:,.0f} rows/s).")
+        )
+        if stored is not None:
+            self.stdout.write(f"Replaced {replaced} changed windows, skipped {unchanged} unchanged.")
+        stages = {"read/aggregate": elapsed - writer.write_seconds, "write": writer.write_seconds}
+        self.stdout.write(f"Stage timings: {format_stage_timings(stages)}")
+        self.stdout.write(f"Peak memory (RSS high-water mark): {peak_rss_mib():.1f} MiB")
+
+        if writer.written or replaced:
+            # Compacted sources must not keep serving the previous version of the reloaded windows.
+            synced = sync_grid_cells(writer.tiles)
+            if synced.converted or synced.skipped:
+                self.stdout.write(
+                    f"Re-synced {synced.converted} compact grid cells ({synced.skipped} not grid-aligned)."
+                )
+            cells_loaded.send(
+                sender=self.__class__, sources=writer.sources, tiles=writer.tiles, replaced=replaced_extents
+            )
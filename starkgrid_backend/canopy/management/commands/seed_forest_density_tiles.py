@@ -0,0 +1,91 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from canopy.services.grid_storage import cell_rows_sql
+from canopy.services.tile_cache import iter_tiles, tile_range
+from canopy.services.tiles import MAX_ZOOM, mvt_cache, render_mvt
+
+
+class Command(BaseCommand):
+    help = "Pre-render forest density vector tiles into the disk tile cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--min-zoom", type=int, default=0, help="First zoom level to seed. Defaults to 0.")
+        parser.add_argument("--max-zoom", type=int, default=6, help="Last zoom level to seed. Defaults to 6.")
+        parser.add_argument(
+            "--source",
+            default=None,
+            help="Seed the layer of one source. Defaults to the all-sources layer.",
+        )
+        parser.add_argument(
+            "--bbox",
+            default=None,
+            help="Limit seeding to 'xmin,ymin,xmax,ymax' (lon/lat). Defaults to the extent of the data.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Re-render tiles that are already cached.",
+        )
+
+    def handle(self, *args, **options):
+        min_zoom, max_zoom = options["min_zoom"], options["max_zoom"]
+        if not 0 <= min_zoom <= max_zoom <= MAX_ZOOM:
+            raise CommandError(f"Zoom levels must satisfy 0 <= --min-zoom <= --max-zoom <= {MAX_ZOOM}.")
+        source = options["source"]
+
+        bbox = self._parse_bbox(options["bbox"]) if options["bbox"] else self._data_extent(source)
+        if bbox is None:
+            self.stdout.write("No cells to render.")
+            return
+
+        total = 0
+        for z in range(min_zoom, max_zoom + 1):
+            x_min, y_min, x_max, y_max = tile_range(bbox, z)
+            total += (x_max - x_min + 1) * (y_max - y_min + 1)
+        self.stdout.write(f"Seeding {total} tiles for zooms {min_zoom}-{max_zoom} ...")
+
+        started = time.perf_counter()
+        rendered = skipped = empty = 0
+        for z, x, y in iter_tiles(bbox, min_zoom, max_zoom):
+            if not options["force"] and mvt_cache.get(source, z, x, y) is not None:
+                skipped += 1
+                continue
+            data = render_mvt(z, x, y, source)
+            mvt_cache.set(source, z, x, y, data)
+            rendered += 1
+            empty += not data
+            if rendered % 500 == 0:
+                rate = rendered / (time.perf_counter() - started)
+                self.stdout.write(f"Rendered {rendered} tiles ({rate:,.1f} tiles/s)...")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done. Rendered {rendered} tiles ({empty} empty), skipped {skipped} cached, "
+                f"in {time.perf_counter() - started:.1f}s."
+            )
+        )
+
+    def _parse_bbox(self, value):
+        try:
+            xmin, ymin, xmax, ymax = (float(part) for part in value.split(","))
+        except ValueError as exc:
+            raise CommandError(f"Invalid --bbox value: {value}") from exc
+        if xmin >= xmax or ymin >= ymax:
+            raise CommandError("--bbox must be 'xmin,ymin,xmax,ymax' with xmin < xmax and ymin < ymax.")
+        return xmin, ymin, xmax, ymax
+
+    def _data_extent(self, source):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e)
+                FROM (SELECT ST_Extent(geom) AS e FROM {cell_rows_sql()} AS cells
+                      WHERE %(source)s::text IS NULL OR source = %(source)s) AS extent
+                """,
+                {"source": source},
+            )
+            row = cursor.fetchone()
+        return tuple(row) if row and row[0] is not None else None
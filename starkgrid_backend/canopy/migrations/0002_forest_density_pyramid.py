@@ -0,0 +1,49 @@
+# Generated by Django 6.1.2 on 2026-10-17 00:10
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canopy', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForestDensityPyramidLevel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(blank=True, help_text='Source aggregated by this level; blank for all sources.', max_length=64)),
+                ('cell_size', models.FloatField(help_text='Aggregate cell edge length in degrees.')),
+                ('base_cell_size', models.FloatField(help_text='Largest fine cell edge (degrees) at build time; sets the interior margin.')),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['source', '-cell_size'],
+                'constraints': [models.UniqueConstraint(fields=('source', 'cell_size'), name='forest_density_pyramid_level_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ForestDensityAggregateCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key_x', models.IntegerField()),
+                ('key_y', models.IntegerField()),
+                ('geom', django.contrib.gis.db.models.fields.PolygonField(srid=4326)),
+                ('histogram_pct', django.contrib.postgres.fields.ArrayField(base_field=models.SmallIntegerField(), help_text='Canopy buckets (floor of canopy_pct).')),
+                ('histogram_area', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), help_text='Geodesic area (m²) per bucket.')),
+                ('histogram_weighted', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), help_text='Sum of canopy_pct * area per bucket.')),
+                ('histogram_count', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), help_text='Fine cell count per bucket.')),
+                ('level', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cells', to='canopy.forestdensitypyramidlevel')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GistIndex(fields=['geom'], name='forest_density_agg_geom_gist')],
+                'constraints': [models.UniqueConstraint(fields=('level', 'key_x', 'key_y'), name='forest_density_agg_key_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 6.1.2 on 2026-10-17 00:12
+
+from django.db import migrations, models
+
+
+AREA_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION canopy_forestdensitycell_set_area() RETURNS trigger AS $$
+BEGIN
+    NEW.area_m2 := ST_Area(NEW.geom::geography);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER canopy_forestdensitycell_area_m2
+    BEFORE INSERT OR UPDATE OF geom ON canopy_forestdensitycell
+    FOR EACH ROW EXECUTE FUNCTION canopy_forestdensitycell_set_area();
+
+UPDATE canopy_forestdensitycell SET area_m2 = ST_Area(geom::geography) WHERE area_m2 IS NULL;
+"""
+
+DROP_AREA_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS canopy_forestdensitycell_area_m2 ON canopy_forestdensitycell;
+DROP FUNCTION IF EXISTS canopy_forestdensitycell_set_area();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canopy', '0002_forest_density_pyramid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forestdensitycell',
+            name='area_m2',
+            field=models.FloatField(editable=False, help_text='Geodesic cell area (m²), set by a database trigger whenever geom is written.', null=True),
+        ),
+        migrations.RunSQL(AREA_TRIGGER_SQL, DROP_AREA_TRIGGER_SQL),
+    ]
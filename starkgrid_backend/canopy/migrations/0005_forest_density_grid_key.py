@@ -0,0 +1,51 @@
+# Generated by Django 6.1.2 on 2026-10-17 00:36
+
+from django.db import migrations, models
+
+
+# Bbox centre quantised to 1e-5° (about a metre): x and y are shifted to be
+# non-negative and packed as x * 1e8 + y, which fits comfortably in a bigint.
+GRID_KEY_SQL = """
+    round(((ST_XMin({geom}) + ST_XMax({geom})) / 2 + 180) * 1e5)::bigint * 100000000
+    + round(((ST_YMin({geom}) + ST_YMax({geom})) / 2 + 90) * 1e5)::bigint
+"""
+
+GRID_KEY_TRIGGER_SQL = f"""
+CREATE OR REPLACE FUNCTION canopy_forestdensitycell_set_grid_key() RETURNS trigger AS $$
+BEGIN
+    NEW.grid_key := {GRID_KEY_SQL.format(geom="NEW.geom")};
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER canopy_forestdensitycell_grid_key
+    BEFORE INSERT OR UPDATE OF geom ON canopy_forestdensitycell
+    FOR EACH ROW EXECUTE FUNCTION canopy_forestdensitycell_set_grid_key();
+
+UPDATE canopy_forestdensitycell SET grid_key = {GRID_KEY_SQL.format(geom="geom")} WHERE grid_key IS NULL;
+"""
+
+DROP_GRID_KEY_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS canopy_forestdensitycell_grid_key ON canopy_forestdensitycell;
+DROP FUNCTION IF EXISTS canopy_forestdensitycell_set_grid_key();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canopy', '0004_forest_density_dataset_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forestdensitycell',
+            name='grid_key',
+            field=models.BigIntegerField(editable=False, help_text='Bbox centre quantised to 1e-5° and packed into one integer, set by a database trigger. Cells of the same grid share it across sources, so versions can be joined cell by cell.', null=True),
+        ),
+        migrations.RunSQL(GRID_KEY_TRIGGER_SQL, DROP_GRID_KEY_TRIGGER_SQL),
+        migrations.AddIndex(
+            model_name='forestdensitycell',
+            index=models.Index(fields=['source', 'grid_key'], name='forest_density_grid_key_idx'),
+        ),
+    ]
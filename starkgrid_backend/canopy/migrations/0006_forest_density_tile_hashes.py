@@ -0,0 +1,57 @@
+# Generated by Django 6.1.2 on 2026-10-17 00:54
+
+from django.db import migrations, models
+
+
+# Repeated loads used to append a second copy of every cell. Keep the most
+# recently inserted row per (source, grid_key) so the unique constraint can be
+# added; the (source, grid_key) index still exists at this point.
+DEDUPLICATE_CELLS_SQL = """
+DELETE FROM canopy_forestdensitycell older
+USING canopy_forestdensitycell newer
+WHERE older.source = newer.source
+  AND older.grid_key = newer.grid_key
+  AND older.id < newer.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canopy', '0005_forest_density_grid_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForestDensityTile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=64)),
+                ('tile_id', models.CharField(blank=True, max_length=64)),
+                ('content_hash', models.CharField(help_text="Order-independent SHA-256 over the tile's cell geometries and canopy values.", max_length=64)),
+                ('cell_count', models.PositiveIntegerField()),
+                ('loaded_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['source', 'tile_id'],
+            },
+        ),
+        migrations.RunSQL(DEDUPLICATE_CELLS_SQL, migrations.RunSQL.noop),
+        migrations.RemoveIndex(
+            model_name='forestdensitycell',
+            name='forest_density_grid_key_idx',
+        ),
+        migrations.AlterField(
+            model_name='forestdensitycell',
+            name='grid_key',
+            field=models.BigIntegerField(editable=False, help_text='Bbox centre quantised to 1e-5° and packed into one integer, set by a database trigger. Cells of the same grid share it across sources, so versions can be joined cell by cell; within a source it is unique, so reloads update cells in place.', null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='forestdensitycell',
+            constraint=models.UniqueConstraint(fields=('source', 'grid_key'), name='forest_density_source_grid_key_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='forestdensitytile',
+            constraint=models.UniqueConstraint(fields=('source', 'tile_id'), name='forest_density_tile_unique'),
+        ),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 6.1.2 on 2026-10-17 01:00
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Compact cells carry no geometry; these immutable (inlinable) SQL functions
+# derive a cell's envelope and its geodesic area from the grid definition.
+# The area is the WGS84 ellipsoid area of the quadrangle between the cell's
+# bounding latitudes (as canopy.services.grid_snapshot.row_areas computes it),
+# so it depends only on the row.
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+E2 = WGS84_F * (2 - WGS84_F)
+E = E2 ** 0.5
+B = WGS84_A * (1 - WGS84_F)
+
+GRID_FUNCTIONS_SQL = f"""
+-- Authalic latitude term for sin(latitude); see grid_snapshot.row_areas.
+CREATE OR REPLACE FUNCTION canopy_grid_authalic(sin_lat float8) RETURNS float8 AS $$
+    SELECT sin_lat / (1 - {E2!r} * sin_lat * sin_lat)
+        + ln((1 + {E!r} * sin_lat) / (1 - {E!r} * sin_lat)) / {2 * E!r}
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION canopy_grid_cell_area(north float8, cell_size float8, row_index integer)
+RETURNS float8 AS $$
+    SELECT {B * B!r} * radians(cell_size) / 2 * (
+        canopy_grid_authalic(sin(radians(north - row_index * cell_size)))
+        - canopy_grid_authalic(sin(radians(north - (row_index + 1) * cell_size)))
+    )
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION canopy_grid_cell_envelope(
+    west float8, north float8, cell_size float8, row_index integer, col_index integer
+) RETURNS geometry AS $$
+    SELECT ST_MakeEnvelope(
+        west + col_index * cell_size,
+        north - (row_index + 1) * cell_size,
+        west + (col_index + 1) * cell_size,
+        north - row_index * cell_size,
+        4326
+    )
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+"""
+
+DROP_GRID_FUNCTIONS_SQL = """
+DROP FUNCTION IF EXISTS canopy_grid_cell_envelope(float8, float8, float8, integer, integer);
+DROP FUNCTION IF EXISTS canopy_grid_cell_area(float8, float8, integer);
+DROP FUNCTION IF EXISTS canopy_grid_authalic(float8);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canopy', '0006_forest_density_tile_hashes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForestDensityGrid',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('west', models.FloatField(help_text="Longitude of the grid's western edge.")),
+                ('north', models.FloatField(help_text="Latitude of the grid's northern edge.")),
+                ('cell_size', models.FloatField(help_text='Cell edge length in degrees.')),
+                ('width', models.PositiveIntegerField(help_text='Number of columns.')),
+                ('height', models.PositiveIntegerField(help_text='Number of rows.')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ForestDensitySource',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=64, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ForestDensitySourceTile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=64)),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tiles', to='canopy.forestdensitysource')),
+            ],
+            options={
+                'ordering': ['source', 'name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ForestDensityGridCell',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('row', models.IntegerField()),
+                ('col', models.IntegerField()),
+                ('canopy', models.SmallIntegerField(help_text='Canopy cover percentage times 100 (0-10000), exact for two-decimal percentages.', validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(10000)])),
+                ('grid', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='cells', to='canopy.forestdensitygrid')),
+                ('source', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='canopy.forestdensitysource')),
+                ('tile', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='canopy.forestdensitysourcetile')),
+            ],
+            options={
+                'verbose_name': 'Forest density grid cell',
+                'verbose_name_plural': 'Forest density grid cells',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='forestdensitysourcetile',
+            constraint=models.UniqueConstraint(fields=('source', 'name'), name='forest_density_source_tile_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='forestdensitygridcell',
+            constraint=models.UniqueConstraint(fields=('grid', 'row', 'col', 'source'), name='forest_density_grid_cell_unique'),
+        ),
+        migrations.RunSQL(GRID_FUNCTIONS_SQL, DROP_GRID_FUNCTIONS_SQL),
+    ]
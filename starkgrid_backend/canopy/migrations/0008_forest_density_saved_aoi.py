@@ -0,0 +1,41 @@
+# Generated by Django 6.1.2 on 2026-10-17 01:10
+
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canopy', '0007_forest_density_grid_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForestDensitySavedAOI',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=128)),
+                ('geom', django.contrib.gis.db.models.fields.MultiPolygonField(spatial_index=False, srid=4326)),
+                ('bbox', django.contrib.gis.db.models.fields.PolygonField(help_text='Envelope of geom.', srid=4326)),
+                ('geometry_hash', models.CharField(help_text='Stats cache geometry hash of the AOI as submitted, so saved and inline requests for the same shape share cache entries.', max_length=64)),
+                ('num_coords', models.PositiveIntegerField()),
+                ('area_m2', models.FloatField(editable=False, help_text='Geodesic area (m²).', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Saved AOI',
+                'verbose_name_plural': 'Saved AOIs',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ForestDensitySavedAOIPiece',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geom', django.contrib.gis.db.models.fields.PolygonField(spatial_index=False, srid=4326)),
+                ('aoi', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pieces', to='canopy.forestdensitysavedaoi')),
+            ],
+        ),
+    ]
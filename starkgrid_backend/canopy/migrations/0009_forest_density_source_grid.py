@@ -0,0 +1,35 @@
+# Generated by Django 6.1.2 on 2026-10-17 01:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Sources compacted before this migration keep the grid holding most of their
+# cells; cells they have on other grids stop being read.
+ASSIGN_SOURCE_GRIDS_SQL = """
+UPDATE canopy_forestdensitysource s
+SET grid_id = (
+    SELECT gc.grid_id
+    FROM canopy_forestdensitygridcell gc
+    WHERE gc.source_id = s.id
+    GROUP BY gc.grid_id
+    ORDER BY COUNT(*) DESC, gc.grid_id
+    LIMIT 1
+);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canopy', '0008_forest_density_saved_aoi'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forestdensitysource',
+            name='grid',
+            field=models.ForeignKey(blank=True, help_text='Grid the source is compacted onto; compact cells on other grids are not read.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sources', to='canopy.forestdensitygrid'),
+        ),
+        migrations.RunSQL(ASSIGN_SOURCE_GRIDS_SQL, migrations.RunSQL.noop),
+    ]
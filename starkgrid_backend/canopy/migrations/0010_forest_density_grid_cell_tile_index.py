@@ -0,0 +1,17 @@
+# Generated by Django 6.1.2 on 2026-10-17 01:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canopy', '0009_forest_density_source_grid'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='forestdensitygridcell',
+            index=models.Index(fields=['tile'], name='forest_density_grid_tile_idx'),
+        ),
+    ]
@@ -1,3 +1,6 @@
+from decimal import Decimal
+
+from django.contrib.postgres.fields import ArrayField
 from django.contrib.postgres.indexes import GistIndex
 from django.contrib.gis.db import models
 from django.core.validators import MaxValueValidator, MinValueValidator
@@ -26,6 +29,20 @@ class ForestDensityCell(models.Model):
         blank=True,
         help_text="Optional tile or scene id to group cells by input product.",
     )
+    area_m2 = models.FloatField(
+        null=True,
+        editable=False,
+        help_text="Geodesic cell area (m²), set by a database trigger whenever geom is written.",
+    )
+    grid_key = models.BigIntegerField(
+        null=True,
+        editable=False,
+        help_text=(
+            "Bbox centre quantised to 1e-5° and packed into one integer, set by a database trigger. "
+            "Cells of the same grid share it across sources, so versions can be joined cell by cell; "
+            "within a source it is unique, so reloads update cells in place."
+        ),
+    )
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
@@ -33,9 +50,258 @@ class ForestDensityCell(models.Model):
             GistIndex(fields=["geom"], name="forest_density_geom_gist"),
             models.Index(fields=["canopy_pct"], name="forest_density_canopy_pct_idx"),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=["source", "grid_key"], name="forest_density_source_grid_key_unique"),
+        ]
         verbose_name = "Forest density cell"
         verbose_name_plural = "Forest density cells"
         ordering = ["-updated_at"]
 
     def __str__(self) -> str:
         return f"ForestDensityCell {self.id} ({self.canopy_pct}% canopy)"
+
+
+class ForestDensityTile(models.Model):
+    """
+    Content hash of the cells last loaded for one (source, tile_id), so
+    incremental reloads can skip tiles whose input has not changed.
+    """
+
+    source = models.CharField(max_length=64)
+    tile_id = models.CharField(max_length=64, blank=True)
+    content_hash = models.CharField(
+        max_length=64, help_text="Order-independent SHA-256 over the tile's cell geometries and canopy values."
+    )
+    cell_count = models.PositiveIntegerField()
+    loaded_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["source", "tile_id"], name="forest_density_tile_unique"),
+        ]
+        ordering = ["source", "tile_id"]
+
+    def __str__(self) -> str:
+        return f"Tile {self.tile_id or '(none)'} of {self.source} ({self.cell_count} cells)"
+
+
+class ForestDensityGrid(models.Model):
+    """
+    A registered regular lon/lat grid that compact cells are addressed on.
+    Cell (row, col) spans ``west + col * cell_size`` to ``west + (col + 1) * cell_size``
+    and ``north - (row + 1) * cell_size`` to ``north - row * cell_size``.
+    """
+
+    id = models.SmallAutoField(primary_key=True)
+    name = models.CharField(max_length=64, unique=True)
+    west = models.FloatField(help_text="Longitude of the grid's western edge.")
+    north = models.FloatField(help_text="Latitude of the grid's northern edge.")
+    cell_size = models.FloatField(help_text="Cell edge length in degrees.")
+    width = models.PositiveIntegerField(help_text="Number of columns.")
+    height = models.PositiveIntegerField(help_text="Number of rows.")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.width}x{self.height} at {self.cell_size:g}°)"
+
+    def cell_bounds(self, row: int, col: int):
+        """
+        (xmin, ymin, xmax, ymax) of cell (row, col).
+        """
+        west = self.west + col * self.cell_size
+        north = self.north - row * self.cell_size
+        return (west, north - self.cell_size, west + self.cell_size, north)
+
+
+class ForestDensitySource(models.Model):
+    """
+    Lookup table for source labels referenced by compact cells. A source is
+    compacted onto one grid, so compact reads never count a cell twice.
+    """
+
+    id = models.SmallAutoField(primary_key=True)
+    name = models.CharField(max_length=64, unique=True)
+    grid = models.ForeignKey(
+        ForestDensityGrid,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="sources",
+        help_text="Grid the source is compacted onto; compact cells on other grids are not read.",
+    )
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class ForestDensitySourceTile(models.Model):
+    """
+    Lookup table for the tile ids of a source referenced by compact cells.
+    """
+
+    source = models.ForeignKey(ForestDensitySource, on_delete=models.CASCADE, related_name="tiles")
+    name = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["source", "name"], name="forest_density_source_tile_unique"),
+        ]
+        ordering = ["source", "name"]
+
+    def __str__(self) -> str:
+        return f"{self.source}:{self.name or '(none)'}"
+
+
+class ForestDensityGridCell(models.Model):
+    """
+    Compact storage of a canopy cell: row/col on a registered grid and the
+    canopy percentage in hundredths, with source and tile id normalised into
+    lookup tables. Cell geometry and geodesic area are derived from the grid
+    on demand (see canopy.services.grid_storage), so no GIST index is needed:
+    reads use the btree on (grid, row, col, source), and the btree on tile
+    lets loaders replace the compact cells of a reloaded tile.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    grid = models.ForeignKey(ForestDensityGrid, on_delete=models.CASCADE, related_name="cells", db_index=False)
+    source = models.ForeignKey(ForestDensitySource, on_delete=models.CASCADE, db_index=False)
+    tile = models.ForeignKey(ForestDensitySourceTile, on_delete=models.CASCADE, db_index=False)
+    row = models.IntegerField()
+    col = models.IntegerField()
+    canopy = models.SmallIntegerField(
+        validators=[MinValueValidator(0), MaxValueValidator(10000)],
+        help_text="Canopy cover percentage times 100 (0-10000), exact for two-decimal percentages.",
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["grid", "row", "col", "source"], name="forest_density_grid_cell_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["tile"], name="forest_density_grid_tile_idx"),
+        ]
+        verbose_name = "Forest density grid cell"
+        verbose_name_plural = "Forest density grid cells"
+
+    def __str__(self) -> str:
+        return f"ForestDensityGridCell {self.row}/{self.col} ({self.canopy_pct}% canopy)"
+
+    @property
+    def canopy_pct(self) -> Decimal:
+        return Decimal(self.canopy) / 100
+
+
+class ForestDensityPyramidLevel(models.Model):
+    """
+    One coarse aggregation level over ForestDensityCell rows of a source.
+    A blank source means the level aggregates every source, matching stats
+    requests that do not filter by source.
+    """
+
+    source = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Source aggregated by this level; blank for all sources.",
+    )
+    cell_size = models.FloatField(help_text="Aggregate cell edge length in degrees.")
+    base_cell_size = models.FloatField(
+        help_text="Largest fine cell edge (degrees) at build time; sets the interior margin.",
+    )
+    built_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["source", "cell_size"], name="forest_density_pyramid_level_unique"),
+        ]
+        ordering = ["source", "-cell_size"]
+
+    def __str__(self) -> str:
+        return f"Pyramid level {self.cell_size}° ({self.source or 'all sources'})"
+
+
+class ForestDensityAggregateCell(models.Model):
+    """
+    Canopy histogram of the fine cells whose centre falls in one aggregate
+    cell. Buckets are whole canopy percentages (floored); per-bucket area,
+    canopy-weighted area and cell counts are kept so sums stay exact.
+    """
+
+    level = models.ForeignKey(ForestDensityPyramidLevel, on_delete=models.CASCADE, related_name="cells")
+    key_x = models.IntegerField()
+    key_y = models.IntegerField()
+    geom = models.PolygonField(srid=4326)
+    histogram_pct = ArrayField(models.SmallIntegerField(), help_text="Canopy buckets (floor of canopy_pct).")
+    histogram_area = ArrayField(models.FloatField(), help_text="Geodesic area (m²) per bucket.")
+    histogram_weighted = ArrayField(models.FloatField(), help_text="Sum of canopy_pct * area per bucket.")
+    histogram_count = ArrayField(models.IntegerField(), help_text="Fine cell count per bucket.")
+
+    class Meta:
+        indexes = [
+            GistIndex(fields=["geom"], name="forest_density_agg_geom_gist"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["level", "key_x", "key_y"], name="forest_density_agg_key_unique"),
+        ]
+
+
+class ForestDensityDatasetVersion(models.Model):
+    """
+    Monotonic version per source, bumped whenever a loader writes rows.
+    The blank source tracks "any source changed". Derived results such as
+    cached stats embed the version so they go stale automatically.
+    """
+
+    source = models.CharField(max_length=64, unique=True, blank=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.source or 'all sources'} v{self.version}"
+
+
+class ForestDensitySavedAOI(models.Model):
+    """
+    An AOI saved for repeated stats requests. The geometry is stored validated
+    and in EPSG:4326 together with what the stats query would otherwise derive
+    on every call: its ST_Subdivide pieces, bbox, vertex count and the
+    normalised geometry hash that stats cache keys are built from.
+    """
+
+    name = models.CharField(max_length=128, blank=True)
+    # Read by id only; the bbox carries the spatial index.
+    geom = models.MultiPolygonField(srid=4326, spatial_index=False)
+    bbox = models.PolygonField(srid=4326, help_text="Envelope of geom.")
+    geometry_hash = models.CharField(
+        max_length=64,
+        help_text=(
+            "Stats cache geometry hash of the AOI as submitted, so saved and inline requests "
+            "for the same shape share cache entries."
+        ),
+    )
+    num_coords = models.PositiveIntegerField()
+    area_m2 = models.FloatField(null=True, editable=False, help_text="Geodesic area (m²).")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Saved AOI"
+        verbose_name_plural = "Saved AOIs"
+        ordering = ["-created_at"]
+
+    def __str__(self) -> str:
+        return self.name or f"Saved AOI {self.id}"
+
+
+class ForestDensitySavedAOIPiece(models.Model):
+    """
+    One ST_Subdivide piece of a saved AOI. Pieces only share edges, so stats
+    joined against them add up to those of the whole AOI.
+    """
+
+    aoi = models.ForeignKey(ForestDensitySavedAOI, on_delete=models.CASCADE, related_name="pieces")
+    geom = models.PolygonField(srid=4326, spatial_index=False)
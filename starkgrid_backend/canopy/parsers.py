@@ -0,0 +1,57 @@
+from django.contrib.gis.geos import GEOSException, GEOSGeometry
+from django.http import QueryDict
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+def parse_wkb(body: bytes, query: QueryDict) -> dict:
+    """
+    Request data from a WKB/EWKB body and its query string; see WKBParser.
+    Raises ParseError for bodies that are not a geometry.
+    """
+    if not body:
+        raise ParseError("Empty WKB body.")
+    try:
+        geometry = GEOSGeometry(memoryview(body))
+    except (GEOSException, ValueError) as exc:
+        raise ParseError(f"WKB parse error - {exc}") from exc
+
+    if geometry.srid is None:
+        try:
+            geometry.srid = int(query.get("srid", 4326))
+        except ValueError as exc:
+            raise ParseError("srid must be an integer EPSG code.") from exc
+
+    data = {key: query.get(key) for key in query if key not in ("bins", "srid")}
+    if "bins" in query:
+        data["bins"] = [edge for value in query.getlist("bins") for edge in value.split(",") if edge]
+    data["geometry"] = geometry
+    return data
+
+
+class WKBParser(BaseParser):
+    """
+    Reads a binary WKB or EWKB geometry request body, so large polygons skip
+    GeoJSON parsing. The other request fields come from the query string
+    (``bins`` repeated or comma-separated); geometries without an embedded
+    SRID take ``?srid=``, defaulting to EPSG:4326. The parsed data has the
+    same keys as a JSON body, with ``geometry`` already a GEOSGeometry.
+    """
+
+    media_type = "application/wkb"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get("request")
+        return parse_wkb(stream.read(), request.query_params if request is not None else QueryDict())
+
+
+class OctetStreamWKBParser(WKBParser):
+    """
+    WKBParser for clients that send WKB as ``application/octet-stream``.
+    """
+
+    media_type = "application/octet-stream"
+
+
+WKB_MEDIA_TYPES = (WKBParser.media_type, OctetStreamWKBParser.media_type)
+
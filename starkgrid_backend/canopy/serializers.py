@@ -1,12 +1,38 @@
+from django.conf import settings
 from rest_framework import serializers
 from rest_framework_gis.fields import GeometryField
+from rest_framework_gis.serializers import GeoFeatureModelSerializer
+
+from canopy.models import ForestDensitySavedAOI
+from canopy.services.metrics import stage
 
 
 DEFAULT_BINS = [0, 20, 40, 60, 80, 100]
+# Simple, readable ramp (one colour per default bin); frontend can override if needed.
+DEFAULT_LEGEND_COLORS = ["#f7fcf5", "#c7e9c0", "#74c476", "#31a354", "#006d2c"]
 
+# Batch stats limits, overridable with FOREST_DENSITY_BATCH_MAX_FEATURES and
+# FOREST_DENSITY_BATCH_MAX_AREA_KM2.
+DEFAULT_BATCH_MAX_FEATURES = 500
+DEFAULT_BATCH_MAX_AREA_KM2 = 100_000
 
-class ForestDensityStatsRequestSerializer(serializers.Serializer):
-    geometry = GeometryField()
+# Stats engines; FOREST_DENSITY_STATS_BACKEND picks the default.
+STATS_BACKENDS = ["sql", "snapshot"]
+DEFAULT_STATS_BACKEND = "sql"
+
+# World Cylindrical Equal Area, used to measure AOI areas against the batch cap.
+EQUAL_AREA_SRID = 6933
+
+
+def to_wgs84(value):
+    if value.srid is None:
+        value.srid = 4326
+    elif value.srid != 4326:
+        value.transform(4326)
+    return value
+
+
+class ForestDensityBinningSerializer(serializers.Serializer):
     threshold = serializers.DecimalField(
         max_digits=5, decimal_places=2, min_value=0, max_value=100, required=False, default=60
     )
@@ -27,10 +53,119 @@ class ForestDensityStatsRequestSerializer(serializers.Serializer):
             raise serializers.ValidationError("Bins must start at 0 and end at 100.")
         return floats
 
+
+class ForestDensityAOISerializer(ForestDensityBinningSerializer):
+    geometry = GeometryField()
+    source = serializers.CharField(max_length=64, required=False)
+
     def validate_geometry(self, value):
         # Normalize SRID to WGS84 for downstream queries.
-        if value.srid is None:
-            value.srid = 4326
-        elif value.srid != 4326:
-            value.transform(4326)
+        with stage("transform"):
+            return to_wgs84(value)
+
+
+class ForestDensityStatsRequestSerializer(ForestDensityAOISerializer):
+    geometry = GeometryField(required=False)
+    aoi_id = serializers.PrimaryKeyRelatedField(
+        source="aoi", queryset=ForestDensitySavedAOI.objects.all(), required=False, help_text="A saved AOI id."
+    )
+    mode = serializers.ChoiceField(choices=["summary", "histogram"], required=False, default="summary")
+    backend = serializers.ChoiceField(choices=STATS_BACKENDS, required=False)
+    fragmentation = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, attrs):
+        # Exactly one of geometry / aoi_id; a saved AOI supplies its stored geometry.
+        aoi = attrs.get("aoi")
+        if (aoi is None) == (attrs.get("geometry") is None):
+            raise serializers.ValidationError("Provide either geometry or aoi_id.")
+        if aoi is not None:
+            attrs["geometry"] = aoi.geom
+        return attrs
+
+
+class ForestDensitySavedAOIRequestSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=128, required=False, allow_blank=True, default="")
+    geometry = GeometryField()
+
+    def validate_geometry(self, value):
+        if value.geom_type not in ("Polygon", "MultiPolygon"):
+            raise serializers.ValidationError(f"Expected Polygon or MultiPolygon geometry, got {value.geom_type}.")
+        if value.empty:
+            raise serializers.ValidationError("Geometry is empty.")
+        value = to_wgs84(value)
+        if not value.valid:
+            raise serializers.ValidationError(f"Geometry is invalid: {value.valid_reason}.")
         return value
+
+
+class ForestDensitySavedAOISerializer(GeoFeatureModelSerializer):
+    class Meta:
+        model = ForestDensitySavedAOI
+        geo_field = "geom"
+        bbox_geo_field = "bbox"
+        fields = ("id", "name", "num_coords", "area_m2", "created_at")
+
+
+class ForestDensityExportRequestSerializer(ForestDensityAOISerializer):
+    format = serializers.ChoiceField(choices=["csv", "geojson", "ndjson"], required=False, default="geojson")
+    content = serializers.ChoiceField(choices=["cells", "stats"], required=False, default="cells")
+    gzip = serializers.BooleanField(required=False, default=False)
+
+
+class ForestDensityChangeRequestSerializer(ForestDensityAOISerializer):
+    source = None
+    before_source = serializers.CharField(max_length=64)
+    after_source = serializers.CharField(max_length=64)
+
+    def validate(self, attrs):
+        if attrs["before_source"] == attrs["after_source"]:
+            raise serializers.ValidationError("before_source and after_source must differ.")
+        return attrs
+
+
+class ForestDensityRebinRequestSerializer(ForestDensityBinningSerializer):
+    handle = serializers.RegexField(r"^[0-9a-f]{64}$")
+
+
+class ForestDensityBatchStatsRequestSerializer(ForestDensityBinningSerializer):
+    aois = serializers.JSONField(help_text="GeoJSON FeatureCollection; every feature needs a unique id.")
+    source = serializers.CharField(max_length=64, required=False)
+
+    def validate_aois(self, value):
+        # Returns [(feature id, WGS84 geometry), ...] in input order.
+        if not isinstance(value, dict) or value.get("type") != "FeatureCollection":
+            raise serializers.ValidationError("Expected a GeoJSON FeatureCollection.")
+        features = value.get("features")
+        if not isinstance(features, list) or not features:
+            raise serializers.ValidationError("FeatureCollection has no features.")
+
+        max_features = getattr(settings, "FOREST_DENSITY_BATCH_MAX_FEATURES", DEFAULT_BATCH_MAX_FEATURES)
+        if len(features) > max_features:
+            raise serializers.ValidationError(f"At most {max_features} features per batch.")
+
+        geometry_field = GeometryField()
+        aois = []
+        seen = set()
+        total_km2 = 0.0
+        for position, feature in enumerate(features):
+            if not isinstance(feature, dict):
+                raise serializers.ValidationError(f"Feature {position} is not an object.")
+            key = feature.get("id", (feature.get("properties") or {}).get("id"))
+            if key is None or not isinstance(key, (str, int)):
+                raise serializers.ValidationError(f"Feature {position} needs a string or integer id.")
+            if key in seen:
+                raise serializers.ValidationError(f"Duplicate feature id {key!r}.")
+            seen.add(key)
+            try:
+                geometry = to_wgs84(geometry_field.to_internal_value(feature.get("geometry")))
+            except serializers.ValidationError as exc:
+                raise serializers.ValidationError(f"Feature {key!r}: {exc.detail[0]}") from exc
+            total_km2 += geometry.transform(EQUAL_AREA_SRID, clone=True).area / 1e6
+            aois.append((key, geometry))
+
+        max_km2 = getattr(settings, "FOREST_DENSITY_BATCH_MAX_AREA_KM2", DEFAULT_BATCH_MAX_AREA_KM2)
+        if total_km2 > max_km2:
+            raise serializers.ValidationError(
+                f"Total AOI area {total_km2:,.0f} km² exceeds the batch limit of {max_km2:,.0f} km²."
+            )
+        return aois
@@ -0,0 +1,52 @@
+"""
+psycopg 3 async connection pool for the async stats views.
+
+Django's ORM connections are thread-bound and block, so the async views run
+their spatial queries on a separate AsyncConnectionPool built from the same
+DATABASES entry. A pool is bound to the event loop that opened it; an ASGI
+server runs one loop per worker process, so each worker gets one pool.
+"""
+import asyncio
+import weakref
+from typing import Any, Dict
+
+from django.conf import settings
+from django.db import connections
+from psycopg_pool import AsyncConnectionPool
+
+
+DEFAULT_ASYNC_POOL = {"min_size": 1, "max_size": 10, "timeout": 10.0}
+
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncConnectionPool]" = weakref.WeakKeyDictionary()
+
+
+def async_connection_kwargs(alias: str = "default") -> Dict[str, Any]:
+    """
+    psycopg connect() kwargs for ``alias``, as Django's backend builds them,
+    minus the sync-only cursor factory.
+    """
+    params = connections[alias].get_connection_params()
+    params.pop("cursor_factory", None)
+    params["autocommit"] = True
+    return params
+
+
+async def get_async_pool(alias: str = "default") -> AsyncConnectionPool:
+    """
+    Opens (once per event loop) and returns the pool sized by
+    ``FOREST_DENSITY_ASYNC_POOL``.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        options = {**DEFAULT_ASYNC_POOL, **getattr(settings, "FOREST_DENSITY_ASYNC_POOL", {})}
+        pool = AsyncConnectionPool(kwargs=async_connection_kwargs(alias), open=False, **options)
+        _pools[loop] = pool
+        await pool.open()
+    return pool
+
+
+async def close_async_pool() -> None:
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
@@ -0,0 +1,171 @@
+"""
+Synthetic grids, timers and baseline comparison for benchmark_forest_density.
+
+Results are a flat ``{"metrics": {name: {"value", "unit", "better"}}}`` JSON
+document, so a run can be diffed against any stored baseline regardless of
+which cases either run included.
+"""
+import json
+import math
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+from django.contrib.gis.geos import Polygon
+
+
+DISTRIBUTIONS = ("uniform", "bimodal", "patchy")
+DEFAULT_MAX_REGRESSION = 0.10
+
+
+class SyntheticGrid(NamedTuple):
+    """
+    A regular lon/lat grid of ``width`` x ``height`` cells of ``resolution``
+    degrees with its south-west corner at (``west``, ``south``).
+    """
+
+    west: float = 100.0
+    south: float = -2.0
+    width: int = 200
+    height: int = 200
+    resolution: float = 0.01
+    distribution: str = "patchy"
+    seed: int = 0
+    tile_size: int = 100
+
+    @property
+    def extent(self) -> Tuple[float, float, float, float]:
+        return (
+            self.west,
+            self.south,
+            self.west + self.width * self.resolution,
+            self.south + self.height * self.resolution,
+        )
+
+    @property
+    def cell_count(self) -> int:
+        return self.width * self.height
+
+
+def canopy_values(grid: SyntheticGrid) -> np.ndarray:
+    """
+    (height, width) canopy percentages with two decimals, row 0 at the south.
+    ``uniform`` is white noise, ``bimodal`` piles up near 0 and 100 like
+    forest/non-forest land, and ``patchy`` is a smooth field with noise so
+    neighbouring cells are correlated, as in real canopy products.
+    """
+    rng = np.random.default_rng(grid.seed)
+    shape = (grid.height, grid.width)
+    if grid.distribution == "uniform":
+        values = rng.uniform(0, 100, shape)
+    elif grid.distribution == "bimodal":
+        values = rng.beta(0.4, 0.4, shape) * 100
+    elif grid.distribution == "patchy":
+        rows, cols = np.mgrid[0:grid.height, 0:grid.width]
+        field = np.zeros(shape)
+        for _ in range(6):
+            wavelength = rng.uniform(10, 60)
+            angle, phase = rng.uniform(0, math.pi), rng.uniform(0, 2 * math.pi)
+            field += np.sin((cols * math.cos(angle) + rows * math.sin(angle)) * 2 * math.pi / wavelength + phase)
+        field += rng.normal(0, 0.5, shape)
+        values = (field - field.min()) / (np.ptp(field) or 1.0) * 100
+    else:
+        raise ValueError(f"Unknown distribution {grid.distribution!r}; expected one of {DISTRIBUTIONS}.")
+    return np.round(np.clip(values, 0, 100), 2)
+
+
+def iter_synthetic_features(grid: SyntheticGrid, source: str) -> Iterator[Dict[str, Any]]:
+    """
+    GeoJSON features for every cell, in the shape load_forest_density reads.
+    """
+    values = canopy_values(grid)
+    step = grid.resolution
+    for row in range(grid.height):
+        y0 = grid.south + row * step
+        y1 = y0 + step
+        for col in range(grid.width):
+            x0 = grid.west + col * step
+            x1 = x0 + step
+            yield {
+                "type": "Feature",
+                "geometry": {"type": "Polygon", "coordinates": [[[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]]},
+                "properties": {
+                    "canopy_pct": float(values[row, col]),
+                    "source": source,
+                    "tile_id": f"{row // grid.tile_size}_{col // grid.tile_size}",
+                },
+            }
+
+
+def write_synthetic_ndjson(grid: SyntheticGrid, path: Path, source: str) -> int:
+    written = 0
+    with open(path, "w", encoding="utf-8") as handle:
+        for feature in iter_synthetic_features(grid, source):
+            handle.write(json.dumps(feature, separators=(",", ":")))
+            handle.write("\n")
+            written += 1
+    return written
+
+
+def benchmark_aoi(grid: SyntheticGrid, fraction: float, vertices: int) -> Polygon:
+    """
+    A wavy ring with ``vertices`` vertices centred on the grid, spanning
+    ``fraction`` of its shorter side. The wobble makes the boundary cross
+    cells at every angle, so clipping cost is realistic.
+    """
+    xmin, ymin, xmax, ymax = grid.extent
+    centre_x, centre_y = (xmin + xmax) / 2, (ymin + ymax) / 2
+    radius = fraction * min(xmax - xmin, ymax - ymin) / 2 / 1.1
+    ring = []
+    for index in range(vertices):
+        angle = 2 * math.pi * index / vertices
+        wobble = 1 + 0.1 * math.sin(angle * 17) if vertices >= 32 else 1
+        ring.append((centre_x + radius * wobble * math.cos(angle), centre_y + radius * wobble * math.sin(angle)))
+    ring.append(ring[0])
+    return Polygon(ring, srid=4326)
+
+
+def time_calls(func: Callable[[], Any], repeats: int, warmup: int = 1) -> Dict[str, float]:
+    """
+    Wall-clock timings of ``func`` in milliseconds after ``warmup`` untimed calls.
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "min_ms": samples[0],
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[min(len(samples) - 1, math.ceil(0.95 * len(samples)) - 1)],
+    }
+
+
+def metric(value: float, unit: str, better: str = "lower") -> Dict[str, Any]:
+    return {"value": value, "unit": unit, "better": better}
+
+
+def compare_results(
+    current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float = DEFAULT_MAX_REGRESSION
+) -> List[Dict[str, Any]]:
+    """
+    Metrics present in both runs that got worse by more than ``max_regression``
+    (a fraction of the baseline value), worst first. ``change`` is positive
+    when worse, whichever direction is better for the metric.
+    """
+    regressions = []
+    for name, entry in current["metrics"].items():
+        base = baseline.get("metrics", {}).get(name)
+        if base is None or not base["value"]:
+            continue
+        change = (entry["value"] - base["value"]) / base["value"]
+        if entry.get("better", "lower") == "higher":
+            change = -change
+        if change > max_regression:
+            regressions.append({"name": name, "baseline": base["value"], "value": entry["value"], "change": change})
+    return sorted(regressions, key=lambda item: item["change"], reverse=True)
@@ -0,0 +1,355 @@
+"""
+Cloud-Optimized GeoTIFF export of the cell grid and PNG XYZ tiles read from it.
+
+Export streams cells through a server-side cursor and burns them into a
+disk-backed (memmap) uint8 grid by bbox, so memory does not grow with the
+table; rio-cogeo then writes the COG with overviews. Tiles read only the
+window they cover, at the overview GDAL picks for the decimated read, so tile
+latency depends on the COG, not on the number of cells.
+
+A load marks the COGs of its sources (and the all-sources COG) stale; stale
+COGs serve no tiles until they are exported again.
+"""
+import math
+import tempfile
+import time
+import warnings
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+import rasterio
+from django.conf import settings
+from django.db import connection, transaction
+from django.dispatch import receiver
+from rasterio.enums import Resampling
+from rasterio.errors import NotGeoreferencedWarning
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+from rasterio.windows import Window, from_bounds
+from rio_cogeo.cogeo import cog_translate
+from rio_cogeo.profiles import cog_profiles
+
+from canopy.serializers import DEFAULT_BINS, DEFAULT_LEGEND_COLORS
+from canopy.services.grid_storage import cell_rows_sql
+from canopy.services.tile_cache import ALL_SOURCES, TileCache, source_dir_name
+from canopy.signals import cells_loaded
+
+
+NODATA = 255
+TILE_SIZE = 256
+STRIP_ROWS = 4096
+DEFAULT_FETCH_SIZE = 50_000
+
+png_cache = TileCache("png", "png")
+
+
+class GridSpec(NamedTuple):
+    west: float
+    north: float
+    res_x: float
+    res_y: float
+    width: int
+    height: int
+
+    @property
+    def transform(self):
+        return from_origin(self.west, self.north, self.res_x, self.res_y)
+
+
+def cog_dir() -> Path:
+    return Path(getattr(settings, "FOREST_DENSITY_COG_DIR", Path(settings.BASE_DIR) / "cogs"))
+
+
+def cog_path(source: Optional[str]) -> Path:
+    return cog_dir() / f"{source_dir_name(source)}.tif"
+
+
+def stale_path(source: Optional[str]) -> Path:
+    return cog_dir() / f"{source_dir_name(source)}.stale"
+
+
+def mark_cog_stale(sources: Iterable[str]) -> None:
+    """
+    Flags the COGs of ``sources`` and the all-sources COG as older than the
+    cells, and drops their PNG tiles. The marker is rewritten on every load,
+    so an export that started before the load does not clear it. Nothing is
+    marked before the first export has created the COG directory.
+    """
+    directory = cog_dir()
+    if not directory.is_dir():
+        return
+    for name in {source_dir_name(source) for source in sources} | {ALL_SOURCES}:
+        (directory / f"{name}.stale").write_text(f"{time.time()}\n")
+    for source in set(sources) | {None}:
+        png_cache.clear(source)
+
+
+def cog_is_stale(source: Optional[str]) -> bool:
+    return stale_path(source).exists()
+
+
+def _clear_stale(source: Optional[str], started_ns: int) -> None:
+    path = stale_path(source)
+    try:
+        # Loads that finished after the export started may not be in it.
+        if path.stat().st_mtime_ns < started_ns:
+            path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+@receiver(cells_loaded)
+def _mark_stale_on_load(sender, sources, **kwargs):
+    mark_cog_stale(sources)
+
+
+def _source_clause() -> str:
+    return "(%(source)s::text IS NULL OR source = %(source)s)"
+
+
+def grid_spec(
+    source: Optional[str] = None, resolution: Optional[float] = None, layout: Optional[str] = None
+) -> Optional[GridSpec]:
+    """
+    Raster grid covering the cells of ``source`` in storage ``layout`` (the
+    configured one by default). The pixel size defaults to the smallest cell
+    edge, so every cell covers at least one pixel.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e), min_x, min_y
+            FROM (
+                SELECT ST_Extent(geom) AS e,
+                       MIN(ST_XMax(geom) - ST_XMin(geom)) AS min_x,
+                       MIN(ST_YMax(geom) - ST_YMin(geom)) AS min_y
+                FROM {cell_rows_sql(layout=layout)} AS cells
+                WHERE {_source_clause()}
+            ) AS extent
+            """,
+            {"source": source},
+        )
+        row = cursor.fetchone()
+    if not row or row[0] is None:
+        return None
+    west, south, east, north, min_x, min_y = row
+    res_x = resolution or min_x
+    res_y = resolution or min_y
+    return GridSpec(
+        west=west,
+        north=north,
+        res_x=res_x,
+        res_y=res_y,
+        width=max(1, math.ceil(round((east - west) / res_x, 6))),
+        height=max(1, math.ceil(round((north - south) / res_y, 6))),
+    )
+
+
+def iter_cell_bounds(source: Optional[str] = None, fetch_size: int = DEFAULT_FETCH_SIZE) -> Iterator[np.ndarray]:
+    """
+    Yields (n, 5) float arrays of xmin, ymin, xmax, ymax, canopy_pct.
+    """
+    with transaction.atomic():
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT ST_XMin(geom), ST_YMin(geom), ST_XMax(geom), ST_YMax(geom), canopy_pct::float8
+                FROM {cell_rows_sql()} AS cells
+                WHERE {_source_clause()}
+                """,
+                {"source": source},
+            )
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield np.asarray(rows, dtype=np.float64)
+
+
+def burn_cells(target: np.ndarray, grid: GridSpec, cells: np.ndarray, values: Optional[np.ndarray] = None) -> None:
+    """
+    Writes ``values`` (default: rounded canopy percentages) into every pixel
+    whose centre lies in a cell's bbox. Single-pixel cells (the usual case)
+    are burned vectorised.
+    """
+    height, width = target.shape
+    col0 = np.rint((cells[:, 0] - grid.west) / grid.res_x).astype(np.int64)
+    col1 = np.maximum(col0 + 1, np.rint((cells[:, 2] - grid.west) / grid.res_x).astype(np.int64))
+    row0 = np.rint((grid.north - cells[:, 3]) / grid.res_y).astype(np.int64)
+    row1 = np.maximum(row0 + 1, np.rint((grid.north - cells[:, 1]) / grid.res_y).astype(np.int64))
+    np.clip(col0, 0, width, out=col0)
+    np.clip(col1, 0, width, out=col1)
+    np.clip(row0, 0, height, out=row0)
+    np.clip(row1, 0, height, out=row1)
+    if values is None:
+        values = np.clip(np.rint(cells[:, 4]), 0, 100).astype(np.uint8)
+
+    single = (col1 - col0 == 1) & (row1 - row0 == 1)
+    target[row0[single], col0[single]] = values[single]
+    for index in np.flatnonzero(~single):
+        target[row0[index]:row1[index], col0[index]:col1[index]] = values[index]
+
+
+def write_cog(grid_path: Path, grid: GridSpec, data: np.ndarray, dst_path: Path) -> None:
+    """
+    Writes ``data`` (uint8, NODATA for empty) as a COG with averaged overviews.
+    """
+    profile = {
+        "driver": "GTiff",
+        "dtype": "uint8",
+        "count": 1,
+        "width": grid.width,
+        "height": grid.height,
+        "crs": "EPSG:4326",
+        "transform": grid.transform,
+        "nodata": NODATA,
+        "tiled": True,
+        "blockxsize": 512,
+        "blockysize": 512,
+        "compress": "DEFLATE",
+    }
+    with rasterio.open(grid_path, "w", **profile) as dst:
+        for row in range(0, grid.height, STRIP_ROWS):
+            rows = min(STRIP_ROWS, grid.height - row)
+            dst.write(data[row:row + rows][np.newaxis], window=Window(0, row, grid.width, rows))
+
+    dst_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = dst_path.with_suffix(".tmp.tif")
+    cog_translate(
+        str(grid_path),
+        str(temp_path),
+        cog_profiles.get("deflate"),
+        nodata=NODATA,
+        overview_resampling="average",
+        in_memory=False,
+        quiet=True,
+    )
+    temp_path.replace(dst_path)
+
+
+def export_cog(
+    source: Optional[str] = None, resolution: Optional[float] = None, dst_path: Optional[Path] = None
+) -> Optional[Tuple[Path, GridSpec]]:
+    """
+    Rasterises the cells of ``source`` (all sources when None) into a COG.
+    Returns the output path and grid, or None when there are no cells.
+    Writing to ``cog_path(source)`` clears its stale marker unless cells were
+    loaded while the export ran.
+    """
+    started_ns = time.time_ns()
+    # Loads only mark COGs stale once the directory exists; create it before reading cells.
+    cog_dir().mkdir(parents=True, exist_ok=True)
+    grid = grid_spec(source, resolution)
+    if grid is None:
+        return None
+    dst_path = Path(dst_path) if dst_path else cog_path(source)
+
+    with tempfile.TemporaryDirectory(prefix="forest_density_cog_") as workdir:
+        data = np.memmap(Path(workdir) / "grid.u8", dtype=np.uint8, mode="w+", shape=(grid.height, grid.width))
+        data[:] = NODATA
+        for cells in iter_cell_bounds(source):
+            burn_cells(data, grid, cells)
+        data.flush()
+        write_cog(Path(workdir) / "grid.tif", grid, data, dst_path)
+        del data
+
+    if dst_path == cog_path(source):
+        _clear_stale(source, started_ns)
+    png_cache.clear(source)
+    return dst_path, grid
+
+
+def legend_lookup() -> Tuple[np.ndarray, Dict[int, Tuple[int, int, int, int]]]:
+    """
+    Maps uint8 canopy values to legend class indexes (NODATA -> transparent
+    index) and returns the matching PNG palette.
+    """
+    edges = [float(edge) for edge in DEFAULT_BINS]
+    classes = len(edges) - 1
+    lookup = np.full(256, classes, dtype=np.uint8)
+    values = np.arange(101)
+    lookup[:101] = np.minimum(np.searchsorted(edges, values, side="right") - 1, classes - 1)
+
+    palette = {}
+    for index, color in enumerate(DEFAULT_LEGEND_COLORS[:classes]):
+        palette[index] = tuple(int(color[offset:offset + 2], 16) for offset in (1, 3, 5)) + (255,)
+    palette[classes] = (0, 0, 0, 0)
+    return lookup, palette
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """
+    (west, south, east, north) of an XYZ tile in degrees.
+    """
+    n = 2 ** z
+
+    def lat(row: float) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def read_tile(src, z: int, x: int, y: int) -> Optional[np.ndarray]:
+    """
+    Canopy values for a 256x256 Web Mercator tile, or None outside the COG.
+    The lon/lat window is read decimated (GDAL picks the overview), then rows
+    are remapped from equal-latitude to Mercator spacing.
+    """
+    west, south, east, north = tile_bounds(z, x, y)
+    left, bottom, right, top = src.bounds
+    if west >= right or east <= left or south >= top or north <= bottom:
+        return None
+
+    window = from_bounds(west, south, east, north, transform=src.transform)
+    data = src.read(
+        1,
+        window=window,
+        out_shape=(TILE_SIZE, TILE_SIZE),
+        boundless=True,
+        fill_value=NODATA,
+        resampling=Resampling.nearest,
+    )
+    n = 2 ** z
+    centres = y + (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * centres / n))))
+    rows = np.clip(((north - lats) / (north - south) * TILE_SIZE).astype(np.int64), 0, TILE_SIZE - 1)
+    return data[rows]
+
+
+def encode_png(values: np.ndarray) -> bytes:
+    lookup, palette = legend_lookup()
+    classes = lookup[values]
+    with MemoryFile() as memfile, warnings.catch_warnings():
+        # Tiles are placed by their XYZ address; the PNG carries no georeferencing.
+        warnings.simplefilter("ignore", NotGeoreferencedWarning)
+        with memfile.open(driver="PNG", width=TILE_SIZE, height=TILE_SIZE, count=1, dtype="uint8") as dst:
+            dst.write(classes, 1)
+            dst.write_colormap(1, palette)
+        return memfile.read()
+
+
+def render_png(z: int, x: int, y: int, source: Optional[str] = None) -> Optional[bytes]:
+    """
+    PNG tile coloured with the legend ramp; b"" for tiles without data.
+    Returns None when no COG has been exported for ``source`` or cells were
+    loaded since the last export.
+    """
+    path = cog_path(source)
+    if not path.exists() or cog_is_stale(source):
+        return None
+    with rasterio.open(path) as src:
+        values = read_tile(src, z, x, y)
+    if values is None or not (values != NODATA).any():
+        return b""
+    return encode_png(values)
+
+
+def get_png(z: int, x: int, y: int, source: Optional[str] = None) -> Optional[bytes]:
+    data = png_cache.get(source, z, x, y)
+    if data is None:
+        data = render_png(z, x, y, source)
+        if data is not None:
+            png_cache.set(source, z, x, y, data)
+    return data
+
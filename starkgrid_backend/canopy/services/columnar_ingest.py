@@ -0,0 +1,258 @@
+"""
+Record-batch readers for columnar cell inputs: GeoParquet and FlatGeobuf.
+
+Rows are built straight from Arrow record batches. WKB geometries become
+EWKB by splicing in the SRID header, without parsing coordinates, and the
+canopy, tile and source columns are read column-wise, so no GeoJSON dicts
+are built. A bbox filter is pushed down to the reader: FlatGeobuf searches
+its packed R-tree, and GeoParquet files with a bbox covering column skip
+row groups by their statistics.
+
+pyarrow (GeoParquet) and pyogrio (FlatGeobuf) are optional and imported on
+first use.
+"""
+import importlib
+import json
+import re
+import struct
+from pathlib import Path
+from typing import Any, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from django.contrib.gis.geos import GEOSGeometry, WKBWriter
+
+from canopy.services.ingest import EWKB_SRID_FLAG, TARGET_SRID, WKB_POLYGON, CellRow
+
+
+COLUMNAR_FORMATS = {".parquet": "geoparquet", ".geoparquet": "geoparquet", ".fgb": "flatgeobuf"}
+DEFAULT_RECORD_BATCH_SIZE = 65_536
+
+# Little-endian 2D Polygon WKB, and the EWKB header that replaces it.
+POLYGON_WKB_HEADER = struct.pack("<BI", 1, WKB_POLYGON)
+POLYGON_EWKB_HEADER = struct.pack("<BII", 1, WKB_POLYGON | EWKB_SRID_FLAG, TARGET_SRID)
+
+Bbox = Tuple[float, float, float, float]
+
+
+class ColumnarInputError(ValueError):
+    """
+    The input cannot be read: a missing optional dependency, column or unsupported encoding.
+    """
+
+
+class RowBatch(NamedTuple):
+    rows: List[CellRow]
+    skipped: int
+
+
+def columnar_format(path: Path) -> Optional[str]:
+    """
+    ``geoparquet`` or ``flatgeobuf`` for columnar inputs, None for GeoJSON/NDJSON.
+    """
+    return COLUMNAR_FORMATS.get(path.suffix.lower())
+
+
+def crs_to_srid(crs: Any) -> Optional[int]:
+    """
+    EPSG code of a GeoParquet PROJJSON CRS or an ``AUTHORITY:CODE`` string;
+    OGC:CRS84 (GeoParquet's default) counts as 4326. None when unknown.
+    """
+    if isinstance(crs, dict):
+        ident = crs.get("id") or {}
+        crs = f"{ident.get('authority', '')}:{ident.get('code', '')}"
+    if not isinstance(crs, str):
+        return None
+    match = re.fullmatch(r"(EPSG|OGC):(\w+)", crs.strip(), flags=re.IGNORECASE)
+    if not match:
+        return None
+    authority, code = match.group(1).upper(), match.group(2).upper()
+    if authority == "OGC":
+        return TARGET_SRID if code == "CRS84" else None
+    return int(code) if code.isdigit() else None
+
+
+def wkb_to_ewkb_hex(wkb: bytes, srid: int = TARGET_SRID) -> str:
+    """
+    EWKB hex (EPSG:4326) of a Polygon WKB value. Little-endian 2D polygons
+    in 4326 only get the SRID header spliced in; anything else (big-endian,
+    Z/M ordinates, other SRIDs) goes through GEOS.
+    """
+    if srid == TARGET_SRID and wkb[:5] == POLYGON_WKB_HEADER:
+        if len(wkb) < 13 or struct.unpack_from("<I", wkb, 5)[0] == 0:
+            raise ValueError("Polygon has no rings.")
+        return (POLYGON_EWKB_HEADER + wkb[5:]).hex()
+
+    geometry = GEOSGeometry(memoryview(wkb))
+    if geometry.geom_type != "Polygon":
+        raise ValueError(f"Expected Polygon geometry, got {geometry.geom_type!r}.")
+    if geometry.empty:
+        raise ValueError("Polygon has no rings.")
+    geometry.srid = srid
+    if srid != TARGET_SRID:
+        geometry.transform(TARGET_SRID)
+    # Drop any Z/M ordinates; the column is 2D.
+    writer = WKBWriter(dim=2)
+    writer.srid = True
+    writer.byteorder = 1
+    return writer.write_hex(geometry).decode("ascii")
+
+
+def wkb_bounds(wkb: bytes) -> Bbox:
+    """
+    (xmin, ymin, xmax, ymax) of a Polygon WKB value from its exterior ring.
+    """
+    if wkb[:5] == POLYGON_WKB_HEADER and len(wkb) >= 13:
+        points = struct.unpack_from("<I", wkb, 9)[0]
+        coords = np.frombuffer(wkb, dtype="<f8", count=points * 2, offset=13).reshape(-1, 2)
+        xmin, ymin = coords.min(axis=0)
+        xmax, ymax = coords.max(axis=0)
+        return float(xmin), float(ymin), float(xmax), float(ymax)
+    return GEOSGeometry(memoryview(wkb)).extent
+
+
+def batch_to_rows(
+    geometries: Sequence[Optional[bytes]],
+    canopy: Sequence[Any],
+    tiles: Optional[Sequence[Any]],
+    sources: Optional[Sequence[Any]],
+    source_override: Optional[str],
+    srid: int,
+    bbox: Optional[Bbox] = None,
+) -> RowBatch:
+    """
+    CellRows for one record batch of columns. Rows without a geometry or
+    canopy value, and unusable geometries, are counted as skipped. ``bbox``
+    keeps only rows whose geometry bbox intersects it, for readers that
+    cannot filter themselves; those rows are dropped, not skipped.
+    """
+    rows: List[CellRow] = []
+    skipped = 0
+    for index, wkb in enumerate(geometries):
+        canopy_pct = canopy[index]
+        if wkb is None or canopy_pct is None:
+            skipped += 1
+            continue
+        try:
+            if bbox is not None:
+                xmin, ymin, xmax, ymax = wkb_bounds(wkb)
+                if xmax < bbox[0] or xmin > bbox[2] or ymax < bbox[1] or ymin > bbox[3]:
+                    continue
+            geom_hex = wkb_to_ewkb_hex(wkb, srid)
+        except Exception:
+            skipped += 1
+            continue
+        row_source = source_override or (sources[index] if sources is not None else None) or "unknown"
+        tile_id = str((tiles[index] if tiles is not None else None) or "")
+        rows.append(CellRow(geom_hex=geom_hex, canopy_pct=canopy_pct, source=row_source, tile_id=tile_id))
+    return RowBatch(rows, skipped)
+
+
+def iter_columnar_rows(
+    path: Path,
+    source_override: Optional[str],
+    tile_field: str,
+    canopy_field: str,
+    srid: int = TARGET_SRID,
+    bbox: Optional[Bbox] = None,
+    batch_size: int = DEFAULT_RECORD_BATCH_SIZE,
+) -> Iterator[RowBatch]:
+    """
+    Yields a RowBatch per record batch of a GeoParquet or FlatGeobuf file.
+    The file's declared CRS wins over ``srid``, which covers files without
+    one. ``bbox`` is in the file's coordinates.
+    """
+    if columnar_format(path) == "flatgeobuf":
+        reader = _flatgeobuf_batches
+    else:
+        reader = _geoparquet_batches
+    for batch, geometry_name, file_srid, filter_rows in reader(path, tile_field, canopy_field, bbox, batch_size):
+        names = batch.schema.names
+        yield batch_to_rows(
+            batch.column(geometry_name).to_pylist(),
+            batch.column(canopy_field).to_pylist(),
+            batch.column(tile_field).to_pylist() if tile_field in names else None,
+            batch.column("source").to_pylist() if "source" in names and not source_override else None,
+            source_override,
+            file_srid or srid,
+            bbox if filter_rows else None,
+        )
+
+
+def _import(module: str, purpose: str):
+    try:
+        return importlib.import_module(module)
+    except ImportError as exc:
+        raise ColumnarInputError(f"Reading {purpose} needs the optional '{module.split('.')[0]}' package.") from exc
+
+
+def _geoparquet_batches(path: Path, tile_field: str, canopy_field: str, bbox: Optional[Bbox], batch_size: int):
+    """
+    Yields (record batch, geometry column, srid, filter rows) for a GeoParquet
+    file. With a bbox covering column the bbox becomes a dataset filter;
+    otherwise rows are filtered by their geometry.
+    """
+    dataset_module = _import("pyarrow.dataset", "GeoParquet")
+    dataset = dataset_module.dataset(str(path), format="parquet")
+    schema = dataset.schema
+    geo = json.loads((schema.metadata or {}).get(b"geo", b"{}"))
+    geometry_name = geo.get("primary_column", "geometry")
+    column = (geo.get("columns") or {}).get(geometry_name, {})
+    if column.get("encoding", "WKB").upper() != "WKB":
+        raise ColumnarInputError(f"GeoParquet column {geometry_name!r} is {column['encoding']}; only WKB is supported.")
+    for name in (geometry_name, canopy_field):
+        if name not in schema.names:
+            raise ColumnarInputError(f"Column {name!r} not found in {path.name}.")
+
+    # GeoParquet defaults to OGC:CRS84 when "crs" is absent; an explicit null means unknown.
+    srid = crs_to_srid(column.get("crs", "OGC:CRS84")) if geo else None
+    columns = [name for name in (geometry_name, canopy_field, tile_field, "source") if name in schema.names]
+    covering = (column.get("covering") or {}).get("bbox")
+    expression = None
+    if bbox is not None and covering:
+        field = dataset_module.field
+        expression = (
+            (field(*covering["xmin"]) <= bbox[2])
+            & (field(*covering["xmax"]) >= bbox[0])
+            & (field(*covering["ymin"]) <= bbox[3])
+            & (field(*covering["ymax"]) >= bbox[1])
+        )
+    scanner = dataset.scanner(columns=columns, filter=expression, batch_size=batch_size)
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield batch, geometry_name, srid, bbox is not None and not covering
+
+
+def _flatgeobuf_batches(path: Path, tile_field: str, canopy_field: str, bbox: Optional[Bbox], batch_size: int):
+    """
+    Yields (record batch, geometry column, srid, filter rows) for a FlatGeobuf
+    file through GDAL's Arrow stream; the bbox is a spatial filter that GDAL
+    answers from the packed R-tree.
+    """
+    pyogrio = _import("pyogrio", "FlatGeobuf")
+    raw = _import("pyogrio.raw", "FlatGeobuf")
+    fields = list(pyogrio.read_info(str(path))["fields"])
+    if canopy_field not in fields:
+        raise ColumnarInputError(f"Column {canopy_field!r} not found in {path.name}.")
+    columns = [name for name in (canopy_field, tile_field, "source") if name in fields]
+
+    # GDAL cannot force 2D on Arrow streams; wkb_to_ewkb_hex drops any Z/M ordinates instead.
+    with raw.open_arrow(str(path), columns=columns, bbox=bbox, batch_size=batch_size, use_pyarrow=True) as (
+        meta,
+        reader,
+    ):
+        geometry_name = meta.get("geometry_name") or _arrow_geometry_column(reader.schema)
+        srid = crs_to_srid(meta.get("crs"))
+        for batch in reader:
+            if batch.num_rows:
+                yield batch, geometry_name, srid, False
+
+
+def _arrow_geometry_column(schema) -> str:
+    """
+    Name of the WKB column in a GDAL Arrow stream whose layer has no named
+    geometry column: the one tagged ``geoarrow.wkb``, else GDAL's default.
+    """
+    for field in schema:
+        if (field.metadata or {}).get(b"ARROW:extension:name") == b"geoarrow.wkb":
+            return field.name
+    return "wkb_geometry"
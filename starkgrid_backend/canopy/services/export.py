@@ -0,0 +1,261 @@
+"""
+Streaming exports of clipped forest density cells and AOI stats.
+
+Cells are read through a server-side cursor inside a transaction (so the
+cursor is not WITH HOLD and rows arrive while PostGIS is still scanning) and
+are encoded batch by batch. Summary stats for cell exports are folded from the
+streamed rows, so no second query is needed and memory stays flat. The
+``a``-prefixed variants do the same on the psycopg async pool for ASGI.
+"""
+import csv
+import io
+import json
+import zlib
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+from django.db import connection, transaction
+
+from canopy.services.async_db import get_async_pool
+from canopy.services.forest_density import clipped_area_sql, distribution_from_rows, summarize_distribution
+from canopy.services.grid_storage import cell_rows_sql
+
+
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv",
+    "geojson": "application/geo+json",
+    "ndjson": "application/x-ndjson",
+}
+CELL_CSV_COLUMNS = ["id", "source", "tile_id", "canopy_pct", "area_m2", "wkt"]
+DEFAULT_FETCH_SIZE = 2000
+
+
+def build_export_sql(export_format: str) -> str:
+    """
+    Cells intersecting the AOI with their clipped area and clipped geometry,
+    encoded as GeoJSON (geojson/ndjson) or WKT (csv) by PostGIS.
+    """
+    encode = "ST_AsText({})" if export_format == "csv" else "ST_AsGeoJSON({}, 7)"
+    clipped_geom = "CASE WHEN ST_CoveredBy(c.geom, aoi.geom) THEN c.geom ELSE ST_Intersection(c.geom, aoi.geom) END"
+    return f"""
+        WITH aoi AS (SELECT ST_GeomFromEWKB(%(aoi)s) AS geom)
+        SELECT c.id, c.source, c.tile_id, c.canopy_pct,
+               {clipped_area_sql("aoi.geom")} AS area_m2,
+               {encode.format(clipped_geom)} AS geometry
+        FROM {cell_rows_sql("ST_GeomFromEWKB(%(aoi)s)")} c, aoi
+        WHERE c.geom && aoi.geom
+          AND ST_Intersects(c.geom, aoi.geom)
+          AND (%(source)s::text IS NULL OR c.source = %(source)s)
+    """
+
+
+def iter_clipped_cells(
+    geometry, export_format: str, source: Optional[str] = None, fetch_size: int = DEFAULT_FETCH_SIZE
+) -> Iterator[List[tuple]]:
+    """
+    Yields batches of (id, source, tile_id, canopy_pct, area_m2, geometry)
+    rows with a positive clipped area.
+    """
+    params = {"aoi": bytes(geometry.ewkb), "source": source}
+    with transaction.atomic():
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(build_export_sql(export_format), params)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield [row for row in rows if row[4] and row[4] > 0]
+
+
+async def aiter_clipped_cells(
+    geometry, export_format: str, source: Optional[str] = None, fetch_size: int = DEFAULT_FETCH_SIZE
+) -> AsyncIterator[List[tuple]]:
+    """
+    iter_clipped_cells on the psycopg async pool: a named (server-side)
+    cursor inside a transaction, fetched batch by batch.
+    """
+    params = {"aoi": bytes(geometry.ewkb), "source": source}
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            async with conn.cursor(name="forest_density_export") as cursor:
+                await cursor.execute(build_export_sql(export_format), params)
+                while True:
+                    rows = await cursor.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    yield [row for row in rows if row[4] and row[4] > 0]
+
+
+class StatsAccumulator:
+    """
+    Folds streamed cells into the compute_stats payload.
+    """
+
+    def __init__(self):
+        self._by_pct: Dict[float, List[float]] = {}
+
+    def add(self, canopy_pct, area_m2: float) -> None:
+        pct = float(canopy_pct)
+        entry = self._by_pct.setdefault(pct, [0.0, 0, 0.0])
+        entry[0] += area_m2
+        entry[1] += 1
+        entry[2] += pct * area_m2
+
+    def summary(self, threshold: float, bins: List[float]) -> Dict:
+        rows = [(pct, area, count, weighted) for pct, (area, count, weighted) in self._by_pct.items()]
+        return summarize_distribution(distribution_from_rows(rows), threshold, bins)
+
+
+def _cell_properties(row) -> Dict:
+    cell_id, source, tile_id, canopy_pct, area_m2, _ = row
+    return {"id": cell_id, "source": source, "tile_id": tile_id, "canopy_pct": float(canopy_pct), "area_m2": area_m2}
+
+
+class CellEncoder:
+    """
+    Encodes batches of clipped cells for stream_cells and astream_cells:
+    a header, one chunk per batch (empty when there is nothing to write)
+    and a footer carrying the stats folded from the rows.
+    """
+
+    def __init__(self, export_format: str, threshold: float, bins: List[float]):
+        self.export_format = export_format
+        self.threshold = threshold
+        self.bins = bins
+        self.stats = StatsAccumulator()
+        self.separator = ",\n" if export_format == "geojson" else "\n"
+        self.first = True
+        if export_format == "csv":
+            self.buffer = io.StringIO()
+            self.writer = csv.writer(self.buffer)
+
+    def header(self) -> str:
+        if self.export_format == "csv":
+            self.writer.writerow(CELL_CSV_COLUMNS)
+            return self._drain()
+        return '{"type": "FeatureCollection", "features": [\n' if self.export_format == "geojson" else ""
+
+    def encode(self, rows: List[tuple]) -> str:
+        if self.export_format == "csv":
+            for row in rows:
+                self.stats.add(row[3], row[4])
+                self.writer.writerow(row)
+            return self._drain()
+
+        features = []
+        for row in rows:
+            self.stats.add(row[3], row[4])
+            properties = json.dumps(_cell_properties(row))
+            features.append(f'{{"type": "Feature", "geometry": {row[5]}, "properties": {properties}}}')
+        if not features:
+            return ""
+        chunk = self.separator.join(features)
+        first, self.first = self.first, False
+        if self.export_format == "geojson":
+            return chunk if first else self.separator + chunk
+        return chunk + "\n"
+
+    def footer(self) -> str:
+        if self.export_format == "csv":
+            return ""
+        summary = json.dumps(self.stats.summary(self.threshold, self.bins))
+        if self.export_format == "geojson":
+            return f'\n], "stats": {summary}}}\n'
+        return f'{{"stats": {summary}}}\n'
+
+    def _drain(self) -> str:
+        value = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return value
+
+
+def stream_cells(
+    geometry,
+    export_format: str,
+    threshold: float,
+    bins: List[float],
+    source: Optional[str] = None,
+    fetch_size: int = DEFAULT_FETCH_SIZE,
+) -> Iterator[str]:
+    """
+    Encodes clipped cells as CSV, a GeoJSON FeatureCollection (with the AOI
+    stats as a trailing ``stats`` member) or NDJSON features followed by a
+    final ``{"stats": ...}`` line.
+    """
+    encoder = CellEncoder(export_format, threshold, bins)
+    yield encoder.header()
+    for rows in iter_clipped_cells(geometry, export_format, source=source, fetch_size=fetch_size):
+        chunk = encoder.encode(rows)
+        if chunk:
+            yield chunk
+    footer = encoder.footer()
+    if footer:
+        yield footer
+
+
+async def astream_cells(
+    geometry,
+    export_format: str,
+    threshold: float,
+    bins: List[float],
+    source: Optional[str] = None,
+    fetch_size: int = DEFAULT_FETCH_SIZE,
+) -> AsyncIterator[str]:
+    """
+    stream_cells for ASGI: rows come from aiter_clipped_cells, so each batch
+    is sent as it arrives instead of Django consuming a sync iterator whole.
+    """
+    encoder = CellEncoder(export_format, threshold, bins)
+    yield encoder.header()
+    async for rows in aiter_clipped_cells(geometry, export_format, source=source, fetch_size=fetch_size):
+        chunk = encoder.encode(rows)
+        if chunk:
+            yield chunk
+    footer = encoder.footer()
+    if footer:
+        yield footer
+
+
+def stream_stats(geometry, stats: Dict, export_format: str) -> Iterator[str]:
+    """
+    Encodes one AOI's stats: ``field,value`` CSV rows, a GeoJSON Feature of
+    the AOI with the stats as properties, or a single NDJSON line.
+    """
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["field", "value"])
+        for field in ("mean_canopy", "total_area_m2", "area_above_threshold_m2", "pixel_count", "threshold"):
+            writer.writerow([field, stats[field]])
+        for item in stats["area_by_class"]:
+            writer.writerow([f"area_m2[{item['min']:g}-{item['max']:g}]", item["area_m2"]])
+        yield buffer.getvalue()
+    elif export_format == "geojson":
+        yield json.dumps({"type": "Feature", "geometry": json.loads(geometry.geojson), "properties": stats}) + "\n"
+    else:
+        yield json.dumps(stats) + "\n"
+
+
+def gzip_stream(chunks: Iterable[str], level: int = 6) -> Iterator[bytes]:
+    """
+    Gzip-compresses a text stream on the fly.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def agzip_stream(chunks: AsyncIterable[str], level: int = 6) -> AsyncIterator[bytes]:
+    """
+    gzip_stream for async chunk streams.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,184 @@
+"""
+Forest change (loss/gain) between two sources over an AOI.
+
+Both sources are read in one index scan of the cells intersecting the AOI and
+paired on ``grid_key``, the quantised bbox centre maintained by a database
+trigger, so a cell of one dataset version meets the same cell of the other
+without a spatial self-join. Each before cell looks its partner up through
+the unique ``(source, grid_key)`` constraint, so at most one cell matches.
+Cells only one source has (e.g. grids of different resolution, or partial
+coverage) are reported as unmatched area instead of being guessed at.
+"""
+from typing import Dict, List, Sequence, Tuple
+
+from django.db import connection
+
+from canopy.serializers import DEFAULT_BINS
+from canopy.services.forest_density import clipped_area_sql
+from canopy.services.grid_storage import cell_rows_sql
+
+
+def build_change_sql() -> str:
+    """
+    Change query returning one row per (before class, after class, before
+    forest, after forest) with cell count, area, canopy-weighted areas and the
+    decreased/increased areas and canopy amounts. Classes and forest flags are
+    NULL on the side a cell is missing from.
+    """
+    cells = cell_rows_sql("ST_GeomFromEWKB(%(aoi)s)")
+    return f"""
+        WITH aoi AS (SELECT ST_GeomFromEWKB(%(aoi)s) AS geom),
+        clip AS (
+            SELECT c.grid_key, c.source, c.canopy_pct, {clipped_area_sql("aoi.geom")} AS area_m2
+            FROM {cells} c, aoi
+            WHERE c.geom && aoi.geom
+              AND ST_Intersects(c.geom, aoi.geom)
+              AND c.source IN (%(before)s, %(after)s)
+        ),
+        pairs AS (
+            SELECT b.canopy_pct AS before_pct, a.canopy_pct AS after_pct, b.area_m2
+            FROM clip b
+            LEFT JOIN {cells} a ON a.source = %(after)s AND a.grid_key = b.grid_key
+            WHERE b.source = %(before)s AND b.area_m2 > 0
+            UNION ALL
+            SELECT NULL, a.canopy_pct, a.area_m2
+            FROM clip a
+            WHERE a.source = %(after)s
+              AND a.area_m2 > 0
+              AND NOT EXISTS (
+                  SELECT 1 FROM {cells} b WHERE b.source = %(before)s AND b.grid_key = a.grid_key
+              )
+        )
+        -- width_bucket counts edges <= pct; LEAST folds 100 into the last bin.
+        SELECT
+            LEAST(width_bucket(before_pct, %(edges)s::numeric[]), %(classes)s) AS before_class,
+            LEAST(width_bucket(after_pct, %(edges)s::numeric[]), %(classes)s) AS after_class,
+            before_pct >= %(threshold)s AS before_forest,
+            after_pct >= %(threshold)s AS after_forest,
+            COUNT(*),
+            SUM(area_m2),
+            SUM(before_pct * area_m2),
+            SUM(after_pct * area_m2),
+            COALESCE(SUM(area_m2) FILTER (WHERE after_pct < before_pct), 0),
+            COALESCE(SUM(area_m2) FILTER (WHERE after_pct > before_pct), 0),
+            COALESCE(SUM((before_pct - after_pct) * area_m2) FILTER (WHERE after_pct < before_pct), 0),
+            COALESCE(SUM((after_pct - before_pct) * area_m2) FILTER (WHERE after_pct > before_pct), 0)
+        FROM pairs
+        GROUP BY 1, 2, 3, 4
+    """
+
+
+def summarize_change(rows: Sequence[Tuple], threshold: float, bin_edges: List[float]) -> Dict:
+    """
+    Folds change query rows into the change payload.
+
+    ``canopy_loss_m2``/``canopy_gain_m2`` are canopy-equivalent areas (cell
+    area times the percentage-point drop or rise), so a cell going from 80%
+    to 50% loses 30% of its area. ``forest_loss_m2``/``forest_gain_m2`` count
+    whole cells crossing ``threshold``. ``transitions[i][j]`` is the area that
+    moved from bin ``i`` to bin ``j``.
+    """
+    classes = len(bin_edges) - 1
+    transitions = [[0.0] * classes for _ in range(classes)]
+    transition_counts = [[0] * classes for _ in range(classes)]
+    totals = dict.fromkeys(
+        (
+            "matched_area_m2",
+            "before_weighted",
+            "after_weighted",
+            "decreased_area_m2",
+            "increased_area_m2",
+            "canopy_loss_m2",
+            "canopy_gain_m2",
+            "forest_before_m2",
+            "forest_after_m2",
+            "forest_loss_m2",
+            "forest_gain_m2",
+            "unmatched_before_area_m2",
+            "unmatched_after_area_m2",
+        ),
+        0.0,
+    )
+    matched_cells = 0
+
+    for row in rows:
+        before_class, after_class, before_forest, after_forest, count, area = row[:6]
+        before_weighted, after_weighted, decreased, increased, loss, gain = (float(value) for value in row[6:])
+        area = float(area)
+        if after_class is None:
+            totals["unmatched_before_area_m2"] += area
+            continue
+        if before_class is None:
+            totals["unmatched_after_area_m2"] += area
+            continue
+
+        matched_cells += count
+        transitions[before_class - 1][after_class - 1] += area
+        transition_counts[before_class - 1][after_class - 1] += count
+        totals["matched_area_m2"] += area
+        totals["before_weighted"] += before_weighted
+        totals["after_weighted"] += after_weighted
+        totals["decreased_area_m2"] += decreased
+        totals["increased_area_m2"] += increased
+        totals["canopy_loss_m2"] += loss / 100
+        totals["canopy_gain_m2"] += gain / 100
+        if before_forest:
+            totals["forest_before_m2"] += area
+        if after_forest:
+            totals["forest_after_m2"] += area
+        if before_forest and not after_forest:
+            totals["forest_loss_m2"] += area
+        if after_forest and not before_forest:
+            totals["forest_gain_m2"] += area
+
+    matched = totals["matched_area_m2"]
+    mean_before = totals["before_weighted"] / matched if matched > 0 else 0.0
+    mean_after = totals["after_weighted"] / matched if matched > 0 else 0.0
+    return {
+        "matched_area_m2": matched,
+        "matched_cell_count": matched_cells,
+        "mean_canopy_before": mean_before,
+        "mean_canopy_after": mean_after,
+        "mean_change_pct": mean_after - mean_before,
+        "decreased_area_m2": totals["decreased_area_m2"],
+        "increased_area_m2": totals["increased_area_m2"],
+        "unchanged_area_m2": matched - totals["decreased_area_m2"] - totals["increased_area_m2"],
+        "canopy_loss_m2": totals["canopy_loss_m2"],
+        "canopy_gain_m2": totals["canopy_gain_m2"],
+        "net_canopy_change_m2": totals["canopy_gain_m2"] - totals["canopy_loss_m2"],
+        "forest_before_m2": totals["forest_before_m2"],
+        "forest_after_m2": totals["forest_after_m2"],
+        "forest_loss_m2": totals["forest_loss_m2"],
+        "forest_gain_m2": totals["forest_gain_m2"],
+        "net_forest_change_m2": totals["forest_gain_m2"] - totals["forest_loss_m2"],
+        "unmatched_before_area_m2": totals["unmatched_before_area_m2"],
+        "unmatched_after_area_m2": totals["unmatched_after_area_m2"],
+        "transitions": {"area_m2": transitions, "cell_count": transition_counts},
+        "bin_edges": bin_edges,
+        "threshold": float(threshold),
+    }
+
+
+def compute_change(
+    geometry, before_source: str, after_source: str, threshold: float = 60, bins: List[float] = None
+) -> Dict:
+    """
+    Loss, gain, net change and the bin transition matrix between
+    ``before_source`` and ``after_source`` inside ``geometry``.
+    """
+    bin_edges = bins or DEFAULT_BINS
+    params = {
+        "aoi": bytes(geometry.ewkb),
+        "before": before_source,
+        "after": after_source,
+        "edges": [float(edge) for edge in bin_edges],
+        "classes": len(bin_edges) - 1,
+        "threshold": float(threshold),
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(build_change_sql(), params)
+        rows = cursor.fetchall()
+
+    payload = summarize_change(rows, threshold, bin_edges)
+    payload.update(before_source=before_source, after_source=after_source)
+    return payload
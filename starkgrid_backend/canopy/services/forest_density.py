@@ -1,9 +1,241 @@
-from decimal import Decimal
-from typing import Dict, Iterable, List, Tuple
+import time
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from itertools import accumulate
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
 
+from django.conf import settings
 from django.db import connection
 
+from canopy.models import ForestDensitySavedAOI, ForestDensitySavedAOIPiece
 from canopy.serializers import DEFAULT_BINS
+from canopy.services.async_db import get_async_pool
+from canopy.services.grid_storage import grid_cells_sql, uses_grid_storage
+from canopy.services.metrics import explain_slow_query, is_slow_query, stage
+from canopy.services.pyramid import aselect_level, cell_key_sql, select_level
+
+
+# AOIs with more vertices than this are split with ST_Subdivide before the
+# cell join so that bbox filters stay tight and each intersection test only
+# walks a small ring.
+DEFAULT_SUBDIVIDE_MAX_VERTICES = 256
+
+# Batch queries: AOIs from the %(aois)s EWKB array, always subdivided.
+BATCH_PIECES_SQL = """
+        aoi AS (
+            SELECT u.aoi_index, ST_GeomFromEWKB(u.wkb) AS geom
+            FROM unnest(%(aois)s::bytea[]) WITH ORDINALITY AS u(wkb, aoi_index)
+        ),
+        pieces AS (
+            SELECT aoi_index, ST_Subdivide(geom, %(max_vertices)s) AS geom FROM aoi
+        )
+"""
+
+# Batch queries: folds ``pairs`` (aoi_index, id, canopy_pct, area_m2) into rows.
+BATCH_FOLD_SQL = """
+        clip AS (
+            SELECT aoi_index, canopy_pct, SUM(area_m2) AS area_m2
+            FROM pairs
+            GROUP BY aoi_index, id, canopy_pct
+        )
+        SELECT aoi_index, canopy_pct, SUM(area_m2), COUNT(*), SUM(canopy_pct * area_m2)
+        FROM clip
+        WHERE area_m2 > 0
+        GROUP BY aoi_index, canopy_pct
+"""
+
+
+def clipped_area_sql(aoi: str) -> str:
+    """
+    Area of cell ``c`` inside ``aoi``: cells wholly inside contribute their
+    precomputed geodesic area; only boundary cells pay for the geography
+    intersection.
+    """
+    return f"""
+        CASE
+            WHEN ST_CoveredBy(c.geom, {aoi}) THEN c.area_m2
+            ELSE ST_Area(ST_Intersection(c.geom::geography, ({aoi})::geography))
+        END
+    """
+
+
+@lru_cache(maxsize=None)
+def build_stats_sql(use_pyramid: bool = False, subdivide: bool = False, saved: bool = False) -> str:
+    """
+    Stats query returning (canopy_pct, area_m2, cell_count, canopy_pct * area_m2) rows.
+
+    With ``use_pyramid``, aggregate cells whose envelope (grown by half a fine
+    cell) lies inside the AOI contribute their stored histograms: every fine
+    cell keyed to them is wholly inside, so its full area is exact, and those
+    cells are excluded from the clip. The remaining fine cells are found
+    through ``remainder``, the AOI minus those aggregate cells, subdivided so
+    its pieces hug the AOI edge; a cell keyed to any other aggregate cell
+    keeps part of its clip outside them, so none is missed and the interior
+    is never scanned.
+
+    With ``subdivide``, cells are joined against ST_Subdivide pieces of the
+    AOI. Pieces only share edges, so per-piece areas add up exactly; they are
+    summed per cell id first so no cell is counted twice.
+
+    With ``saved``, the AOI and its pieces are read from the saved AOI
+    ``%(aoi_id)s`` instead of the ``%(aoi)s`` EWKB; pair it with ``subdivide``
+    to join against the stored pieces.
+    """
+    ctes, target = _aoi_ctes(subdivide, saved)
+
+    cells = "canopy_forestdensitycell"
+    if use_pyramid:
+        key_x, key_y = cell_key_sql("c.geom", "%(cell_size)s")
+        ctes.append(
+            f"""
+            interior AS (
+                SELECT a.key_x, a.key_y, a.geom,
+                       a.histogram_pct, a.histogram_area, a.histogram_count, a.histogram_weighted
+                FROM canopy_forestdensityaggregatecell a, aoi
+                WHERE a.level_id = %(level)s
+                  AND a.geom && aoi.geom
+                  AND ST_CoveredBy(ST_Expand(a.geom, %(margin)s), aoi.geom)
+            ),
+            remainder AS (
+                SELECT ST_Subdivide(
+                    COALESCE(ST_Difference(aoi.geom, (SELECT ST_Union(geom) FROM interior)), aoi.geom),
+                    %(max_vertices)s
+                ) AS geom
+                FROM aoi
+            ),
+            edge AS (
+                SELECT DISTINCT ON (c.id) c.id, c.canopy_pct, c.source, c.geom, c.area_m2
+                FROM remainder r
+                JOIN canopy_forestdensitycell c ON c.geom && r.geom AND ST_Intersects(c.geom, r.geom)
+                WHERE (%(source)s::text IS NULL OR c.source = %(source)s)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM interior i
+                      WHERE i.key_x = {key_x} AND i.key_y = {key_y}
+                  )
+            )
+            """
+        )
+        cells = "edge"
+
+    ctes.append(
+        f"""
+        pairs AS (
+            SELECT c.id, c.canopy_pct, {clipped_area_sql(f"{target}.geom")} AS area_m2
+            FROM {cells} c, {target}
+            WHERE c.geom && {target}.geom
+              AND ST_Intersects(c.geom, {target}.geom)
+              AND (%(source)s::text IS NULL OR c.source = %(source)s)
+        )
+        """
+    )
+    sql = _fold_pairs_sql(ctes, subdivide)
+    if use_pyramid:
+        sql += """
+        UNION ALL
+        SELECT h.pct::numeric, SUM(h.area_m2), SUM(h.cell_count), SUM(h.weighted)
+        FROM interior,
+             unnest(histogram_pct, histogram_area, histogram_count, histogram_weighted)
+                 AS h(pct, area_m2, cell_count, weighted)
+        GROUP BY h.pct
+        """
+    return sql
+
+
+@lru_cache(maxsize=None)
+def build_batch_stats_sql() -> str:
+    """
+    Stats query for many AOIs in one pass, returning (aoi_index, canopy_pct,
+    area_m2, cell_count, weighted) rows; ``aoi_index`` is the 1-based position
+    in the ``%(aois)s`` EWKB array. AOIs are always subdivided (a no-op for
+    small ones) so one plan serves every feature. Pyramid levels are chosen
+    per AOI and are not used here.
+    """
+    return f"""
+        WITH {BATCH_PIECES_SQL},
+        pairs AS (
+            SELECT pieces.aoi_index, c.id, c.canopy_pct, {clipped_area_sql("pieces.geom")} AS area_m2
+            FROM pieces
+            JOIN canopy_forestdensitycell c
+              ON c.geom && pieces.geom AND ST_Intersects(c.geom, pieces.geom)
+            WHERE (%(source)s::text IS NULL OR c.source = %(source)s)
+        ),
+        {BATCH_FOLD_SQL}
+    """
+
+
+def _aoi_ctes(subdivide: bool, saved: bool) -> Tuple[List[str], str]:
+    """
+    The leading CTEs of a single-AOI stats query and the FROM item cells are
+    joined against: ``aoi``, plus ``pieces`` when subdividing.
+    """
+    if saved:
+        ctes = [f"aoi AS (SELECT geom FROM {ForestDensitySavedAOI._meta.db_table} WHERE id = %(aoi_id)s)"]
+        pieces = f"pieces AS (SELECT geom FROM {ForestDensitySavedAOIPiece._meta.db_table} WHERE aoi_id = %(aoi_id)s)"
+    else:
+        ctes = ["aoi AS (SELECT ST_GeomFromEWKB(%(aoi)s) AS geom)"]
+        pieces = "pieces AS (SELECT ST_Subdivide(aoi.geom, %(max_vertices)s) AS geom FROM aoi)"
+    if not subdivide:
+        return ctes, "aoi"
+    ctes.append(pieces)
+    return ctes, "pieces"
+
+
+def _fold_pairs_sql(ctes: List[str], subdivide: bool) -> str:
+    """
+    Completes a single-AOI stats query from CTEs ending in ``pairs`` (id,
+    canopy_pct, area_m2). Subdivided AOIs sum piece areas per cell first.
+    """
+    if subdivide:
+        ctes.append("clip AS (SELECT canopy_pct, SUM(area_m2) AS area_m2 FROM pairs GROUP BY id, canopy_pct)")
+    else:
+        ctes.append("clip AS (SELECT canopy_pct, area_m2 FROM pairs)")
+
+    return "WITH " + ",\n".join(ctes) + """
+        SELECT canopy_pct, SUM(area_m2) AS area_m2, COUNT(*) AS cell_count, SUM(canopy_pct * area_m2) AS weighted
+        FROM clip
+        WHERE area_m2 > 0
+        GROUP BY canopy_pct
+    """
+
+
+@lru_cache(maxsize=None)
+def build_grid_stats_sql(subdivide: bool = False, saved: bool = False) -> str:
+    """
+    build_stats_sql over compact grid cells (``FOREST_DENSITY_STORAGE = "grid"``).
+    Each AOI (or piece) reads the row/col window of its bbox; envelopes and
+    areas are derived from the grid, so the clip is the same as for stored
+    cells. Pyramid levels aggregate ForestDensityCell rows and are not used.
+    """
+    ctes, target = _aoi_ctes(subdivide, saved)
+
+    cells = grid_cells_sql(target, f"{target}.geom", carry=[f"{target}.geom AS target"])
+    ctes.append(
+        f"""
+        pairs AS (
+            SELECT c.id, c.canopy_pct, {clipped_area_sql("c.target")} AS area_m2
+            FROM ({cells}) c
+            WHERE ST_Intersects(c.geom, c.target)
+        )
+        """
+    )
+    return _fold_pairs_sql(ctes, subdivide)
+
+
+@lru_cache(maxsize=None)
+def build_grid_batch_stats_sql() -> str:
+    """
+    build_batch_stats_sql over compact grid cells.
+    """
+    cells = grid_cells_sql("pieces", "pieces.geom", carry=["pieces.aoi_index", "pieces.geom AS target"])
+    return f"""
+        WITH {BATCH_PIECES_SQL},
+        pairs AS (
+            SELECT c.aoi_index, c.id, c.canopy_pct, {clipped_area_sql("c.target")} AS area_m2
+            FROM ({cells}) c
+            WHERE ST_Intersects(c.geom, c.target)
+        ),
+        {BATCH_FOLD_SQL}
+    """
 
 
 def _pairwise_bins(edges: Iterable[float]) -> List[Tuple[float, float]]:
@@ -11,72 +243,243 @@ def _pairwise_bins(edges: Iterable[float]) -> List[Tuple[float, float]]:
     return list(zip(floats[:-1], floats[1:]))
 
 
-def compute_stats(geometry, threshold: float = 60, bins: List[float] = None) -> Dict:
+def subdivide_max_vertices() -> int:
+    """
+    AOI vertex count above which stats queries subdivide, from ``FOREST_DENSITY_SUBDIVIDE_MAX_VERTICES``.
+    """
+    return max(8, getattr(settings, "FOREST_DENSITY_SUBDIVIDE_MAX_VERTICES", DEFAULT_SUBDIVIDE_MAX_VERTICES))
+
+
+class CanopyDistribution(NamedTuple):
+    """
+    Area, cell count and canopy-weighted area per distinct ``canopy_pct``
+    (ascending), with running totals so threshold and bin lookups are bisects.
+    ``backend`` names the engine that produced it (``sql`` or ``snapshot``).
+    """
+
+    canopy_pct: List[float]
+    area_m2: List[float]
+    cell_count: List[int]
+    weighted: List[float]
+    cum_area_m2: List[float]
+    cum_cell_count: List[int]
+    cum_weighted: List[float]
+    pyramid_level: Optional[float] = None
+    backend: str = "sql"
+
+    def _total_before(self, running: List[float], index: int) -> float:
+        return running[index - 1] if index else 0.0
+
+    def area_below(self, value: float) -> float:
+        """
+        Area of cells with ``canopy_pct < value``.
+        """
+        return self._total_before(self.cum_area_m2, bisect_left(self.canopy_pct, value))
+
+    def area_through(self, value: float) -> float:
+        """
+        Area of cells with ``canopy_pct <= value``.
+        """
+        return self._total_before(self.cum_area_m2, bisect_right(self.canopy_pct, value))
+
+
+def distribution_from_rows(rows: Sequence[Tuple], pyramid_level: Optional[float] = None) -> CanopyDistribution:
+    """
+    Merges (canopy_pct, area_m2, cell_count, weighted) rows into a distribution.
+    Rows may repeat a percentage (clipped cells and pyramid histograms).
+    """
+    merged: Dict[float, List[float]] = {}
+    for canopy_pct, area_m2, count, weighted in rows:
+        entry = merged.setdefault(float(canopy_pct), [0.0, 0, 0.0])
+        entry[0] += float(area_m2 or 0)
+        entry[1] += int(count or 0)
+        entry[2] += float(weighted or 0)
+
+    pcts = sorted(merged)
+    area = [merged[pct][0] for pct in pcts]
+    count = [merged[pct][1] for pct in pcts]
+    weighted = [merged[pct][2] for pct in pcts]
+    return CanopyDistribution(
+        canopy_pct=pcts,
+        area_m2=area,
+        cell_count=count,
+        weighted=weighted,
+        cum_area_m2=list(accumulate(area)),
+        cum_cell_count=list(accumulate(count)),
+        cum_weighted=list(accumulate(weighted)),
+        pyramid_level=pyramid_level,
+    )
+
+
+def compute_distribution(
+    geometry, source: Optional[str] = None, aoi_id: Optional[int] = None
+) -> CanopyDistribution:
+    """
+    Runs the stats query for ``geometry`` and returns the canopy distribution
+    inside it. Large AOIs use the coarsest suitable pyramid level for whole
+    interior blocks and clip only boundary cells; ``pyramid_level`` records its
+    cell size in degrees (None when only fine cells were used). AOIs with more
+    than ``FOREST_DENSITY_SUBDIVIDE_MAX_VERTICES`` vertices are subdivided
+    before the cell join. With ``FOREST_DENSITY_STORAGE = "grid"`` the compact
+    grid cells are read instead and the pyramid is skipped. ``aoi_id`` names
+    the ForestDensitySavedAOI that ``geometry`` came from; its stored pieces
+    are joined instead of sending and subdividing the geometry.
+    """
+    with stage("select_level"):
+        level = None if uses_grid_storage() else select_level(geometry, source)
+    sql, params = _stats_query(geometry, source, level, aoi_id)
+    rows = _fetch_rows(sql, params)
+    with stage("fold"):
+        return distribution_from_rows(rows, pyramid_level=level.cell_size if level is not None else None)
+
+
+async def acompute_distribution(
+    geometry, source: Optional[str] = None, aoi_id: Optional[int] = None
+) -> CanopyDistribution:
+    """
+    compute_distribution on a pooled psycopg async connection, so the event
+    loop keeps serving other requests while PostGIS works.
+    """
+    with stage("select_level"):
+        level = None if uses_grid_storage() else await aselect_level(geometry, source)
+    sql, params = _stats_query(geometry, source, level, aoi_id)
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            with stage("query"):
+                started = time.perf_counter()
+                await cursor.execute(sql, params)
+                rows = await cursor.fetchall()
+                elapsed = time.perf_counter() - started
+    if is_slow_query(elapsed):
+        explain_slow_query(elapsed, sql, params)
+
+    with stage("fold"):
+        return distribution_from_rows(rows, pyramid_level=level.cell_size if level is not None else None)
+
+
+def _fetch_rows(sql: str, params) -> List[Tuple]:
+    """
+    Runs a stats query as the ``query`` stage. Queries slower than
+    ``FOREST_DENSITY_EXPLAIN_SLOW_QUERY_MS`` have their plan sampled in the
+    background (see metrics.explain_slow_query).
+    """
+    with connection.cursor() as cursor:
+        with stage("query"):
+            started = time.perf_counter()
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            elapsed = time.perf_counter() - started
+    if is_slow_query(elapsed):
+        explain_slow_query(elapsed, sql, params)
+    return rows
+
+
+def _stats_query(geometry, source: Optional[str], level, aoi_id: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+    params: Dict[str, Any] = {"source": source}
+    saved = aoi_id is not None
+    if saved:
+        # Saved AOIs always have stored pieces, so joining them costs nothing extra.
+        subdivide = True
+        params["aoi_id"] = aoi_id
+    else:
+        max_vertices = subdivide_max_vertices()
+        subdivide = geometry.num_coords > max_vertices
+        params.update(aoi=bytes(geometry.ewkb), max_vertices=max_vertices)
+    if uses_grid_storage():
+        return build_grid_stats_sql(subdivide=subdivide, saved=saved), params
+    if level is not None:
+        params.update(level=level.pk, cell_size=level.cell_size, margin=level.base_cell_size / 2)
+        params.setdefault("max_vertices", subdivide_max_vertices())
+    return build_stats_sql(use_pyramid=level is not None, subdivide=subdivide, saved=saved), params
+
+
+def compute_distributions(geometries: Sequence, source: Optional[str] = None) -> List[CanopyDistribution]:
+    """
+    Canopy distributions for many AOIs from a single query, in input order.
+    """
+    if not geometries:
+        return []
+    params = {
+        "aois": [bytes(geometry.ewkb) for geometry in geometries],
+        "source": source,
+        "max_vertices": subdivide_max_vertices(),
+    }
+    sql = build_grid_batch_stats_sql() if uses_grid_storage() else build_batch_stats_sql()
+    rows = _fetch_rows(sql, params)
+
+    grouped: List[List[Tuple]] = [[] for _ in geometries]
+    for aoi_index, *row in rows:
+        grouped[aoi_index - 1].append(row)
+    return [distribution_from_rows(aoi_rows) for aoi_rows in grouped]
+
+
+def compute_stats(
+    geometry, threshold: float = 60, bins: List[float] = None, source: Optional[str] = None
+) -> Dict:
     """
     Compute canopy statistics for a given polygon geometry.
     Returns mean canopy, total area, area above threshold, and area by bins.
+    See compute_distribution for how the query is planned.
     """
-    bin_edges = bins or DEFAULT_BINS
-    bin_pairs = _pairwise_bins(bin_edges)
+    return summarize_distribution(compute_distribution(geometry, source), threshold, bins or DEFAULT_BINS)
 
-    geom_wkb = geometry.ewkb
 
-    with connection.cursor() as cursor:
-        cursor.execute(
-            """
-            WITH clip AS (
-                SELECT
-                    canopy_pct,
-                    ST_Area(
-                        ST_Intersection(
-                            geom::geography,
-                            ST_GeomFromEWKB(%s)::geography
-                        )
-                    ) AS area_m2
-                FROM canopy_forestdensitycell
-                WHERE geom && ST_GeomFromEWKB(%s)
-                  AND ST_Intersects(geom, ST_GeomFromEWKB(%s))
-            )
-            SELECT canopy_pct, SUM(area_m2) AS area_m2, COUNT(*) AS cell_count
-            FROM clip
-            WHERE area_m2 > 0
-            GROUP BY canopy_pct
-            """,
-            [geom_wkb, geom_wkb, geom_wkb],
-        )
-        rows = cursor.fetchall()
-
-    total_area = 0.0
-    weighted_sum = 0.0
-    area_above_threshold = 0.0
-    pixel_count = 0
-
-    # Collect area grouped by canopy_pct to aggregate into bins.
-    pct_area_pairs: List[Tuple[float, float]] = []
-
-    for canopy_pct, area_m2, count in rows:
-        canopy_val = float(canopy_pct)
-        area_val = float(area_m2 or 0)
-        total_area += area_val
-        weighted_sum += area_val * canopy_val
-        if canopy_val >= float(threshold):
-            area_above_threshold += area_val
-        pixel_count += int(count or 0)
-        pct_area_pairs.append((canopy_val, area_val))
+async def acompute_stats(
+    geometry, threshold: float = 60, bins: List[float] = None, source: Optional[str] = None
+) -> Dict:
+    """
+    Async compute_stats for the ASGI views.
+    """
+    distribution = await acompute_distribution(geometry, source)
+    return summarize_distribution(distribution, threshold, bins or DEFAULT_BINS)
+
+
+def summarize_distribution(distribution: CanopyDistribution, threshold: float, bin_edges: List[float]) -> Dict:
+    """
+    Builds the stats payload from a distribution without touching the database.
+    Bins are half-open ``[min, max)`` except the last, which includes its upper edge.
+    """
+    bin_pairs = _pairwise_bins(bin_edges)
+    total_area = float(distribution.cum_area_m2[-1]) if distribution.canopy_pct else 0.0
+    weighted_sum = float(distribution.cum_weighted[-1]) if distribution.canopy_pct else 0.0
 
     area_by_class: List[Dict[str, float]] = []
-    for low, high in bin_pairs:
-        area_bin = sum(area for pct, area in pct_area_pairs if low <= pct < high)
-        area_by_class.append({"min": low, "max": high, "area_m2": area_bin})
+    for index, (low, high) in enumerate(bin_pairs):
+        upper = distribution.area_through(high) if index == len(bin_pairs) - 1 else distribution.area_below(high)
+        area_by_class.append({"min": low, "max": high, "area_m2": upper - distribution.area_below(low)})
 
     mean_canopy = weighted_sum / total_area if total_area > 0 else 0.0
 
     return {
         "mean_canopy": mean_canopy,
         "total_area_m2": total_area,
-        "area_above_threshold_m2": area_above_threshold,
+        "area_above_threshold_m2": total_area - distribution.area_below(float(threshold)),
         "area_by_class": area_by_class,
-        "pixel_count": pixel_count,
+        "pixel_count": int(distribution.cum_cell_count[-1]) if distribution.canopy_pct else 0,
         "bin_edges": bin_edges,
         "threshold": float(threshold),
+        "pyramid_level": distribution.pyramid_level,
+        "backend": distribution.backend,
     }
+
+
+def distribution_payload(distribution: CanopyDistribution) -> Dict[str, Any]:
+    """
+    Compact per-``canopy_pct`` histogram with running totals for clients that
+    re-threshold locally.
+    """
+    return {
+        "canopy_pct": distribution.canopy_pct,
+        "area_m2": distribution.area_m2,
+        "cum_area_m2": distribution.cum_area_m2,
+        "cell_count": distribution.cell_count,
+        "cum_cell_count": distribution.cum_cell_count,
+    }
+
+
+def summarize_rows(rows: Sequence[Tuple], threshold: float, bin_edges: List[float]) -> Dict:
+    """
+    Folds (canopy_pct, area_m2, cell_count, weighted) rows into the stats payload.
+    """
+    return summarize_distribution(distribution_from_rows(rows), threshold, bin_edges)
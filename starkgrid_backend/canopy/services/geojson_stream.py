@@ -0,0 +1,120 @@
+import json
+from typing import Any, Dict, Iterator, TextIO
+
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class _BufferedReader:
+    """
+    Sliding text window over a file handle. Consumed text is discarded on
+    each refill, so memory stays at roughly one chunk plus one JSON value.
+    """
+
+    def __init__(self, handle: TextIO, chunk_size: int):
+        self.handle = handle
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size: int) -> bool:
+        if self.eof:
+            return False
+        chunk = self.handle.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill(self.chunk_size):
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed GeoJSON: expected {char!r}, found {found or 'end of file'!r}.")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                obj, end = _DECODER.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as exc:
+                # Most likely the value continues past the buffer; read more
+                # (doubling so very large features are not re-parsed too often).
+                if not self.fill(size):
+                    raise ValueError(f"Malformed GeoJSON: {exc}") from exc
+                size *= 2
+                continue
+            # A number ending exactly at the buffer edge may be truncated.
+            if end == len(self.buffer) and self.fill(size):
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_geojson_features(handle: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Incrementally yields features from a GeoJSON FeatureCollection (or a
+    single Feature) without loading the whole document. Only one feature is
+    held in memory at a time, so multi-GB exports parse in bounded memory.
+    Raises ValueError for malformed or non-feature documents.
+    """
+    reader = _BufferedReader(handle, chunk_size)
+    reader.expect("{")
+    members: Dict[str, Any] = {}
+
+    if reader.peek() == "}":
+        reader.pos += 1
+    else:
+        while True:
+            key = reader.value()
+            if not isinstance(key, str):
+                raise ValueError("Malformed GeoJSON: object keys must be strings.")
+            reader.expect(":")
+
+            if key == "features":
+                if members.get("type", "FeatureCollection") != "FeatureCollection":
+                    raise ValueError("Unrecognized GeoJSON structure; expected Feature or FeatureCollection.")
+                members["type"] = "FeatureCollection"
+                reader.expect("[")
+                if reader.peek() == "]":
+                    reader.pos += 1
+                else:
+                    while True:
+                        yield reader.value()
+                        separator = reader.peek()
+                        reader.pos += 1
+                        if separator == "]":
+                            break
+                        if separator != ",":
+                            raise ValueError("Malformed GeoJSON: expected ',' or ']' in features array.")
+            else:
+                members[key] = reader.value()
+
+            separator = reader.peek()
+            reader.pos += 1
+            if separator == "}":
+                break
+            if separator != ",":
+                raise ValueError("Malformed GeoJSON: expected ',' or '}' in object.")
+
+    doc_type = members.get("type")
+    if doc_type == "Feature":
+        yield members
+    elif doc_type != "FeatureCollection":
+        raise ValueError("Unrecognized GeoJSON structure; expected Feature or FeatureCollection.")
@@ -0,0 +1,291 @@
+"""
+In-process stats engine over memory-mapped grid snapshots.
+
+A snapshot rasterises the cells of one source onto a regular lon/lat grid
+(the COG grid, see cog.grid_spec) and stores it as plain ``.npy`` files:
+
+* ``canopy.npy``: uint16 canopy_pct * 100 per pixel (NODATA where no cell),
+  which is exact for the table's two-decimal percentages;
+* ``row_area.npy``: geodesic (WGS84) area of one pixel in each row;
+* ``meta.json``: grid origin, cell size and the dataset version it was built from.
+
+Workers open the arrays with ``mmap_mode="r"``, so every process on a host
+shares the same page-cache pages instead of holding its own copy. An AOI is
+answered by rasterising it (supersampled) over its bbox window into per-pixel
+coverage fractions and reducing ``coverage * row_area`` with ``np.bincount``
+per canopy value; no database round trip is needed.
+
+Snapshots live in ``<FOREST_DENSITY_SNAPSHOT_DIR>/<source>/<build>/`` and a
+``current`` file names the live build; it is swapped with ``os.replace``, so
+readers switch atomically and old builds can be unlinked while still mapped.
+Builders publish under a per-source lock file: ``meta.json`` is written, the
+pointer swapped and superseded builds removed in one step, so a build without
+``meta.json`` is still being written and is never removed by another builder.
+"""
+import fcntl
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+from itertools import accumulate
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from rasterio.features import rasterize
+from rasterio.transform import from_origin
+
+from canopy.services.cog import GridSpec, burn_cells, grid_spec, iter_cell_bounds
+from canopy.services.forest_density import CanopyDistribution
+from canopy.services.tile_cache import source_dir_name
+
+
+NODATA = np.iinfo(np.uint16).max
+PCT_SCALE = 100
+PCT_VALUES = 100 * PCT_SCALE + 1
+
+# AOIs are rasterised at up to DEFAULT_SUPERSAMPLE x DEFAULT_SUPERSAMPLE
+# samples per pixel; the factor drops for large windows so that at most
+# FOREST_DENSITY_SNAPSHOT_MAX_SAMPLES samples are rasterised at once.
+DEFAULT_SUPERSAMPLE = 8
+DEFAULT_MAX_SAMPLES = 4_000_000
+
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+
+CURRENT = "current"
+LOCK = ".lock"
+
+
+class SnapshotUnavailable(Exception):
+    """
+    No snapshot has been built for the source, or it predates the last load.
+    """
+
+
+class GridSnapshot(NamedTuple):
+    grid: GridSpec
+    canopy: np.ndarray
+    row_area: np.ndarray
+    source: Optional[str]
+    dataset_version: int
+    path: Path
+
+
+def snapshot_dir() -> Path:
+    return Path(getattr(settings, "FOREST_DENSITY_SNAPSHOT_DIR", Path(settings.BASE_DIR) / "snapshots"))
+
+
+def _max_samples() -> int:
+    return max(1, getattr(settings, "FOREST_DENSITY_SNAPSHOT_MAX_SAMPLES", DEFAULT_MAX_SAMPLES))
+
+
+def row_areas(grid: GridSpec) -> np.ndarray:
+    """
+    Geodesic area (m²) of one pixel per grid row: the WGS84 ellipsoid area of
+    a ``res_x`` wide quadrangle between the row's bounding latitudes.
+    """
+    e2 = WGS84_F * (2 - WGS84_F)
+    e = math.sqrt(e2)
+    b = WGS84_A * (1 - WGS84_F)
+    edges = np.radians(np.clip(grid.north - np.arange(grid.height + 1) * grid.res_y, -90.0, 90.0))
+    sin = np.sin(edges)
+    authalic = sin / (1 - e2 * sin ** 2) + np.log((1 + e * sin) / (1 - e * sin)) / (2 * e)
+    return b ** 2 * math.radians(grid.res_x) / 2 * (authalic[:-1] - authalic[1:])
+
+
+def build_snapshot(
+    source: Optional[str], dataset_version: int, resolution: Optional[float] = None
+) -> Optional[Tuple[Path, GridSpec]]:
+    """
+    Rasterises the cells of ``source`` (all sources when None) into a new
+    snapshot and makes it current. ``dataset_version`` is the version of the
+    source read before the cells; stats refuse the snapshot once it changes.
+    Returns the build directory and grid, or None when there are no cells.
+    """
+    grid = grid_spec(source, resolution)
+    if grid is None:
+        return None
+
+    source_root = snapshot_dir() / source_dir_name(source)
+    source_root.mkdir(parents=True, exist_ok=True)
+    build = Path(tempfile.mkdtemp(dir=source_root, prefix=time.strftime("%Y%m%dT%H%M%S-")))
+    try:
+        canopy = np.lib.format.open_memmap(
+            build / "canopy.npy", mode="w+", dtype=np.uint16, shape=(grid.height, grid.width)
+        )
+        canopy[:] = NODATA
+        for cells in iter_cell_bounds(source):
+            values = np.clip(np.rint(cells[:, 4] * PCT_SCALE), 0, 100 * PCT_SCALE).astype(np.uint16)
+            burn_cells(canopy, grid, cells, values=values)
+        canopy.flush()
+        del canopy
+
+        np.save(build / "row_area.npy", row_areas(grid))
+        meta = {**grid._asdict(), "source": source, "dataset_version": dataset_version}
+        _publish(source_root, build, meta)
+    except BaseException:
+        shutil.rmtree(build, ignore_errors=True)
+        raise
+    return build, grid
+
+
+def _publish(source_root: Path, build: Path, meta: Dict) -> None:
+    """
+    Marks ``build`` finished, makes it current and removes the finished
+    builds it supersedes, holding the source's lock file throughout.
+    """
+    with open(source_root / LOCK, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            (build / "meta.json").write_text(json.dumps({**meta, "built_at": time.time()}))
+            handle, temp_path = tempfile.mkstemp(dir=source_root, suffix=".tmp")
+            with os.fdopen(handle, "w") as pointer:
+                pointer.write(build.name)
+            os.replace(temp_path, source_root / CURRENT)
+
+            # Builds in progress have no meta.json yet. Workers still mapping an
+            # old build keep their pages until they reload.
+            for old in source_root.iterdir():
+                if old.is_dir() and old != build and (old / "meta.json").exists():
+                    shutil.rmtree(old, ignore_errors=True)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+_snapshots: Dict[str, Tuple[Tuple[int, int], GridSnapshot]] = {}
+_snapshots_lock = threading.Lock()
+
+
+def load_snapshot(source: Optional[str] = None) -> Optional[GridSnapshot]:
+    """
+    The current snapshot of ``source``, mapped read-only. Mappings are kept
+    per process and reopened when the ``current`` pointer is replaced.
+    """
+    name = source_dir_name(source)
+    pointer = snapshot_dir() / name / CURRENT
+    try:
+        stat = pointer.stat()
+    except FileNotFoundError:
+        return None
+    stamp = (stat.st_ino, stat.st_mtime_ns)
+
+    cached = _snapshots.get(name)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with _snapshots_lock:
+        try:
+            snapshot = _open_build(pointer)
+        except FileNotFoundError:
+            # A newer build was published, and this one removed, after the pointer was read.
+            snapshot = _open_build(pointer)
+        _snapshots[name] = (stamp, snapshot)
+    return snapshot
+
+
+def _open_build(pointer: Path) -> GridSnapshot:
+    build = pointer.parent / pointer.read_text().strip()
+    meta = json.loads((build / "meta.json").read_text())
+    return GridSnapshot(
+        grid=GridSpec(**{field: meta[field] for field in GridSpec._fields}),
+        canopy=np.load(build / "canopy.npy", mmap_mode="r"),
+        row_area=np.load(build / "row_area.npy", mmap_mode="r"),
+        source=meta["source"],
+        dataset_version=meta["dataset_version"],
+        path=build,
+    )
+
+
+def _window(grid: GridSpec, extent: Tuple[float, float, float, float]) -> Tuple[int, int, int, int]:
+    xmin, ymin, xmax, ymax = extent
+    col0 = max(0, math.floor((xmin - grid.west) / grid.res_x))
+    col1 = min(grid.width, math.ceil((xmax - grid.west) / grid.res_x))
+    row0 = max(0, math.floor((grid.north - ymax) / grid.res_y))
+    row1 = min(grid.height, math.ceil((grid.north - ymin) / grid.res_y))
+    return row0, row1, col0, col1
+
+
+def snapshot_window(snapshot: GridSnapshot, extent: Tuple[float, float, float, float]) -> Tuple[GridSpec, np.ndarray]:
+    """
+    The pixels of ``snapshot`` covering ``extent`` as a sub-grid and a
+    read-only view of their scaled canopy values.
+    """
+    grid = snapshot.grid
+    row0, row1, col0, col1 = _window(grid, extent)
+    window = GridSpec(
+        west=grid.west + col0 * grid.res_x,
+        north=grid.north - row0 * grid.res_y,
+        res_x=grid.res_x,
+        res_y=grid.res_y,
+        width=max(0, col1 - col0),
+        height=max(0, row1 - row0),
+    )
+    return window, snapshot.canopy[row0:max(row0, row1), col0:max(col0, col1)]
+
+
+def snapshot_distribution(snapshot: GridSnapshot, geometry) -> CanopyDistribution:
+    """
+    Canopy distribution of ``geometry`` (EPSG:4326) from a snapshot. Pixels
+    are weighted by the fraction of their supersamples inside the AOI, so
+    ``cell_count`` counts pixels touched by the AOI, like the SQL path counts
+    cells with a positive clipped area.
+    """
+    grid = snapshot.grid
+    row0, row1, col0, col1 = _window(grid, geometry.extent)
+    area = np.zeros(PCT_VALUES)
+    count = np.zeros(PCT_VALUES, dtype=np.int64)
+
+    if row1 > row0 and col1 > col0:
+        shapes = [json.loads(geometry.geojson)]
+        cols = col1 - col0
+        budget = _max_samples()
+        factor = int(max(1, min(DEFAULT_SUPERSAMPLE, math.sqrt(budget / ((row1 - row0) * cols)))))
+        strip = max(1, budget // (cols * factor * factor))
+
+        for row in range(row0, row1, strip):
+            rows = min(strip, row1 - row)
+            transform = from_origin(
+                grid.west + col0 * grid.res_x, grid.north - row * grid.res_y, grid.res_x / factor, grid.res_y / factor
+            )
+            mask = rasterize(shapes, out_shape=(rows * factor, cols * factor), transform=transform, dtype=np.uint8)
+            coverage = mask.reshape(rows, factor, cols, factor).sum(axis=(1, 3), dtype=np.uint16)
+
+            values = snapshot.canopy[row:row + rows, col0:col1]
+            inside = (coverage > 0) & (values != NODATA)
+            weights = coverage * (snapshot.row_area[row:row + rows, np.newaxis] / (factor * factor))
+            area += np.bincount(values[inside], weights=weights[inside], minlength=PCT_VALUES)
+            count += np.bincount(values[inside], minlength=PCT_VALUES)
+
+    present = np.flatnonzero(count)
+    pcts = present / PCT_SCALE
+    areas = area[present]
+    weighted = areas * pcts
+    return CanopyDistribution(
+        canopy_pct=pcts.tolist(),
+        area_m2=areas.tolist(),
+        cell_count=count[present].tolist(),
+        weighted=weighted.tolist(),
+        cum_area_m2=list(accumulate(areas.tolist())),
+        cum_cell_count=list(accumulate(count[present].tolist())),
+        cum_weighted=list(accumulate(weighted.tolist())),
+        backend="snapshot",
+    )
+
+
+def compute_snapshot_distribution(geometry, source: Optional[str], dataset_version: int) -> CanopyDistribution:
+    """
+    Answers an AOI from the current snapshot of ``source``. Raises
+    SnapshotUnavailable when there is none or it was built from an older
+    ``dataset_version``, so callers can fall back to the SQL path.
+    """
+    snapshot = load_snapshot(source)
+    if snapshot is None:
+        raise SnapshotUnavailable(f"No grid snapshot for {source or 'all sources'}.")
+    if snapshot.dataset_version != dataset_version:
+        raise SnapshotUnavailable(f"Grid snapshot for {source or 'all sources'} is stale.")
+    return snapshot_distribution(snapshot, geometry)
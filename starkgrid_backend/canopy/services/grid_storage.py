@@ -0,0 +1,291 @@
+"""
+Compact grid-keyed storage for canopy cells.
+
+``ForestDensityGridCell`` rows hold only a row/col on a registered
+``ForestDensityGrid``, the canopy percentage in hundredths and lookup ids for
+the source and tile. Envelopes and geodesic areas are derived on demand by the
+``canopy_grid_cell_envelope`` / ``canopy_grid_cell_area`` SQL functions (see
+migration 0007), and a bbox becomes a row/col range on the
+(grid, row, col, source) btree, so no GIST index is needed.
+
+``FOREST_DENSITY_STORAGE = "grid"`` switches every cell reader to this layout:
+the stats and vector tile queries through grid_cells_sql, and the COG,
+snapshot, export, change and fragmentation reads through cell_rows_sql.
+Loaders keep writing ForestDensityCell rows; compact_cells converts them (see
+the compact_forest_density command), and once a source is compacted the
+loaders re-sync the tiles they wrote with sync_grid_cells.
+"""
+from typing import Dict, Iterable, NamedTuple, Optional, Set
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from canopy.models import (
+    ForestDensityCell,
+    ForestDensityGrid,
+    ForestDensityGridCell,
+    ForestDensitySource,
+    ForestDensitySourceTile,
+)
+
+
+STORAGE_CELLS = "cells"
+STORAGE_GRID = "grid"
+STORAGE_LAYOUTS = (STORAGE_CELLS, STORAGE_GRID)
+DEFAULT_STORAGE = STORAGE_CELLS
+
+CANOPY_SCALE = 100
+
+# A ForestDensityCell converts to (row, col) only if each bbox edge lies
+# within this fraction of a grid cell of the matching grid line.
+ALIGNMENT_TOLERANCE = 1e-3
+
+
+class CompactResult(NamedTuple):
+    converted: int
+    skipped: int
+
+
+def storage_layout() -> str:
+    """
+    The cell layout the stats and tile queries read, from ``FOREST_DENSITY_STORAGE``.
+    """
+    layout = getattr(settings, "FOREST_DENSITY_STORAGE", DEFAULT_STORAGE)
+    if layout not in STORAGE_LAYOUTS:
+        raise ValueError(f"FOREST_DENSITY_STORAGE must be one of {', '.join(STORAGE_LAYOUTS)}, not {layout!r}.")
+    return layout
+
+
+def uses_grid_storage() -> bool:
+    return storage_layout() == STORAGE_GRID
+
+
+GRID_CELL_COLUMNS = f"""
+    gc.id,
+    gc.canopy / {CANOPY_SCALE}.0 AS canopy_pct,
+    s.name AS source,
+    t.name AS tile_id,
+    canopy_grid_cell_envelope(g.west, g.north, g.cell_size, gc.row, gc.col) AS geom,
+    canopy_grid_cell_area(g.north, g.cell_size, gc.row) AS area_m2
+"""
+
+# The grid_key trigger formula of migration 0005, over the bounds of the cell
+# envelope (see canopy_grid_cell_envelope in migration 0007).
+GRID_CELL_KEY_SQL = """
+    round(((g.west + gc.col * g.cell_size + g.west + (gc.col + 1) * g.cell_size) / 2 + 180) * 1e5)::bigint * 100000000
+    + round(((g.north - (gc.row + 1) * g.cell_size + g.north - gc.row * g.cell_size) / 2 + 90) * 1e5)::bigint
+"""
+
+
+def _grid_window_sql(geom: str) -> str:
+    """
+    Join conditions limiting ``gc`` to the row/col window of ``geom``'s bbox.
+    The bounds are cast to int so the (grid, row, col, source) btree serves
+    the range scan.
+    """
+    return f"""
+         AND gc.row BETWEEN floor((g.north - ST_YMax({geom})) / g.cell_size)::int
+                        AND floor((g.north - ST_YMin({geom})) / g.cell_size)::int
+         AND gc.col BETWEEN floor((ST_XMin({geom}) - g.west) / g.cell_size)::int
+                        AND floor((ST_XMax({geom}) - g.west) / g.cell_size)::int
+    """
+
+
+def grid_cells_sql(target: str, geom: str, carry: Iterable[str] = ()) -> str:
+    """
+    SELECT over the compact cells in the row/col window of ``geom``'s bbox,
+    for every row of ``target`` (a FROM item that ``geom`` refers to). Rows
+    have the ForestDensityCell columns the queries use: id, canopy_pct,
+    source, tile_id, geom and area_m2, preceded by the ``carry`` expressions.
+    Filters on ``%(source)s`` when it is not NULL. Each source is read from
+    its own grid only.
+    """
+    columns = "".join(f"{expression}, " for expression in carry)
+    return f"""
+        SELECT {columns}{GRID_CELL_COLUMNS}
+        FROM {target}
+        CROSS JOIN {ForestDensitySource._meta.db_table} s
+        JOIN {ForestDensityGrid._meta.db_table} g ON g.id = s.grid_id
+        JOIN {ForestDensityGridCell._meta.db_table} gc
+          ON gc.grid_id = g.id
+         AND gc.source_id = s.id
+         {_grid_window_sql(geom)}
+        JOIN {ForestDensitySourceTile._meta.db_table} t ON t.id = gc.tile_id
+        WHERE (%(source)s::text IS NULL OR s.name = %(source)s)
+    """
+
+
+def cell_rows_sql(geom: Optional[str] = None, layout: Optional[str] = None) -> str:
+    """
+    FROM item (the caller adds the alias) with the ForestDensityCell columns
+    id, canopy_pct, source, tile_id, grid_key, geom and area_m2, read from
+    ``layout`` (the configured one by default). In the grid layout ``geom``,
+    an expression that does not refer to other FROM items, limits the read
+    to its row/col window. Callers filter on source and geometry themselves.
+    """
+    if (layout or storage_layout()) == STORAGE_CELLS:
+        return ForestDensityCell._meta.db_table
+    window = _grid_window_sql(geom) if geom else ""
+    return f"""(
+        SELECT {GRID_CELL_COLUMNS}, {GRID_CELL_KEY_SQL} AS grid_key
+        FROM {ForestDensitySource._meta.db_table} s
+        JOIN {ForestDensityGrid._meta.db_table} g ON g.id = s.grid_id
+        JOIN {ForestDensityGridCell._meta.db_table} gc
+          ON gc.grid_id = g.id
+         AND gc.source_id = s.id
+         {window}
+        JOIN {ForestDensitySourceTile._meta.db_table} t ON t.id = gc.tile_id
+    )"""
+
+
+def _aligned_cells_sql(tiles: bool = False) -> str:
+    """
+    ForestDensityCell rows (of ``%(source)s`` unless NULL, and of the tile
+    ids ``%(tiles)s`` with ``tiles``) that are exactly one cell of grid
+    ``%(grid)s``, with their row and col.
+    """
+    tile_clause = "AND c.tile_id = ANY(%(tiles)s)" if tiles else ""
+    return f"""
+        SELECT c.id, c.source, c.tile_id, c.canopy_pct, placed.row, placed.col
+        FROM {ForestDensityCell._meta.db_table} c
+        JOIN {ForestDensityGrid._meta.db_table} g ON g.id = %(grid)s
+        CROSS JOIN LATERAL (
+            SELECT round((g.north - ST_YMax(c.geom)) / g.cell_size)::int AS row,
+                   round((ST_XMin(c.geom) - g.west) / g.cell_size)::int AS col
+        ) AS placed
+        WHERE (%(source)s::text IS NULL OR c.source = %(source)s)
+          {tile_clause}
+          AND placed.row BETWEEN 0 AND g.height - 1
+          AND placed.col BETWEEN 0 AND g.width - 1
+          AND abs(ST_XMin(c.geom) - (g.west + placed.col * g.cell_size)) <= %(tolerance)s * g.cell_size
+          AND abs(ST_XMax(c.geom) - (g.west + (placed.col + 1) * g.cell_size)) <= %(tolerance)s * g.cell_size
+          AND abs(ST_YMax(c.geom) - (g.north - placed.row * g.cell_size)) <= %(tolerance)s * g.cell_size
+          AND abs(ST_YMin(c.geom) - (g.north - (placed.row + 1) * g.cell_size)) <= %(tolerance)s * g.cell_size
+          AND ST_Area(c.geom) >= (1 - %(tolerance)s) * g.cell_size * g.cell_size
+    """
+
+
+def _upsert_grid_cells_sql(tiles: bool = False) -> str:
+    """
+    Upserts the aligned cells (see _aligned_cells_sql) into grid ``%(grid)s``.
+    """
+    source_table = ForestDensitySource._meta.db_table
+    tile_table = ForestDensitySourceTile._meta.db_table
+    return f"""
+        INSERT INTO {ForestDensityGridCell._meta.db_table} (grid_id, source_id, tile_id, row, col, canopy)
+        SELECT %(grid)s, s.id, t.id, aligned.row, aligned.col, round(aligned.canopy_pct * {CANOPY_SCALE})::smallint
+        FROM ({_aligned_cells_sql(tiles)}) AS aligned
+        JOIN {source_table} s ON s.name = aligned.source
+        JOIN {tile_table} t ON t.source_id = s.id AND t.name = aligned.tile_id
+        ON CONFLICT (grid_id, row, col, source_id)
+        DO UPDATE SET canopy = EXCLUDED.canopy, tile_id = EXCLUDED.tile_id
+    """
+
+
+def compact_cells(grid: ForestDensityGrid, source: Optional[str] = None, delete: bool = False) -> CompactResult:
+    """
+    Converts the ForestDensityCell rows of ``source`` (all sources when None)
+    that line up with ``grid`` into ForestDensityGridCell rows, upserting on
+    (grid, row, col, source). Cells that are not exactly one grid cell are
+    skipped and counted. With ``delete``, converted rows are removed from the
+    ForestDensityCell table in the same transaction.
+
+    A source is compacted onto one grid: the first compaction assigns it,
+    and raises ValueError if a source is already on another grid.
+    """
+    cell_table = ForestDensityCell._meta.db_table
+    source_table = ForestDensitySource._meta.db_table
+    tile_table = ForestDensitySourceTile._meta.db_table
+    params = {"grid": grid.pk, "source": source, "tolerance": ALIGNMENT_TOLERANCE}
+    source_clause = "(%(source)s::text IS NULL OR c.source = %(source)s)"
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"SELECT DISTINCT c.source FROM {cell_table} c WHERE {source_clause}", params)
+        names = [row[0] for row in cursor.fetchall()]
+        ForestDensitySource.objects.bulk_create(
+            [ForestDensitySource(name=name) for name in names], ignore_conflicts=True
+        )
+        elsewhere = (
+            ForestDensitySource.objects.filter(name__in=names, grid__isnull=False)
+            .exclude(grid=grid)
+            .select_related("grid")
+        )
+        if elsewhere:
+            listed = ", ".join(f"{item.name} (on {item.grid.name})" for item in elsewhere)
+            raise ValueError(f"Sources are already compacted onto another grid: {listed}.")
+        ForestDensitySource.objects.filter(name__in=names, grid__isnull=True).update(grid=grid)
+        cursor.execute(
+            f"""
+            INSERT INTO {tile_table} (source_id, name)
+            SELECT DISTINCT s.id, c.tile_id
+            FROM {cell_table} c
+            JOIN {source_table} s ON s.name = c.source
+            WHERE {source_clause}
+            ON CONFLICT (source_id, name) DO NOTHING
+            """,
+            params,
+        )
+        cursor.execute(_upsert_grid_cells_sql(), params)
+        converted = cursor.rowcount
+        if delete:
+            cursor.execute(
+                f"DELETE FROM {cell_table} WHERE id IN (SELECT aligned.id FROM ({_aligned_cells_sql()}) AS aligned)",
+                params,
+            )
+            cursor.execute(f"SELECT COUNT(*) FROM {cell_table} c WHERE {source_clause}", params)
+            skipped = cursor.fetchone()[0]
+        else:
+            cursor.execute(f"SELECT COUNT(*) FROM {cell_table} c WHERE {source_clause}", params)
+            skipped = cursor.fetchone()[0] - converted
+    return CompactResult(converted=converted, skipped=skipped)
+
+
+def sync_grid_cells(tiles: Dict[str, Set[str]]) -> CompactResult:
+    """
+    Brings the compact cells of ``tiles`` (source -> tile ids) in line with
+    ForestDensityCell after a load, for sources already compacted onto a
+    grid. Their grid cells in those tiles are deleted and the aligned cells
+    re-inserted, so cells a reload removed disappear as well. Loaders call
+    this before sending cells_loaded, so nothing is cached under the new
+    dataset version from the old compact cells. Other sources are left to
+    compact_cells.
+    """
+    tile_table = ForestDensitySourceTile._meta.db_table
+    converted = skipped = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        for source in ForestDensitySource.objects.filter(name__in=list(tiles), grid__isnull=False):
+            params = {
+                "grid": source.grid_id,
+                "source": source.name,
+                "source_id": source.pk,
+                "tiles": sorted(tiles[source.name]),
+                "tolerance": ALIGNMENT_TOLERANCE,
+            }
+            cursor.execute(
+                f"""
+                INSERT INTO {tile_table} (source_id, name)
+                SELECT %(source_id)s, unnest(%(tiles)s::text[])
+                ON CONFLICT (source_id, name) DO NOTHING
+                """,
+                params,
+            )
+            cursor.execute(
+                f"""
+                DELETE FROM {ForestDensityGridCell._meta.db_table} gc
+                USING {tile_table} t
+                WHERE t.id = gc.tile_id AND t.source_id = %(source_id)s AND t.name = ANY(%(tiles)s)
+                """,
+                params,
+            )
+            cursor.execute(_upsert_grid_cells_sql(tiles=True), params)
+            synced = cursor.rowcount
+            cursor.execute(
+                f"""
+                SELECT COUNT(*) FROM {ForestDensityCell._meta.db_table} c
+                WHERE c.source = %(source)s AND c.tile_id = ANY(%(tiles)s)
+                """,
+                params,
+            )
+            converted += synced
+            skipped += cursor.fetchone()[0] - synced
+    return CompactResult(converted=converted, skipped=skipped)
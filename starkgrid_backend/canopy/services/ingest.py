@@ -0,0 +1,461 @@
+import hashlib
+import json
+import struct
+import sys
+import time
+from itertools import chain
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import connection, transaction
+from django.utils import timezone
+
+from canopy.models import ForestDensityCell, ForestDensityTile
+
+
+TARGET_SRID = 4326
+WKB_POLYGON = 3
+EWKB_SRID_FLAG = 0x20000000
+
+COPY_COLUMNS = ("geom", "canopy_pct", "source", "tile_id", "updated_at")
+# Cells are unique per (source, grid_key); loads update matching cells in place.
+UPSERT_FIELDS = ("geom", "canopy_pct", "tile_id", "updated_at")
+STAGE_TABLE = "canopy_forestdensitycell_stage"
+# Little-endian Polygon EWKB with an SRID, as written by the encoders below.
+POLYGON_EWKB_PREFIX = struct.pack("<BI", 1, WKB_POLYGON | EWKB_SRID_FLAG)
+
+TileKey = Tuple[str, str]
+# Lon/lat (xmin, ymin, xmax, ymax).
+Extent = Tuple[float, float, float, float]
+
+
+class CellRow(NamedTuple):
+    """
+    A forest density cell ready to be written: geometry as EWKB hex in EPSG:4326.
+    """
+
+    geom_hex: str
+    canopy_pct: float
+    source: str
+    tile_id: str
+
+
+class SkipFeature(ValueError):
+    """
+    Raised for input features that cannot be turned into a cell row.
+    """
+
+
+def feature_to_row(
+    feature: Dict[str, Any],
+    source_override: Optional[str],
+    tile_field: str,
+    canopy_field: str,
+    srid: int = TARGET_SRID,
+) -> CellRow:
+    """
+    Converts a GeoJSON feature into a CellRow, raising SkipFeature when it is unusable.
+    """
+    geom = feature.get("geometry")
+    if not geom:
+        raise SkipFeature("Skipping feature with no geometry.")
+
+    props: Dict[str, Any] = feature.get("properties") or {}
+    canopy_pct = props.get(canopy_field)
+    if canopy_pct is None:
+        raise SkipFeature("Skipping feature with no canopy percentage value.")
+
+    row_source, tile_id = feature_tile_key(feature, source_override, tile_field)
+
+    try:
+        geom_hex = polygon_to_ewkb_hex(geom, srid=srid)
+    except Exception as exc:  # pragma: no cover - safety net
+        raise SkipFeature(f"Skipping invalid geometry: {exc}") from exc
+
+    return CellRow(geom_hex=geom_hex, canopy_pct=canopy_pct, source=row_source, tile_id=tile_id)
+
+
+def feature_tile_key(feature: Dict[str, Any], source_override: Optional[str], tile_field: str) -> TileKey:
+    """
+    The (source, tile_id) a feature is stored under.
+    """
+    props: Dict[str, Any] = feature.get("properties") or {}
+    return source_override or props.get("source") or "unknown", str(props.get(tile_field) or "")
+
+
+def polygon_to_ewkb_hex(geometry: Dict, srid: int = TARGET_SRID) -> str:
+    """
+    Encodes a GeoJSON Polygon mapping as little-endian EWKB hex.
+    EPSG:4326 input is packed directly without building a GEOS object;
+    other SRIDs are reprojected through GEOS first.
+    """
+    if geometry.get("type") != "Polygon":
+        raise ValueError(f"Expected Polygon geometry, got {geometry.get('type')!r}.")
+
+    if srid != TARGET_SRID:
+        # GeoJSON input is tagged 4326 by GDAL; override with the declared SRID.
+        geos_geom = GEOSGeometry(json.dumps(geometry))
+        geos_geom.srid = srid
+        geos_geom.transform(TARGET_SRID)
+        return geos_geom.hexewkb.decode("ascii")
+
+    rings = geometry.get("coordinates") or []
+    if not rings:
+        raise ValueError("Polygon has no rings.")
+
+    parts = [struct.pack("<BIII", 1, WKB_POLYGON | EWKB_SRID_FLAG, TARGET_SRID, len(rings))]
+    for ring in rings:
+        if len(ring) < 4:
+            raise ValueError("Polygon rings need at least four positions.")
+        # Drop any Z/M ordinates; the column is 2D.
+        flat = list(chain.from_iterable((point[0], point[1]) for point in ring))
+        try:
+            parts.append(struct.pack(f"<I{len(flat)}d", len(ring), *flat))
+        except struct.error as exc:
+            raise ValueError(f"Invalid coordinates: {exc}") from exc
+    return b"".join(parts).hex()
+
+
+def cell_grid_key(geom_hex: str) -> int:
+    """
+    The ``grid_key`` the database trigger (migration 0005) will give a cell:
+    its bbox centre quantised to 1e-5° and packed as x * 1e8 + y. Computed
+    with the same float arithmetic; round() is half-even like PostgreSQL's
+    round(double precision).
+    """
+    wkb = bytes.fromhex(geom_hex)
+    if wkb[:5] == POLYGON_EWKB_PREFIX and len(wkb) >= 17:
+        points = struct.unpack_from("<I", wkb, 13)[0]
+        coords = np.frombuffer(wkb, dtype="<f8", count=points * 2, offset=17).reshape(-1, 2)
+        (xmin, ymin), (xmax, ymax) = coords.min(axis=0), coords.max(axis=0)
+    else:
+        xmin, ymin, xmax, ymax = GEOSGeometry(geom_hex).extent
+    key_x = round(((float(xmin) + float(xmax)) / 2 + 180) * 1e5)
+    key_y = round(((float(ymin) + float(ymax)) / 2 + 90) * 1e5)
+    return key_x * 100_000_000 + key_y
+
+
+def rings_to_ewkb_hex(xs: np.ndarray, ys: np.ndarray) -> List[str]:
+    """
+    Vectorised EWKB hex encoding of single-ring EPSG:4326 polygons.
+    ``xs``/``ys`` are (n, k) arrays of closed rings (first vertex repeated last).
+    """
+    count, vertices = xs.shape
+    record = np.dtype(
+        [
+            ("byte_order", "u1"),
+            ("geom_type", "<u4"),
+            ("srid", "<u4"),
+            ("ring_count", "<u4"),
+            ("point_count", "<u4"),
+            ("coords", "<f8", (vertices * 2,)),
+        ]
+    )
+    packed = np.empty(count, dtype=record)
+    packed["byte_order"] = 1
+    packed["geom_type"] = WKB_POLYGON | EWKB_SRID_FLAG
+    packed["srid"] = TARGET_SRID
+    packed["ring_count"] = 1
+    packed["point_count"] = vertices
+    packed["coords"][:, 0::2] = xs
+    packed["coords"][:, 1::2] = ys
+    encoded = packed.tobytes().hex()
+    width = record.itemsize * 2
+    return [encoded[offset:offset + width] for offset in range(0, len(encoded), width)]
+
+
+class CellWriter:
+    """
+    Buffers rows and hands them to ``_write`` in batches of ``batch_size``.
+    ``_write`` also drops the stored hashes of the tiles it writes (see
+    forget_tile_hashes), in the same transaction.
+    """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self.written = 0
+        self.sources: Set[str] = set()
+        # tile ids written per source, for tile cache invalidation
+        self.tiles: Dict[str, Set[str]] = {}
+        # time spent in _write, so loaders can split database time from parsing
+        self.write_seconds = 0.0
+        self._rows: List[CellRow] = []
+
+    def add(self, row: CellRow) -> int:
+        """
+        Queues a row; returns the number of rows flushed (0 while buffering).
+        """
+        self._rows.append(row)
+        self.sources.add(row.source)
+        self.tiles.setdefault(row.source, set()).add(row.tile_id)
+        if len(self._rows) >= self.batch_size:
+            return self.flush()
+        return 0
+
+    def flush(self) -> int:
+        if not self._rows:
+            return 0
+        # A batch may not upsert the same (source, grid_key) twice; the last copy wins.
+        rows = list({(row.source, cell_grid_key(row.geom_hex)): row for row in self._rows}.values())
+        started = time.perf_counter()
+        self._write(rows)
+        self.write_seconds += time.perf_counter() - started
+        flushed = len(rows)
+        self.written += flushed
+        self._rows = []
+        return flushed
+
+    def close(self) -> int:
+        return self.flush()
+
+    def _write(self, rows: List[CellRow]) -> None:
+        raise NotImplementedError
+
+
+class OrmCellWriter(CellWriter):
+    """
+    Upserts batches with ``bulk_create``, one transaction per batch.
+    """
+
+    def _write(self, rows: List[CellRow]) -> None:
+        cells = [
+            ForestDensityCell(
+                geom=GEOSGeometry(row.geom_hex),
+                canopy_pct=row.canopy_pct,
+                source=row.source,
+                tile_id=row.tile_id,
+            )
+            for row in rows
+        ]
+        # Bulk create inside a transaction to keep batches atomic.
+        with transaction.atomic():
+            ForestDensityCell.objects.bulk_create(
+                cells, update_conflicts=True, unique_fields=["source", "grid_key"], update_fields=UPSERT_FIELDS
+            )
+            forget_tile_hashes((row.source, row.tile_id) for row in rows)
+
+
+class CopyCellWriter(CellWriter):
+    """
+    Streams batches with PostgreSQL ``COPY ... FROM STDIN`` into a temporary
+    staging table and upserts them into the cell table from there. Geometries
+    travel as EWKB hex text, so no model instances are built. Cells whose
+    values did not change are left untouched.
+    """
+
+    def __init__(self, batch_size: int):
+        super().__init__(batch_size)
+        quote = connection.ops.quote_name
+        table = quote(ForestDensityCell._meta.db_table)
+        columns = ", ".join(quote(column) for column in COPY_COLUMNS)
+        self.stage_sql = f"""
+            CREATE TEMPORARY TABLE IF NOT EXISTS {STAGE_TABLE} (
+                geom geometry(Polygon, {TARGET_SRID}),
+                canopy_pct numeric(5, 2),
+                source varchar(64),
+                tile_id varchar(64),
+                updated_at timestamptz
+            )
+        """
+        self.copy_sql = f"COPY {STAGE_TABLE} ({columns}) FROM STDIN"
+        self.upsert_sql = f"""
+            INSERT INTO {table} AS cell ({columns})
+            SELECT {columns} FROM {STAGE_TABLE}
+            ON CONFLICT (source, grid_key) DO UPDATE
+            SET {", ".join(f"{quote(field)} = EXCLUDED.{quote(field)}" for field in UPSERT_FIELDS)}
+            WHERE cell.canopy_pct <> EXCLUDED.canopy_pct
+               OR cell.tile_id <> EXCLUDED.tile_id
+               OR NOT ST_OrderingEquals(cell.geom, EXCLUDED.geom)
+        """
+
+    def _write(self, rows: List[CellRow]) -> None:
+        # updated_at is auto_now on the model; COPY has to supply it explicitly.
+        now = timezone.now()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(self.stage_sql)
+                with cursor.cursor.copy(self.copy_sql) as copy:
+                    for row in rows:
+                        copy.write_row((row.geom_hex, row.canopy_pct, row.source, row.tile_id, now))
+                cursor.execute(self.upsert_sql)
+                cursor.execute(f"TRUNCATE {STAGE_TABLE}")
+            forget_tile_hashes((row.source, row.tile_id) for row in rows)
+
+
+WRITERS = {"orm": OrmCellWriter, "copy": CopyCellWriter}
+DEFAULT_BATCH_SIZES = {"orm": 500, "copy": 50000}
+
+
+class TileDigest(NamedTuple):
+    content_hash: str
+    cell_count: int
+
+
+EMPTY_TILE = TileDigest(content_hash="0" * 64, cell_count=0)
+
+
+def hash_tiles(rows: Iterable[CellRow]) -> Dict[TileKey, TileDigest]:
+    """
+    Content digest per (source, tile_id): the sum modulo 2**256 of each
+    row's SHA-256 over its geometry and two-decimal canopy value, so it does
+    not depend on the order rows arrive in.
+    """
+    sums: Dict[TileKey, int] = {}
+    counts: Dict[TileKey, int] = {}
+    for row in rows:
+        try:
+            canopy = f"{float(row.canopy_pct):.2f}"
+        except (TypeError, ValueError):
+            canopy = str(row.canopy_pct)
+        digest = hashlib.sha256(f"{row.geom_hex}|{canopy}".encode("ascii", "replace")).digest()
+        key = (row.source, row.tile_id)
+        sums[key] = (sums.get(key, 0) + int.from_bytes(digest, "big")) % (1 << 256)
+        counts[key] = counts.get(key, 0) + 1
+    return {key: TileDigest(f"{total:064x}", counts[key]) for key, total in sums.items()}
+
+
+def stored_tile_hashes(sources: Iterable[str]) -> Dict[TileKey, TileDigest]:
+    tiles = ForestDensityTile.objects.filter(source__in=set(sources))
+    return {
+        (source, tile_id): TileDigest(content_hash, cell_count)
+        for source, tile_id, content_hash, cell_count in tiles.values_list(
+            "source", "tile_id", "content_hash", "cell_count"
+        )
+    }
+
+
+def changed_tiles(digests: Dict[TileKey, TileDigest]) -> Set[TileKey]:
+    """
+    Tiles whose digest differs from the one stored by the last load.
+    """
+    stored = stored_tile_hashes(source for source, _ in digests)
+    return {key for key, digest in digests.items() if stored.get(key) != digest}
+
+
+class DeletedCells(NamedTuple):
+    count: int
+    # Source -> extent of the deleted cells, so the loaders can report where
+    # the old version of a tile was drawn (see tile_cache.invalidate_tiles).
+    extents: Dict[str, Extent]
+
+
+def union_extent(a: Optional[Extent], b: Optional[Extent]) -> Optional[Extent]:
+    if a is None or b is None:
+        return a or b
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def delete_tile_cells(tiles: Iterable[TileKey]) -> DeletedCells:
+    """
+    Deletes the cells of ``tiles`` so a changed tile can be written afresh;
+    run it in the transaction that writes the replacement rows. The extent
+    of the deleted cells is captured by the same statement.
+    """
+    by_source: Dict[str, Set[str]] = {}
+    for source, tile_id in tiles:
+        by_source.setdefault(source, set()).add(tile_id)
+    deleted = 0
+    extents: Dict[str, Extent] = {}
+    with connection.cursor() as cursor:
+        for source, tile_ids in by_source.items():
+            cursor.execute(
+                f"""
+                WITH gone AS (
+                    DELETE FROM {ForestDensityCell._meta.db_table}
+                    WHERE source = %s AND tile_id = ANY(%s)
+                    RETURNING geom
+                )
+                SELECT n, ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e)
+                FROM (SELECT COUNT(*) AS n, ST_Extent(geom) AS e FROM gone) AS deleted
+                """,
+                [source, sorted(tile_ids)],
+            )
+            count, *extent = cursor.fetchone()
+            deleted += count
+            if count:
+                extents[source] = tuple(extent)
+    return DeletedCells(count=deleted, extents=extents)
+
+
+def forget_tile_hashes(tiles: Iterable[TileKey]) -> None:
+    """
+    Drops the stored hashes of ``tiles``, so the next incremental load
+    treats them as changed. Incremental loads save fresh ones afterwards.
+    """
+    by_source: Dict[str, Set[str]] = {}
+    for source, tile_id in tiles:
+        by_source.setdefault(source, set()).add(tile_id)
+    for source, tile_ids in by_source.items():
+        ForestDensityTile.objects.filter(source=source, tile_id__in=tile_ids).delete()
+
+
+def save_tile_hashes(digests: Dict[TileKey, TileDigest]) -> None:
+    ForestDensityTile.objects.bulk_create(
+        [
+            ForestDensityTile(
+                source=source, tile_id=tile_id, content_hash=digest.content_hash, cell_count=digest.cell_count
+            )
+            for (source, tile_id), digest in digests.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["source", "tile_id"],
+        update_fields=["content_hash", "cell_count", "loaded_at"],
+    )
+
+
+def peak_rss_mib(children: bool = False) -> float:
+    """
+    Returns the process' resident memory high-water mark in MiB since it
+    started (0.0 where the ``resource`` module is unavailable). It never
+    goes down, so it is not the peak of the latest phase. With ``children``,
+    returns the largest high-water mark of the terminated child processes
+    (e.g. ingest workers) instead.
+    """
+    try:
+        import resource
+    except ImportError:  # pragma: no cover - non-POSIX platforms
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def format_stage_timings(stages: Dict[str, float]) -> str:
+    """
+    ``"parse 1.2s (60%), write 0.8s (40%)"`` for the loaders' summary line.
+    """
+    total = sum(stages.values())
+    return ", ".join(
+        f"{name} {seconds:.1f}s ({seconds / total:.0%})" if total > 0 else f"{name} {seconds:.1f}s"
+        for name, seconds in stages.items()
+    )
+
+
+def drop_secondary_indexes(table: str) -> List[str]:
+    """
+    Drops non-unique, non-primary indexes on ``table`` and returns their
+    definitions so they can be rebuilt after a large load.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT idx.relname, pg_get_indexdef(idx.oid)
+            FROM pg_index i
+            JOIN pg_class idx ON idx.oid = i.indexrelid
+            WHERE i.indrelid = %s::regclass
+              AND NOT i.indisprimary
+              AND NOT i.indisunique
+            """,
+            [table],
+        )
+        indexes = cursor.fetchall()
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX IF EXISTS {connection.ops.quote_name(name)}")
+    return [definition for _, definition in indexes]
+
+
+def restore_indexes(definitions: List[str]) -> None:
+    with connection.cursor() as cursor:
+        for definition in definitions:
+            cursor.execute(definition)
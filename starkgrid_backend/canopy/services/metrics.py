@@ -0,0 +1,265 @@
+"""
+Stage timings and Prometheus metrics for the stats pipeline.
+
+A stats request runs inside ``track_stats_request()``, which makes a
+StageTimer current (a context variable, so it follows sync views and async
+tasks alike). Code along the pipeline wraps its work in ``stage(name)`` and
+reports sizes with ``note(name, value)``; both are no-ops outside a tracked
+request. When the request ends, the timings are folded into the histograms
+that ``GET /api/forest-density/metrics/`` renders in the Prometheus text
+format. Metrics are kept per process, like the stats cache counters, so
+scrape every worker (or run one worker per metrics target).
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CELL_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+VERTEX_BUCKETS = (5, 16, 64, 256, 1_024, 4_096, 16_384, 65_536)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = f'le="{bound:g}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {count}")
+                total = series[len(self.buckets)]
+                inf = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, inf)} {total}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {series[-1]:g}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {total}")
+        return lines
+
+
+STATS_STAGE_SECONDS = Histogram(
+    "forest_density_stats_stage_seconds",
+    "Time spent per stats pipeline stage; stage=\"total\" is the whole request.",
+    LATENCY_BUCKETS,
+    labelnames=("stage",),
+)
+STATS_CANDIDATE_CELLS = Histogram(
+    "forest_density_stats_candidate_cells",
+    "Cells (or snapshot pixels) intersecting the AOI, per uncached stats computation.",
+    CELL_BUCKETS,
+)
+STATS_AOI_VERTICES = Histogram(
+    "forest_density_stats_aoi_vertices",
+    "Vertex count of stats request AOIs.",
+    VERTEX_BUCKETS,
+)
+STATS_REQUESTS = Counter(
+    "forest_density_stats_requests_total",
+    "Stats requests by answering backend and stats cache outcome.",
+    labelnames=("backend", "cache"),
+)
+SLOW_QUERIES = Counter(
+    "forest_density_slow_queries_total",
+    "Stats queries slower than FOREST_DENSITY_EXPLAIN_SLOW_QUERY_MS.",
+)
+
+REGISTRY = (STATS_STAGE_SECONDS, STATS_CANDIDATE_CELLS, STATS_AOI_VERTICES, STATS_REQUESTS, SLOW_QUERIES)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for collector in REGISTRY:
+        lines.extend(collector.render())
+    return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """
+    Wall-clock seconds per named stage plus free-form notes for one request.
+    Repeated stages accumulate.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.notes: Dict[str, object] = {}
+        self.discarded = False
+
+    def discard(self) -> None:
+        """
+        Keeps this request out of the metrics (e.g. it was rejected as invalid).
+        """
+        self.discarded = True
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+
+_current_timer: ContextVar[Optional[StageTimer]] = ContextVar("forest_density_stage_timer", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def note(name: str, value) -> None:
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.notes[name] = value
+
+
+@contextmanager
+def track_stats_request() -> Iterator[StageTimer]:
+    """
+    Times one stats request and records its stages, AOI vertex count,
+    candidate cells and cache outcome when it finishes without an error
+    and was not discarded.
+    """
+    timer = StageTimer()
+    token = _current_timer.set(timer)
+    try:
+        with timer.stage("total"):
+            yield timer
+    finally:
+        _current_timer.reset(token)
+    if timer.discarded:
+        return
+
+    for name, seconds in timer.stages.items():
+        STATS_STAGE_SECONDS.observe(seconds, stage=name)
+    if "aoi_vertices" in timer.notes:
+        STATS_AOI_VERTICES.observe(timer.notes["aoi_vertices"])
+    if "candidate_cells" in timer.notes:
+        STATS_CANDIDATE_CELLS.observe(timer.notes["candidate_cells"])
+    if "cache" in timer.notes:
+        STATS_REQUESTS.inc(backend=timer.notes.get("backend", ""), cache=timer.notes["cache"])
+
+
+def explain_threshold_seconds() -> Optional[float]:
+    """
+    ``FOREST_DENSITY_EXPLAIN_SLOW_QUERY_MS`` in seconds; None (the default) disables plan capture.
+    """
+    threshold = getattr(settings, "FOREST_DENSITY_EXPLAIN_SLOW_QUERY_MS", None)
+    return None if threshold is None else threshold / 1000
+
+
+def is_slow_query(seconds: float) -> bool:
+    threshold = explain_threshold_seconds()
+    return threshold is not None and seconds >= threshold
+
+
+# One plan capture at a time, on a thread of its own: slow queries that
+# arrive while one is running are counted and logged without a plan.
+_explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="forest-density-explain")
+_explain_slot = threading.Lock()
+
+
+def explain_slow_query(seconds: float, sql: str, params) -> bool:
+    """
+    Counts a stats query that took ``seconds`` and samples its plan off the
+    request path: unless a capture is already running, the query is re-run
+    under EXPLAIN (ANALYZE, BUFFERS) on a background thread with its own
+    database connection, and the plan is logged when it finishes. Returns
+    whether a capture was started.
+    """
+    SLOW_QUERIES.inc()
+    if not _explain_slot.acquire(blocking=False):
+        logger.warning("Slow forest density stats query (%.0f ms), plan not sampled:\n%s", seconds * 1000, sql.strip())
+        return False
+    try:
+        _explain_executor.submit(_capture_plan, seconds, sql, params)
+    except RuntimeError:
+        _explain_slot.release()
+        raise
+    return True
+
+
+def _capture_plan(seconds: float, sql: str, params) -> None:
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+            plan = [line for line, in cursor.fetchall()]
+        log_slow_query(seconds, sql, plan)
+    except DatabaseError:
+        logger.exception("Could not capture the plan of a slow forest density stats query.")
+    finally:
+        connection.close()
+        _explain_slot.release()
+
+
+def log_slow_query(seconds: float, sql: str, plan: Sequence[str]) -> None:
+    logger.warning(
+        "Slow forest density stats query (%.0f ms):\n%s\nEXPLAIN (ANALYZE, BUFFERS):\n%s",
+        seconds * 1000,
+        sql.strip(),
+        "\n".join(plan),
+    )
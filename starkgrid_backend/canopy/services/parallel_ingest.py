@@ -0,0 +1,218 @@
+"""
+Process-pool ingestion for load_forest_density.
+
+Input is split into shards that are each parsed, validated and written by a
+worker process over its own database connection, inside a single transaction.
+A failed shard leaves no rows behind, so it can be retried on its own.
+Incremental loads use tile shards, so each tile is hashed, compared and
+replaced by exactly one worker.
+
+This module is imported by spawned workers before Django is configured, so
+model-dependent imports stay inside the functions.
+"""
+import json
+import os
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+
+class IngestOptions(NamedTuple):
+    source_override: Optional[str]
+    tile_field: str
+    canopy_field: str
+    srid: int
+    mode: str
+    batch_size: int
+    # Skip tiles whose content hash is unchanged and replace the others.
+    incremental: bool = False
+    # Spatial filter (xmin, ymin, xmax, ymax) for columnar inputs, in the file's coordinates.
+    bbox: Optional[Tuple[float, float, float, float]] = None
+
+
+class ShardSpec(NamedTuple):
+    """
+    Lines of ``path`` whose first byte falls in ``[start, end)``.
+    """
+
+    index: int
+    path: str
+    start: int
+    end: int
+
+
+class ShardResult(NamedTuple):
+    index: int
+    rows: int
+    skipped: int
+    seconds: float
+    peak_rss_mib: float
+    error: str = ""
+    sources: Tuple[str, ...] = ()
+    tiles: Tuple[Tuple[str, str], ...] = ()
+    write_seconds: float = 0.0
+    unchanged_tiles: int = 0
+    # (source, xmin, ymin, xmax, ymax) of the cells deleted from changed tiles.
+    replaced: Tuple[Tuple[str, float, float, float, float], ...] = ()
+
+
+def byte_range_shards(path: Path, shard_count: int) -> List[ShardSpec]:
+    """
+    Splits an uncompressed NDJSON file into ``shard_count`` contiguous byte ranges.
+    Boundaries depend only on file size, so shard numbers are stable across runs.
+    """
+    size = path.stat().st_size
+    step = max(1, -(-size // shard_count))
+    return [
+        ShardSpec(index=index, path=str(path), start=min(index * step, size), end=min((index + 1) * step, size))
+        for index in range(shard_count)
+    ]
+
+
+def tile_shard_index(tile_id: Any, shard_count: int) -> int:
+    """
+    Stable shard number for a tile id (crc32, unlike ``hash`` which is salted per process).
+    """
+    return zlib.crc32(str(tile_id or "").encode("utf-8")) % shard_count
+
+
+def spool_tile_shards(
+    features: Iterable[Dict[str, Any]],
+    tile_field: str,
+    shard_count: int,
+    spool_dir: Path,
+    selected: Optional[Iterable[int]] = None,
+) -> List[ShardSpec]:
+    """
+    Writes features into one NDJSON spool file per tile shard so that inputs
+    that cannot be split by byte range (gzip, FeatureCollections) can still be
+    loaded in parallel. Only ``selected`` shards are spooled when given.
+    """
+    wanted = set(range(shard_count) if selected is None else selected)
+    handles = {index: open(spool_dir / f"shard-{index:04d}.ndjson", "w", encoding="utf-8") for index in wanted}
+    try:
+        for feature in features:
+            props = feature.get("properties") or {}
+            index = tile_shard_index(props.get(tile_field), shard_count)
+            if index in handles:
+                handles[index].write(json.dumps(feature))
+                handles[index].write("\n")
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    return [
+        ShardSpec(index=index, path=handle.name, start=0, end=os.path.getsize(handle.name))
+        for index, handle in sorted(handles.items())
+    ]
+
+
+def iter_shard_lines(spec: ShardSpec) -> Iterator[bytes]:
+    with open(spec.path, "rb") as handle:
+        if spec.start > 0:
+            # Skip the line straddling the start offset; the previous shard owns it.
+            handle.seek(spec.start - 1)
+            handle.readline()
+        while handle.tell() < spec.end:
+            line = handle.readline()
+            if not line:
+                break
+            yield line
+
+
+def init_worker(database_name: Optional[str] = None) -> None:
+    """
+    Sets Django up in a spawned worker. ``database_name`` is the parent's
+    default database, which differs from the settings module's under tests.
+    """
+    import django
+
+    django.setup()
+    if database_name is not None:
+        from django.db import connections
+
+        connections["default"].settings_dict["NAME"] = database_name
+
+
+def iter_shard_rows(spec: ShardSpec, options: IngestOptions, skipped: List[int]) -> Iterator[Any]:
+    """
+    CellRows of a shard; unusable features are counted in ``skipped[0]``.
+    """
+    from canopy.services.ingest import SkipFeature, feature_to_row
+
+    for line in iter_shard_lines(spec):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield feature_to_row(
+                json.loads(line), options.source_override, options.tile_field, options.canopy_field, options.srid
+            )
+        except SkipFeature:
+            skipped[0] += 1
+
+
+def load_shard(spec: ShardSpec, options: IngestOptions, progress=None) -> ShardResult:
+    """
+    Worker entry point: parses and writes one shard atomically. Errors are
+    returned rather than raised so the parent can report retryable shards.
+    Cumulative row counts are posted to ``progress`` (a queue) after each batch.
+    """
+    from django.db import close_old_connections, transaction
+
+    from canopy.services.ingest import (
+        WRITERS,
+        changed_tiles,
+        delete_tile_cells,
+        hash_tiles,
+        peak_rss_mib,
+        save_tile_hashes,
+    )
+
+    close_old_connections()
+    started = time.perf_counter()
+    writer = WRITERS[options.mode](options.batch_size)
+    skipped = [0]
+    unchanged = 0
+    replaced = {}
+    try:
+        with transaction.atomic():
+            changed = None
+            if options.incremental:
+                digests = hash_tiles(iter_shard_rows(spec, options, [0]))
+                changed = changed_tiles(digests)
+                unchanged = len(digests) - len(changed)
+                replaced = delete_tile_cells(changed).extents
+            for row in iter_shard_rows(spec, options, skipped):
+                if changed is not None and (row.source, row.tile_id) not in changed:
+                    continue
+                if writer.add(row) and progress is not None:
+                    progress.put((spec.index, writer.written))
+            writer.close()
+            if changed:
+                save_tile_hashes({key: digests[key] for key in changed})
+    except Exception as exc:
+        return ShardResult(
+            index=spec.index,
+            rows=0,
+            skipped=skipped[0],
+            seconds=time.perf_counter() - started,
+            peak_rss_mib=peak_rss_mib(),
+            error=f"{type(exc).__name__}: {exc}",
+        )
+
+    if progress is not None:
+        progress.put((spec.index, writer.written))
+    return ShardResult(
+        index=spec.index,
+        rows=writer.written,
+        skipped=skipped[0],
+        seconds=time.perf_counter() - started,
+        peak_rss_mib=peak_rss_mib(),
+        sources=tuple(sorted(writer.sources)),
+        tiles=tuple(sorted((source, tile_id) for source, tile_ids in writer.tiles.items() for tile_id in tile_ids)),
+        write_seconds=writer.write_seconds,
+        unchanged_tiles=unchanged,
+        replaced=tuple((source, *extent) for source, extent in sorted(replaced.items())),
+    )
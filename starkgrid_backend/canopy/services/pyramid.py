@@ -0,0 +1,159 @@
+import math
+from typing import Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.dispatch import receiver
+
+from canopy.models import ForestDensityAggregateCell, ForestDensityCell, ForestDensityPyramidLevel
+from canopy.services.async_db import get_async_pool
+from canopy.signals import cells_loaded
+
+
+# A level is only used when at least this many aggregate cells span the AOI,
+# which keeps the band of fine boundary cells to a small share of the area.
+DEFAULT_MIN_CELLS_ACROSS = 8
+
+
+def cell_key_sql(geom: str, size: str) -> Tuple[str, str]:
+    """
+    SQL for the aggregate key (key_x, key_y) of a fine cell: the aggregate
+    cell containing its bbox centre. Shared by the build and the stats query
+    so both assign cells identically.
+    """
+    return (
+        f"floor(((ST_XMin({geom}) + ST_XMax({geom})) / 2) / {size})::int",
+        f"floor(((ST_YMin({geom}) + ST_YMax({geom})) / 2) / {size})::int",
+    )
+
+
+def build_level(cell_size: float, source: str = "") -> ForestDensityPyramidLevel:
+    """
+    (Re)builds the aggregate level of ``cell_size`` degrees for ``source``
+    (blank for all sources) in a single transaction.
+    """
+    cells_table = ForestDensityCell._meta.db_table
+    aggregate_table = ForestDensityAggregateCell._meta.db_table
+    source_filter = "WHERE source = %(source)s" if source else ""
+    key_x, key_y = cell_key_sql("geom", "%(size)s")
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT MAX(GREATEST(ST_XMax(geom) - ST_XMin(geom), ST_YMax(geom) - ST_YMin(geom)))
+                FROM {cells_table} {source_filter}
+                """,
+                {"source": source},
+            )
+            base_cell_size = cursor.fetchone()[0] or 0.0
+
+        ForestDensityPyramidLevel.objects.filter(source=source, cell_size=cell_size).delete()
+        level = ForestDensityPyramidLevel.objects.create(
+            source=source, cell_size=cell_size, base_cell_size=base_cell_size
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH cells AS (
+                    SELECT
+                        {key_x} AS key_x,
+                        {key_y} AS key_y,
+                        LEAST(floor(canopy_pct)::int, 100) AS bucket,
+                        canopy_pct,
+                        area_m2
+                    FROM {cells_table}
+                    {source_filter}
+                ),
+                buckets AS (
+                    SELECT
+                        key_x,
+                        key_y,
+                        bucket,
+                        SUM(area_m2) AS area_m2,
+                        SUM(canopy_pct * area_m2) AS weighted,
+                        COUNT(*) AS cell_count
+                    FROM cells
+                    GROUP BY 1, 2, 3
+                )
+                INSERT INTO {aggregate_table}
+                    (level_id, key_x, key_y, geom,
+                     histogram_pct, histogram_area, histogram_weighted, histogram_count)
+                SELECT
+                    %(level)s,
+                    key_x,
+                    key_y,
+                    ST_MakeEnvelope(
+                        key_x * %(size)s, key_y * %(size)s,
+                        (key_x + 1) * %(size)s, (key_y + 1) * %(size)s,
+                        4326
+                    ),
+                    array_agg(bucket ORDER BY bucket),
+                    array_agg(area_m2 ORDER BY bucket),
+                    array_agg(weighted ORDER BY bucket),
+                    array_agg(cell_count ORDER BY bucket)
+                FROM buckets
+                GROUP BY key_x, key_y
+                """,
+                {"size": cell_size, "level": level.pk, "source": source},
+            )
+    return level
+
+
+def select_level(geometry, source: Optional[str] = None) -> Optional[ForestDensityPyramidLevel]:
+    """
+    Picks the coarsest level fine enough that at least
+    ``FOREST_DENSITY_PYRAMID_MIN_CELLS_ACROSS`` aggregate cells span the AOI,
+    or None when the AOI is too small for any level to help.
+    """
+    return _pick_level(ForestDensityPyramidLevel.objects.filter(source=source or ""), geometry)
+
+
+async def aselect_level(geometry, source: Optional[str] = None) -> Optional[ForestDensityPyramidLevel]:
+    """
+    select_level for the async views. The levels are read on the psycopg
+    async pool rather than through the ORM's thread-bound connection.
+    """
+    fields = ForestDensityPyramidLevel._meta.concrete_fields
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                f"""
+                SELECT {", ".join(field.column for field in fields)}
+                FROM {ForestDensityPyramidLevel._meta.db_table}
+                WHERE source = %s
+                ORDER BY cell_size DESC
+                """,
+                [source or ""],
+            )
+            rows = await cursor.fetchall()
+    names = [field.attname for field in fields]
+    levels = [ForestDensityPyramidLevel.from_db(DEFAULT_DB_ALIAS, names, row) for row in rows]
+    return _pick_level(levels, geometry)
+
+
+def _pick_level(levels: Iterable[ForestDensityPyramidLevel], geometry) -> Optional[ForestDensityPyramidLevel]:
+    min_cells = getattr(settings, "FOREST_DENSITY_PYRAMID_MIN_CELLS_ACROSS", DEFAULT_MIN_CELLS_ACROSS)
+    xmin, ymin, xmax, ymax = geometry.extent
+    span = math.sqrt(max(geometry.area, 0.0)) or min(xmax - xmin, ymax - ymin)
+    for level in levels:
+        # Levels are ordered coarse to fine; aggregates must be clearly coarser than the cells they summarise.
+        if level.cell_size * min_cells <= span and level.cell_size > 2 * level.base_cell_size:
+            return level
+    return None
+
+
+def invalidate(sources: Iterable[str]) -> int:
+    """
+    Drops levels made stale by new rows in ``sources`` (and the all-sources levels).
+    Returns the number of levels removed.
+    """
+    deleted, per_model = ForestDensityPyramidLevel.objects.filter(source__in=set(sources) | {""}).delete()
+    return per_model.get(ForestDensityPyramidLevel._meta.label, 0)
+
+
+@receiver(cells_loaded)
+def _invalidate_on_load(sender, sources, **kwargs):
+    invalidate(sources)
@@ -0,0 +1,120 @@
+import math
+from typing import Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+import rasterio
+from rasterio.warp import transform as warp_transform
+from rasterio.windows import Window
+
+from canopy.services.ingest import TARGET_SRID, CellRow, rings_to_ewkb_hex
+
+
+# Mean length of one degree of latitude, used to size cells on geographic rasters.
+METRES_PER_DEGREE = 111_320.0
+MIN_WINDOW_PIXELS = 512
+
+
+class RasterBlock(NamedTuple):
+    tile_id: str
+    rows: List[CellRow]
+    pixels_read: int
+
+
+def pixel_size_m(src: rasterio.io.DatasetReader) -> float:
+    """
+    Approximate pixel height in metres (degrees are converted for geographic CRSs).
+    """
+    height = abs(src.res[1])
+    if src.crs is not None and src.crs.is_geographic:
+        return height * METRES_PER_DEGREE
+    return height
+
+
+def aggregation_factor(src: rasterio.io.DatasetReader, cell_size_m: float) -> int:
+    """
+    Number of pixels per cell side that best approximates ``cell_size_m``.
+    """
+    return max(1, round(cell_size_m / pixel_size_m(src)))
+
+
+def aggregate_window(data: np.ma.MaskedArray, factor: int, min_valid_fraction: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Averages ``factor`` x ``factor`` pixel blocks, ignoring nodata.
+    Returns (mean values, keep mask) at cell resolution; partial edge blocks
+    are padded with nodata so their fraction is judged on the full block.
+    """
+    height, width = data.shape
+    cell_rows = -(-height // factor)
+    cell_cols = -(-width // factor)
+    padded_values = np.zeros((cell_rows * factor, cell_cols * factor), dtype=np.float64)
+    padded_valid = np.zeros(padded_values.shape, dtype=bool)
+    padded_values[:height, :width] = data.filled(0)
+    padded_valid[:height, :width] = ~np.ma.getmaskarray(data)
+
+    shape = (cell_rows, factor, cell_cols, factor)
+    valid_counts = padded_valid.reshape(shape).sum(axis=(1, 3))
+    sums = (padded_values * padded_valid).reshape(shape).sum(axis=(1, 3))
+
+    keep = valid_counts >= max(1, math.ceil(min_valid_fraction * factor * factor))
+    means = np.divide(sums, valid_counts, out=np.zeros_like(sums), where=valid_counts > 0)
+    return means, keep
+
+
+def iter_raster_blocks(
+    src: rasterio.io.DatasetReader,
+    band: int,
+    factor: int,
+    source: str,
+    tile_prefix: str,
+    min_valid_fraction: float = 0.5,
+) -> Iterator[RasterBlock]:
+    """
+    Reads the raster one window at a time (block-aligned, a multiple of ``factor``
+    pixels on each side) and yields the aggregated cells of each window.
+    Cell polygons are pixel-edge rectangles reprojected to EPSG:4326.
+    """
+    block_height, block_width = src.block_shapes[band - 1]
+    window_height = -(-max(block_height, MIN_WINDOW_PIXELS) // factor) * factor
+    window_width = -(-max(block_width, MIN_WINDOW_PIXELS) // factor) * factor
+    reproject = src.crs is not None and src.crs.to_epsg() != TARGET_SRID
+    affine = src.transform
+
+    for row_off in range(0, src.height, window_height):
+        for col_off in range(0, src.width, window_width):
+            window = Window(
+                col_off,
+                row_off,
+                min(window_width, src.width - col_off),
+                min(window_height, src.height - row_off),
+            )
+            data = src.read(band, window=window, masked=True)
+            means, keep = aggregate_window(data, factor, min_valid_fraction)
+            tile_id = f"{tile_prefix}:{row_off}:{col_off}"
+            cell_rows, cell_cols = np.nonzero(keep)
+            if cell_rows.size == 0:
+                yield RasterBlock(tile_id=tile_id, rows=[], pixels_read=data.size)
+                continue
+
+            # Pixel-edge extents of each cell, clipped to the raster edge.
+            row0 = row_off + cell_rows * factor
+            col0 = col_off + cell_cols * factor
+            row1 = np.minimum(row0 + factor, src.height)
+            col1 = np.minimum(col0 + factor, src.width)
+            ring_cols = np.stack([col0, col0, col1, col1, col0], axis=1).astype(np.float64)
+            ring_rows = np.stack([row0, row1, row1, row0, row0], axis=1).astype(np.float64)
+            xs = affine.c + affine.a * ring_cols + affine.b * ring_rows
+            ys = affine.f + affine.d * ring_cols + affine.e * ring_rows
+            if reproject:
+                flat_x, flat_y = warp_transform(src.crs, f"EPSG:{TARGET_SRID}", xs.ravel(), ys.ravel())
+                xs = np.asarray(flat_x).reshape(xs.shape)
+                ys = np.asarray(flat_y).reshape(ys.shape)
+            if affine.e > 0:
+                # South-up rasters: keep exterior rings counter-clockwise.
+                xs, ys = xs[:, ::-1], ys[:, ::-1]
+
+            values = np.round(means[cell_rows, cell_cols], 2)
+            rows = [
+                CellRow(geom_hex=geom_hex, canopy_pct=float(value), source=source, tile_id=tile_id)
+                for geom_hex, value in zip(rings_to_ewkb_hex(xs, ys), values)
+            ]
+            yield RasterBlock(tile_id=tile_id, rows=rows, pixels_read=data.size)
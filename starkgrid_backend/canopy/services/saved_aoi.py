@@ -0,0 +1,53 @@
+"""
+Saved AOIs: geometries stored once and referenced by id in stats requests.
+
+Saving does the per-request geometry work up front. The AOI is stored as a
+validated EPSG:4326 MultiPolygon with its bbox, vertex count, geodesic area
+and stats cache hash, and its ST_Subdivide pieces go into their own table.
+Stats queries for a saved AOI read the stored pieces by id (see
+forest_density.build_stats_sql) instead of decoding an EWKB parameter and
+subdividing it again.
+"""
+from django.contrib.gis.geos import MultiPolygon, Polygon
+from django.db import connection, transaction
+
+from canopy.models import ForestDensitySavedAOI, ForestDensitySavedAOIPiece
+from canopy.services.forest_density import subdivide_max_vertices
+from canopy.services.stats_cache import geometry_hash
+
+
+def save_aoi(geometry, name: str = "") -> ForestDensitySavedAOI:
+    """
+    Stores a valid WGS84 Polygon or MultiPolygon (see
+    ForestDensitySavedAOIRequestSerializer) as a saved AOI and subdivides it
+    with the current ``FOREST_DENSITY_SUBDIVIDE_MAX_VERTICES``. Pieces
+    partition the AOI, so they stay exact if that setting changes later.
+    """
+    multi = geometry.clone() if geometry.geom_type == "MultiPolygon" else MultiPolygon(geometry.clone())
+    multi.srid = geometry.srid
+    bbox = Polygon.from_bbox(geometry.extent)
+    bbox.srid = geometry.srid
+
+    aoi_table = ForestDensitySavedAOI._meta.db_table
+    with transaction.atomic():
+        aoi = ForestDensitySavedAOI.objects.create(
+            name=name,
+            geom=multi,
+            bbox=bbox,
+            geometry_hash=geometry_hash(geometry),
+            num_coords=geometry.num_coords,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {ForestDensitySavedAOIPiece._meta.db_table} (aoi_id, geom)
+                SELECT a.id, ST_Subdivide(a.geom, %(max_vertices)s) FROM {aoi_table} a WHERE a.id = %(aoi)s
+                """,
+                {"aoi": aoi.pk, "max_vertices": subdivide_max_vertices()},
+            )
+            cursor.execute(
+                f"UPDATE {aoi_table} SET area_m2 = ST_Area(geom::geography) WHERE id = %s RETURNING area_m2",
+                [aoi.pk],
+            )
+            aoi.area_m2 = cursor.fetchone()[0]
+    return aoi
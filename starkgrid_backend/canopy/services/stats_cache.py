@@ -0,0 +1,455 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from canopy.models import ForestDensityDatasetVersion
+from canopy.serializers import DEFAULT_BINS, DEFAULT_STATS_BACKEND
+from canopy.services.async_db import get_async_pool
+from canopy.services.forest_density import (
+    CanopyDistribution,
+    acompute_distribution,
+    compute_distribution,
+    compute_distributions,
+    distribution_payload,
+    summarize_distribution,
+)
+from canopy.services.grid_snapshot import SnapshotUnavailable, compute_snapshot_distribution
+from canopy.services.metrics import note, stage
+from canopy.signals import cells_loaded
+
+
+DEFAULT_CACHE_CONFIG = {
+    "BACKEND": "canopy.services.stats_cache.LocMemLRUCache",
+    "OPTIONS": {"max_entries": 1024, "ttl": 3600},
+}
+
+
+class StatsCache:
+    """
+    Base class for stats result caches. Hit/miss counters are per process.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, **options):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._set(key, value)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        value = await self._aget(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def aset(self, key: str, value: Any) -> None:
+        await self._aset(key, value)
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": f"{type(self).__module__}.{type(self).__name__}",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "ttl": self.ttl,
+        }
+
+    def _get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    # In-process backends never block, so the async hooks default to the sync ones.
+    async def _aget(self, key: str) -> Optional[Any]:
+        return self._get(key)
+
+    async def _aset(self, key: str, value: Any) -> None:
+        self._set(key, value)
+
+
+class NullStatsCache(StatsCache):
+    """
+    Disables caching while still counting lookups.
+    """
+
+    def clear(self) -> None:
+        pass
+
+    def _get(self, key: str) -> Optional[Any]:
+        return None
+
+    def _set(self, key: str, value: Any) -> None:
+        pass
+
+
+class LocMemLRUCache(StatsCache):
+    """
+    Thread-safe in-process LRU with a size bound and optional TTL (seconds).
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600, **options):
+        super().__init__(ttl=ttl, **options)
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        data = super().stats()
+        data.update(size=len(self._entries), max_entries=self.max_entries, evictions=self.evictions)
+        return data
+
+    def _get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key: str, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+class DjangoStatsCache(StatsCache):
+    """
+    Stores results in a configured Django cache alias (e.g. Redis) so that all
+    web workers share them.
+    """
+
+    def __init__(self, alias: str = "default", ttl: Optional[float] = 3600, key_prefix: str = "forest-stats", **options):
+        super().__init__(ttl=ttl, **options)
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def clear(self) -> None:
+        # Entries are keyed by dataset version, so stale ones simply expire.
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        data = super().stats()
+        data.update(alias=self.alias)
+        return data
+
+    def _get(self, key: str) -> Optional[Any]:
+        return self._cache.get(f"{self.key_prefix}:{key}")
+
+    def _set(self, key: str, value: Any) -> None:
+        self._cache.set(f"{self.key_prefix}:{key}", value, timeout=self.ttl)
+
+    async def _aget(self, key: str) -> Optional[Any]:
+        return await self._cache.aget(f"{self.key_prefix}:{key}")
+
+    async def _aset(self, key: str, value: Any) -> None:
+        await self._cache.aset(f"{self.key_prefix}:{key}", value, timeout=self.ttl)
+
+
+_cache: Optional[StatsCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_stats_cache() -> StatsCache:
+    """
+    Returns the process-wide cache configured by ``FOREST_DENSITY_STATS_CACHE``
+    (``{"BACKEND": dotted path, "OPTIONS": {...}}``).
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = getattr(settings, "FOREST_DENSITY_STATS_CACHE", DEFAULT_CACHE_CONFIG)
+                backend = import_string(config.get("BACKEND", DEFAULT_CACHE_CONFIG["BACKEND"]))
+                _cache = backend(**config.get("OPTIONS", {}))
+    return _cache
+
+
+def reset_stats_cache() -> None:
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+def geometry_hash(geometry) -> str:
+    """
+    Hash of the geometry after GEOS normalisation, so ring start points and
+    orientation do not split otherwise identical requests.
+    """
+    normalized = geometry.normalize(clone=True)
+    return hashlib.sha256(bytes(normalized.ewkb)).hexdigest()
+
+
+def dataset_version(source: Optional[str] = None) -> int:
+    """
+    Current version of ``source``, or of the whole table when no source is given.
+    """
+    version = (
+        ForestDensityDatasetVersion.objects.filter(source=source or "").values_list("version", flat=True).first()
+    )
+    return version or 0
+
+
+async def adataset_version(source: Optional[str] = None) -> int:
+    """
+    dataset_version read on the psycopg async pool.
+    """
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                f"SELECT version FROM {ForestDensityDatasetVersion._meta.db_table} WHERE source = %s",
+                [source or ""],
+            )
+            row = await cursor.fetchone()
+    return row[0] if row else 0
+
+
+def bump_dataset_versions(sources: Iterable[str]) -> None:
+    labels = set(sources) | {""}
+    with transaction.atomic():
+        for label in labels:
+            ForestDensityDatasetVersion.objects.get_or_create(source=label)
+        ForestDensityDatasetVersion.objects.filter(source__in=labels).update(version=F("version") + 1)
+
+
+def distribution_cache_key(
+    geometry,
+    source: Optional[str],
+    version: int,
+    backend: str = DEFAULT_STATS_BACKEND,
+    geometry_digest: Optional[str] = None,
+) -> str:
+    """
+    Cache key for the canopy distribution of an AOI. Threshold and bins are
+    not part of it: they are applied to the cached distribution on each request.
+    ``geometry_digest`` is a precomputed geometry_hash, e.g. a saved AOI's.
+    """
+    payload = json.dumps(
+        {
+            "geometry": geometry_digest or geometry_hash(geometry),
+            "source": source,
+            "version": version,
+            "backend": backend,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def stats_backend(backend: Optional[str] = None) -> str:
+    """
+    The requested stats engine, defaulting to ``FOREST_DENSITY_STATS_BACKEND``.
+    """
+    return backend or getattr(settings, "FOREST_DENSITY_STATS_BACKEND", DEFAULT_STATS_BACKEND)
+
+
+def _snapshot_distribution(geometry, source: Optional[str], version: int) -> Optional[CanopyDistribution]:
+    # Missing or stale snapshots fall back to the SQL path rather than failing.
+    try:
+        with stage("snapshot"):
+            return compute_snapshot_distribution(geometry, source, version)
+    except SnapshotUnavailable:
+        return None
+
+
+def _note_entry(entry: tuple, hit: bool) -> None:
+    distribution = entry[2]
+    note("backend", distribution.backend)
+    note("cache", "hit" if hit else "miss")
+    if not hit:
+        note("candidate_cells", distribution.cum_cell_count[-1] if distribution.canopy_pct else 0)
+
+
+def cached_distribution(
+    geometry, source: Optional[str] = None, backend: Optional[str] = None, saved_aoi=None
+) -> Tuple[str, CanopyDistribution]:
+    """
+    Returns ``(handle, distribution)`` for the AOI, computing it only on a
+    cache miss. The handle is the cache key and can be passed to rebin_cached.
+    ``saved_aoi`` is the ForestDensitySavedAOI that ``geometry`` came from;
+    its stored hash and pieces are used instead of deriving them again.
+    """
+    backend = stats_backend(backend)
+    cache = get_stats_cache()
+    with stage("cache"):
+        version = dataset_version(source)
+        digest, aoi_id = (saved_aoi.geometry_hash, saved_aoi.pk) if saved_aoi is not None else (None, None)
+        handle = distribution_cache_key(geometry, source, version, backend, geometry_digest=digest)
+        entry = cache.get(handle)
+    hit = entry is not None
+    if not hit:
+        distribution = _snapshot_distribution(geometry, source, version) if backend == "snapshot" else None
+        if distribution is None:
+            distribution = compute_distribution(geometry, source, aoi_id=aoi_id)
+        entry = (source, version, distribution)
+        cache.set(handle, entry)
+    _note_entry(entry, hit)
+    return handle, entry[2]
+
+
+def cached_compute_stats(
+    geometry,
+    threshold: float = 60,
+    bins: List[float] = None,
+    source: Optional[str] = None,
+    include_distribution: bool = False,
+    backend: Optional[str] = None,
+    saved_aoi=None,
+) -> Dict:
+    """
+    compute_stats behind the configured cache. Keys include the dataset version
+    of ``source``, so reloads invalidate entries automatically. The response
+    carries a ``distribution_handle`` and, with ``include_distribution``, the
+    per-``canopy_pct`` histogram itself. ``backend="snapshot"`` answers from
+    the memory-mapped grid snapshot when a current one exists. See
+    cached_distribution for ``saved_aoi``.
+    """
+    handle, distribution = cached_distribution(geometry, source, backend, saved_aoi)
+    with stage("summarize"):
+        stats = summarize_distribution(distribution, threshold, bins or DEFAULT_BINS)
+    stats["distribution_handle"] = handle
+    if include_distribution:
+        stats["distribution"] = distribution_payload(distribution)
+    return stats
+
+
+async def acached_compute_stats(
+    geometry,
+    threshold: float = 60,
+    bins: List[float] = None,
+    source: Optional[str] = None,
+    include_distribution: bool = False,
+    backend: Optional[str] = None,
+    saved_aoi=None,
+) -> Dict:
+    """
+    Async cached_compute_stats; SQL misses run on the async connection pool.
+    Snapshot reductions are CPU-bound numpy work, so they run in a worker
+    thread rather than on the event loop.
+    """
+    backend = stats_backend(backend)
+    cache = get_stats_cache()
+    with stage("cache"):
+        version = await adataset_version(source)
+        digest, aoi_id = (saved_aoi.geometry_hash, saved_aoi.pk) if saved_aoi is not None else (None, None)
+        handle = distribution_cache_key(geometry, source, version, backend, geometry_digest=digest)
+        entry = await cache.aget(handle)
+    hit = entry is not None
+    if not hit:
+        distribution = None
+        if backend == "snapshot":
+            reduce = sync_to_async(_snapshot_distribution, thread_sensitive=False)
+            distribution = await reduce(geometry, source, version)
+        if distribution is None:
+            distribution = await acompute_distribution(geometry, source, aoi_id=aoi_id)
+        entry = (source, version, distribution)
+        await cache.aset(handle, entry)
+    _note_entry(entry, hit)
+
+    with stage("summarize"):
+        stats = summarize_distribution(entry[2], threshold, bins or DEFAULT_BINS)
+    stats["distribution_handle"] = handle
+    if include_distribution:
+        stats["distribution"] = distribution_payload(entry[2])
+    return stats
+
+
+def cached_compute_batch_stats(
+    aois: List[Tuple[Any, Any]],
+    threshold: float = 60,
+    bins: List[float] = None,
+    source: Optional[str] = None,
+) -> Dict[Any, Dict]:
+    """
+    Stats for ``(key, geometry)`` pairs, keyed like the input. Cached AOIs are
+    answered from the cache; the rest are computed together in one query.
+    Batches always use the SQL backend.
+    """
+    bin_edges = bins or DEFAULT_BINS
+    cache = get_stats_cache()
+    version = dataset_version(source)
+    handles = [distribution_cache_key(geometry, source, version) for _, geometry in aois]
+    entries = [cache.get(handle) for handle in handles]
+
+    missing = [index for index, entry in enumerate(entries) if entry is None]
+    computed = compute_distributions([aois[index][1] for index in missing], source)
+    for index, distribution in zip(missing, computed):
+        entries[index] = (source, version, distribution)
+        cache.set(handles[index], entries[index])
+
+    results: Dict[Any, Dict] = {}
+    for (key, _), handle, entry in zip(aois, handles, entries):
+        stats = summarize_distribution(entry[2], threshold, bin_edges)
+        stats["distribution_handle"] = handle
+        results[key] = stats
+    return results
+
+
+def rebin_cached(handle: str, threshold: float = 60, bins: List[float] = None) -> Optional[Dict]:
+    """
+    Re-summarises a previously computed distribution for a new threshold or
+    bins. Returns None when the handle is unknown, expired or from an older
+    dataset version. Handle lookups bypass the hit/miss counters, which
+    describe stats requests only.
+    """
+    entry = get_stats_cache()._get(handle)
+    if entry is None:
+        return None
+    source, version, distribution = entry
+    # Another worker may have loaded new rows since this entry was cached.
+    if dataset_version(source) != version:
+        return None
+    stats = summarize_distribution(distribution, threshold, bins or DEFAULT_BINS)
+    stats["distribution_handle"] = handle
+    return stats
+
+
+@receiver(cells_loaded)
+def _invalidate_on_load(sender, sources, **kwargs):
+    bump_dataset_versions(sources)
+    # Other processes see the new version; drop this process' entries right away.
+    get_stats_cache().clear()
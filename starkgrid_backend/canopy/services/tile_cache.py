@@ -0,0 +1,186 @@
+"""
+Disk cache for rendered map tiles.
+
+Tiles live at ``<FOREST_DENSITY_TILE_CACHE_DIR>/<layer>/<source>/<z>/<x>/<y>.<ext>``
+(``_all`` stands for the all-sources layer). When the loaders report new rows,
+only tiles overlapping the extent of the reloaded ``tile_id``s, and of any
+cells deleted to replace them, are removed.
+"""
+import math
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import connection
+from django.dispatch import receiver
+
+from canopy.models import ForestDensityCell
+from canopy.signals import cells_loaded
+
+
+ALL_SOURCES = "_all"
+WEB_MERCATOR_MAX_LAT = 85.0511287798066
+
+
+def tile_cache_root() -> Path:
+    return Path(getattr(settings, "FOREST_DENSITY_TILE_CACHE_DIR", Path(settings.BASE_DIR) / "tile_cache"))
+
+
+def source_dir_name(source: Optional[str]) -> str:
+    """
+    Directory name for ``source``. ``quote`` escapes "/" but not dots or
+    underscores, so names that would resolve to "." / ".." or collide with
+    ``_all`` are percent-encoded byte by byte instead.
+    """
+    if not source:
+        return ALL_SOURCES
+    name = quote(source, safe="")
+    if not name.strip(".") or name == ALL_SOURCES:
+        name = "".join(f"%{byte:02X}" for byte in source.encode())
+    return name
+
+
+class TileCache:
+    """
+    One cached tile layer (e.g. ``mvt`` or ``png``). Writes go through a
+    temporary file and ``os.replace`` so readers never see partial tiles.
+    """
+
+    def __init__(self, layer: str, extension: str):
+        self.layer = layer
+        self.extension = extension
+
+    def path(self, source: Optional[str], z: int, x: int, y: int) -> Path:
+        return tile_cache_root() / self.layer / source_dir_name(source) / str(z) / str(x) / f"{y}.{self.extension}"
+
+    def get(self, source: Optional[str], z: int, x: int, y: int) -> Optional[bytes]:
+        try:
+            return self.path(source, z, x, y).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def clear(self, source: Optional[str]) -> None:
+        shutil.rmtree(tile_cache_root() / self.layer / source_dir_name(source), ignore_errors=True)
+
+    def set(self, source: Optional[str], z: int, x: int, y: int, data: bytes) -> None:
+        path = self.path(source, z, x, y)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as temp:
+                temp.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+def tile_range(bbox: Tuple[float, float, float, float], z: int) -> Tuple[int, int, int, int]:
+    """
+    Inclusive (x_min, y_min, x_max, y_max) XYZ tile indexes covering a lon/lat bbox at zoom ``z``.
+    """
+    n = 2 ** z
+
+    def tile_x(lon: float) -> int:
+        return min(n - 1, max(0, int((lon + 180.0) / 360.0 * n)))
+
+    def tile_y(lat: float) -> int:
+        lat = max(-WEB_MERCATOR_MAX_LAT, min(WEB_MERCATOR_MAX_LAT, lat))
+        rad = math.radians(lat)
+        return min(n - 1, max(0, int((1.0 - math.asinh(math.tan(rad)) / math.pi) / 2.0 * n)))
+
+    xmin, ymin, xmax, ymax = bbox
+    return tile_x(xmin), tile_y(ymax), tile_x(xmax), tile_y(ymin)
+
+
+def iter_tiles(bbox: Tuple[float, float, float, float], min_zoom: int, max_zoom: int) -> Iterator[Tuple[int, int, int]]:
+    for z in range(min_zoom, max_zoom + 1):
+        x_min, y_min, x_max, y_max = tile_range(bbox, z)
+        for x in range(x_min, x_max + 1):
+            for y in range(y_min, y_max + 1):
+                yield z, x, y
+
+
+def _remove_tiles_in_bbox(source_dir: Path, bbox: Tuple[float, float, float, float]) -> int:
+    removed = 0
+    for zoom_dir in source_dir.iterdir() if source_dir.is_dir() else ():
+        if not zoom_dir.name.isdigit():
+            continue
+        x_min, y_min, x_max, y_max = tile_range(bbox, int(zoom_dir.name))
+        # Neighbouring tiles draw the same cells inside their buffer.
+        x_min, y_min, x_max, y_max = x_min - 1, y_min - 1, x_max + 1, y_max + 1
+        for x_dir in zoom_dir.iterdir():
+            if not x_dir.name.isdigit() or not x_min <= int(x_dir.name) <= x_max:
+                continue
+            for tile in x_dir.iterdir():
+                stem = tile.name.split(".", 1)[0]
+                if stem.isdigit() and y_min <= int(stem) <= y_max:
+                    tile.unlink(missing_ok=True)
+                    removed += 1
+    return removed
+
+
+def tile_extents(tiles: Dict[str, Set[str]]) -> Dict[str, Tuple[float, float, float, float]]:
+    """
+    Lon/lat extent of the given tile ids per source, read from the cell table.
+    """
+    extents = {}
+    with connection.cursor() as cursor:
+        for source, tile_ids in tiles.items():
+            cursor.execute(
+                f"""
+                SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e)
+                FROM (SELECT ST_Extent(geom) AS e FROM {ForestDensityCell._meta.db_table}
+                      WHERE source = %s AND tile_id = ANY(%s)) AS extent
+                """,
+                [source, sorted(tile_ids)],
+            )
+            row = cursor.fetchone()
+            if row and row[0] is not None:
+                extents[source] = tuple(row)
+    return extents
+
+
+def invalidate_tiles(
+    sources: Iterable[str],
+    tiles: Optional[Dict[str, Set[str]]] = None,
+    replaced: Optional[Dict[str, Tuple[float, float, float, float]]] = None,
+) -> int:
+    """
+    Removes cached tiles made stale by a load, in every layer: those over the
+    current extent of the reloaded tile ids and over ``replaced``, the extent
+    of the cells the load deleted (captured before the delete). Sources with
+    neither lose their whole cache; the all-sources layer loses the same
+    extents. Returns the number of tiles removed (directories count as one).
+    """
+    root = tile_cache_root()
+    if not root.is_dir():
+        return 0
+
+    extents = tile_extents(tiles) if tiles else {}
+    replaced = replaced or {}
+    removed = 0
+    for layer_dir in root.iterdir():
+        if not layer_dir.is_dir():
+            continue
+        for source in set(sources) | set(tiles or {}) | set(replaced):
+            bboxes = [bbox for bbox in (extents.get(source), replaced.get(source)) if bbox is not None]
+            if bboxes:
+                for bbox in bboxes:
+                    removed += _remove_tiles_in_bbox(layer_dir / source_dir_name(source), bbox)
+                    removed += _remove_tiles_in_bbox(layer_dir / ALL_SOURCES, bbox)
+            else:
+                for name in (source_dir_name(source), ALL_SOURCES):
+                    if (layer_dir / name).is_dir():
+                        shutil.rmtree(layer_dir / name, ignore_errors=True)
+                        removed += 1
+    return removed
+
+
+@receiver(cells_loaded)
+def _invalidate_on_load(sender, sources, tiles=None, replaced=None, **kwargs):
+    invalidate_tiles(sources, tiles, replaced)
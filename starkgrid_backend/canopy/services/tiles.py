@@ -0,0 +1,137 @@
+from functools import lru_cache
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection
+
+from canopy.models import ForestDensityCell, ForestDensitySourceTile
+from canopy.serializers import DEFAULT_BINS
+from canopy.services.grid_storage import grid_cells_sql, uses_grid_storage
+from canopy.services.tile_cache import TileCache
+
+
+MVT_LAYER = "forest_density"
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+MAX_ZOOM = 22
+
+# Up to this zoom, cells are dissolved into one multipolygon per DEFAULT_BINS
+# class; individual cells are below a pixel there anyway.
+DEFAULT_DISSOLVE_MAX_ZOOM = 8
+
+mvt_cache = TileCache("mvt", "mvt")
+
+
+def dissolve_max_zoom() -> int:
+    return getattr(settings, "FOREST_DENSITY_TILE_DISSOLVE_MAX_ZOOM", DEFAULT_DISSOLVE_MAX_ZOOM)
+
+
+def is_valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+@lru_cache(maxsize=None)
+def build_mvt_sql(dissolve: bool, grid: bool = False) -> str:
+    """
+    ST_AsMVT query for tile (%(z)s, %(x)s, %(y)s). Cells are filtered in 4326
+    against the tile envelope grown by the MVT buffer, then projected to 3857.
+    With ``grid``, compact grid cells in the envelope's row/col window are read.
+
+    Dissolved tiles have one feature per bin with its class index, bounds and
+    area-weighted mean canopy; detailed tiles have one feature per cell.
+    """
+    bounds = f"""
+        bounds AS (
+            SELECT
+                ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS tile,
+                ST_Transform(
+                    ST_TileEnvelope(%(z)s, %(x)s, %(y)s, margin => {MVT_BUFFER / MVT_EXTENT}), 4326
+                ) AS filter
+        )
+    """
+    if grid:
+        cells = grid_cells_sql("bounds", "bounds.filter")
+    else:
+        cells = """
+            SELECT c.*
+            FROM canopy_forestdensitycell c, bounds
+            WHERE c.geom && bounds.filter
+              AND (%(source)s::text IS NULL OR c.source = %(source)s)
+        """
+    mvt_geom = f"ST_AsMVTGeom({{}}, bounds.tile, {MVT_EXTENT}, {MVT_BUFFER}, true)"
+    if dissolve:
+        # width_bucket counts edges <= pct; LEAST folds 100 into the last bin.
+        features = f"""
+            classed AS (
+                SELECT
+                    LEAST(width_bucket(c.canopy_pct, %(edges)s::numeric[]), %(classes)s) AS class,
+                    c.geom,
+                    c.canopy_pct,
+                    c.area_m2
+                FROM ({cells}) c
+            ),
+            features AS (
+                SELECT
+                    class - 1 AS class,
+                    (%(edges)s::numeric[])[class]::float8 AS min,
+                    (%(edges)s::numeric[])[class + 1]::float8 AS max,
+                    (SUM(canopy_pct * area_m2) / NULLIF(SUM(area_m2), 0))::float8 AS mean_canopy,
+                    {mvt_geom.format("ST_Transform(ST_Union(geom), 3857)")} AS geom
+                FROM classed, bounds
+                WHERE class >= 1
+                GROUP BY class, bounds.tile
+            )
+        """
+    else:
+        features = f"""
+            features AS (
+                SELECT
+                    c.id,
+                    c.canopy_pct::float8 AS canopy_pct,
+                    c.source,
+                    c.tile_id,
+                    {mvt_geom.format("ST_Transform(c.geom, 3857)")} AS geom
+                FROM ({cells}) c, bounds
+            )
+        """
+    return f"""
+        WITH {bounds}, {features}
+        SELECT ST_AsMVT(features.*, '{MVT_LAYER}', {MVT_EXTENT}, 'geom')
+        FROM features
+        WHERE geom IS NOT NULL
+    """
+
+
+def render_mvt(z: int, x: int, y: int, source: Optional[str] = None) -> bytes:
+    dissolve = z <= dissolve_max_zoom()
+    params = {"z": z, "x": x, "y": y, "source": source}
+    if dissolve:
+        params.update(edges=[float(edge) for edge in DEFAULT_BINS], classes=len(DEFAULT_BINS) - 1)
+    with connection.cursor() as cursor:
+        cursor.execute(build_mvt_sql(dissolve, grid=uses_grid_storage()), params)
+        row = cursor.fetchone()
+    return bytes(row[0]) if row and row[0] is not None else b""
+
+
+def has_cells(source: str) -> bool:
+    """
+    Whether ``source`` has any cells in the configured storage layout.
+    """
+    if uses_grid_storage():
+        return ForestDensitySourceTile.objects.filter(source__name=source).exists()
+    return ForestDensityCell.objects.filter(source=source).exists()
+
+
+def get_mvt(z: int, x: int, y: int, source: Optional[str] = None) -> Optional[bytes]:
+    """
+    Cached MVT for a tile; empty tiles are cached too (as empty files).
+    Returns None for a source with no cells, so arbitrary ``?source=``
+    values never render or add cache directories.
+    """
+    data = mvt_cache.get(source, z, x, y)
+    if data is None:
+        if source is not None and not has_cells(source):
+            return None
+        data = render_mvt(z, x, y, source)
+        mvt_cache.set(source, z, x, y, data)
+    return data
@@ -0,0 +1,9 @@
+from django.dispatch import Signal
+
+
+# Sent by the loaders once new rows are committed.
+# Keyword arguments: ``sources`` (set of source labels that received rows) and
+# ``tiles`` (source label -> set of tile ids written; may be omitted) and
+# ``replaced`` (source label -> lon/lat extent of the cells deleted to make
+# room for the new rows; may be omitted).
+cells_loaded = Signal()
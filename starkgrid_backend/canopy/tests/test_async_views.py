@@ -0,0 +1,117 @@
+from contextlib import asynccontextmanager
+from unittest import mock
+
+from django.contrib.gis.geos import Polygon
+from django.test import SimpleTestCase
+
+from canopy.services.forest_density import distribution_from_rows
+from canopy.services.pyramid import aselect_level
+from canopy.services.stats_cache import adataset_version, reset_stats_cache
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, sql, params):
+        self.executed.append((sql, params))
+
+    async def fetchall(self):
+        return self.rows
+
+    async def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+def fake_pool(rows):
+    pool = mock.Mock()
+    cursor = FakeCursor(rows)
+
+    @asynccontextmanager
+    async def connection():
+        yield mock.Mock(cursor=lambda: cursor)
+
+    pool.connection = connection
+    return pool, cursor
+
+
+class AsyncForestDensityViewTests(SimpleTestCase):
+    def setUp(self):
+        reset_stats_cache()
+        self.geometry = Polygon.from_bbox((0, 0, 1, 1)).geojson
+
+    async def test_stats_match_sync_response_shape(self):
+        distribution = distribution_from_rows([(30, 100.0, 1, 3000.0), (70, 300.0, 1, 21000.0)])
+        with mock.patch("canopy.services.stats_cache.adataset_version", return_value=0), mock.patch(
+            "canopy.services.stats_cache.acompute_distribution", return_value=distribution
+        ):
+            response = await self.async_client.post(
+                "/api/forest-density/async/stats/",
+                {"geometry": self.geometry, "threshold": 50, "mode": "histogram"},
+                content_type="application/json",
+            )
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["area_above_threshold_m2"], 300.0)
+        self.assertEqual(body["distribution"]["cum_area_m2"], [100.0, 400.0])
+
+    async def test_invalid_payload_returns_serializer_errors(self):
+        response = await self.async_client.post(
+            "/api/forest-density/async/stats/",
+            {"geometry": self.geometry, "bins": [10, 100]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("bins", response.json())
+
+    async def test_legend(self):
+        response = await self.async_client.get("/api/forest-density/async/legend/")
+        self.assertEqual(response.json()["bin_edges"], [0, 20, 40, 60, 80, 100])
+
+    async def test_wkb_bodies_are_parsed_like_the_sync_view(self):
+        distribution = distribution_from_rows([(30, 100.0, 1, 3000.0), (70, 300.0, 1, 21000.0)])
+        with mock.patch("canopy.services.stats_cache.adataset_version", return_value=0), mock.patch(
+            "canopy.services.stats_cache.acompute_distribution", return_value=distribution
+        ) as compute:
+            response = await self.async_client.post(
+                "/api/forest-density/async/stats/?threshold=50",
+                bytes(Polygon.from_bbox((0, 0, 1, 1)).wkb),
+                content_type="application/octet-stream",
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()["area_above_threshold_m2"], 300.0)
+        self.assertEqual(compute.call_args.args[0].srid, 4326)
+
+        bad = await self.async_client.post(
+            "/api/forest-density/async/stats/", b"\x01garbage", content_type="application/wkb"
+        )
+        self.assertEqual(bad.status_code, 400)
+        self.assertIn("WKB parse error", bad.json()["detail"])
+
+
+class AsyncPoolReadTests(SimpleTestCase):
+    async def test_dataset_version_reads_the_async_pool(self):
+        pool, cursor = fake_pool([(7,)])
+        with mock.patch("canopy.services.stats_cache.get_async_pool", return_value=pool):
+            self.assertEqual(await adataset_version("lidar"), 7)
+        self.assertEqual(cursor.executed[0][1], ["lidar"])
+
+        pool, _ = fake_pool([])
+        with mock.patch("canopy.services.stats_cache.get_async_pool", return_value=pool):
+            self.assertEqual(await adataset_version(), 0)
+
+    async def test_select_level_builds_levels_from_pool_rows(self):
+        aoi = Polygon.from_bbox((0, 0, 1, 1))
+        pool, cursor = fake_pool([(1, "", 0.5, 0.01, None), (2, "", 0.05, 0.01, None)])
+        with mock.patch("canopy.services.pyramid.get_async_pool", return_value=pool):
+            level = await aselect_level(aoi)
+        self.assertEqual((level.pk, level.cell_size), (2, 0.05))
+        self.assertIn("ORDER BY cell_size DESC", cursor.executed[0][0])
@@ -0,0 +1,90 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.test import SimpleTestCase
+
+from canopy.services.benchmark import (
+    SyntheticGrid,
+    benchmark_aoi,
+    canopy_values,
+    compare_results,
+    metric,
+    time_calls,
+    write_synthetic_ndjson,
+)
+from canopy.services.ingest import peak_rss_mib
+
+
+class SyntheticGridTests(SimpleTestCase):
+    def test_values_are_seeded_and_in_range(self):
+        for distribution in ("uniform", "bimodal", "patchy"):
+            grid = SyntheticGrid(width=30, height=20, distribution=distribution, seed=7)
+            values = canopy_values(grid)
+            self.assertEqual(values.shape, (20, 30))
+            self.assertTrue(((values >= 0) & (values <= 100)).all())
+            self.assertTrue((canopy_values(grid) == values).all())
+
+    def test_unknown_distribution(self):
+        with self.assertRaises(ValueError):
+            canopy_values(SyntheticGrid(distribution="gaussian"))
+
+    def test_ndjson_covers_the_extent(self):
+        grid = SyntheticGrid(west=10.0, south=-1.0, width=4, height=3, resolution=0.5, tile_size=2)
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cells.ndjson"
+            self.assertEqual(write_synthetic_ndjson(grid, path, "bench"), 12)
+            features = [json.loads(line) for line in path.read_text().splitlines()]
+
+        xs = [x for feature in features for x, _ in feature["geometry"]["coordinates"][0]]
+        ys = [y for feature in features for _, y in feature["geometry"]["coordinates"][0]]
+        self.assertEqual((min(xs), min(ys), max(xs), max(ys)), grid.extent)
+        self.assertEqual({feature["properties"]["tile_id"] for feature in features}, {"0_0", "0_1", "1_0", "1_1"})
+        self.assertEqual(features[0]["properties"]["source"], "bench")
+
+    def test_aoi_vertices_and_size(self):
+        grid = SyntheticGrid()
+        aoi = benchmark_aoi(grid, 0.5, 64)
+        self.assertEqual(aoi.num_coords, 65)
+        self.assertTrue(aoi.valid)
+        xmin, _, xmax, _ = aoi.extent
+        self.assertLessEqual(xmax - xmin, 0.5 * grid.width * grid.resolution)
+
+
+class CompareResultsTests(SimpleTestCase):
+    def test_flags_regressions_in_either_direction(self):
+        baseline = {
+            "metrics": {
+                "stats.median_ms": metric(10.0, "ms"),
+                "ingest.rows_per_s": metric(1000.0, "rows/s", better="higher"),
+                "stats.p95_ms": metric(20.0, "ms"),
+            }
+        }
+        current = {
+            "metrics": {
+                "stats.median_ms": metric(12.0, "ms"),
+                "ingest.rows_per_s": metric(950.0, "rows/s", better="higher"),
+                "stats.p95_ms": metric(15.0, "ms"),
+                "stats.new_case_ms": metric(1.0, "ms"),
+            }
+        }
+        regressions = compare_results(current, baseline, max_regression=0.1)
+        self.assertEqual([item["name"] for item in regressions], ["stats.median_ms"])
+        self.assertAlmostEqual(regressions[0]["change"], 0.2)
+
+        regressions = compare_results(current, baseline, max_regression=0.01)
+        self.assertEqual([item["name"] for item in regressions], ["stats.median_ms", "ingest.rows_per_s"])
+
+    def test_time_calls_reports_percentiles(self):
+        calls = []
+        timings = time_calls(lambda: calls.append(1), repeats=4, warmup=2)
+        self.assertEqual(len(calls), 6)
+        self.assertLessEqual(timings["min_ms"], timings["median_ms"])
+        self.assertLessEqual(timings["median_ms"], timings["p95_ms"])
+
+    def test_peak_rss_of_finished_children(self):
+        subprocess.run([sys.executable, "-c", "data = bytearray(96 << 20); data[::4096] = b'x' * len(data[::4096])"])
+        self.assertGreaterEqual(peak_rss_mib(children=True), 96)
+        self.assertGreater(peak_rss_mib(), 0)
@@ -0,0 +1,103 @@
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from django.test import SimpleTestCase, override_settings
+
+from canopy.services.cog import (
+    NODATA,
+    GridSpec,
+    _clear_stale,
+    burn_cells,
+    cog_is_stale,
+    cog_path,
+    get_png,
+    legend_lookup,
+    mark_cog_stale,
+    read_tile,
+    render_png,
+    write_cog,
+)
+
+
+class BurnCellsTests(SimpleTestCase):
+    def test_single_and_multi_pixel_cells(self):
+        grid = GridSpec(west=0.0, north=1.0, res_x=0.25, res_y=0.25, width=4, height=4)
+        target = np.full((4, 4), NODATA, dtype=np.uint8)
+        cells = np.array(
+            [
+                (0.0, 0.75, 0.25, 1.0, 12.4),  # top-left pixel
+                (0.5, 0.0, 1.0, 0.5, 100.0),  # bottom-right 2x2 block
+            ]
+        )
+        burn_cells(target, grid, cells)
+        self.assertEqual(target[0, 0], 12)
+        self.assertTrue((target[2:, 2:] == 100).all())
+        self.assertEqual(int((target == NODATA).sum()), 11)
+
+
+class LegendLookupTests(SimpleTestCase):
+    def test_bins_and_nodata(self):
+        lookup, palette = legend_lookup()
+        self.assertEqual([lookup[0], lookup[19], lookup[20], lookup[99], lookup[100]], [0, 0, 1, 4, 4])
+        self.assertEqual(palette[lookup[NODATA]][3], 0)
+        self.assertEqual(palette[4], (0x00, 0x6D, 0x2C, 255))
+
+
+class PngTileTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.override = override_settings(
+            FOREST_DENSITY_COG_DIR=self.directory.name, FOREST_DENSITY_TILE_CACHE_DIR=self.directory.name
+        )
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+
+        grid = GridSpec(west=0.0, north=10.0, res_x=0.01, res_y=0.01, width=1000, height=1000)
+        data = np.full((1000, 1000), 80, dtype=np.uint8)
+        data[:, :500] = NODATA
+        write_cog(Path(self.directory.name) / "grid.tif", grid, data, cog_path("hansen_v1"))
+
+    def test_cog_has_overviews(self):
+        with rasterio.open(cog_path("hansen_v1")) as src:
+            self.assertTrue(src.overviews(1))
+
+    def test_tile_reads_window(self):
+        with rasterio.open(cog_path("hansen_v1")) as src:
+            # z7 tile (64, 61) spans lon 0..2.8, lat ~5.6..8.4: inside the western (nodata) half.
+            self.assertTrue((read_tile(src, 7, 64, 61) == NODATA).all())
+            values = read_tile(src, 8, 133, 123)
+            self.assertIsNone(read_tile(src, 8, 10, 10))
+        self.assertTrue((values == 80).all())
+
+    def test_png_endpoint(self):
+        response = self.client.get("/api/forest-density/tiles/8/133/123.png?source=hansen_v1")
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertTrue(response.content.startswith(b"\x89PNG"))
+        self.assertEqual(render_png(8, 10, 10, "hansen_v1"), b"")
+        self.assertEqual(self.client.get("/api/forest-density/tiles/8/133/123.png?source=missing").status_code, 404)
+
+    def test_load_marks_cog_stale_until_export(self):
+        self.assertIsNotNone(get_png(8, 133, 123, "hansen_v1"))
+        before_load = time.time_ns()
+        time.sleep(0.01)
+        mark_cog_stale({"hansen_v1"})
+        self.assertTrue(cog_is_stale("hansen_v1") and cog_is_stale(None))
+        self.assertIsNone(get_png(8, 133, 123, "hansen_v1"))
+        self.assertEqual(self.client.get("/api/forest-density/tiles/8/133/123.png?source=hansen_v1").status_code, 404)
+
+        # An export that started before the load keeps the marker; one started after clears it.
+        _clear_stale("hansen_v1", before_load)
+        self.assertTrue(cog_is_stale("hansen_v1"))
+        _clear_stale("hansen_v1", time.time_ns())
+        self.assertFalse(cog_is_stale("hansen_v1"))
+        self.assertTrue(render_png(8, 133, 123, "hansen_v1").startswith(b"\x89PNG"))
+
+        # Loads before the first export leave no marker (or directory) behind.
+        missing = Path(self.directory.name) / "missing"
+        with override_settings(FOREST_DENSITY_COG_DIR=missing):
+            mark_cog_stale({"hansen_v1"})
+        self.assertFalse(missing.exists())
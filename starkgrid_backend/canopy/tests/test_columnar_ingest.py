@@ -0,0 +1,224 @@
+import importlib.util
+import json
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.contrib.gis.geos import GEOSGeometry, WKBWriter
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase
+
+from canopy.services.columnar_ingest import (
+    _flatgeobuf_batches,
+    _geoparquet_batches,
+    batch_to_rows,
+    columnar_format,
+    crs_to_srid,
+    iter_columnar_rows,
+    wkb_bounds,
+    wkb_to_ewkb_hex,
+)
+from canopy.services.ingest import polygon_to_ewkb_hex
+
+
+def square(x: float, y: float, size: float = 1.0) -> dict:
+    return {
+        "type": "Polygon",
+        "coordinates": [[[x, y], [x, y + size], [x + size, y + size], [x + size, y], [x, y]]],
+    }
+
+
+def to_wkb(geometry: dict, byteorder: int = 1, dim: int = 2) -> bytes:
+    writer = WKBWriter(dim=dim)
+    writer.byteorder = byteorder
+    return bytes(writer.write(GEOSGeometry(json.dumps(geometry))))
+
+
+class WkbToEwkbTests(SimpleTestCase):
+    def test_little_endian_polygons_match_the_geojson_encoder(self):
+        self.assertEqual(wkb_to_ewkb_hex(to_wkb(square(1, 2))), polygon_to_ewkb_hex(square(1, 2)))
+
+    def test_other_encodings_go_through_geos(self):
+        expected = GEOSGeometry(polygon_to_ewkb_hex(square(1, 2)))
+        big_endian = GEOSGeometry(wkb_to_ewkb_hex(to_wkb(square(1, 2), byteorder=0)))
+        self.assertTrue(big_endian.equals_exact(expected))
+
+        with_z = dict(square(1, 2), coordinates=[[[x, y, 5.0] for x, y in square(1, 2)["coordinates"][0]]])
+        flattened = GEOSGeometry(wkb_to_ewkb_hex(to_wkb(with_z, dim=3)))
+        self.assertFalse(flattened.hasz)
+        self.assertTrue(flattened.equals_exact(expected))
+
+    def test_reprojects_other_srids(self):
+        mercator = GEOSGeometry(json.dumps(square(1, 2)), srid=4326)
+        mercator.transform(3857)
+        encoded = GEOSGeometry(wkb_to_ewkb_hex(bytes(mercator.wkb), srid=3857))
+        self.assertEqual(encoded.srid, 4326)
+        self.assertAlmostEqual(encoded.extent[0], 1.0, places=6)
+
+    def test_rejects_non_polygons(self):
+        with self.assertRaises(ValueError):
+            wkb_to_ewkb_hex(bytes(GEOSGeometry("POINT (0 0)").wkb))
+
+    def test_bounds_from_the_exterior_ring(self):
+        self.assertEqual(wkb_bounds(to_wkb(square(1, 2, 0.5))), (1.0, 2.0, 1.5, 2.5))
+        self.assertEqual(wkb_bounds(to_wkb(square(1, 2, 0.5), byteorder=0)), (1.0, 2.0, 1.5, 2.5))
+
+
+class BatchToRowsTests(SimpleTestCase):
+    def setUp(self):
+        self.geometries = [to_wkb(square(0, 0)), None, to_wkb(square(10, 10)), b"\x01garbage", to_wkb(square(2, 0))]
+        self.canopy = [40.5, 50, 60, 70, None]
+
+    def test_maps_columns_and_counts_unusable_rows(self):
+        tiles = ["a", "b", 7, "d", "e"]
+        sources = ["s1", "s1", None, "s1", "s1"]
+        batch = batch_to_rows(self.geometries, self.canopy, tiles, sources, source_override=None, srid=4326)
+        self.assertEqual(batch.skipped, 3)
+        self.assertEqual(
+            [(row.canopy_pct, row.source, row.tile_id) for row in batch.rows],
+            [(40.5, "s1", "a"), (60, "unknown", "7")],
+        )
+        self.assertEqual(batch.rows[0].geom_hex, polygon_to_ewkb_hex(square(0, 0)))
+
+    def test_source_override_and_missing_tile_column(self):
+        batch = batch_to_rows(self.geometries, self.canopy, None, None, source_override="v2", srid=4326)
+        self.assertEqual({(row.source, row.tile_id) for row in batch.rows}, {("v2", "")})
+
+    def test_bbox_drops_rows_outside_without_counting_them(self):
+        batch = batch_to_rows(self.geometries, self.canopy, None, None, "v2", 4326, bbox=(-1, -1, 1.5, 1.5))
+        self.assertEqual([row.canopy_pct for row in batch.rows], [40.5])
+        self.assertEqual(batch.skipped, 3)
+
+
+class FormatDetectionTests(SimpleTestCase):
+    def test_columnar_suffixes(self):
+        self.assertEqual(columnar_format(Path("cells.parquet")), "geoparquet")
+        self.assertEqual(columnar_format(Path("cells.FGB")), "flatgeobuf")
+        self.assertIsNone(columnar_format(Path("cells.ndjson.gz")))
+
+    def test_crs_to_srid(self):
+        self.assertEqual(crs_to_srid({"id": {"authority": "EPSG", "code": 32750}}), 32750)
+        self.assertEqual(crs_to_srid("OGC:CRS84"), 4326)
+        self.assertEqual(crs_to_srid("EPSG:3857"), 3857)
+        self.assertIsNone(crs_to_srid(None))
+        self.assertIsNone(crs_to_srid({"name": "custom"}))
+
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+HAS_PYOGRIO = importlib.util.find_spec("pyogrio") is not None
+
+# Ten unit squares along the x axis, in two tiles.
+FIXTURE_ROWS = [(square(x, 0), 10.0 * x, f"t{x // 5}") for x in range(10)]
+
+
+def read_rows(path: Path, bbox=None):
+    return [row for batch in iter_columnar_rows(path, "v1", "tile_id", "canopy_pct", bbox=bbox) for row in batch.rows]
+
+
+@unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+class GeoParquetReaderTests(SimpleTestCase):
+    def write(self, path: Path, covering: bool, row_group_size: int = 2) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        columns = {
+            "geometry": pa.array([to_wkb(geometry) for geometry, _, _ in FIXTURE_ROWS], pa.binary()),
+            "canopy_pct": pa.array([canopy for _, canopy, _ in FIXTURE_ROWS], pa.float64()),
+            "tile_id": pa.array([tile for _, _, tile in FIXTURE_ROWS]),
+        }
+        column_meta = {"encoding": "WKB", "geometry_types": ["Polygon"]}
+        if covering:
+            bounds = [wkb_bounds(to_wkb(geometry)) for geometry, _, _ in FIXTURE_ROWS]
+            columns["bbox"] = pa.array(
+                [dict(zip(("xmin", "ymin", "xmax", "ymax"), box)) for box in bounds],
+                pa.struct([(name, pa.float64()) for name in ("xmin", "ymin", "xmax", "ymax")]),
+            )
+            column_meta["covering"] = {
+                "bbox": {name: ["bbox", name] for name in ("xmin", "ymin", "xmax", "ymax")}
+            }
+        geo = {"version": "1.1.0", "primary_column": "geometry", "columns": {"geometry": column_meta}}
+        table = pa.table(columns).replace_schema_metadata({"geo": json.dumps(geo)})
+        pq.write_table(table, path, row_group_size=row_group_size)
+
+    def test_reads_all_rows_with_the_default_crs(self):
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cells.parquet"
+            self.write(path, covering=False)
+            rows = read_rows(path)
+        self.assertEqual([row.canopy_pct for row in rows], [canopy for _, canopy, _ in FIXTURE_ROWS])
+        self.assertEqual(rows[7].tile_id, "t1")
+        self.assertEqual(rows[3].geom_hex, polygon_to_ewkb_hex(square(3, 0)))
+
+    def test_bbox_uses_the_covering_column(self):
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cells.parquet"
+            self.write(path, covering=True)
+            batches = list(_geoparquet_batches(path, "tile_id", "canopy_pct", (2.5, 0, 4.5, 1), 1024))
+            rows = read_rows(path, bbox=(2.5, 0, 4.5, 1))
+        # The filter is answered by the covering column, so no row-level geometry check is needed.
+        self.assertTrue(batches)
+        self.assertFalse(any(filter_rows for _, _, _, filter_rows in batches))
+        self.assertEqual(sum(batch.num_rows for batch, _, _, _ in batches), 3)
+        self.assertEqual([row.canopy_pct for row in rows], [20.0, 30.0, 40.0])
+
+    def test_bbox_without_covering_filters_rows(self):
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cells.parquet"
+            self.write(path, covering=False)
+            batches = list(_geoparquet_batches(path, "tile_id", "canopy_pct", (2.5, 0, 4.5, 1), 1024))
+            rows = read_rows(path, bbox=(2.5, 0, 4.5, 1))
+        self.assertTrue(all(filter_rows for _, _, _, filter_rows in batches))
+        self.assertEqual([row.canopy_pct for row in rows], [20.0, 30.0, 40.0])
+
+
+@unittest.skipUnless(HAS_PYOGRIO and HAS_PYARROW, "pyogrio and pyarrow are not installed")
+class FlatGeobufReaderTests(SimpleTestCase):
+    def write(self, path: Path) -> None:
+        import numpy as np
+        from pyogrio.raw import write
+
+        geometry = np.array([to_wkb(geometry) for geometry, _, _ in FIXTURE_ROWS], dtype=object)
+        field_data = [
+            np.array([canopy for _, canopy, _ in FIXTURE_ROWS]),
+            np.array([tile for _, _, tile in FIXTURE_ROWS], dtype=object),
+        ]
+        write(
+            str(path),
+            geometry,
+            field_data,
+            ["canopy_pct", "tile_id"],
+            driver="FlatGeobuf",
+            geometry_type="Polygon",
+            crs="EPSG:4326",
+        )
+
+    def test_reads_all_rows(self):
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cells.fgb"
+            self.write(path)
+            rows = read_rows(path)
+        self.assertEqual(sorted(row.canopy_pct for row in rows), [canopy for _, canopy, _ in FIXTURE_ROWS])
+        self.assertEqual({row.tile_id for row in rows}, {"t0", "t1"})
+        by_canopy = {row.canopy_pct: row for row in rows}
+        self.assertTrue(GEOSGeometry(by_canopy[30.0].geom_hex).equals_exact(GEOSGeometry(json.dumps(square(3, 0)))))
+
+    def test_bbox_is_a_spatial_filter(self):
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cells.fgb"
+            self.write(path)
+            batches = list(_flatgeobuf_batches(path, "tile_id", "canopy_pct", (2.5, 0, 4.5, 1), 1024))
+            rows = read_rows(path, bbox=(2.5, 0, 4.5, 1))
+        # GDAL answers the bbox from the packed R-tree; rows are not filtered again.
+        self.assertFalse(any(filter_rows for _, _, _, filter_rows in batches))
+        self.assertEqual(sum(batch.num_rows for batch, _, _, _ in batches), 3)
+        self.assertEqual(sorted(row.canopy_pct for row in rows), [20.0, 30.0, 40.0])
+
+
+class LoadCommandOptionTests(SimpleTestCase):
+    def test_bbox_cannot_be_combined_with_incremental(self):
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cells.fgb"
+            path.write_bytes(b"")
+            with self.assertRaisesMessage(CommandError, "--bbox cannot be combined with --incremental"):
+                call_command("load_forest_density", "--file", str(path), "--bbox", "0,0,1,1", "--incremental")
@@ -0,0 +1,104 @@
+import csv
+import gzip
+import io
+import json
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.gis.geos import Polygon
+from django.test import AsyncClient, SimpleTestCase, TestCase
+
+from canopy.services.export import astream_cells, gzip_stream, stream_cells, stream_stats
+from canopy.services.forest_density import compute_stats
+from canopy.tests.test_forest_density_stats import make_grid
+
+
+SQUARE = '{"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 0]]]}'
+BATCHES = [
+    [(1, "s", "t1", Decimal("30.00"), 100.0, SQUARE), (2, "s", "t1", Decimal("70.00"), 300.0, SQUARE)],
+    [],
+    [(3, "s", "t2", Decimal("90.00"), 600.0, SQUARE)],
+]
+
+
+class StreamCellsTests(SimpleTestCase):
+    def stream(self, export_format):
+        with mock.patch("canopy.services.export.iter_clipped_cells", return_value=iter(BATCHES)):
+            return list(stream_cells(None, export_format, threshold=60, bins=[0, 50, 100]))
+
+    def test_geojson_is_one_collection_with_trailing_stats(self):
+        body = json.loads("".join(self.stream("geojson")))
+        self.assertEqual([f["properties"]["id"] for f in body["features"]], [1, 2, 3])
+        self.assertEqual(body["stats"]["total_area_m2"], 1000.0)
+        self.assertEqual(body["stats"]["area_above_threshold_m2"], 900.0)
+
+    def test_ndjson_has_one_feature_per_line_then_stats(self):
+        lines = [json.loads(line) for line in "".join(self.stream("ndjson")).splitlines()]
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[2]["properties"]["canopy_pct"], 90.0)
+        self.assertEqual(lines[3]["stats"]["pixel_count"], 3)
+
+    def test_csv_rows(self):
+        rows = list(csv.reader(io.StringIO("".join(self.stream("csv")))))
+        self.assertEqual(rows[0], ["id", "source", "tile_id", "canopy_pct", "area_m2", "wkt"])
+        self.assertEqual(len(rows), 4)
+
+    async def test_async_stream_matches_the_sync_stream(self):
+        async def batches(*args, **kwargs):
+            for batch in BATCHES:
+                yield batch
+
+        for export_format in ("csv", "geojson", "ndjson"):
+            with mock.patch("canopy.services.export.aiter_clipped_cells", batches):
+                chunks = [chunk async for chunk in astream_cells(None, export_format, threshold=60, bins=[0, 50, 100])]
+            self.assertEqual(chunks, self.stream(export_format))
+
+    async def test_async_view_streams_gzip(self):
+        async def batches(*args, **kwargs):
+            for batch in BATCHES:
+                yield batch
+
+        with mock.patch("canopy.services.export.aiter_clipped_cells", batches):
+            response = await self.async_client.post(
+                "/api/forest-density/async/export/",
+                {"geometry": json.loads(SQUARE), "format": "ndjson", "gzip": True},
+                content_type="application/json",
+            )
+            body = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="forest-density-cells.ndjson.gz"')
+        self.assertEqual(len(gzip.decompress(body).splitlines()), 4)
+
+    async def test_async_views_are_csrf_exempt(self):
+        client = AsyncClient(enforce_csrf_checks=True)
+        for path in ("/api/forest-density/async/export/", "/api/forest-density/async/stats/"):
+            response = await client.post(path, "{", content_type="application/json")
+            self.assertEqual(response.status_code, 400, path)
+
+    def test_stats_csv(self):
+        stats = {
+            "mean_canopy": 50.0,
+            "total_area_m2": 10.0,
+            "area_above_threshold_m2": 5.0,
+            "pixel_count": 2,
+            "threshold": 60.0,
+            "area_by_class": [{"min": 0.0, "max": 50.0, "area_m2": 5.0}, {"min": 50.0, "max": 100.0, "area_m2": 5.0}],
+        }
+        rows = list(csv.reader(io.StringIO("".join(stream_stats(None, stats, "csv")))))
+        self.assertEqual(rows[-1], ["area_m2[50-100]", "5.0"])
+
+    def test_gzip_round_trip(self):
+        compressed = b"".join(gzip_stream(["a,b\n", "1,2\n"]))
+        self.assertEqual(gzip.decompress(compressed), b"a,b\n1,2\n")
+
+
+class ExportQueryTests(TestCase):
+    def test_streamed_stats_match_compute_stats(self):
+        make_grid(size=10, step=0.01)
+        aoi = Polygon.from_bbox((0.013, 0.017, 0.087, 0.091))
+        aoi.srid = 4326
+
+        body = json.loads("".join(stream_cells(aoi, "geojson", threshold=60, bins=[0, 50, 100], source="test_grid")))
+        expected = compute_stats(aoi, threshold=60, bins=[0, 50, 100], source="test_grid")
+
+        self.assertEqual(len(body["features"]), expected["pixel_count"])
+        self.assertAlmostEqual(body["stats"]["total_area_m2"], expected["total_area_m2"], places=3)
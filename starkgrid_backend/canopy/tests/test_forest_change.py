@@ -0,0 +1,105 @@
+from django.contrib.gis.geos import Polygon
+from django.test import SimpleTestCase, TestCase
+
+from canopy.models import ForestDensityCell
+from canopy.serializers import ForestDensityChangeRequestSerializer
+from canopy.services.forest_change import compute_change, summarize_change
+
+
+def make_cells(values, source: str, step: float = 0.01, x_offset: float = 0.0) -> None:
+    ForestDensityCell.objects.bulk_create(
+        ForestDensityCell(
+            geom=Polygon.from_bbox((x_offset + col * step, 0, x_offset + (col + 1) * step, step)),
+            canopy_pct=value,
+            source=source,
+            tile_id="0_0",
+        )
+        for col, value in enumerate(values)
+    )
+
+
+class SummarizeChangeTests(SimpleTestCase):
+    def test_folds_matched_and_unmatched_rows(self):
+        # (before class, after class, before forest, after forest, cells, area,
+        #  before weighted, after weighted, decreased, increased, loss, gain)
+        rows = [
+            (2, 1, True, False, 1, 100.0, 8000.0, 3000.0, 100.0, 0.0, 5000.0, 0.0),
+            (1, 1, False, False, 2, 200.0, 4000.0, 4000.0, 0.0, 0.0, 0.0, 0.0),
+            (1, 2, False, True, 1, 50.0, 1000.0, 4000.0, 0.0, 50.0, 0.0, 3000.0),
+            (None, 2, None, True, 1, 30.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0),
+            (1, None, False, None, 1, 20.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0),
+        ]
+        change = summarize_change(rows, threshold=60, bin_edges=[0, 50, 100])
+
+        self.assertEqual(change["matched_area_m2"], 350.0)
+        self.assertEqual(change["matched_cell_count"], 4)
+        self.assertEqual(change["transitions"]["area_m2"], [[200.0, 50.0], [100.0, 0.0]])
+        self.assertEqual(change["transitions"]["cell_count"], [[2, 1], [1, 0]])
+        self.assertEqual(change["unchanged_area_m2"], 200.0)
+        self.assertAlmostEqual(change["canopy_loss_m2"], 50.0)
+        self.assertAlmostEqual(change["canopy_gain_m2"], 30.0)
+        self.assertAlmostEqual(change["net_canopy_change_m2"], -20.0)
+        self.assertEqual((change["forest_loss_m2"], change["forest_gain_m2"]), (100.0, 50.0))
+        self.assertEqual(change["net_forest_change_m2"], -50.0)
+        self.assertAlmostEqual(change["mean_change_pct"], (11000.0 - 13000.0) / 350.0)
+        self.assertEqual((change["unmatched_before_area_m2"], change["unmatched_after_area_m2"]), (20.0, 30.0))
+
+    def test_empty_aoi(self):
+        change = summarize_change([], threshold=60, bin_edges=[0, 50, 100])
+        self.assertEqual(change["matched_area_m2"], 0.0)
+        self.assertEqual(change["mean_change_pct"], 0.0)
+        self.assertEqual(change["transitions"]["area_m2"], [[0.0, 0.0], [0.0, 0.0]])
+
+    def test_sources_must_differ(self):
+        geometry = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+        serializer = ForestDensityChangeRequestSerializer(
+            data={"geometry": geometry, "before_source": "v1", "after_source": "v1"}
+        )
+        self.assertFalse(serializer.is_valid())
+
+    def test_request_reuses_the_aoi_serializer(self):
+        geometry = Polygon.from_bbox((0, 0, 100_000, 100_000))
+        geometry.srid = 3857
+        serializer = ForestDensityChangeRequestSerializer(
+            data={"geometry": geometry.ewkt, "before_source": "v1", "after_source": "v2", "source": "v1"}
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data["geometry"].srid, 4326)
+        self.assertNotIn("source", serializer.validated_data)
+
+
+class ForestChangeTests(TestCase):
+    def test_cells_are_paired_across_sources(self):
+        make_cells([80, 30, 70, 10], source="v1")
+        make_cells([40, 30, 90, 65], source="v2")
+        self.assertEqual(
+            ForestDensityCell.objects.filter(source="v1").order_by("grid_key").values_list("grid_key", flat=True)[0],
+            ForestDensityCell.objects.filter(source="v2").order_by("grid_key").values_list("grid_key", flat=True)[0],
+        )
+        aoi = Polygon.from_bbox((-1, -1, 1, 1))
+        aoi.srid = 4326
+
+        change = compute_change(aoi, "v1", "v2", threshold=60, bins=[0, 50, 100])
+
+        cell_area = ForestDensityCell.objects.filter(source="v1").first().area_m2
+        self.assertEqual(change["matched_cell_count"], 4)
+        self.assertAlmostEqual(change["matched_area_m2"] / (4 * cell_area), 1.0, places=6)
+        self.assertEqual(change["transitions"]["cell_count"], [[1, 1], [1, 1]])
+        self.assertAlmostEqual(change["forest_loss_m2"] / cell_area, 1.0, places=6)
+        self.assertAlmostEqual(change["forest_gain_m2"] / cell_area, 1.0, places=6)
+        self.assertAlmostEqual(change["canopy_loss_m2"] / cell_area, 0.4, places=6)
+        self.assertAlmostEqual(change["canopy_gain_m2"] / cell_area, 0.75, places=6)
+        self.assertAlmostEqual(change["unchanged_area_m2"] / cell_area, 1.0, places=6)
+        self.assertEqual(change["unmatched_before_area_m2"], 0.0)
+
+    def test_cells_missing_from_one_source_are_unmatched(self):
+        make_cells([50, 50], source="v1")
+        make_cells([50], source="v2", x_offset=0.005)
+        aoi = Polygon.from_bbox((-1, -1, 1, 1))
+        aoi.srid = 4326
+
+        change = compute_change(aoi, "v1", "v2")
+
+        self.assertEqual(change["matched_cell_count"], 0)
+        self.assertGreater(change["unmatched_before_area_m2"], 0)
+        self.assertGreater(change["unmatched_after_area_m2"], 0)
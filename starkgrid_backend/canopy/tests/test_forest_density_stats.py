@@ -0,0 +1,166 @@
+import math
+
+from django.contrib.gis.geos import Polygon
+from django.test import SimpleTestCase, TestCase
+
+from canopy.models import ForestDensityCell
+from canopy.services.forest_density import (
+    compute_distributions,
+    compute_stats,
+    distribution_from_rows,
+    summarize_distribution,
+    summarize_rows,
+)
+from canopy.services.pyramid import build_level
+
+
+def make_grid(size: int, step: float, source: str = "test_grid") -> None:
+    cells = []
+    for row in range(size):
+        for col in range(size):
+            x0, y0 = col * step, row * step
+            cells.append(
+                ForestDensityCell(
+                    geom=Polygon.from_bbox((x0, y0, x0 + step, y0 + step)),
+                    canopy_pct=(row * 7 + col * 3) % 101,
+                    source=source,
+                    tile_id=f"{row // 10}_{col // 10}",
+                )
+            )
+    ForestDensityCell.objects.bulk_create(cells)
+
+
+class SummarizeRowsTests(SimpleTestCase):
+    def test_folds_rows_into_bins_and_threshold(self):
+        rows = [(10, 100.0, 1, 1000.0), (50, 300.0, 2, 15000.0), (90, 600.0, 3, 54000.0)]
+        stats = summarize_rows(rows, threshold=60, bin_edges=[0, 50, 100])
+        self.assertAlmostEqual(stats["total_area_m2"], 1000.0)
+        self.assertAlmostEqual(stats["mean_canopy"], 70.0)
+        self.assertAlmostEqual(stats["area_above_threshold_m2"], 600.0)
+        self.assertEqual([item["area_m2"] for item in stats["area_by_class"]], [100.0, 900.0])
+        self.assertEqual(stats["pixel_count"], 6)
+
+    def test_full_canopy_falls_in_last_bin(self):
+        stats = summarize_rows([(100, 50.0, 1, 5000.0)], threshold=100, bin_edges=[0, 50, 100])
+        self.assertEqual([item["area_m2"] for item in stats["area_by_class"]], [0.0, 50.0])
+        self.assertEqual(stats["area_above_threshold_m2"], 50.0)
+
+    def test_distribution_merges_repeated_percentages(self):
+        rows = [(40, 10.0, 1, 400.0), (20, 5.0, 2, 100.0), (40.0, 30.0, 3, 1200.0)]
+        distribution = distribution_from_rows(rows, pyramid_level=0.1)
+        self.assertEqual(distribution.canopy_pct, [20.0, 40.0])
+        self.assertEqual(distribution.cum_area_m2, [5.0, 45.0])
+        self.assertEqual(distribution.cum_cell_count, [2, 6])
+        self.assertEqual(distribution.area_below(40), 5.0)
+        self.assertEqual(distribution.area_through(40), 45.0)
+
+
+class PyramidStatsTests(TestCase):
+    def setUp(self):
+        make_grid(size=40, step=0.01)
+        self.aoi = Polygon.from_bbox((0.013, 0.017, 0.387, 0.391))
+        self.aoi.srid = 4326
+
+    def test_pyramid_matches_fine_cells(self):
+        expected = compute_stats(self.aoi, threshold=60, source="test_grid")
+        self.assertIsNone(expected["pyramid_level"])
+
+        build_level(0.05, source="test_grid")
+        actual = compute_stats(self.aoi, threshold=60, source="test_grid")
+
+        self.assertEqual(actual["pyramid_level"], 0.05)
+        self.assertEqual(actual["pixel_count"], expected["pixel_count"])
+        for key in ("total_area_m2", "area_above_threshold_m2", "mean_canopy"):
+            self.assertAlmostEqual(actual[key] / expected[key], 1.0, places=6)
+        for got, want in zip(actual["area_by_class"], expected["area_by_class"]):
+            self.assertAlmostEqual(got["area_m2"], want["area_m2"], delta=max(1.0, want["area_m2"] * 1e-6))
+
+    def test_pyramid_matches_fine_cells_for_a_jagged_aoi(self):
+        ring = []
+        for step in range(200):
+            angle = 2 * math.pi * step / 200
+            radius = 0.15 + 0.02 * math.sin(angle * 13)
+            ring.append((0.2 + radius * math.cos(angle), 0.2 + radius * math.sin(angle)))
+        ring.append(ring[0])
+        aoi = Polygon(ring, srid=4326)
+        with self.settings(FOREST_DENSITY_SUBDIVIDE_MAX_VERTICES=16):
+            expected = compute_stats(aoi, threshold=60, source="test_grid")
+            build_level(0.05, source="test_grid")
+            actual = compute_stats(aoi, threshold=60, source="test_grid")
+
+        self.assertEqual(actual["pyramid_level"], 0.05)
+        self.assertEqual(actual["pixel_count"], expected["pixel_count"])
+        for key in ("total_area_m2", "area_above_threshold_m2", "mean_canopy"):
+            self.assertAlmostEqual(actual[key] / expected[key], 1.0, places=6)
+
+    def test_small_aoi_skips_pyramid(self):
+        build_level(0.05, source="test_grid")
+        small = Polygon.from_bbox((0.1, 0.1, 0.12, 0.12))
+        small.srid = 4326
+        self.assertIsNone(compute_stats(small, source="test_grid")["pyramid_level"])
+
+
+class CellAreaTests(TestCase):
+    def test_area_is_set_on_insert_and_geometry_update(self):
+        make_grid(size=1, step=0.01)
+        cell = ForestDensityCell.objects.get()
+        self.assertAlmostEqual(cell.area_m2 / 1_230_900, 1.0, places=3)
+
+        cell.geom = Polygon.from_bbox((0, 0, 0.02, 0.01))
+        cell.save()
+        cell.refresh_from_db()
+        self.assertAlmostEqual(cell.area_m2 / 2_461_800, 1.0, places=3)
+
+    def test_interior_cells_match_clipped_area(self):
+        make_grid(size=4, step=0.01)
+        aoi = Polygon.from_bbox((-1, -1, 1, 1))
+        aoi.srid = 4326
+        stats = compute_stats(aoi, source="test_grid")
+        expected = sum(ForestDensityCell.objects.values_list("area_m2", flat=True))
+        self.assertAlmostEqual(stats["total_area_m2"], expected, places=3)
+
+
+class SubdividedStatsTests(TestCase):
+    def setUp(self):
+        make_grid(size=20, step=0.01)
+        # A jagged ring with many vertices, crossing cell boundaries in all directions.
+        ring = []
+        for step in range(400):
+            angle = 2 * math.pi * step / 400
+            radius = 0.08 + 0.015 * math.sin(angle * 23)
+            ring.append((0.1 + radius * math.cos(angle), 0.1 + radius * math.sin(angle)))
+        ring.append(ring[0])
+        self.aoi = Polygon(ring, srid=4326)
+
+    def test_subdivided_matches_single_polygon(self):
+        with self.settings(FOREST_DENSITY_SUBDIVIDE_MAX_VERTICES=10_000):
+            expected = compute_stats(self.aoi, threshold=40, source="test_grid")
+        with self.settings(FOREST_DENSITY_SUBDIVIDE_MAX_VERTICES=16):
+            actual = compute_stats(self.aoi, threshold=40, source="test_grid")
+
+        self.assertEqual(actual["pixel_count"], expected["pixel_count"])
+        for key in ("total_area_m2", "area_above_threshold_m2", "mean_canopy"):
+            self.assertAlmostEqual(actual[key] / expected[key], 1.0, places=6)
+
+
+class BatchStatsTests(TestCase):
+    def test_batch_matches_single_requests(self):
+        make_grid(size=20, step=0.01)
+        aois = [
+            Polygon.from_bbox((0.013, 0.017, 0.087, 0.091)),
+            Polygon.from_bbox((0.05, 0.05, 0.15, 0.12)),
+            Polygon.from_bbox((5, 5, 6, 6)),
+        ]
+        for aoi in aois:
+            aoi.srid = 4326
+
+        distributions = compute_distributions(aois, source="test_grid")
+
+        self.assertEqual(len(distributions), 3)
+        for aoi, distribution in zip(aois[:2], distributions):
+            expected = compute_stats(aoi, threshold=40, source="test_grid")
+            actual = summarize_distribution(distribution, 40, expected["bin_edges"])
+            self.assertEqual(actual["pixel_count"], expected["pixel_count"])
+            for key in ("total_area_m2", "area_above_threshold_m2", "mean_canopy"):
+                self.assertAlmostEqual(actual[key] / expected[key], 1.0, places=6)
+        self.assertEqual(distributions[2].canopy_pct, [])
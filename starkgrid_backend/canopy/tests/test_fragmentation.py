@@ -0,0 +1,145 @@
+import numpy as np
+from django.contrib.gis.geos import Polygon
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from canopy.models import ForestDensityCell
+from canopy.services.cog import GridSpec
+from canopy.services.fragmentation import (
+    FragmentationTooLarge,
+    _cell_window,
+    compute_fragmentation,
+    fragmentation_metrics,
+    label_runs,
+    mask_runs,
+)
+from canopy.services.grid_snapshot import NODATA, PCT_SCALE, row_areas
+from canopy.services.raster_ingest import METRES_PER_DEGREE
+
+
+def patch_sizes(mask: np.ndarray, connectivity: int) -> list:
+    run_rows, starts, ends = mask_runs(mask)
+    labels = label_runs(run_rows, starts, ends, mask.shape[1], connectivity)
+    _, index = np.unique(labels, return_inverse=True)
+    return sorted(np.bincount(index, weights=ends - starts).astype(int).tolist()) if len(labels) else []
+
+
+class LabelRunsTests(SimpleTestCase):
+    def test_diagonal_neighbours_join_only_with_8_connectivity(self):
+        mask = np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=bool)
+        self.assertEqual(patch_sizes(mask, 8), [3])
+        self.assertEqual(patch_sizes(mask, 4), [1, 1, 1])
+
+    def test_branches_merge_through_later_rows(self):
+        # Two arms joined only at the bottom, plus a separate blob.
+        mask = np.array(
+            [
+                [1, 0, 1, 0, 0, 1],
+                [1, 0, 1, 0, 0, 1],
+                [1, 1, 1, 0, 0, 0],
+            ],
+            dtype=bool,
+        )
+        self.assertEqual(patch_sizes(mask, 4), [2, 7])
+        self.assertEqual(patch_sizes(np.zeros((3, 3), dtype=bool), 8), [])
+
+
+class FragmentationMetricsTests(SimpleTestCase):
+    def setUp(self):
+        self.grid = GridSpec(west=100.0, north=0.005, res_x=0.001, res_y=0.001, width=10, height=10)
+        self.canopy = np.full((10, 10), 10 * PCT_SCALE, dtype=np.uint16)
+        self.canopy[3:7, 3:7] = 90 * PCT_SCALE
+
+    def test_single_square_patch(self):
+        metrics = fragmentation_metrics(self.grid, self.canopy, np.ones((10, 10), dtype=bool), threshold=60)
+
+        pixel_area = row_areas(self.grid)
+        height_m = self.grid.res_y * METRES_PER_DEGREE
+        self.assertEqual(metrics["patch_count"], 1)
+        self.assertAlmostEqual(metrics["largest_patch_m2"], 4 * pixel_area[3:7].sum())
+        self.assertAlmostEqual(metrics["mean_patch_m2"], metrics["largest_patch_m2"])
+        # 8 vertical edge segments plus 8 horizontal ones; pixels are nearly square at the equator.
+        self.assertAlmostEqual(metrics["edge_length_m"] / (16 * height_m), 1.0, places=2)
+        # With a one-pixel edge depth only the inner 2x2 block is core.
+        self.assertAlmostEqual(metrics["core_area_m2"], 2 * pixel_area[4:6].sum())
+        landscape_m2 = pixel_area.sum() * 10
+        self.assertAlmostEqual(metrics["largest_patch_index"], metrics["largest_patch_m2"] / landscape_m2 * 100)
+
+    def test_pixels_outside_the_aoi_or_without_data_form_no_edges(self):
+        self.canopy[:, :3] = NODATA
+        inside = np.ones((10, 10), dtype=bool)
+        inside[:3] = False
+        metrics = fragmentation_metrics(self.grid, self.canopy, inside, threshold=60)
+
+        height_m = self.grid.res_y * METRES_PER_DEGREE
+        # The left side borders no-data and the top side the AOI edge; only right and bottom count.
+        self.assertAlmostEqual(metrics["edge_length_m"] / (8 * height_m), 1.0, places=2)
+        self.assertEqual(metrics["patch_count"], 1)
+
+    @override_settings(FOREST_DENSITY_CORE_EDGE_DEPTH_M=250)
+    def test_edge_depth_setting(self):
+        metrics = fragmentation_metrics(self.grid, self.canopy, np.ones((10, 10), dtype=bool), threshold=60)
+        self.assertEqual(metrics["core_area_m2"], 0.0)
+        self.assertEqual(metrics["edge_depth_m"], 250.0)
+
+
+class ComputeFragmentationTests(TestCase):
+    def test_patches_from_cells(self):
+        step = 0.01
+        cells = []
+        for row in range(6):
+            for col in range(6):
+                forest = (row < 2 and col < 2) or (row >= 4 and col >= 3)
+                cells.append(
+                    ForestDensityCell(
+                        geom=Polygon.from_bbox((col * step, row * step, (col + 1) * step, (row + 1) * step)),
+                        canopy_pct=80 if forest else 20,
+                        source="fragmentation_test",
+                    )
+                )
+        ForestDensityCell.objects.bulk_create(cells)
+        aoi = Polygon.from_bbox((0, 0, 0.06, 0.06))
+        aoi.srid = 4326
+
+        metrics = compute_fragmentation(aoi, threshold=60, source="fragmentation_test")
+
+        self.assertEqual(metrics["backend"], "sql")
+        self.assertEqual(metrics["patch_count"], 2)
+        area = sum(ForestDensityCell.objects.filter(canopy_pct=80).values_list("area_m2", flat=True))
+        self.assertAlmostEqual(metrics["forest_area_m2"] / area, 1.0, places=4)
+
+        response = self.client.post(
+            "/api/forest-density/stats/",
+            {"geometry": aoi.geojson, "source": "fragmentation_test", "fragmentation": True},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["fragmentation"]["patch_count"], 2)
+
+    def test_window_streams_cells_and_checks_the_cap_first(self):
+        step = 0.01
+        ForestDensityCell.objects.bulk_create(
+            ForestDensityCell(
+                geom=Polygon.from_bbox((col * step, row * step, (col + 1) * step, (row + 1) * step)),
+                canopy_pct=row * 10 + col,
+                source="fragmentation_test",
+            )
+            for row in range(4)
+            for col in range(5)
+        )
+        aoi = Polygon.from_bbox((0, 0, 0.05, 0.04))
+        aoi.srid = 4326
+
+        grid, canopy = _cell_window(aoi, "fragmentation_test", fetch_size=3)
+        self.assertEqual((grid.width, grid.height), (5, 4))
+        self.assertEqual(int(canopy[0, 4]), 34 * PCT_SCALE)
+        self.assertEqual(int(canopy[3, 0]), 0)
+
+        # The estimate from the AOI extent refuses a window larger than the cells alone.
+        wide = Polygon.from_bbox((0, 0, 1, 1))
+        wide.srid = 4326
+        with self.settings(FOREST_DENSITY_FRAGMENTATION_MAX_PIXELS=1_000):
+            with self.assertRaises(FragmentationTooLarge):
+                _cell_window(wide, "fragmentation_test")
+        with self.settings(FOREST_DENSITY_FRAGMENTATION_MAX_PIXELS=19):
+            with self.assertRaises(FragmentationTooLarge):
+                _cell_window(aoi, "fragmentation_test")
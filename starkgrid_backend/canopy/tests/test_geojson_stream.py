@@ -0,0 +1,52 @@
+import gzip
+import io
+import json
+
+from django.test import SimpleTestCase
+
+from canopy.services.geojson_stream import iter_geojson_features
+
+
+class IterGeojsonFeaturesTests(SimpleTestCase):
+    def setUp(self):
+        self.features = [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Polygon", "coordinates": [[[0, 0], [0, 1], [1, 1], [0, 0]]]},
+                "properties": {"canopy_pct": 12.345678, "tile_id": f"T{i}"},
+            }
+            for i in range(25)
+        ]
+
+    def _collect(self, text, chunk_size=7):
+        return list(iter_geojson_features(io.StringIO(text), chunk_size=chunk_size))
+
+    def test_streams_feature_collection_across_small_chunks(self):
+        document = json.dumps(
+            {"type": "FeatureCollection", "name": "cells", "features": self.features}, indent=2
+        )
+        self.assertEqual(self._collect(document), self.features)
+
+    def test_members_after_features_are_accepted(self):
+        document = json.dumps({"features": self.features[:2], "type": "FeatureCollection", "bbox": [0, 0, 1, 1]})
+        self.assertEqual(self._collect(document), self.features[:2])
+
+    def test_single_feature_document(self):
+        self.assertEqual(self._collect(json.dumps(self.features[0])), [self.features[0]])
+
+    def test_empty_feature_collection(self):
+        self.assertEqual(self._collect('{"type": "FeatureCollection", "features": []}'), [])
+
+    def test_gzip_handle(self):
+        payload = gzip.compress(json.dumps({"type": "FeatureCollection", "features": self.features}).encode())
+        with gzip.open(io.BytesIO(payload), "rt", encoding="utf-8") as handle:
+            self.assertEqual(list(iter_geojson_features(handle, chunk_size=64)), self.features)
+
+    def test_rejects_unknown_structure(self):
+        with self.assertRaises(ValueError):
+            self._collect('{"type": "Polygon", "coordinates": []}')
+
+    def test_rejects_truncated_document(self):
+        document = json.dumps({"type": "FeatureCollection", "features": self.features})[:-20]
+        with self.assertRaises(ValueError):
+            self._collect(document)
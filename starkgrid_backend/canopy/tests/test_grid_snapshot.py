@@ -0,0 +1,126 @@
+import tempfile
+from unittest import mock
+
+import numpy as np
+from django.contrib.gis.geos import Polygon
+from django.test import SimpleTestCase, override_settings
+
+from canopy.services.cog import GridSpec
+from canopy.services.forest_density import distribution_from_rows, summarize_distribution
+from canopy.services.grid_snapshot import (
+    SnapshotUnavailable,
+    build_snapshot,
+    compute_snapshot_distribution,
+    load_snapshot,
+    row_areas,
+)
+
+
+STEP = 0.01
+SIZE = 20
+GRID = GridSpec(west=0.0, north=SIZE * STEP, res_x=STEP, res_y=STEP, width=SIZE, height=SIZE)
+
+
+def grid_cells(offset: float = 0.0) -> np.ndarray:
+    cells = []
+    for row in range(SIZE):
+        for col in range(SIZE):
+            x0, y0 = col * STEP, row * STEP
+            cells.append((x0, y0, x0 + STEP, y0 + STEP, (row * 7 + col * 3 + offset) % 101))
+    return np.array(cells)
+
+
+def expected_stats(bbox, cells: np.ndarray, threshold: float = 60):
+    """
+    Exact stats for a bbox AOI: each cell contributes its row area times the
+    overlapping fraction of its lon/lat extent.
+    """
+    xmin, ymin, xmax, ymax = bbox
+    areas = row_areas(GRID)
+    rows = []
+    for x0, y0, x1, y1, pct in cells:
+        fraction = max(0.0, min(x1, xmax) - max(x0, xmin)) * max(0.0, min(y1, ymax) - max(y0, ymin)) / STEP ** 2
+        if fraction > 0:
+            row = int(round((GRID.north - y1) / STEP))
+            area = areas[row] * fraction
+            rows.append((pct, area, 1, pct * area))
+    return summarize_distribution(distribution_from_rows(rows), threshold, [0, 20, 40, 60, 80, 100])
+
+
+class RowAreaTests(SimpleTestCase):
+    def test_matches_geodesic_cell_area(self):
+        areas = row_areas(GridSpec(west=0.0, north=0.01, res_x=0.01, res_y=0.01, width=1, height=1))
+        self.assertAlmostEqual(areas[0] / 1_230_900, 1.0, places=3)
+
+    def test_shrinks_towards_the_poles(self):
+        areas = row_areas(GridSpec(west=0.0, north=60.0, res_x=1.0, res_y=1.0, width=1, height=60))
+        self.assertTrue((np.diff(areas) > 0).all())
+        # Roughly cos(latitude); the ellipsoid adds about 1% at 60°.
+        self.assertAlmostEqual(areas[0] / areas[-1], np.cos(np.radians(59.5)), delta=0.01)
+
+
+class GridSnapshotTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.override = override_settings(FOREST_DENSITY_SNAPSHOT_DIR=self.directory.name)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        self.cells = grid_cells()
+        self.build(self.cells, version=3)
+
+    def build(self, cells, version):
+        with mock.patch("canopy.services.grid_snapshot.grid_spec", return_value=GRID), mock.patch(
+            "canopy.services.grid_snapshot.iter_cell_bounds", return_value=iter([cells])
+        ):
+            return build_snapshot("test_grid", version)
+
+    def stats(self, bbox, version=3):
+        aoi = Polygon.from_bbox(bbox)
+        aoi.srid = 4326
+        distribution = compute_snapshot_distribution(aoi, "test_grid", version)
+        return summarize_distribution(distribution, 60, [0, 20, 40, 60, 80, 100])
+
+    def test_pixel_aligned_aoi_is_exact(self):
+        bbox = (0.03, 0.05, 0.15, 0.12)
+        actual, expected = self.stats(bbox), expected_stats(bbox, self.cells)
+        self.assertEqual(actual["backend"], "snapshot")
+        self.assertEqual(actual["pixel_count"], expected["pixel_count"])
+        for key in ("total_area_m2", "area_above_threshold_m2", "mean_canopy"):
+            self.assertAlmostEqual(actual[key] / expected[key], 1.0, places=9)
+
+    def test_clipped_aoi_within_tolerance(self):
+        bbox = (0.013, 0.017, 0.187, 0.191)
+        actual, expected = self.stats(bbox), expected_stats(bbox, self.cells)
+        self.assertEqual(actual["pixel_count"], expected["pixel_count"])
+        self.assertAlmostEqual(actual["total_area_m2"] / expected["total_area_m2"], 1.0, delta=0.005)
+        self.assertAlmostEqual(actual["mean_canopy"], expected["mean_canopy"], delta=0.5)
+        for got, want in zip(actual["area_by_class"], expected["area_by_class"]):
+            self.assertAlmostEqual(got["area_m2"], want["area_m2"], delta=want["area_m2"] * 0.01 + 1.0)
+
+    def test_aoi_outside_grid_is_empty(self):
+        stats = self.stats((1.0, 1.0, 1.1, 1.1))
+        self.assertEqual((stats["total_area_m2"], stats["pixel_count"]), (0.0, 0))
+
+    def test_stale_or_missing_snapshot_is_unavailable(self):
+        aoi = Polygon.from_bbox((0.0, 0.0, 0.1, 0.1))
+        with self.assertRaises(SnapshotUnavailable):
+            compute_snapshot_distribution(aoi, "test_grid", 4)
+        with self.assertRaises(SnapshotUnavailable):
+            compute_snapshot_distribution(aoi, "other", 0)
+
+    def test_rebuild_swaps_current_snapshot(self):
+        first = load_snapshot("test_grid")
+        path, _ = self.build(grid_cells(offset=50), version=4)
+        second = load_snapshot("test_grid")
+        self.assertEqual(second.path, path)
+        self.assertEqual(second.dataset_version, 4)
+        self.assertNotEqual(int(first.canopy[0, 0]), int(second.canopy[0, 0]))
+        self.assertFalse(first.path.exists())
+
+    def test_rebuild_keeps_builds_still_being_written(self):
+        in_progress = load_snapshot("test_grid").path.parent / "20260101T000000-writing"
+        in_progress.mkdir()
+        (in_progress / "canopy.npy").write_bytes(b"")
+        self.build(grid_cells(offset=50), version=4)
+        self.assertTrue(in_progress.exists())
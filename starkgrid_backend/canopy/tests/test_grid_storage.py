@@ -0,0 +1,168 @@
+import json
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.contrib.gis.geos import Polygon
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from canopy.models import ForestDensityCell, ForestDensityGrid, ForestDensityGridCell, ForestDensitySource
+from canopy.services.cog import grid_spec, iter_cell_bounds
+from canopy.services.export import build_export_sql, iter_clipped_cells
+from canopy.services.forest_change import build_change_sql, compute_change
+from canopy.services.forest_density import build_grid_stats_sql, compute_distributions, compute_stats
+from canopy.services.fragmentation import compute_fragmentation
+from canopy.services.grid_storage import STORAGE_CELLS, cell_rows_sql, storage_layout
+from canopy.services.tiles import render_mvt
+from canopy.tests.test_forest_density_stats import make_grid
+
+
+class GridStorageUnitTests(SimpleTestCase):
+    def test_rejects_unknown_layouts(self):
+        with override_settings(FOREST_DENSITY_STORAGE="columnar"):
+            with self.assertRaises(ValueError):
+                storage_layout()
+
+    def test_cell_bounds_run_south_from_the_grid_origin(self):
+        grid = ForestDensityGrid(name="g", west=100.0, north=5.0, cell_size=0.5, width=4, height=4)
+        self.assertEqual(grid.cell_bounds(0, 0), (100.0, 4.5, 100.5, 5.0))
+        self.assertEqual(grid.cell_bounds(2, 1), (100.5, 3.5, 101.0, 4.0))
+
+    def test_grid_query_reads_compact_cells_only(self):
+        sql = build_grid_stats_sql(subdivide=True)
+        self.assertIn("canopy_forestdensitygridcell", sql)
+        self.assertIn("ST_Subdivide", sql)
+        self.assertNotIn("canopy_forestdensitycell c", sql)
+        self.assertNotIn("canopy_forestdensityaggregatecell", sql)
+
+    def test_cell_readers_follow_the_storage_layout(self):
+        self.assertEqual(cell_rows_sql(), "canopy_forestdensitycell")
+        with override_settings(FOREST_DENSITY_STORAGE="grid"):
+            self.assertEqual(cell_rows_sql(layout=STORAGE_CELLS), "canopy_forestdensitycell")
+            for sql in (build_export_sql("csv"), build_change_sql()):
+                self.assertIn("canopy_forestdensitygridcell", sql)
+                self.assertNotIn("canopy_forestdensitycell c", sql)
+
+    def test_grid_queries_read_each_source_from_its_own_grid(self):
+        for sql in (build_grid_stats_sql(), cell_rows_sql(layout="grid")):
+            self.assertIn("g.id = s.grid_id", sql)
+            self.assertIn("gc.source_id = s.id", sql)
+
+
+class CompactGridTests(TestCase):
+    def setUp(self):
+        make_grid(20, 0.01)
+        # Not aligned with the grid of "test_grid": stays in ForestDensityCell only.
+        ForestDensityCell.objects.create(
+            geom=Polygon.from_bbox((0.005, 0.005, 0.015, 0.015)), canopy_pct=50, source="offset"
+        )
+        self.aoi = Polygon(((0.013, 0.021), (0.171, 0.034), (0.152, 0.187), (0.027, 0.163), (0.013, 0.021)))
+
+    def _compact(self, *extra):
+        out, err = StringIO(), StringIO()
+        call_command("compact_forest_density", "--grid", "test", *extra, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_converts_aligned_cells_and_reports_the_rest(self):
+        _, err = self._compact()
+        grid = ForestDensityGrid.objects.get(name="test")
+        self.assertEqual((grid.width, grid.height), (20, 20))
+        self.assertAlmostEqual(grid.cell_size, 0.01)
+        self.assertEqual(ForestDensityGridCell.objects.count(), 400)
+        self.assertIn("Skipped 1 cells", err)
+
+        cell = ForestDensityGridCell.objects.select_related("source", "tile").get(row=19, col=3)
+        centre = Polygon.from_bbox(grid.cell_bounds(19, 3)).centroid
+        original = ForestDensityCell.objects.get(source="test_grid", geom__contains=centre)
+        self.assertEqual(cell.canopy_pct, original.canopy_pct)
+        self.assertEqual((cell.source.name, cell.tile.name), ("test_grid", original.tile_id))
+
+    def test_stats_and_tiles_match_the_polygon_layout(self):
+        self._compact("--source", "test_grid")
+        aois = [self.aoi, Polygon.from_bbox((0, 0, 0.05, 0.05))]
+        expected = compute_stats(self.aoi, threshold=40, source="test_grid")
+        expected_batch = compute_distributions(aois, "test_grid")
+        with override_settings(FOREST_DENSITY_STORAGE="grid"):
+            stats = compute_stats(self.aoi, threshold=40, source="test_grid")
+            batch = compute_distributions(aois, "test_grid")
+            tile = render_mvt(10, 512, 511, source="test_grid")
+
+        tolerance = 1e-6 * expected["total_area_m2"]
+        self.assertEqual(stats["pixel_count"], expected["pixel_count"])
+        self.assertAlmostEqual(stats["total_area_m2"], expected["total_area_m2"], delta=tolerance)
+        self.assertAlmostEqual(stats["mean_canopy"], expected["mean_canopy"], places=6)
+        self.assertAlmostEqual(stats["area_above_threshold_m2"], expected["area_above_threshold_m2"], delta=tolerance)
+        self.assertEqual([d.canopy_pct for d in batch], [d.canopy_pct for d in expected_batch])
+        self.assertGreater(len(tile), 0)
+
+    def test_a_source_is_compacted_onto_one_grid(self):
+        self._compact("--source", "test_grid")
+        with self.assertRaisesMessage(CommandError, "test_grid (on test)"):
+            call_command(
+                "compact_forest_density", "--grid", "coarse", "--source", "test_grid", "--cell-size", "0.02",
+                stdout=StringIO(),
+            )
+        self.assertFalse(ForestDensityGrid.objects.filter(name="coarse").exists())
+        self.assertEqual(ForestDensitySource.objects.get(name="test_grid").grid.name, "test")
+
+        # Recompacting onto the same grid upserts, so stats are not counted twice.
+        self._compact("--source", "test_grid")
+        expected = compute_stats(self.aoi, threshold=40, source="test_grid")
+        with override_settings(FOREST_DENSITY_STORAGE="grid"):
+            stats = compute_stats(self.aoi, threshold=40, source="test_grid")
+        self.assertEqual(stats["pixel_count"], expected["pixel_count"])
+
+    def test_delete_cells_keeps_unconverted_rows(self):
+        self._compact("--source", "test_grid", "--delete-cells")
+        self.assertFalse(ForestDensityCell.objects.filter(source="test_grid").exists())
+        self.assertTrue(ForestDensityCell.objects.filter(source="offset").exists())
+        self.assertEqual(ForestDensityGridCell.objects.count(), 400)
+
+    def test_readers_see_compacted_cells_after_delete(self):
+        square = Polygon.from_bbox((0, 0, 0.05, 0.05))
+        square.srid = 4326
+        expected_cells = sum(len(batch) for batch in iter_clipped_cells(square, "csv", source="test_grid"))
+        expected_change = compute_change(square, "test_grid", "test_grid")
+        expected_fragmentation = compute_fragmentation(square, source="test_grid")
+        self._compact("--source", "test_grid", "--delete-cells")
+
+        with override_settings(FOREST_DENSITY_STORAGE="grid"):
+            spec = grid_spec("test_grid")
+            self.assertEqual((spec.width, spec.height), (20, 20))
+            self.assertEqual(sum(len(cells) for cells in iter_cell_bounds("test_grid")), 400)
+            self.assertEqual(
+                sum(len(batch) for batch in iter_clipped_cells(square, "csv", source="test_grid")), expected_cells
+            )
+            change = compute_change(square, "test_grid", "test_grid")
+            fragmentation = compute_fragmentation(square, source="test_grid")
+        self.assertEqual(change["matched_cell_count"], expected_change["matched_cell_count"])
+        self.assertEqual(fragmentation["patch_count"], expected_fragmentation["patch_count"])
+
+
+class GridSyncTests(TestCase):
+    def _load(self, path: Path, *cells) -> None:
+        features = [
+            {
+                "type": "Feature",
+                "geometry": json.loads(Polygon.from_bbox((x, 0, x + 1, 1)).json),
+                "properties": {"canopy_pct": canopy, "tile_id": "A"},
+            }
+            for x, canopy in cells
+        ]
+        path.write_text("\n".join(json.dumps(feature) for feature in features))
+        call_command("load_forest_density", "--file", str(path), "--source", "v1", "--incremental", stdout=StringIO())
+
+    def test_reloads_replace_the_compacted_tiles(self):
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cells.ndjson"
+            self._load(path, (0, 10), (1, 20))
+            call_command("compact_forest_density", "--grid", "unit", "--source", "v1", stdout=StringIO())
+            self.assertEqual(ForestDensityGridCell.objects.count(), 2)
+
+            # Tile A lost a cell and the other changed.
+            self._load(path, (0, 30))
+
+        cell = ForestDensityGridCell.objects.get()
+        self.assertEqual((cell.row, cell.col, cell.canopy), (0, 0, 3000))
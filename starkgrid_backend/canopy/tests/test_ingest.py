@@ -0,0 +1,93 @@
+import json
+
+from django.contrib.gis.geos import GEOSGeometry, WKBWriter
+from django.test import SimpleTestCase
+
+from canopy.services.ingest import CellRow, OrmCellWriter, cell_grid_key, hash_tiles, polygon_to_ewkb_hex
+
+
+class PolygonToEwkbHexTests(SimpleTestCase):
+    def setUp(self):
+        self.geometry = {
+            "type": "Polygon",
+            "coordinates": [[[0.0, 0.0], [0.0, 1.0], [1.0, 1.0], [1.0, 0.0], [0.0, 0.0]]],
+        }
+
+    def test_matches_geos_encoding(self):
+        expected = GEOSGeometry(json.dumps(self.geometry), srid=4326)
+        encoded = GEOSGeometry(polygon_to_ewkb_hex(self.geometry))
+        self.assertEqual(encoded.srid, 4326)
+        self.assertTrue(encoded.equals_exact(expected))
+
+    def test_reprojects_other_srids(self):
+        mercator = GEOSGeometry(json.dumps(self.geometry), srid=4326)
+        mercator.transform(3857)
+        encoded = GEOSGeometry(polygon_to_ewkb_hex(json.loads(mercator.json), srid=3857))
+        self.assertEqual(encoded.srid, 4326)
+        self.assertAlmostEqual(encoded.extent[2], 1.0, places=6)
+
+    def test_rejects_non_polygons(self):
+        with self.assertRaises(ValueError):
+            polygon_to_ewkb_hex({"type": "Point", "coordinates": [0, 0]})
+
+
+class TileHashTests(SimpleTestCase):
+    def setUp(self):
+        square = {"type": "Polygon", "coordinates": [[[0, 0], [0, 1], [1, 1], [1, 0], [0, 0]]]}
+        shifted = {"type": "Polygon", "coordinates": [[[1, 0], [1, 1], [2, 1], [2, 0], [1, 0]]]}
+        self.rows = [
+            CellRow(polygon_to_ewkb_hex(square), 42.5, "src", "A"),
+            CellRow(polygon_to_ewkb_hex(shifted), 10, "src", "A"),
+            CellRow(polygon_to_ewkb_hex(square), 42.5, "src", "B"),
+        ]
+
+    def test_digest_ignores_row_order_and_number_formatting(self):
+        digests = hash_tiles(self.rows)
+        reordered = [self.rows[1], self.rows[2], self.rows[0]._replace(canopy_pct="42.50")]
+        self.assertEqual(hash_tiles(reordered), digests)
+        self.assertEqual(digests[("src", "A")].cell_count, 2)
+        self.assertEqual(len(digests[("src", "A")].content_hash), 64)
+
+    def test_digest_changes_with_values(self):
+        changed = hash_tiles([self.rows[0], self.rows[1]._replace(canopy_pct=10.01)])
+        self.assertNotEqual(changed[("src", "A")], hash_tiles(self.rows)[("src", "A")])
+
+    def test_writer_drops_repeated_cells_within_a_batch(self):
+        written = []
+
+        class RecordingWriter(OrmCellWriter):
+            def _write(self, rows):
+                written.extend(rows)
+
+        writer = RecordingWriter(batch_size=10)
+        for row in self.rows + [self.rows[0]._replace(canopy_pct=50.0)]:
+            writer.add(row)
+        # rows 0 and 2 are the same cell of the same source, so only the last copy is written
+        self.assertEqual(writer.close(), 2)
+        self.assertEqual([row.canopy_pct for row in written], [50.0, 10])
+
+    def test_writer_dedupes_on_the_upsert_key(self):
+        written = []
+
+        class RecordingWriter(OrmCellWriter):
+            def _write(self, rows):
+                written.extend(rows)
+
+        # A different polygon with the same bbox centre conflicts on (source, grid_key) all the same.
+        inner = {
+            "type": "Polygon",
+            "coordinates": [[[0.25, 0.25], [0.25, 0.75], [0.75, 0.75], [0.75, 0.25], [0.25, 0.25]]],
+        }
+        writer = RecordingWriter(batch_size=10)
+        writer.add(self.rows[0])
+        writer.add(CellRow(polygon_to_ewkb_hex(inner), 7, "src", "A"))
+        self.assertEqual(writer.close(), 1)
+        self.assertEqual(written[0].canopy_pct, 7)
+
+    def test_grid_key_matches_the_trigger_formula(self):
+        self.assertEqual(cell_grid_key(self.rows[0].geom_hex), 18_050_000 * 100_000_000 + 9_050_000)
+        writer = WKBWriter()
+        writer.byteorder = 0
+        writer.srid = True
+        big_endian = writer.write_hex(GEOSGeometry(self.rows[1].geom_hex)).decode("ascii")
+        self.assertEqual(cell_grid_key(big_endian), 18_150_000 * 100_000_000 + 9_050_000)
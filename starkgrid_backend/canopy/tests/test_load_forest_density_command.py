@@ -1,5 +1,6 @@
 import json
 from decimal import Decimal
+from io import StringIO
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
@@ -8,7 +9,8 @@ from django.core.management import call_command
 from django.core.management.base import CommandError
 from django.test import TestCase
 
-from canopy.models import ForestDensityCell
+from canopy.models import ForestDensityCell, ForestDensityTile
+from canopy.signals import cells_loaded
 
 
 class LoadForestDensityCommandTests(TestCase):
@@ -116,3 +118,85 @@ class LoadForestDensityCommandTests(TestCase):
                     "--source",
                     "error_source",
                 )
+
+
+class IncrementalLoadTests(TestCase):
+    def _square(self, x: float, y: float) -> dict:
+        return {
+            "type": "Polygon",
+            "coordinates": [[[x, y], [x, y + 1], [x + 1, y + 1], [x + 1, y], [x, y]]],
+        }
+
+    def _write(self, path: Path, canopy_b: float) -> None:
+        features = [
+            {"type": "Feature", "geometry": self._square(0, 0), "properties": {"canopy_pct": 10, "tile_id": "A"}},
+            {"type": "Feature", "geometry": self._square(1, 0), "properties": {"canopy_pct": 20, "tile_id": "A"}},
+            {"type": "Feature", "geometry": self._square(0, 1), "properties": {"canopy_pct": canopy_b, "tile_id": "B"}},
+        ]
+        path.write_text("\n".join(json.dumps(feature) for feature in features))
+
+    def _load(self, path: Path, *extra: str) -> str:
+        out = StringIO()
+        call_command("load_forest_density", "--file", str(path), "--source", "v1", *extra, stdout=out)
+        return out.getvalue()
+
+    def test_reloading_the_same_file_upserts_in_place(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cells.ndjson"
+            self._write(path, 30)
+            self._load(path)
+            self._write(path, 35)
+            self._load(path)
+
+        self.assertEqual(ForestDensityCell.objects.count(), 3)
+        self.assertEqual(ForestDensityCell.objects.get(tile_id="B").canopy_pct, Decimal("35.00"))
+
+    def test_incremental_reload_only_replaces_changed_tiles(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cells.ndjson"
+            self._write(path, 30)
+            self.assertIn("2 of 2 tiles changed", self._load(path, "--incremental"))
+            self.assertEqual(ForestDensityTile.objects.filter(source="v1").count(), 2)
+            self.assertIn("0 of 2 tiles changed", self._load(path, "--incremental"))
+
+            before = set(ForestDensityCell.objects.filter(tile_id="A").values_list("id", flat=True))
+            self._write(path, 45)
+            self.assertIn("1 of 2 tiles changed", self._load(path, "--incremental"))
+
+        self.assertEqual(set(ForestDensityCell.objects.filter(tile_id="A").values_list("id", flat=True)), before)
+        self.assertEqual(ForestDensityCell.objects.count(), 3)
+        self.assertEqual(ForestDensityCell.objects.get(tile_id="B").canopy_pct, Decimal("45.00"))
+
+    def test_full_load_invalidates_stored_tile_hashes(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cells.ndjson"
+            self._write(path, 30)
+            self._load(path, "--incremental")
+            self._write(path, 45)
+            self._load(path)
+            self.assertFalse(ForestDensityTile.objects.filter(source="v1").exists())
+
+            # The input matches the hashes of the first load again, but the cells do not.
+            self._write(path, 30)
+            self.assertIn("2 of 2 tiles changed", self._load(path, "--incremental"))
+
+        self.assertEqual(ForestDensityCell.objects.get(tile_id="B").canopy_pct, Decimal("30.00"))
+
+    def test_incremental_reload_reports_the_replaced_extent(self) -> None:
+        received = []
+
+        def capture(sender, **kwargs):
+            received.append(kwargs)
+
+        cells_loaded.connect(capture)
+        self.addCleanup(cells_loaded.disconnect, capture)
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cells.ndjson"
+            self._write(path, 30)
+            self._load(path, "--incremental")
+            moved = {"geometry": self._square(5, 5), "properties": {"canopy_pct": 30, "tile_id": "B"}}
+            path.write_text(json.dumps({"type": "Feature", **moved}))
+            self._load(path, "--incremental")
+
+        self.assertEqual(received[-1]["tiles"], {"v1": {"B"}})
+        self.assertEqual(received[-1]["replaced"], {"v1": (0.0, 1.0, 1.0, 2.0)})
@@ -0,0 +1,129 @@
+import logging
+from unittest import mock
+
+from django.contrib.gis.geos import Polygon
+from django.test import SimpleTestCase, override_settings
+
+from canopy.services import metrics
+from canopy.services.forest_density import distribution_from_rows
+from canopy.services.metrics import (
+    STATS_STAGE_SECONDS,
+    Counter,
+    Histogram,
+    explain_slow_query,
+    is_slow_query,
+    log_slow_query,
+    note,
+    stage,
+    track_stats_request,
+)
+from canopy.services.stats_cache import reset_stats_cache
+
+
+def stage_count(name: str) -> int:
+    series = STATS_STAGE_SECONDS._series.get((name,))
+    return series[len(STATS_STAGE_SECONDS.buckets)] if series else 0
+
+
+class PrometheusFormatTests(SimpleTestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("test_seconds", "Test.", (0.1, 1.0), labelnames=("stage",))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, stage="query")
+        lines = histogram.render()
+        self.assertIn("# TYPE test_seconds histogram", lines)
+        self.assertIn('test_seconds_bucket{stage="query",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="query",le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="query",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_sum{stage="query"} 5.55', lines)
+        self.assertIn('test_seconds_count{stage="query"} 3', lines)
+
+    def test_counter_escapes_labels(self):
+        counter = Counter("test_total", "Test.", labelnames=("source",))
+        counter.inc(source='a"b')
+        counter.inc(2, source='a"b')
+        self.assertEqual(counter.render()[-1], 'test_total{source="a\\"b"} 3')
+
+
+class StageTimerTests(SimpleTestCase):
+    def test_stages_outside_a_request_are_ignored(self):
+        before = stage_count("orphan")
+        with stage("orphan"):
+            note("aoi_vertices", 5)
+        self.assertEqual(stage_count("orphan"), before)
+
+    def test_tracked_request_records_stages(self):
+        before = stage_count("query"), stage_count("total")
+        with track_stats_request() as timer:
+            with stage("query"):
+                pass
+            with stage("query"):
+                pass
+        self.assertEqual(set(timer.stages), {"query", "total"})
+        self.assertEqual((stage_count("query"), stage_count("total")), (before[0] + 1, before[1] + 1))
+
+    def test_discarded_and_failed_requests_are_not_recorded(self):
+        before = stage_count("total")
+        with track_stats_request() as timer:
+            timer.discard()
+        with self.assertRaises(ValueError), track_stats_request():
+            raise ValueError
+        self.assertEqual(stage_count("total"), before)
+
+    def test_slow_query_threshold(self):
+        self.assertFalse(is_slow_query(100.0))
+        with override_settings(FOREST_DENSITY_EXPLAIN_SLOW_QUERY_MS=250):
+            self.assertFalse(is_slow_query(0.2))
+            self.assertTrue(is_slow_query(0.3))
+        with self.assertLogs("canopy.services.metrics", level=logging.WARNING) as logs:
+            log_slow_query(0.3, "SELECT 1", ["Result  (cost=0.00..0.01 rows=1 width=4)"])
+        self.assertIn("300 ms", logs.output[0])
+        self.assertIn("Result  (cost", logs.output[0])
+
+    def test_slow_query_plans_are_sampled_in_the_background(self):
+        executor = mock.Mock()
+        with mock.patch.object(metrics, "_explain_executor", executor):
+            self.assertTrue(explain_slow_query(0.3, "SELECT 1", {}))
+            with self.assertLogs("canopy.services.metrics", level=logging.WARNING) as logs:
+                self.assertFalse(explain_slow_query(0.4, "SELECT 2", {}))
+        self.assertIn("plan not sampled", logs.output[0])
+        executor.submit.assert_called_once_with(metrics._capture_plan, 0.3, "SELECT 1", {})
+
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.fetchall.return_value = [("Result  (cost=0.00..0.01 rows=1 width=4)",)]
+        with mock.patch.object(metrics, "connection") as connection:
+            connection.cursor.return_value = cursor
+            with self.assertLogs("canopy.services.metrics", level=logging.WARNING) as logs:
+                metrics._capture_plan(0.3, "SELECT 1", {})
+        cursor.__enter__.return_value.execute.assert_called_once_with("EXPLAIN (ANALYZE, BUFFERS) SELECT 1", {})
+        self.assertIn("Result  (cost", logs.output[0])
+        connection.close.assert_called_once_with()
+        self.assertFalse(metrics._explain_slot.locked())
+
+
+class MetricsViewTests(SimpleTestCase):
+    def setUp(self):
+        reset_stats_cache()
+
+    def test_stats_request_shows_up_in_metrics(self):
+        distribution = distribution_from_rows([(30, 100.0, 1, 3000.0), (70, 300.0, 2, 21000.0)])
+        geometry = Polygon.from_bbox((0, 0, 1, 1)).geojson
+        with mock.patch("canopy.services.stats_cache.dataset_version", return_value=0), mock.patch(
+            "canopy.services.stats_cache.compute_distribution", return_value=distribution
+        ):
+            for _ in range(2):
+                response = self.client.post(
+                    "/api/forest-density/stats/", {"geometry": geometry}, content_type="application/json"
+                )
+                self.assertEqual(response.status_code, 200)
+
+        response = self.client.get("/api/forest-density/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        for stage_name in ("validate", "transform", "cache", "summarize", "total"):
+            self.assertIn(f'forest_density_stats_stage_seconds_count{{stage="{stage_name}"}}', body)
+        self.assertIn('forest_density_stats_requests_total{backend="sql",cache="hit"}', body)
+        self.assertIn('forest_density_stats_requests_total{backend="sql",cache="miss"}', body)
+        self.assertIn('forest_density_stats_candidate_cells_bucket{le="10"}', body)
+        self.assertIn('forest_density_stats_aoi_vertices_bucket{le="5"}', body)
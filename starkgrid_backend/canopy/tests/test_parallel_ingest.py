@@ -0,0 +1,111 @@
+import json
+import re
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.contrib.gis.geos import Polygon
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TransactionTestCase
+
+from canopy.models import ForestDensityCell
+
+from canopy.services.parallel_ingest import (
+    byte_range_shards,
+    iter_shard_lines,
+    spool_tile_shards,
+    tile_shard_index,
+)
+
+
+class ShardingTests(SimpleTestCase):
+    def setUp(self):
+        self.features = [
+            {"type": "Feature", "geometry": None, "properties": {"canopy_pct": i, "tile_id": f"T{i % 7}"}}
+            for i in range(200)
+        ]
+
+    def test_byte_ranges_cover_every_line_once(self):
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cells.ndjson"
+            path.write_text("\n".join(json.dumps(feature) for feature in self.features) + "\n")
+            for shard_count in (1, 3, 16, 500):
+                lines = [
+                    json.loads(line)
+                    for spec in byte_range_shards(path, shard_count)
+                    for line in iter_shard_lines(spec)
+                ]
+                self.assertEqual(lines, self.features)
+
+    def test_tile_spooling_groups_tiles_and_respects_selection(self):
+        with TemporaryDirectory() as tmpdir:
+            specs = spool_tile_shards(self.features, "tile_id", 4, Path(tmpdir), selected=[1, 2])
+            self.assertEqual([spec.index for spec in specs], [1, 2])
+            for spec in specs:
+                for line in iter_shard_lines(spec):
+                    tile_id = json.loads(line)["properties"]["tile_id"]
+                    self.assertEqual(tile_shard_index(tile_id, 4), spec.index)
+            spooled = sum(1 for spec in specs for _ in iter_shard_lines(spec))
+            expected = sum(
+                1 for feature in self.features if tile_shard_index(feature["properties"]["tile_id"], 4) in (1, 2)
+            )
+            self.assertEqual(spooled, expected)
+
+
+class ParallelLoadTests(TransactionTestCase):
+    """
+    Runs the worker pool for real: workers are spawned processes that write
+    over their own connections, so rows must be committed, not rolled back.
+    """
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "cells.ndjson"
+        self.features = [
+            {
+                "type": "Feature",
+                "geometry": json.loads(Polygon.from_bbox((i, 0, i + 1, 1)).json),
+                "properties": {"canopy_pct": i % 100, "tile_id": f"T{i % 5}"},
+            }
+            for i in range(60)
+        ]
+        # Unusable features are skipped, not failures.
+        self.features[7]["properties"].pop("canopy_pct")
+        self.features[31]["geometry"] = None
+
+    def _write(self, features):
+        self.path.write_text("\n".join(json.dumps(feature) for feature in features) + "\n")
+
+    def _load(self, source, *extra):
+        out, err = StringIO(), StringIO()
+        call_command(
+            "load_forest_density", "--file", str(self.path), "--source", source, *extra, stdout=out, stderr=err
+        )
+        return err.getvalue()
+
+    def test_two_workers_match_a_single_worker_load(self):
+        self._write(self.features)
+        serial_err = self._load("serial")
+        parallel_err = self._load("parallel", "--workers", "2")
+
+        serial_skipped = sum(1 for line in serial_err.splitlines() if line.startswith("Skipping"))
+        parallel_skipped = int(re.search(r"Skipped (\d+) features", parallel_err).group(1))
+        self.assertEqual((serial_skipped, parallel_skipped), (2, 2))
+        self.assertEqual(
+            ForestDensityCell.objects.filter(source="parallel").count(),
+            ForestDensityCell.objects.filter(source="serial").count(),
+        )
+        self.assertEqual(ForestDensityCell.objects.filter(source="parallel").count(), 58)
+
+    def test_failed_shard_is_rolled_back_and_reported(self):
+        self.features[-1]["properties"]["canopy_pct"] = "not a number"
+        self._write(self.features)
+        first_shard = sum(1 for _ in iter_shard_lines(byte_range_shards(self.path, 2)[0]))
+
+        with self.assertRaisesMessage(CommandError, "--shards 1"):
+            self._load("parallel", "--workers", "2", "--shard-count", "2")
+        # The good shard is kept; the failed one leaves no rows behind.
+        good_rows = first_shard - sum(1 for index in (7, 31) if index < first_shard)
+        self.assertEqual(ForestDensityCell.objects.filter(source="parallel").count(), good_rows)
@@ -0,0 +1,51 @@
+import numpy as np
+from django.contrib.gis.geos import GEOSGeometry
+from django.test import SimpleTestCase
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+from canopy.services.raster_ingest import aggregate_window, iter_raster_blocks
+
+
+class AggregateWindowTests(SimpleTestCase):
+    def test_means_ignore_nodata_and_drop_sparse_cells(self):
+        data = np.ma.masked_array(
+            [[10, 20, 0, 0], [30, 40, 0, 50], [1, 1, 1, 1]],
+            mask=[[0, 0, 1, 1], [0, 0, 1, 0], [0, 0, 0, 0]],
+        )
+        means, keep = aggregate_window(data, factor=2, min_valid_fraction=0.5)
+        self.assertEqual(means.shape, (2, 2))
+        self.assertAlmostEqual(means[0, 0], 25.0)
+        self.assertFalse(keep[0, 1])  # one valid pixel out of four
+        self.assertTrue(keep[1, 0])  # edge block: two valid pixels out of four
+        self.assertAlmostEqual(means[1, 0], 1.0)
+
+
+class IterRasterBlocksTests(SimpleTestCase):
+    def test_emits_cells_with_geometry_and_tile_ids(self):
+        values = np.arange(36, dtype=np.uint8).reshape(6, 6)
+        profile = {
+            "driver": "GTiff",
+            "width": 6,
+            "height": 6,
+            "count": 1,
+            "dtype": "uint8",
+            "crs": "EPSG:4326",
+            "transform": from_origin(100.0, 1.0, 0.25, 0.25),
+            "nodata": 255,
+        }
+        with MemoryFile() as memfile:
+            with memfile.open(**profile) as dst:
+                dst.write(values, 1)
+            with memfile.open() as src:
+                blocks = list(iter_raster_blocks(src, band=1, factor=3, source="test", tile_prefix="t"))
+
+        self.assertEqual(len(blocks), 1)
+        rows = blocks[0].rows
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0].tile_id, "t:0:0")
+        self.assertAlmostEqual(rows[0].canopy_pct, float(values[:3, :3].mean()))
+        first = GEOSGeometry(rows[0].geom_hex)
+        self.assertEqual(first.srid, 4326)
+        self.assertEqual(first.extent, (100.0, 0.25, 100.75, 1.0))
+        self.assertAlmostEqual(first.area, 0.5625)
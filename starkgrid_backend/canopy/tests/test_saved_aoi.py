@@ -0,0 +1,170 @@
+import io
+import json
+import math
+
+from django.contrib.admin.sites import AdminSite
+from django.contrib.gis.geos import GEOSGeometry, MultiPolygon, Polygon
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from rest_framework.exceptions import ParseError
+from rest_framework.request import Request
+
+from canopy.admin import ForestDensitySavedAOIAdmin
+from canopy.models import ForestDensitySavedAOI
+from canopy.parsers import WKBParser
+from canopy.serializers import ForestDensitySavedAOIRequestSerializer, ForestDensityStatsRequestSerializer
+from canopy.services import stats_cache
+from canopy.services.forest_density import build_grid_stats_sql, build_stats_sql, compute_stats
+from canopy.services.saved_aoi import save_aoi
+from canopy.tests.test_forest_density_stats import make_grid
+
+
+def parse_wkb(body: bytes, query: str = ""):
+    request = Request(RequestFactory().post(f"/api/forest-density/stats/?{query}"))
+    return WKBParser().parse(io.BytesIO(body), parser_context={"request": request})
+
+
+class WKBParserTests(SimpleTestCase):
+    def setUp(self):
+        self.square = Polygon.from_bbox((0, 0, 1, 1))
+        self.square.srid = 4326
+
+    def test_reads_the_geometry_and_query_fields(self):
+        data = parse_wkb(bytes(self.square.wkb), "threshold=50&bins=0,50&bins=100&mode=histogram")
+        self.assertTrue(data["geometry"].equals_exact(self.square))
+        self.assertEqual(data["geometry"].srid, 4326)
+        self.assertEqual(data["bins"], ["0", "50", "100"])
+        self.assertEqual((data["threshold"], data["mode"]), ("50", "histogram"))
+
+        serializer = ForestDensityStatsRequestSerializer(data=data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data["bins"], [0.0, 50.0, 100.0])
+
+    def test_srid_from_ewkb_or_query(self):
+        mercator = self.square.transform(3857, clone=True)
+        self.assertEqual(parse_wkb(bytes(mercator.ewkb))["geometry"].srid, 3857)
+        self.assertEqual(parse_wkb(bytes(mercator.wkb), "srid=3857")["geometry"].srid, 3857)
+
+    def test_rejects_bad_bodies(self):
+        for body, query in ((b"", ""), (b"\x01garbage", ""), (bytes(self.square.wkb), "srid=wgs84")):
+            with self.assertRaises(ParseError):
+                parse_wkb(body, query)
+
+
+class SavedAOISerializerTests(SimpleTestCase):
+    def test_stats_request_needs_exactly_one_aoi(self):
+        serializer = ForestDensityStatsRequestSerializer(data={"threshold": 50})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("Provide either geometry or aoi_id.", str(serializer.errors))
+
+    def test_saved_aoi_must_be_a_valid_polygon(self):
+        bowtie = Polygon(((0, 0), (1, 1), (1, 0), (0, 1), (0, 0)))
+        for geometry in (GEOSGeometry("POINT (0 0)"), bowtie):
+            serializer = ForestDensitySavedAOIRequestSerializer(data={"geometry": geometry.geojson})
+            self.assertFalse(serializer.is_valid())
+            self.assertIn("geometry", serializer.errors)
+
+        serializer = ForestDensitySavedAOIRequestSerializer(data={"geometry": Polygon.from_bbox((0, 0, 1, 1)).geojson})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data["geometry"].srid, 4326)
+
+    def test_admin_cannot_change_the_geometry(self):
+        model_admin = ForestDensitySavedAOIAdmin(ForestDensitySavedAOI, AdminSite())
+        request = RequestFactory().get("/admin/")
+        self.assertIn("geom", model_admin.get_readonly_fields(request, ForestDensitySavedAOI()))
+        self.assertFalse(model_admin.has_add_permission(request))
+
+    def test_saved_queries_read_stored_pieces(self):
+        for sql in (build_stats_sql(subdivide=True, saved=True), build_grid_stats_sql(subdivide=True, saved=True)):
+            self.assertIn("canopy_forestdensitysavedaoipiece", sql)
+            self.assertNotIn("ST_GeomFromEWKB", sql)
+            self.assertNotIn("ST_Subdivide", sql)
+
+
+class SavedAOIStatsTests(TestCase):
+    def setUp(self):
+        stats_cache.reset_stats_cache()
+        make_grid(size=20, step=0.01)
+        ring = []
+        for step in range(400):
+            angle = 2 * math.pi * step / 400
+            radius = 0.08 + 0.015 * math.sin(angle * 23)
+            ring.append((0.1 + radius * math.cos(angle), 0.1 + radius * math.sin(angle)))
+        ring.append(ring[0])
+        self.aoi = Polygon(ring, srid=4326)
+
+    def tearDown(self):
+        stats_cache.reset_stats_cache()
+
+    def test_save_stores_pieces_and_derived_fields(self):
+        with self.settings(FOREST_DENSITY_SUBDIVIDE_MAX_VERTICES=16):
+            saved = save_aoi(self.aoi, name="jagged")
+        saved.refresh_from_db()
+        self.assertIsInstance(saved.geom, MultiPolygon)
+        self.assertEqual(saved.num_coords, 401)
+        self.assertEqual(saved.geometry_hash, stats_cache.geometry_hash(self.aoi))
+        self.assertEqual(saved.bbox.extent, self.aoi.extent)
+        self.assertGreater(saved.pieces.count(), 1)
+        self.assertGreater(saved.area_m2, 0)
+
+    def test_stats_by_id_match_inline_geometry(self):
+        expected = compute_stats(self.aoi, threshold=40, source="test_grid")
+        saved = save_aoi(self.aoi)
+
+        response = self.client.post(
+            "/api/forest-density/stats/",
+            {"aoi_id": saved.pk, "threshold": 40, "source": "test_grid"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        stats = response.json()
+        self.assertEqual(stats["pixel_count"], expected["pixel_count"])
+        for key in ("total_area_m2", "area_above_threshold_m2", "mean_canopy"):
+            self.assertAlmostEqual(stats[key] / expected[key], 1.0, places=6)
+
+        # Same shape, same cache entry: inline and WKB requests hit what the saved AOI computed.
+        inline = self.client.post(
+            "/api/forest-density/stats/",
+            {"geometry": json.loads(self.aoi.geojson), "threshold": 40, "source": "test_grid"},
+            content_type="application/json",
+        )
+        wkb = self.client.post(
+            "/api/forest-density/stats/?threshold=40&source=test_grid",
+            bytes(self.aoi.wkb),
+            content_type="application/wkb",
+        )
+        self.assertEqual(wkb.status_code, 200, wkb.content)
+        async_response = self.client.post(
+            "/api/forest-density/async/stats/",
+            {"aoi_id": saved.pk, "threshold": 40, "source": "test_grid"},
+            content_type="application/json",
+        )
+        self.assertEqual(async_response.status_code, 200, async_response.content)
+        handles = {response.json()["distribution_handle"] for response in (response, inline, wkb, async_response)}
+        self.assertEqual(len(handles), 1)
+        self.assertEqual(stats_cache.get_stats_cache().misses, 1)
+
+    def test_resource_create_list_and_delete(self):
+        response = self.client.post(
+            "/api/forest-density/aois/",
+            {"name": "square", "geometry": json.loads(Polygon.from_bbox((0, 0, 0.05, 0.05)).geojson)},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        feature = response.json()
+        self.assertEqual(feature["properties"]["name"], "square")
+        self.assertEqual(feature["bbox"], [0, 0, 0.05, 0.05])
+
+        upload = self.client.post(
+            "/api/forest-density/aois/?name=uploaded",
+            bytes(self.aoi.wkb),
+            content_type="application/octet-stream",
+        )
+        self.assertEqual(upload.status_code, 201, upload.content)
+        self.assertEqual(len(self.client.get("/api/forest-density/aois/").json()["features"]), 2)
+
+        self.assertEqual(self.client.delete(f"/api/forest-density/aois/{feature['id']}/").status_code, 204)
+        self.assertFalse(ForestDensitySavedAOI.objects.filter(pk=feature["id"]).exists())
+        missing = self.client.post(
+            "/api/forest-density/stats/", {"aoi_id": feature["id"]}, content_type="application/json"
+        )
+        self.assertEqual(missing.status_code, 400)
@@ -1,7 +1,9 @@
+import json
+
 from django.contrib.gis.geos import Polygon
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, override_settings
 
-from canopy.serializers import ForestDensityStatsRequestSerializer
+from canopy.serializers import ForestDensityBatchStatsRequestSerializer, ForestDensityStatsRequestSerializer
 
 
 class ForestDensityStatsSerializerTests(SimpleTestCase):
@@ -26,9 +28,63 @@ class ForestDensityStatsSerializerTests(SimpleTestCase):
         self.assertFalse(serializer.is_valid())
         self.assertIn("Bins must be in ascending order.", str(serializer.errors))
 
+    def test_backend_choice(self):
+        serializer = ForestDensityStatsRequestSerializer(data={"geometry": self.poly_geojson, "backend": "snapshot"})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data["backend"], "snapshot")
+        serializer = ForestDensityStatsRequestSerializer(data={"geometry": self.poly_geojson, "backend": "duckdb"})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("backend", serializer.errors)
+
     def test_bins_must_start_and_end_correctly(self):
         serializer = ForestDensityStatsRequestSerializer(
             data={"geometry": self.poly_geojson, "bins": [10, 20, 100]}
         )
         self.assertFalse(serializer.is_valid())
         self.assertIn("Bins must start at 0 and end at 100.", str(serializer.errors))
+
+
+class ForestDensityBatchStatsSerializerTests(SimpleTestCase):
+    def feature(self, key, bbox):
+        return {"type": "Feature", "id": key, "geometry": json.loads(Polygon.from_bbox(bbox).geojson)}
+
+    def test_valid_collection_keeps_ids_in_order(self):
+        aois = {
+            "type": "FeatureCollection",
+            "features": [self.feature("b", (0, 0, 0.1, 0.1)), self.feature(7, (1, 1, 1.1, 1.1))],
+        }
+        serializer = ForestDensityBatchStatsRequestSerializer(data={"aois": aois})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        keys = [key for key, _ in serializer.validated_data["aois"]]
+        self.assertEqual(keys, ["b", 7])
+        self.assertEqual(serializer.validated_data["aois"][0][1].srid, 4326)
+
+    def test_duplicate_ids_are_rejected(self):
+        aois = {
+            "type": "FeatureCollection",
+            "features": [self.feature("a", (0, 0, 0.1, 0.1)), self.feature("a", (1, 1, 1.1, 1.1))],
+        }
+        serializer = ForestDensityBatchStatsRequestSerializer(data={"aois": aois})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("Duplicate feature id", str(serializer.errors))
+
+    @override_settings(FOREST_DENSITY_BATCH_MAX_FEATURES=1)
+    def test_feature_cap(self):
+        aois = {
+            "type": "FeatureCollection",
+            "features": [self.feature("a", (0, 0, 0.1, 0.1)), self.feature("b", (1, 1, 1.1, 1.1))],
+        }
+        serializer = ForestDensityBatchStatsRequestSerializer(data={"aois": aois})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("At most 1 features per batch.", str(serializer.errors))
+
+    @override_settings(FOREST_DENSITY_BATCH_MAX_AREA_KM2=100)
+    def test_total_area_cap(self):
+        # Two 0.1 degree squares at the equator are ~123 km² each.
+        aois = {
+            "type": "FeatureCollection",
+            "features": [self.feature("a", (0, 0, 0.1, 0.1)), self.feature("b", (1, 0, 1.1, 0.1))],
+        }
+        serializer = ForestDensityBatchStatsRequestSerializer(data={"aois": aois})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("exceeds the batch limit", str(serializer.errors))
@@ -0,0 +1,95 @@
+from unittest import mock
+
+from django.contrib.gis.geos import Polygon
+from django.test import SimpleTestCase, TestCase
+
+from canopy.models import ForestDensityDatasetVersion
+from canopy.services import stats_cache
+from canopy.services.forest_density import distribution_from_rows
+from canopy.services.stats_cache import (
+    LocMemLRUCache,
+    bump_dataset_versions,
+    dataset_version,
+    geometry_hash,
+)
+from canopy.signals import cells_loaded
+
+
+class LocMemLRUCacheTests(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LocMemLRUCache(max_entries=2, ttl=None)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"], stats["size"]), (2, 1, 1, 2))
+
+    def test_entries_expire_after_ttl(self):
+        cache = LocMemLRUCache(max_entries=10, ttl=5)
+        with mock.patch("canopy.services.stats_cache.time.monotonic", return_value=100.0):
+            cache.set("a", 1)
+        with mock.patch("canopy.services.stats_cache.time.monotonic", return_value=106.0):
+            self.assertIsNone(cache.get("a"))
+
+
+class RebinLookupTests(SimpleTestCase):
+    def setUp(self):
+        stats_cache.reset_stats_cache()
+        self.addCleanup(stats_cache.reset_stats_cache)
+
+    def test_handle_lookups_are_not_counted_as_stats_lookups(self):
+        cache = stats_cache.get_stats_cache()
+        cache.set("handle", ("hansen_v1", 3, distribution_from_rows([(30, 100.0, 1, 3000.0)])))
+        with mock.patch("canopy.services.stats_cache.dataset_version", return_value=3):
+            self.assertEqual(stats_cache.rebin_cached("handle", threshold=20)["area_above_threshold_m2"], 100.0)
+            self.assertIsNone(stats_cache.rebin_cached("unknown"))
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (0, 0))
+
+
+class GeometryHashTests(SimpleTestCase):
+    def test_ring_start_and_orientation_do_not_matter(self):
+        first = Polygon(((0, 0), (1, 0), (1, 1), (0, 1), (0, 0)), srid=4326)
+        second = Polygon(((1, 1), (1, 0), (0, 0), (0, 1), (1, 1)), srid=4326)
+        self.assertEqual(geometry_hash(first), geometry_hash(second))
+
+
+class DatasetVersionTests(TestCase):
+    def test_loads_bump_source_and_global_versions(self):
+        bump_dataset_versions({"hansen_v1"})
+        cells_loaded.send(sender=None, sources={"hansen_v1"})
+        self.assertEqual(dataset_version("hansen_v1"), 2)
+        self.assertEqual(dataset_version(), 2)
+        self.assertEqual(dataset_version("other"), 0)
+        self.assertEqual(ForestDensityDatasetVersion.objects.count(), 2)
+
+    def test_cached_stats_recompute_after_load(self):
+        geometry = Polygon(((0, 0), (1, 0), (1, 1), (0, 1), (0, 0)), srid=4326)
+        stats_cache.reset_stats_cache()
+        distribution = distribution_from_rows([(30, 100.0, 1, 3000.0), (70, 300.0, 1, 21000.0)])
+        with mock.patch(
+            "canopy.services.stats_cache.compute_distribution", return_value=distribution
+        ) as compute:
+            stats_cache.cached_compute_stats(geometry, threshold=60)
+            stats_cache.cached_compute_stats(geometry, threshold=20)
+            self.assertEqual(compute.call_count, 1)
+            cells_loaded.send(sender=None, sources={"hansen_v1"})
+            stats_cache.cached_compute_stats(geometry)
+            self.assertEqual(compute.call_count, 2)
+
+    def test_rebin_uses_cached_distribution_until_reload(self):
+        geometry = Polygon(((0, 0), (1, 0), (1, 1), (0, 1), (0, 0)), srid=4326)
+        stats_cache.reset_stats_cache()
+        distribution = distribution_from_rows([(30, 100.0, 1, 3000.0), (70, 300.0, 1, 21000.0)])
+        with mock.patch("canopy.services.stats_cache.compute_distribution", return_value=distribution):
+            first = stats_cache.cached_compute_stats(geometry, include_distribution=True)
+        self.assertEqual(first["distribution"]["cum_area_m2"], [100.0, 400.0])
+
+        rebinned = stats_cache.rebin_cached(first["distribution_handle"], threshold=20, bins=[0, 50, 100])
+        self.assertEqual(rebinned["area_above_threshold_m2"], 400.0)
+        self.assertEqual([item["area_m2"] for item in rebinned["area_by_class"]], [100.0, 300.0])
+
+        bump_dataset_versions(set())
+        self.assertIsNone(stats_cache.rebin_cached(first["distribution_handle"], threshold=20))
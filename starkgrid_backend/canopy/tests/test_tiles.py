@@ -0,0 +1,131 @@
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from canopy.services.tile_cache import TileCache, invalidate_tiles, source_dir_name, tile_range
+from canopy.services.tiles import render_mvt
+from canopy.tests.test_forest_density_stats import make_grid
+
+
+class TileRangeTests(SimpleTestCase):
+    def test_world_and_quadrants(self):
+        self.assertEqual(tile_range((-180, -85, 180, 85), 0), (0, 0, 0, 0))
+        self.assertEqual(tile_range((10, 10, 20, 20), 1), (1, 0, 1, 0))
+        self.assertEqual(tile_range((-20, -20, -10, -10), 1), (0, 1, 0, 1))
+
+    def test_clamps_polar_latitudes(self):
+        self.assertEqual(tile_range((-180, -90, 180, 90), 2), (0, 0, 3, 3))
+
+
+class TileCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.override = override_settings(FOREST_DENSITY_TILE_CACHE_DIR=self.root.name)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        self.cache = TileCache("mvt", "mvt")
+
+    def test_round_trip_and_empty_tiles(self):
+        self.assertIsNone(self.cache.get("hansen_v1", 3, 1, 2))
+        self.cache.set("hansen_v1", 3, 1, 2, b"tile")
+        self.cache.set(None, 3, 1, 2, b"")
+        self.assertEqual(self.cache.get("hansen_v1", 3, 1, 2), b"tile")
+        self.assertEqual(self.cache.get(None, 3, 1, 2), b"")
+        self.assertTrue((Path(self.root.name) / "mvt" / "_all" / "3" / "1" / "2.mvt").exists())
+
+    def test_reloaded_tile_ids_only_drop_overlapping_tiles(self):
+        # At z4 tiles are 22.5° wide: (8, 7) covers lon 0..22.5, lat 0..21.9.
+        for source in ("hansen_v1", None):
+            self.cache.set(source, 4, 8, 7, b"near")
+            self.cache.set(source, 4, 2, 2, b"far")
+        self.cache.set("other", 4, 8, 7, b"other source")
+
+        with mock.patch(
+            "canopy.services.tile_cache.tile_extents", return_value={"hansen_v1": (1.0, 1.0, 2.0, 2.0)}
+        ):
+            invalidate_tiles({"hansen_v1"}, {"hansen_v1": {"t1"}})
+
+        self.assertIsNone(self.cache.get("hansen_v1", 4, 8, 7))
+        self.assertIsNone(self.cache.get(None, 4, 8, 7))
+        self.assertEqual(self.cache.get("hansen_v1", 4, 2, 2), b"far")
+        self.assertEqual(self.cache.get(None, 4, 2, 2), b"far")
+        self.assertEqual(self.cache.get("other", 4, 8, 7), b"other source")
+
+    def test_replaced_extents_drop_tiles_the_old_cells_drew(self):
+        # The reloaded tile shrank from around (8, 7) to around (2, 2); both areas are stale.
+        for source in ("hansen_v1", None):
+            self.cache.set(source, 4, 8, 7, b"old")
+            self.cache.set(source, 4, 2, 2, b"new")
+            self.cache.set(source, 4, 12, 12, b"untouched")
+
+        with mock.patch(
+            "canopy.services.tile_cache.tile_extents", return_value={"hansen_v1": (-130.0, 74.0, -129.0, 75.0)}
+        ):
+            invalidate_tiles({"hansen_v1"}, {"hansen_v1": {"t1"}}, replaced={"hansen_v1": (1.0, 1.0, 2.0, 2.0)})
+
+        for source in ("hansen_v1", None):
+            self.assertIsNone(self.cache.get(source, 4, 8, 7))
+            self.assertIsNone(self.cache.get(source, 4, 2, 2))
+            self.assertEqual(self.cache.get(source, 4, 12, 12), b"untouched")
+
+    def test_source_names_stay_inside_the_layer(self):
+        self.assertEqual(source_dir_name("hansen_v1"), "hansen_v1")
+        self.assertEqual(source_dir_name("a/b"), "a%2Fb")
+        self.assertEqual(source_dir_name(".."), "%2E%2E")
+        self.assertEqual(source_dir_name("_all"), "%5F%61%6C%6C")
+        self.assertEqual(source_dir_name(None), "_all")
+        self.cache.set("..", 0, 0, 0, b"tile")
+        self.assertTrue((Path(self.root.name) / "mvt" / "%2E%2E" / "0" / "0" / "0.mvt").exists())
+
+    def test_loads_without_tile_ids_drop_the_source(self):
+        self.cache.set("hansen_v1", 4, 8, 7, b"tile")
+        self.cache.set("other", 4, 8, 7, b"tile")
+        invalidate_tiles({"hansen_v1"})
+        self.assertIsNone(self.cache.get("hansen_v1", 4, 8, 7))
+        self.assertEqual(self.cache.get("other", 4, 8, 7), b"tile")
+
+
+class TileViewTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+
+    def test_serves_and_caches_tiles(self):
+        with override_settings(FOREST_DENSITY_TILE_CACHE_DIR=self.root.name), mock.patch(
+            "canopy.services.tiles.render_mvt", return_value=b"\x1a\x00"
+        ) as render, mock.patch("canopy.services.tiles.has_cells", return_value=True):
+            first = self.client.get("/api/forest-density/tiles/2/1/1.mvt?source=hansen_v1")
+            second = self.client.get("/api/forest-density/tiles/2/1/1.mvt?source=hansen_v1")
+
+        self.assertEqual(first["Content-Type"], "application/vnd.mapbox-vector-tile")
+        self.assertEqual(second.content, b"\x1a\x00")
+        render.assert_called_once_with(2, 1, 1, "hansen_v1")
+
+    def test_empty_and_out_of_range_tiles(self):
+        with override_settings(FOREST_DENSITY_TILE_CACHE_DIR=self.root.name), mock.patch(
+            "canopy.services.tiles.render_mvt", return_value=b""
+        ):
+            self.assertEqual(self.client.get("/api/forest-density/tiles/0/0/0.mvt").status_code, 204)
+            self.assertEqual(self.client.get("/api/forest-density/tiles/1/2/0.mvt").status_code, 404)
+
+    def test_unknown_sources_are_not_rendered_or_cached(self):
+        with override_settings(FOREST_DENSITY_TILE_CACHE_DIR=self.root.name), mock.patch(
+            "canopy.services.tiles.render_mvt"
+        ) as render, mock.patch("canopy.services.tiles.has_cells", return_value=False):
+            response = self.client.get("/api/forest-density/tiles/0/0/0.mvt?source=..")
+
+        self.assertEqual(response.status_code, 404)
+        render.assert_not_called()
+        self.assertFalse((Path(self.root.name) / "mvt").exists())
+
+
+class RenderMvtTests(TestCase):
+    def test_detailed_and_dissolved_tiles(self):
+        make_grid(size=10, step=0.01)
+        # Tile containing (0.05, 0.05) at z12 and z4.
+        self.assertTrue(render_mvt(12, 2048, 2047, "test_grid"))
+        self.assertTrue(render_mvt(4, 8, 7, "test_grid"))
+        self.assertEqual(render_mvt(4, 0, 0, "test_grid"), b"")
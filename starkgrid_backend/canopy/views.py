@@ -1,39 +1,414 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import mixins, status, viewsets
+from rest_framework.exceptions import NotFound, ParseError, ValidationError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
-from canopy.serializers import DEFAULT_BINS, ForestDensityStatsRequestSerializer
-from canopy.services.forest_density import compute_stats
+from canopy.models import ForestDensitySavedAOI
+from canopy.parsers import WKB_MEDIA_TYPES, OctetStreamWKBParser, WKBParser, parse_wkb
+from canopy.serializers import (
+    DEFAULT_BINS,
+    DEFAULT_LEGEND_COLORS,
+    ForestDensityBatchStatsRequestSerializer,
+    ForestDensityChangeRequestSerializer,
+    ForestDensityExportRequestSerializer,
+    ForestDensityRebinRequestSerializer,
+    ForestDensitySavedAOIRequestSerializer,
+    ForestDensitySavedAOISerializer,
+    ForestDensityStatsRequestSerializer,
+)
+from canopy.services.cog import get_png
+from canopy.services.export import (
+    EXPORT_CONTENT_TYPES,
+    agzip_stream,
+    astream_cells,
+    gzip_stream,
+    stream_cells,
+    stream_stats,
+)
+from canopy.services.forest_change import compute_change
+from canopy.services.fragmentation import FragmentationTooLarge, compute_fragmentation
+from canopy.services.metrics import note, render_metrics, stage, track_stats_request
+from canopy.services.saved_aoi import save_aoi
+from canopy.services.stats_cache import (
+    acached_compute_stats,
+    cached_compute_batch_stats,
+    cached_compute_stats,
+    get_stats_cache,
+    rebin_cached,
+)
+from canopy.services.tiles import get_mvt, is_valid_tile
+
+
+# JSON and form bodies, plus binary WKB geometries with the other fields in the query string.
+GEOMETRY_PARSER_CLASSES = [*api_settings.DEFAULT_PARSER_CLASSES, WKBParser, OctetStreamWKBParser]
 
 
 class ForestDensityStatsView(APIView):
     """
-    Accepts a GeoJSON polygon and returns canopy statistics for the intersection.
+    Accepts a GeoJSON polygon, a saved AOI id (``aoi_id``) or a WKB body and
+    returns canopy statistics for the intersection.
+    ``mode="histogram"`` also returns the per-canopy_pct area distribution;
+    ``backend`` picks the SQL path or the memory-mapped grid snapshot, and
+    ``fragmentation=true`` adds forest patch metrics at the same threshold.
+    """
+
+    parser_classes = GEOMETRY_PARSER_CLASSES
+
+    def post(self, request, *args, **kwargs):
+        with track_stats_request():
+            serializer = ForestDensityStatsRequestSerializer(data=request.data)
+            with stage("validate"):
+                serializer.is_valid(raise_exception=True)
+            geometry = serializer.validated_data["geometry"]
+            note("aoi_vertices", geometry.num_coords)
+            threshold = float(serializer.validated_data.get("threshold", 60))
+            bins = serializer.validated_data.get("bins") or DEFAULT_BINS
+            source = serializer.validated_data.get("source")
+            histogram = serializer.validated_data.get("mode") == "histogram"
+
+            stats = cached_compute_stats(
+                geometry=geometry,
+                threshold=threshold,
+                bins=bins,
+                source=source,
+                include_distribution=histogram,
+                backend=serializer.validated_data.get("backend"),
+                saved_aoi=serializer.validated_data.get("aoi"),
+            )
+            if serializer.validated_data.get("fragmentation"):
+                with stage("fragmentation"):
+                    try:
+                        stats["fragmentation"] = compute_fragmentation(geometry, threshold, source)
+                    except FragmentationTooLarge as exc:
+                        raise ValidationError({"fragmentation": [str(exc)]}) from exc
+        return Response(stats)
+
+
+class ForestDensitySavedAOIViewSet(
+    mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet
+):
+    """
+    Saved AOIs for reuse in stats requests (``aoi_id``). Create with a GeoJSON
+    Polygon/MultiPolygon and optional name, or a WKB body with ``?name=``;
+    the geometry is validated, normalised to EPSG:4326 and subdivided once.
+    """
+
+    queryset = ForestDensitySavedAOI.objects.all()
+    serializer_class = ForestDensitySavedAOISerializer
+    parser_classes = GEOMETRY_PARSER_CLASSES
+
+    def create(self, request, *args, **kwargs):
+        serializer = ForestDensitySavedAOIRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        aoi = save_aoi(serializer.validated_data["geometry"], name=serializer.validated_data["name"])
+        return Response(ForestDensitySavedAOISerializer(aoi).data, status=status.HTTP_201_CREATED)
+
+
+class ForestDensityBatchStatsView(APIView):
+    """
+    Accepts a FeatureCollection of AOIs and returns canopy statistics per
+    feature id, evaluated together in one query.
     """
 
     def post(self, request, *args, **kwargs):
-        serializer = ForestDensityStatsRequestSerializer(data=request.data)
+        serializer = ForestDensityBatchStatsRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        geometry = serializer.validated_data["geometry"]
         threshold = float(serializer.validated_data.get("threshold", 60))
         bins = serializer.validated_data.get("bins") or DEFAULT_BINS
+        source = serializer.validated_data.get("source")
 
-        stats = compute_stats(geometry=geometry, threshold=threshold, bins=bins)
+        results = cached_compute_batch_stats(
+            serializer.validated_data["aois"], threshold=threshold, bins=bins, source=source
+        )
+        return Response({"count": len(results), "results": results})
+
+
+class ForestDensityChangeView(APIView):
+    """
+    Compares two sources (e.g. dataset versions) over a GeoJSON polygon and
+    returns loss, gain, net change and the transition matrix between bins.
+    """
+
+    def post(self, request, *args, **kwargs):
+        serializer = ForestDensityChangeRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        change = compute_change(
+            data["geometry"],
+            before_source=data["before_source"],
+            after_source=data["after_source"],
+            threshold=float(data.get("threshold", 60)),
+            bins=data.get("bins") or DEFAULT_BINS,
+        )
+        return Response(change)
+
+
+class ForestDensityExportView(APIView):
+    """
+    Streams clipped cells (or the AOI stats) as CSV, GeoJSON or NDJSON,
+    optionally gzip-compressed, without materialising the result set. The
+    body is a sync iterator, which only streams under WSGI; an ASGI server
+    consumes it whole first, so use AsyncForestDensityExportView there.
+    """
+
+    def post(self, request, *args, **kwargs):
+        serializer = ForestDensityExportRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        geometry = data["geometry"]
+        threshold = float(data.get("threshold", 60))
+        bins = data.get("bins") or DEFAULT_BINS
+        source = data.get("source")
+        export_format = data["format"]
+
+        if data["content"] == "stats":
+            stats = cached_compute_stats(geometry=geometry, threshold=threshold, bins=bins, source=source)
+            chunks = stream_stats(geometry, stats, export_format)
+        else:
+            chunks = stream_cells(geometry, export_format, threshold=threshold, bins=bins, source=source)
+
+        filename = f"forest-density-{data['content']}.{export_format}"
+        if data["gzip"]:
+            response = StreamingHttpResponse(gzip_stream(chunks), content_type="application/gzip")
+            filename += ".gz"
+        else:
+            response = StreamingHttpResponse(
+                (chunk.encode("utf-8") for chunk in chunks), content_type=EXPORT_CONTENT_TYPES[export_format]
+            )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class ForestDensityRebinView(APIView):
+    """
+    Answers a new threshold or bins for a previously computed AOI from its
+    cached distribution, without querying PostGIS.
+    """
+
+    def post(self, request, *args, **kwargs):
+        serializer = ForestDensityRebinRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        threshold = float(serializer.validated_data.get("threshold", 60))
+        bins = serializer.validated_data.get("bins") or DEFAULT_BINS
+
+        stats = rebin_cached(serializer.validated_data["handle"], threshold=threshold, bins=bins)
+        if stats is None:
+            raise NotFound("Unknown or expired distribution handle; request the AOI stats again.")
         return Response(stats)
 
 
+class ForestDensityStatsCacheView(APIView):
+    """
+    Reports hit/miss counters of the stats result cache for this worker process.
+    """
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_stats_cache().stats())
+
+
+class ForestDensityMetricsView(View):
+    """
+    Stats pipeline metrics of this worker process in the Prometheus text format.
+    """
+
+    http_method_names = ["get", "options"]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def legend_payload():
+    return {
+        "bin_edges": DEFAULT_BINS,
+        "colors": DEFAULT_LEGEND_COLORS,
+        "title": "Forest canopy cover (%)",
+        "description": "Canopy cover percentage per grid cell.",
+    }
+
+
 class ForestDensityLegendView(APIView):
     """
     Returns the default legend configuration for the forest density layer.
     """
 
     def get(self, request, *args, **kwargs):
-        # Simple, readable ramp; frontend can override if needed.
-        colors = ["#f7fcf5", "#c7e9c0", "#74c476", "#31a354", "#006d2c"]
-        return Response(
-            {
-                "bin_edges": DEFAULT_BINS,
-                "colors": colors,
-                "title": "Forest canopy cover (%)",
-                "description": "Canopy cover percentage per grid cell.",
-            }
-        )
+        return Response(legend_payload())
+
+
+# Token/anonymous API like the DRF views, which are CSRF-exempt as well.
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncForestDensityStatsView(View):
+    """
+    Async counterpart of ForestDensityStatsView for ASGI deployments. The
+    query runs on the psycopg async pool instead of holding a worker thread.
+    DRF views are sync-only, so this is a plain Django view using the same
+    serializer, request bodies (JSON, or WKB with the other fields in the
+    query string) and response shape.
+    """
+
+    http_method_names = ["post", "options"]
+
+    async def post(self, request, *args, **kwargs):
+        with track_stats_request() as timer:
+            with stage("validate"):
+                if request.content_type in WKB_MEDIA_TYPES:
+                    try:
+                        data = parse_wkb(request.body, request.GET)
+                    except ParseError as exc:
+                        timer.discard()
+                        return JsonResponse({"detail": str(exc.detail)}, status=400)
+                else:
+                    try:
+                        data = json.loads(request.body or b"{}")
+                    except ValueError as exc:
+                        timer.discard()
+                        return JsonResponse({"detail": f"JSON parse error - {exc}"}, status=400)
+
+                serializer = ForestDensityStatsRequestSerializer(data=data)
+                # Looking up a saved AOI is an ORM query, which must not run on the event loop.
+                if isinstance(data, dict) and "aoi_id" in data:
+                    valid = await sync_to_async(serializer.is_valid)()
+                else:
+                    valid = serializer.is_valid()
+                if not valid:
+                    timer.discard()
+                    return JsonResponse(serializer.errors, status=400)
+            geometry = serializer.validated_data["geometry"]
+            note("aoi_vertices", geometry.num_coords)
+            threshold = float(serializer.validated_data.get("threshold", 60))
+            bins = serializer.validated_data.get("bins") or DEFAULT_BINS
+            source = serializer.validated_data.get("source")
+            histogram = serializer.validated_data.get("mode") == "histogram"
+
+            stats = await acached_compute_stats(
+                geometry=geometry,
+                threshold=threshold,
+                bins=bins,
+                source=source,
+                include_distribution=histogram,
+                backend=serializer.validated_data.get("backend"),
+                saved_aoi=serializer.validated_data.get("aoi"),
+            )
+            if serializer.validated_data.get("fragmentation"):
+                with stage("fragmentation"):
+                    try:
+                        stats["fragmentation"] = await sync_to_async(compute_fragmentation)(geometry, threshold, source)
+                    except FragmentationTooLarge as exc:
+                        timer.discard()
+                        return JsonResponse({"fragmentation": [str(exc)]}, status=400)
+            with stage("render"):
+                return JsonResponse(stats)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncForestDensityExportView(View):
+    """
+    Async counterpart of ForestDensityExportView for ASGI deployments. Cells
+    come from a server-side cursor on the psycopg async pool and each batch
+    is sent as it arrives.
+    """
+
+    http_method_names = ["post", "options"]
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError as exc:
+            return JsonResponse({"detail": f"JSON parse error - {exc}"}, status=400)
+        serializer = ForestDensityExportRequestSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+        data = serializer.validated_data
+        geometry = data["geometry"]
+        threshold = float(data.get("threshold", 60))
+        bins = data.get("bins") or DEFAULT_BINS
+        source = data.get("source")
+        export_format = data["format"]
+
+        if data["content"] == "stats":
+            stats = await acached_compute_stats(geometry=geometry, threshold=threshold, bins=bins, source=source)
+            chunks = _aiter(stream_stats(geometry, stats, export_format))
+        else:
+            chunks = astream_cells(geometry, export_format, threshold=threshold, bins=bins, source=source)
+
+        filename = f"forest-density-{data['content']}.{export_format}"
+        if data["gzip"]:
+            response = StreamingHttpResponse(agzip_stream(chunks), content_type="application/gzip")
+            filename += ".gz"
+        else:
+            response = StreamingHttpResponse(_aencode(chunks), content_type=EXPORT_CONTENT_TYPES[export_format])
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+async def _aiter(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def _aencode(chunks):
+    async for chunk in chunks:
+        yield chunk.encode("utf-8")
+
+
+class AsyncForestDensityLegendView(View):
+    """
+    Async counterpart of ForestDensityLegendView.
+    """
+
+    http_method_names = ["get", "options"]
+
+    async def get(self, request, *args, **kwargs):
+        return JsonResponse(legend_payload())
+
+
+class ForestDensityTileView(View):
+    """
+    Mapbox Vector Tile of the forest density layer, served from the disk tile
+    cache. ``?source=`` restricts the layer to one dataset. Plain Django view
+    so binary responses bypass DRF content negotiation.
+    """
+
+    http_method_names = ["get", "options"]
+
+    def get(self, request, z, x, y, *args, **kwargs):
+        if not is_valid_tile(z, x, y):
+            raise Http404("Tile out of range.")
+        source = request.GET.get("source") or None
+        data = get_mvt(z, x, y, source=source)
+        if data is None:
+            raise Http404("Unknown source.")
+        if not data:
+            return HttpResponse(status=204)
+        return HttpResponse(data, content_type="application/vnd.mapbox-vector-tile")
+
+
+class ForestDensityPngTileView(View):
+    """
+    Raster XYZ tile of the forest density layer, read from the exported COG
+    and coloured with the legend ramp.
+    """
+
+    http_method_names = ["get", "options"]
+
+    def get(self, request, z, x, y, *args, **kwargs):
+        if not is_valid_tile(z, x, y):
+            raise Http404("Tile out of range.")
+        source = request.GET.get("source") or None
+        data = get_png(z, x, y, source=source)
+        if data is None:
+            raise Http404(
+                "No current COG for this source (none exported, or cells loaded since); run export_forest_density_cog."
+            )
+        if not data:
+            return HttpResponse(status=204)
+        return HttpResponse(data, content_type="image/png")
@@ -0,0 +1,16 @@
+from django.contrib import admin
+from django.contrib.gis.admin import GISModelAdmin
+
+from .models import HydroCandidateSite, HydroScreening
+
+
+@admin.register(HydroScreening)
+class HydroScreeningAdmin(GISModelAdmin):
+    list_display = ("name", "dem_path", "forest_source", "built_at")
+    readonly_fields = ("built_at",)
+
+
+@admin.register(HydroCandidateSite)
+class HydroCandidateSiteAdmin(GISModelAdmin):
+    list_display = ("id", "screening", "head_m", "catchment_km2", "power_index", "potential_kw", "forest_warning")
+    list_filter = ("screening", "forest_warning")
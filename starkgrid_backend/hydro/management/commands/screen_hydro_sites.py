@@ -0,0 +1,125 @@
+import time
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_slug
+
+from canopy.services.ingest import peak_rss_mib
+from hydro.services.flow import DEFAULT_TILE_PIXELS
+from hydro.services.sites import ScreeningParameters, screen_dem
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute D8 flow direction and accumulation for a DEM tile by tile, extract run-of-river candidate "
+        "sites by head and catchment thresholds and check each catchment against the canopy data."
+    )
+
+    def add_arguments(self, parser):
+        defaults = ScreeningParameters()
+        parser.add_argument("--dem", required=True, help="Hydrologically conditioned DEM (metres) readable by GDAL.")
+        parser.add_argument(
+            "--name", required=True, help="Screening name; an earlier run of the same name is replaced."
+        )
+        parser.add_argument(
+            "--forest-source",
+            default=None,
+            help="ForestDensityCell source for the forest overlap check. Defaults to all sources.",
+        )
+        parser.add_argument(
+            "--tile-pixels",
+            type=int,
+            default=DEFAULT_TILE_PIXELS,
+            help=f"Tile edge in pixels; one tile is in memory at a time. Defaults to {DEFAULT_TILE_PIXELS}.",
+        )
+        parser.add_argument(
+            "--min-catchment-km2",
+            type=float,
+            default=defaults.min_catchment_km2,
+            help=f"Smallest catchment of a river pixel. Defaults to {defaults.min_catchment_km2:g}.",
+        )
+        parser.add_argument(
+            "--min-head-m",
+            type=float,
+            default=defaults.min_head_m,
+            help=f"Smallest drop over the reach below a site. Defaults to {defaults.min_head_m:g}.",
+        )
+        parser.add_argument(
+            "--reach-m",
+            type=float,
+            default=defaults.reach_m,
+            help=f"Length of river the head is measured over. Defaults to {defaults.reach_m:g}.",
+        )
+        parser.add_argument(
+            "--spacing-m",
+            type=float,
+            default=defaults.spacing_m,
+            help=f"Keep the best site per block of this size. Defaults to {defaults.spacing_m:g}.",
+        )
+        parser.add_argument(
+            "--max-sites",
+            type=int,
+            default=defaults.max_sites,
+            help=f"Keep at most this many sites. Defaults to {defaults.max_sites}.",
+        )
+        parser.add_argument(
+            "--runoff-mm",
+            type=float,
+            default=None,
+            help="Mean annual runoff depth; when given, sites get a mean flow and power estimate.",
+        )
+        parser.add_argument(
+            "--efficiency",
+            type=float,
+            default=defaults.efficiency,
+            help=f"Overall plant efficiency for the power estimate. Defaults to {defaults.efficiency:g}.",
+        )
+        parser.add_argument(
+            "--forest-threshold",
+            type=float,
+            default=defaults.forest_threshold,
+            help=f"Canopy percentage counted as forest. Defaults to {defaults.forest_threshold:g}.",
+        )
+        parser.add_argument(
+            "--forest-warning-share",
+            type=float,
+            default=defaults.forest_warning_share,
+            help=f"Warn when forest covers this share of a catchment. Defaults to {defaults.forest_warning_share:g}.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            validate_slug(options["name"])
+        except ValidationError:
+            raise CommandError("--name must be a slug (letters, numbers, underscores or hyphens).")
+        if not Path(options["dem"]).exists():
+            raise CommandError(f"--dem file not found: {options['dem']}")
+        if options["tile_pixels"] < 1 or options["max_sites"] < 1:
+            raise CommandError("--tile-pixels and --max-sites must be at least 1.")
+        if options["reach_m"] <= 0 or options["spacing_m"] <= 0:
+            raise CommandError("--reach-m and --spacing-m must be positive.")
+        if not 0 <= options["forest_warning_share"] <= 1:
+            raise CommandError("--forest-warning-share must be between 0 and 1.")
+        params = ScreeningParameters(**{field: options[field] for field in ScreeningParameters._fields})
+
+        started = time.perf_counter()
+        try:
+            screening = screen_dem(
+                options["dem"],
+                options["name"],
+                params,
+                forest_source=options["forest_source"],
+                tile_pixels=options["tile_pixels"],
+                progress=self.stdout.write,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+        warnings = screening.sites.filter(forest_warning=True).count()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Screened {screening.name}: {screening.sites.count():,} sites, {warnings:,} with a forest warning, "
+                f"in {time.perf_counter() - started:.1f}s."
+            )
+        )
+        self.stdout.write(f"Peak memory (RSS high-water mark): {peak_rss_mib():.1f} MiB")
@@ -0,0 +1,55 @@
+# Generated by Django 6.1.2 on 2026-10-17 00:51
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HydroScreening',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.SlugField(max_length=64, unique=True)),
+                ('dem_path', models.CharField(max_length=512)),
+                ('flow_dir', models.CharField(help_text='Directory holding the elevation, direction and accumulation .npy rasters.', max_length=512)),
+                ('forest_source', models.CharField(blank=True, help_text='ForestDensityCell source catchments were checked against; blank for all sources.', max_length=64)),
+                ('parameters', models.JSONField(help_text='ScreeningParameters the sites were extracted with.')),
+                ('extent', django.contrib.gis.db.models.fields.PolygonField(srid=4326)),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='HydroCandidateSite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geom', django.contrib.gis.db.models.fields.PointField(help_text='Intake pixel centre.', srid=4326)),
+                ('catchment', django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, help_text='Upstream catchment outline.', null=True, srid=4326)),
+                ('elevation_m', models.FloatField()),
+                ('head_m', models.FloatField(help_text='Elevation drop over the reach below the intake.')),
+                ('reach_m', models.FloatField(help_text='Length of the downstream reach the head was measured over.')),
+                ('catchment_km2', models.FloatField()),
+                ('power_index', models.FloatField(help_text='head_m * catchment_km2; proportional to potential power under uniform runoff.')),
+                ('mean_flow_m3s', models.FloatField(blank=True, help_text='From the runoff depth, when one was given.', null=True)),
+                ('potential_kw', models.FloatField(blank=True, help_text='From the runoff depth, when one was given.', null=True)),
+                ('forest_mean_canopy', models.FloatField(blank=True, help_text='Mean canopy cover of the catchment.', null=True)),
+                ('forest_share', models.FloatField(blank=True, help_text="Share of the catchment's canopy-covered area at or above the threshold.", null=True)),
+                ('forest_warning', models.BooleanField(default=False, help_text="The catchment's forest share reaches the screening's warning share.")),
+                ('screening', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sites', to='hydro.hydroscreening')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GistIndex(fields=['geom'], name='hydro_site_geom_gist'), models.Index(fields=['screening', '-power_index'], name='hydro_site_rank_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+from django.contrib.postgres.indexes import GistIndex
+from django.contrib.gis.db import models
+
+
+class HydroScreening(models.Model):
+    """
+    One run-of-river screening of a DEM: where its flow rasters live and the
+    thresholds its candidate sites were extracted with.
+    """
+
+    name = models.SlugField(max_length=64, unique=True)
+    dem_path = models.CharField(max_length=512)
+    flow_dir = models.CharField(
+        max_length=512, help_text="Directory holding the elevation, direction and accumulation .npy rasters."
+    )
+    forest_source = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="ForestDensityCell source catchments were checked against; blank for all sources.",
+    )
+    parameters = models.JSONField(help_text="ScreeningParameters the sites were extracted with.")
+    extent = models.PolygonField(srid=4326)
+    built_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self) -> str:
+        return f"Hydro screening {self.name}"
+
+
+class HydroCandidateSite(models.Model):
+    """
+    A run-of-river intake candidate: a river pixel with enough catchment and
+    enough head over the diversion reach downstream of it.
+    """
+
+    screening = models.ForeignKey(HydroScreening, on_delete=models.CASCADE, related_name="sites")
+    geom = models.PointField(srid=4326, help_text="Intake pixel centre.")
+    catchment = models.MultiPolygonField(srid=4326, null=True, blank=True, help_text="Upstream catchment outline.")
+    elevation_m = models.FloatField()
+    head_m = models.FloatField(help_text="Elevation drop over the reach below the intake.")
+    reach_m = models.FloatField(help_text="Length of the downstream reach the head was measured over.")
+    catchment_km2 = models.FloatField()
+    power_index = models.FloatField(
+        help_text="head_m * catchment_km2; proportional to potential power under uniform runoff."
+    )
+    mean_flow_m3s = models.FloatField(null=True, blank=True, help_text="From the runoff depth, when one was given.")
+    potential_kw = models.FloatField(null=True, blank=True, help_text="From the runoff depth, when one was given.")
+    forest_mean_canopy = models.FloatField(null=True, blank=True, help_text="Mean canopy cover of the catchment.")
+    forest_share = models.FloatField(
+        null=True, blank=True, help_text="Share of the catchment's canopy-covered area at or above the threshold."
+    )
+    forest_warning = models.BooleanField(
+        default=False, help_text="The catchment's forest share reaches the screening's warning share."
+    )
+
+    class Meta:
+        indexes = [
+            GistIndex(fields=["geom"], name="hydro_site_geom_gist"),
+            models.Index(fields=["screening", "-power_index"], name="hydro_site_rank_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Hydro site {self.id} ({self.head_m:.0f} m, {self.catchment_km2:.1f} km²)"
@@ -0,0 +1,40 @@
+from rest_framework import serializers
+from rest_framework_gis.fields import GeometryField
+from rest_framework_gis.serializers import GeoFeatureModelSerializer
+
+from canopy.serializers import to_wgs84
+from hydro.models import HydroCandidateSite
+
+
+MAX_TOP_SITES = 100
+
+
+class HydroSitesRequestSerializer(serializers.Serializer):
+    geometry = GeometryField()
+    screening = serializers.SlugField(max_length=64, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_TOP_SITES, required=False, default=10)
+    forest_warning = serializers.BooleanField(
+        required=False, allow_null=True, default=None, help_text="Only sites with (true) or without (false) a warning."
+    )
+
+    def validate_geometry(self, value):
+        return to_wgs84(value)
+
+
+class HydroCandidateSiteSerializer(GeoFeatureModelSerializer):
+    class Meta:
+        model = HydroCandidateSite
+        geo_field = "geom"
+        fields = (
+            "id",
+            "elevation_m",
+            "head_m",
+            "reach_m",
+            "catchment_km2",
+            "power_index",
+            "mean_flow_m3s",
+            "potential_kw",
+            "forest_mean_canopy",
+            "forest_share",
+            "forest_warning",
+        )
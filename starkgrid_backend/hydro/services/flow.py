@@ -0,0 +1,454 @@
+"""
+Out-of-core D8 flow direction and flow accumulation.
+
+The DEM is processed in square tiles and the results live in ``.npy``
+memmaps next to each other, so only one tile (plus a one-pixel halo) is in
+memory at a time:
+
+* ``elevation.npy``: float32 DEM with NaN for nodata;
+* ``direction.npy``: uint8 D8 code (index into OFFSETS) of the steepest
+  downhill neighbour, NO_FLOW for pits, flats, nodata and raster edges
+  without a lower neighbour;
+* ``accumulation.npy``: float64 upstream catchment area in m², the cell's own
+  area included.
+
+Directions only need the halo. Accumulation does not stay inside a tile, so
+it runs in three passes (after Barnes, "Parallel non-divergent flow
+accumulation for trillion cell digital elevation models", 2017):
+
+1. every tile accumulates its own area and records, for each cell on its
+   border, the cell through which that flow path leaves the tile;
+2. a graph with one node per tile exit cell (a few per border pixel at most)
+   is accumulated to get the total flow leaving through every exit, and so
+   the flow entering every neighbouring tile;
+3. every tile accumulates again with those inflows added at their entry cells.
+
+Within a tile, accumulation is a vectorised topological sweep: cells with no
+unprocessed upstream neighbours form the frontier, push their totals
+downstream with ``np.add.at`` and release the cells they drain into. DEMs
+should be hydrologically conditioned (depressions filled or breached)
+beforehand; flow stops at pits and flats.
+"""
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from canopy.services.cog import GridSpec
+from canopy.services.grid_snapshot import row_areas
+from canopy.services.raster_ingest import METRES_PER_DEGREE
+
+
+DEFAULT_TILE_PIXELS = 1024
+NO_FLOW = 255
+# (row, col) steps for D8 codes 0-7: E, SE, S, SW, W, NW, N, NE.
+OFFSETS = ((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1))
+
+ELEVATION = "elevation.npy"
+DIRECTION = "direction.npy"
+ACCUMULATION = "accumulation.npy"
+BASINS = "basins.npy"
+
+
+class PixelGeometry(NamedTuple):
+    """
+    Pixel width per row and height in metres, and pixel area per row in m².
+    """
+
+    width_m: np.ndarray
+    height_m: float
+    area_m2: np.ndarray
+
+
+class Tile(NamedTuple):
+    row_off: int
+    col_off: int
+    height: int
+    width: int
+
+
+class FlowRasters(NamedTuple):
+    elevation: np.ndarray
+    direction: np.ndarray
+    accumulation: np.ndarray
+
+
+def pixel_geometry(src) -> PixelGeometry:
+    """
+    Metric pixel sizes of a north-up raster; geographic rasters get the
+    WGS84 area of each row, projected ones are assumed to be in metres.
+    """
+    transform = src.transform
+    if transform.b or transform.d or transform.e >= 0:
+        raise ValueError("Only north-up rasters without rotation are supported.")
+    res_x, res_y = transform.a, -transform.e
+    if src.crs is not None and src.crs.is_geographic:
+        grid = GridSpec(
+            west=transform.c, north=transform.f, res_x=res_x, res_y=res_y, width=src.width, height=src.height
+        )
+        area = row_areas(grid)
+        height_m = res_y * METRES_PER_DEGREE
+        return PixelGeometry(width_m=area / height_m, height_m=height_m, area_m2=area)
+    return PixelGeometry(
+        width_m=np.full(src.height, res_x), height_m=res_y, area_m2=np.full(src.height, res_x * res_y)
+    )
+
+
+def iter_tiles(height: int, width: int, tile_pixels: int) -> Iterator[Tile]:
+    for row_off in range(0, height, tile_pixels):
+        for col_off in range(0, width, tile_pixels):
+            yield Tile(row_off, col_off, min(tile_pixels, height - row_off), min(tile_pixels, width - col_off))
+
+
+def open_flow_rasters(directory: Path, mode: str = "r") -> FlowRasters:
+    return FlowRasters(
+        elevation=np.load(directory / ELEVATION, mmap_mode=mode),
+        direction=np.load(directory / DIRECTION, mmap_mode=mode),
+        accumulation=np.load(directory / ACCUMULATION, mmap_mode=mode),
+    )
+
+
+def d8_directions(window: np.ndarray, width_m: np.ndarray, height_m: float) -> np.ndarray:
+    """
+    D8 codes for the interior of ``window`` (a tile with a one-pixel halo,
+    NaN for nodata); ``width_m`` holds the pixel width of each interior row.
+    Ties go to the first direction in OFFSETS.
+    """
+    rows, cols = window.shape[0] - 2, window.shape[1] - 2
+    centre = window[1:-1, 1:-1]
+    best = np.zeros((rows, cols))
+    codes = np.full((rows, cols), NO_FLOW, dtype=np.uint8)
+    dx = width_m[:, np.newaxis]
+    with np.errstate(invalid="ignore"):
+        for code, (dy, dx_step) in enumerate(OFFSETS):
+            neighbour = window[1 + dy:1 + dy + rows, 1 + dx_step:1 + dx_step + cols]
+            distance = np.sqrt((dx_step * dx) ** 2 + (dy * height_m) ** 2)
+            slope = (centre - neighbour) / distance
+            steeper = slope > best
+            best = np.where(steeper, slope, best)
+            codes[steeper] = code
+    codes[np.isnan(centre)] = NO_FLOW
+    return codes
+
+
+def accumulate(down: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Sum of ``weights`` over every cell draining into each cell, itself
+    included. ``down[i]`` is the index cell ``i`` drains into, or -1.
+    """
+    totals = weights.astype(np.float64)
+    draining = down >= 0
+    pending = np.bincount(down[draining], minlength=len(down))
+    frontier = np.flatnonzero(pending == 0)
+    while frontier.size:
+        targets = down[frontier]
+        flowing = targets >= 0
+        sources, targets = frontier[flowing], targets[flowing]
+        np.add.at(totals, targets, totals[sources])
+        np.subtract.at(pending, targets, 1)
+        targets = np.unique(targets)
+        frontier = targets[pending[targets] == 0]
+    return totals
+
+
+def _tile_links(direction: np.ndarray, tile: Tile, height: int, width: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    For each tile cell (row-major): the tile cell it drains into (-1 if none
+    or outside the tile) and the global index it drains into when that lies
+    outside the tile but inside the raster (-1 otherwise).
+    """
+    codes = np.asarray(direction[tile.row_off:tile.row_off + tile.height, tile.col_off:tile.col_off + tile.width])
+    rows, cols = np.indices(codes.shape)
+    flowing = codes != NO_FLOW
+    offsets = np.array(OFFSETS + ((0, 0),) * (NO_FLOW - len(OFFSETS) + 1))
+    target_rows = rows + offsets[codes, 0]
+    target_cols = cols + offsets[codes, 1]
+    inside = flowing & (target_rows >= 0) & (target_rows < tile.height)
+    inside &= (target_cols >= 0) & (target_cols < tile.width)
+    down = np.where(inside, target_rows * tile.width + target_cols, -1).ravel()
+
+    global_rows = tile.row_off + target_rows
+    global_cols = tile.col_off + target_cols
+    leaving = flowing & ~inside & (global_rows >= 0) & (global_rows < height)
+    leaving &= (global_cols >= 0) & (global_cols < width)
+    external = np.where(leaving, global_rows * width + global_cols, -1).ravel()
+    return down, external
+
+
+def _border_cells(tile: Tile) -> np.ndarray:
+    rows, cols = np.indices((tile.height, tile.width))
+    border = (rows == 0) | (rows == tile.height - 1) | (cols == 0) | (cols == tile.width - 1)
+    return np.flatnonzero(border.ravel())
+
+
+def _path_ends(down: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """
+    Last tile cell on the flow path from each of ``starts``.
+    """
+    ends = starts.copy()
+    active = np.arange(len(starts))
+    while active.size:
+        following = down[ends[active]]
+        moving = following >= 0
+        active = active[moving]
+        ends[active] = following[moving]
+    return ends
+
+
+def _global_index(tile: Tile, local: np.ndarray, width: int) -> np.ndarray:
+    rows, cols = np.divmod(local, tile.width)
+    return (tile.row_off + rows) * width + tile.col_off + cols
+
+
+def compute_flow(
+    dem_path: str, directory: Path, tile_pixels: int = DEFAULT_TILE_PIXELS, band: int = 1
+) -> FlowRasters:
+    """
+    Writes elevation, direction and accumulation memmaps for ``dem_path``
+    into ``directory`` and returns them opened read-only.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    with rasterio.open(dem_path) as src:
+        height, width = src.height, src.width
+        pixels = pixel_geometry(src)
+        elevation = np.lib.format.open_memmap(directory / ELEVATION, mode="w+", dtype=np.float32, shape=(height, width))
+        direction = np.lib.format.open_memmap(directory / DIRECTION, mode="w+", dtype=np.uint8, shape=(height, width))
+        for tile in iter_tiles(height, width, tile_pixels):
+            window = Window(tile.col_off - 1, tile.row_off - 1, tile.width + 2, tile.height + 2)
+            data = src.read(band, window=window, boundless=True, masked=True)
+            values = np.ma.filled(data.astype(np.float64), np.nan)
+            rows = slice(tile.row_off, tile.row_off + tile.height)
+            cols = slice(tile.col_off, tile.col_off + tile.width)
+            elevation[rows, cols] = values[1:-1, 1:-1]
+            direction[rows, cols] = d8_directions(values, pixels.width_m[rows], pixels.height_m)
+        elevation.flush()
+        direction.flush()
+        del elevation
+
+    accumulation = np.lib.format.open_memmap(
+        directory / ACCUMULATION, mode="w+", dtype=np.float64, shape=(height, width)
+    )
+
+    def area(tile: Tile) -> np.ndarray:
+        return np.repeat(pixels.area_m2[tile.row_off:tile.row_off + tile.height], tile.width)
+
+    def store(tile: Tile, totals: np.ndarray) -> None:
+        rows = slice(tile.row_off, tile.row_off + tile.height)
+        cols = slice(tile.col_off, tile.col_off + tile.width)
+        accumulation[rows, cols] = totals.reshape(tile.height, tile.width)
+
+    accumulate_tiles(direction, tile_pixels, area, store)
+    accumulation.flush()
+    del direction
+    return open_flow_rasters(directory)
+
+
+def accumulate_tiles(
+    direction: np.ndarray,
+    tile_pixels: int,
+    tile_weights: Callable[[Tile], np.ndarray],
+    emit: Callable[[Tile, np.ndarray], None],
+) -> None:
+    """
+    Flow accumulation of arbitrary weights over ``direction`` in the three
+    passes described above. ``tile_weights(tile)`` returns the tile's
+    weights in row-major order, one column per layer when 2-D, and is called
+    twice per tile; ``emit(tile, totals)`` receives each tile's totals in the
+    same layout.
+    """
+    height, width = direction.shape
+    tiles = list(iter_tiles(height, width, tile_pixels))
+
+    # Pass 1: per-tile accumulation, tile exits and where each border cell's flow leaves.
+    exits: List[np.ndarray] = []
+    exit_targets: List[np.ndarray] = []
+    exit_flow: List[np.ndarray] = []
+    borders: List[np.ndarray] = []
+    border_exits: List[np.ndarray] = []
+    for tile in tiles:
+        down, external = _tile_links(direction, tile, height, width)
+        totals = accumulate(down, tile_weights(tile))
+        leaving = np.flatnonzero(external >= 0)
+        exits.append(_global_index(tile, leaving, width))
+        exit_targets.append(external[leaving])
+        exit_flow.append(totals[leaving])
+
+        border = _border_cells(tile)
+        ends = _path_ends(down, border)
+        borders.append(_global_index(tile, border, width))
+        border_exits.append(np.where(external[ends] >= 0, _global_index(tile, ends, width), -1))
+
+    # Pass 2: accumulate the graph of tile exits to get the inflow at every entry cell.
+    exit_index = np.concatenate(exits)
+    targets = np.concatenate(exit_targets)
+    border_index = np.concatenate(borders)
+    border_exit = np.concatenate(border_exits)
+    order = np.argsort(border_index)
+    border_index, border_exit = border_index[order], border_exit[order]
+    next_exit = border_exit[np.searchsorted(border_index, targets)]
+    order = np.argsort(exit_index)
+    exit_index, targets, flow = exit_index[order], targets[order], np.concatenate(exit_flow)[order]
+    next_exit = next_exit[order]
+    next_node = np.where(next_exit >= 0, np.searchsorted(exit_index, next_exit), -1)
+    outflow = accumulate(next_node, flow)
+    entries, inverse = np.unique(targets, return_inverse=True)
+    inflow = np.zeros((len(entries),) + outflow.shape[1:])
+    np.add.at(inflow, inverse, outflow)
+    by_tile = _by_tile(entries, inflow, width, tile_pixels)
+
+    # Pass 3: accumulate each tile again with its inflows added.
+    for tile_id, tile in enumerate(tiles):
+        down, _ = _tile_links(direction, tile, height, width)
+        weights = tile_weights(tile).astype(np.float64)
+        if tile_id in by_tile:
+            cells, amounts = by_tile[tile_id]
+            np.add.at(weights, _local_index(tile, cells, width), amounts)
+        emit(tile, accumulate(down, weights))
+
+
+def _by_tile(cells: np.ndarray, values: np.ndarray, width: int, tile_pixels: int) -> Dict[int, Tuple]:
+    """
+    ``cells`` (global indices) and their ``values`` grouped by tile id.
+    """
+    rows, cols = np.divmod(cells, width)
+    tile_ids = (rows // tile_pixels) * -(-width // tile_pixels) + cols // tile_pixels
+    grouped: Dict[int, Tuple] = {}
+    for tile_id in np.unique(tile_ids):
+        selected = tile_ids == tile_id
+        grouped[int(tile_id)] = (cells[selected], values[selected])
+    return grouped
+
+
+def _local_index(tile: Tile, cells: np.ndarray, width: int) -> np.ndarray:
+    rows, cols = np.divmod(cells, width)
+    return (rows - tile.row_off) * tile.width + cols - tile.col_off
+
+
+def _stopped_ends(down: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    """
+    For every tile cell, the first cell of ``stops`` on its flow path (itself
+    included) or, when there is none, the last tile cell of the path. Pointer
+    jumping, so long paths take logarithmically many steps.
+    """
+    cells = np.arange(len(down))
+    ends = np.where((down >= 0) & ~stops, down, cells)
+    while True:
+        jumped = ends[ends]
+        if np.array_equal(jumped, ends):
+            return ends
+        ends = jumped
+
+
+class Basins(NamedTuple):
+    """
+    ``labels``: for every pixel, 1 + the index of the first outlet on its
+    flow path (itself included), 0 when the path meets none; ``bounds``:
+    (row_min, row_max, col_min, col_max) of each label's pixels, row 0 unused.
+    """
+
+    labels: np.ndarray
+    bounds: np.ndarray
+
+
+def label_basins(directory: Path, outlets: np.ndarray, tile_pixels: int = DEFAULT_TILE_PIXELS) -> Basins:
+    """
+    Writes the basin of each of ``outlets`` (flat indices) to ``basins.npy``
+    next to the flow rasters of ``directory``, tile by tile like the
+    accumulation: tiles resolve paths up to their exits, a graph of exit
+    cells carries labels across tile edges, and tiles are labelled again.
+    """
+    direction = np.load(directory / DIRECTION, mmap_mode="r")
+    height, width = direction.shape
+    tiles = list(iter_tiles(height, width, tile_pixels))
+    outlets = np.asarray(outlets, dtype=np.int64)
+    by_tile = _by_tile(outlets, np.arange(1, len(outlets) + 1), width, tile_pixels)
+
+    def resolve(tile_id: int, tile: Tile) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        down, external = _tile_links(direction, tile, height, width)
+        site = np.zeros(tile.height * tile.width, dtype=np.int64)
+        if tile_id in by_tile:
+            cells, labels = by_tile[tile_id]
+            site[_local_index(tile, cells, width)] = labels
+        return down, external, site, _stopped_ends(down, site > 0)
+
+    # Pass 1: each border cell either meets an outlet in its tile, leaves through an exit, or stops.
+    exits: List[np.ndarray] = []
+    exit_targets: List[np.ndarray] = []
+    borders: List[np.ndarray] = []
+    border_labels: List[np.ndarray] = []
+    border_exits: List[np.ndarray] = []
+    for tile_id, tile in enumerate(tiles):
+        down, external, site, ends = resolve(tile_id, tile)
+        leaving = np.flatnonzero((external >= 0) & (site == 0))
+        exits.append(_global_index(tile, leaving, width))
+        exit_targets.append(external[leaving])
+
+        border = _border_cells(tile)
+        end = ends[border]
+        borders.append(_global_index(tile, border, width))
+        border_labels.append(site[end])
+        border_exits.append(np.where((site[end] == 0) & (external[end] >= 0), _global_index(tile, end, width), -1))
+
+    # Pass 2: pointer jumping over the exit graph carries labels upstream across tiles.
+    exit_index = np.concatenate(exits)
+    targets = np.concatenate(exit_targets)
+    order = np.argsort(exit_index)
+    exit_index, targets = exit_index[order], targets[order]
+    border_index = np.concatenate(borders)
+    order = np.argsort(border_index)
+    border_index = border_index[order]
+    border_label = np.concatenate(border_labels)[order]
+    border_exit = np.concatenate(border_exits)[order]
+    entry = np.searchsorted(border_index, targets)
+    exit_label = border_label[entry]
+    next_node = np.where(border_exit[entry] >= 0, np.searchsorted(exit_index, border_exit[entry]), -1)
+    while True:
+        pending = next_node >= 0
+        if not pending.any():
+            break
+        exit_label[pending] = exit_label[next_node[pending]]
+        next_node[pending] = next_node[next_node[pending]]
+
+    # Pass 3: label every cell and collect the bounds of each basin.
+    labels = np.lib.format.open_memmap(directory / BASINS, mode="w+", dtype=np.int32, shape=(height, width))
+    bounds = np.tile(np.array([height, -1, width, -1], dtype=np.int64), (len(outlets) + 1, 1))
+    for tile_id, tile in enumerate(tiles):
+        _, external, site, ends = resolve(tile_id, tile)
+        through = (site[ends] == 0) & (external[ends] >= 0)
+        tile_labels = site[ends]
+        if through.any():
+            nodes = np.searchsorted(exit_index, _global_index(tile, ends[through], width))
+            tile_labels[through] = exit_label[nodes]
+        tile_labels = tile_labels.reshape(tile.height, tile.width)
+        labels[tile.row_off:tile.row_off + tile.height, tile.col_off:tile.col_off + tile.width] = tile_labels
+
+        rows, cols = np.nonzero(tile_labels)
+        found = tile_labels[rows, cols]
+        np.minimum.at(bounds[:, 0], found, tile.row_off + rows)
+        np.maximum.at(bounds[:, 1], found, tile.row_off + rows)
+        np.minimum.at(bounds[:, 2], found, tile.col_off + cols)
+        np.maximum.at(bounds[:, 3], found, tile.col_off + cols)
+    labels.flush()
+    del labels
+    return Basins(labels=np.load(directory / BASINS, mmap_mode="r"), bounds=bounds)
+
+
+def flat_offsets(width: int) -> np.ndarray:
+    """
+    Global flat index step per D8 code, 0 for NO_FLOW (and unused codes).
+    """
+    steps = np.zeros(NO_FLOW + 1, dtype=np.int64)
+    for code, (dy, dx) in enumerate(OFFSETS):
+        steps[code] = dy * width + dx
+    return steps
+
+
+def step_lengths(codes: np.ndarray, rows: np.ndarray, pixels: PixelGeometry) -> np.ndarray:
+    """
+    Length in metres of the D8 step ``codes`` (none of them NO_FLOW) taken
+    from cells in ``rows``.
+    """
+    steps = np.array(OFFSETS)[codes]
+    return np.hypot(steps[:, 1] * pixels.width_m[rows], steps[:, 0] * pixels.height_m)
@@ -0,0 +1,439 @@
+"""
+Run-of-river candidate sites from the flow rasters of hydro.services.flow.
+
+A river pixel (catchment of at least ``min_catchment_km2``) is a candidate
+intake when the elevation drops by ``min_head_m`` or more over the
+``reach_m`` of river below it, which is where the water would be returned
+after the penstock. Candidates are thinned to the best ``power_index`` per
+``spacing_m`` block, so a steep river yields a handful of sites rather than
+one per pixel; the blocks are fixed, so two sites can still sit closer than
+``spacing_m`` across a block edge. The raster is scanned in row strips that
+are whole blocks high, which keeps both the scan and the thinning in memory
+for one strip only.
+
+Catchments are never traced pixel by pixel. The kept sites label their
+basins tile by tile (hydro.services.flow.label_basins): every pixel gets the
+first site on its flow path, and a site's catchment is its basin plus the
+basins of the sites upstream of it. The forest check is a second tiled
+accumulation over the same directions, weighted by the canopy burned onto
+the DEM grid; read at a site, it gives the canopy-covered, forest and
+canopy-weighted area of the catchment. A site warns when forest (canopy at
+or above ``forest_threshold``) makes up at least ``forest_warning_share`` of
+the catchment's canopy-covered area.
+"""
+import json
+import math
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import rasterio
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry, MultiPolygon, Point, Polygon
+from django.db import transaction
+from rasterio.features import shapes
+from rasterio.transform import Affine, array_bounds
+from rasterio.warp import transform as transform_coords
+from rasterio.warp import transform_bounds, transform_geom
+
+from canopy.services.cog import GridSpec, burn_cells, iter_cell_bounds
+from canopy.services.grid_snapshot import NODATA, PCT_SCALE
+from canopy.services.raster_ingest import METRES_PER_DEGREE
+from hydro.models import HydroCandidateSite, HydroScreening
+from hydro.services.flow import (
+    DEFAULT_TILE_PIXELS,
+    NO_FLOW,
+    OFFSETS,
+    Basins,
+    FlowRasters,
+    PixelGeometry,
+    Tile,
+    accumulate_tiles,
+    compute_flow,
+    flat_offsets,
+    iter_tiles,
+    label_basins,
+    pixel_geometry,
+    step_lengths,
+)
+
+
+DEFAULT_TOP_SITES = 10
+# Catchment masks above this many pixels are outlined on a coarser grid.
+DEFAULT_MAX_OUTLINE_PIXELS = 4_000_000
+STRIP_PIXELS = 4_000_000
+CANOPY = "canopy.npy"
+WATER_DENSITY = 1000.0
+GRAVITY = 9.81
+SECONDS_PER_YEAR = 365.25 * 24 * 3600
+
+
+class ScreeningParameters(NamedTuple):
+    min_catchment_km2: float = 10.0
+    min_head_m: float = 20.0
+    reach_m: float = 2000.0
+    spacing_m: float = 2000.0
+    max_sites: int = 200
+    # Mean annual runoff depth; without it sites are ranked by power_index only.
+    runoff_mm: Optional[float] = None
+    efficiency: float = 0.85
+    forest_threshold: float = 60.0
+    forest_warning_share: float = 0.3
+
+
+class SiteCandidates(NamedTuple):
+    index: np.ndarray
+    elevation_m: np.ndarray
+    head_m: np.ndarray
+    reach_m: np.ndarray
+    catchment_km2: np.ndarray
+
+
+def screening_dir() -> Path:
+    return Path(getattr(settings, "HYDRO_SCREENING_DIR", Path(settings.BASE_DIR) / "hydro_screenings"))
+
+
+def downstream_head(
+    rasters: FlowRasters, pixels: PixelGeometry, starts: np.ndarray, reach_m: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Elevation drop and distance travelled following the flow from each of
+    ``starts`` (flat indices) for ``reach_m``, or until the flow stops.
+    """
+    width = rasters.direction.shape[1]
+    direction = rasters.direction.reshape(-1)
+    elevation = rasters.elevation.reshape(-1)
+    steps = flat_offsets(width)
+    ends = starts.copy()
+    travelled = np.zeros(len(starts))
+    active = np.arange(len(starts))
+    while active.size:
+        codes = direction[ends[active]]
+        flowing = codes != NO_FLOW
+        active, codes = active[flowing], codes[flowing]
+        travelled[active] += step_lengths(codes, ends[active] // width, pixels)
+        ends[active] += steps[codes]
+        active = active[travelled[active] < reach_m]
+    return elevation[starts] - elevation[ends], travelled
+
+
+def find_sites(rasters: FlowRasters, pixels: PixelGeometry, params: ScreeningParameters) -> SiteCandidates:
+    """
+    Thinned candidate sites, best power_index first, at most ``max_sites``.
+    """
+    height, width = rasters.direction.shape
+    block_rows = max(1, round(params.spacing_m / pixels.height_m))
+    block_cols = max(1, round(params.spacing_m / float(np.median(pixels.width_m))))
+    strip_rows = block_rows * max(1, STRIP_PIXELS // (block_rows * width))
+    min_catchment_m2 = params.min_catchment_km2 * 1e6
+
+    found: List[SiteCandidates] = []
+    for row0 in range(0, height, strip_rows):
+        row1 = min(height, row0 + strip_rows)
+        catchment = np.asarray(rasters.accumulation[row0:row1])
+        river = (catchment >= min_catchment_m2) & (np.asarray(rasters.direction[row0:row1]) != NO_FLOW)
+        rows, cols = np.nonzero(river)
+        if not rows.size:
+            continue
+        starts = (row0 + rows) * width + cols
+        head, travelled = downstream_head(rasters, pixels, starts, params.reach_m)
+        keep = head >= params.min_head_m
+        rows, cols, starts, head, travelled = rows[keep], cols[keep], starts[keep], head[keep], travelled[keep]
+        catchment_km2 = catchment[rows, cols] / 1e6
+
+        # Best site per spacing block: sort by block, then by descending power index.
+        blocks = ((row0 + rows) // block_rows) * (width // block_cols + 1) + cols // block_cols
+        order = np.lexsort((-head * catchment_km2, blocks))
+        first = order[np.r_[True, blocks[order][1:] != blocks[order][:-1]]] if order.size else order
+        found.append(
+            SiteCandidates(
+                index=starts[first],
+                elevation_m=rasters.elevation.reshape(-1)[starts[first]].astype(np.float64),
+                head_m=head[first],
+                reach_m=travelled[first],
+                catchment_km2=catchment_km2[first],
+            )
+        )
+
+    if not found:
+        return SiteCandidates(*(np.zeros(0) for _ in SiteCandidates._fields))
+    sites = SiteCandidates(*(np.concatenate(column) for column in zip(*found)))
+    best = np.argsort(-sites.head_m * sites.catchment_km2, kind="stable")[:params.max_sites]
+    return SiteCandidates(*(column[best] for column in sites))
+
+
+def catchment_members(direction: np.ndarray, labels: np.ndarray, outlets: np.ndarray) -> List[np.ndarray]:
+    """
+    Basin labels making up the catchment of each of ``outlets``: its own and
+    those of every site upstream of it.
+    """
+    height, width = direction.shape
+    steps = flat_offsets(width)
+    children: List[List[int]] = [[] for _ in range(len(outlets) + 1)]
+    for position, outlet in enumerate(outlets):
+        row, col = divmod(int(outlet), width)
+        code = int(direction[row, col])
+        if code == NO_FLOW:
+            continue
+        dy, dx = OFFSETS[code]
+        if 0 <= row + dy < height and 0 <= col + dx < width:
+            children[int(labels.reshape(-1)[int(outlet) + steps[code]])].append(position + 1)
+
+    members = []
+    for position in range(len(outlets)):
+        found, frontier = [position + 1], [position + 1]
+        while frontier:
+            frontier = [child for label in frontier for child in children[label]]
+            found.extend(frontier)
+        members.append(np.array(found))
+    return members
+
+
+def _wgs84_geometry(geojson: Dict, crs) -> GEOSGeometry:
+    if crs.to_epsg() != 4326:
+        geojson = transform_geom(crs, "EPSG:4326", geojson)
+    return GEOSGeometry(json.dumps(geojson), srid=4326)
+
+
+def catchment_outline(
+    basins: Basins, members: np.ndarray, transform: Affine, crs, max_pixels: int = DEFAULT_MAX_OUTLINE_PIXELS
+) -> MultiPolygon:
+    """
+    Outline in EPSG:4326 of the basins ``members``, read in row strips over
+    their bounding window. Large catchments are outlined on blocks of pixels
+    (any pixel marks its block), which only widens the outline by less than
+    a block.
+    """
+    bounds = basins.bounds[members]
+    row0, row1 = int(bounds[:, 0].min()), int(bounds[:, 1].max()) + 1
+    col0, col1 = int(bounds[:, 2].min()), int(bounds[:, 3].max()) + 1
+    factor = max(1, math.ceil(math.sqrt((row1 - row0) * (col1 - col0) / max_pixels)))
+    mask = np.zeros((-(-(row1 - row0) // factor), -(-(col1 - col0) // factor)), dtype=np.uint8)
+    strip_rows = factor * max(1, STRIP_PIXELS // (factor * (col1 - col0)))
+    for strip in range(row0, row1, strip_rows):
+        rows, cols = np.nonzero(np.isin(basins.labels[strip:min(row1, strip + strip_rows), col0:col1], members))
+        mask[(strip - row0 + rows) // factor, cols // factor] = 1
+
+    window_transform = transform * Affine.translation(col0, row0) * Affine.scale(factor)
+    polygons = [
+        Polygon(*geometry["coordinates"])
+        for geometry, _ in shapes(mask, mask=mask.astype(bool), transform=window_transform)
+    ]
+    outline = MultiPolygon(polygons).simplify(abs(window_transform.a), preserve_topology=True)
+    outline = _wgs84_geometry(json.loads(outline.geojson), crs)
+    return outline if isinstance(outline, MultiPolygon) else MultiPolygon(outline, srid=4326)
+
+
+def _burn_canopy(target: np.ndarray, grid: GridSpec, source: Optional[str]) -> None:
+    east = grid.west + grid.width * grid.res_x
+    south = grid.north - grid.height * grid.res_y
+    for cells in iter_cell_bounds(source):
+        inside = (cells[:, 2] > grid.west) & (cells[:, 0] < east) & (cells[:, 3] > south) & (cells[:, 1] < grid.north)
+        if inside.any():
+            values = np.clip(np.rint(cells[inside, 4] * PCT_SCALE), 0, 100 * PCT_SCALE).astype(np.uint16)
+            burn_cells(target, grid, cells[inside], values=values)
+
+
+def burn_canopy(
+    directory: Path, shape: Tuple[int, int], transform: Affine, crs, source: Optional[str], tile_pixels: int
+) -> np.ndarray:
+    """
+    Canopy of ``source`` on the DEM grid (``canopy.npy`` in ``directory``),
+    scaled by PCT_SCALE with NODATA for gaps. WGS84 DEMs are burned directly;
+    other DEMs are burned onto a WGS84 grid of about their pixel size, which
+    is then sampled at the DEM pixel centres one tile at a time.
+    """
+    height, width = shape
+    canopy = np.lib.format.open_memmap(directory / CANOPY, mode="w+", dtype=np.uint16, shape=shape)
+    canopy[:] = NODATA
+    if crs.to_epsg() == 4326:
+        grid = GridSpec(
+            west=transform.c, north=transform.f, res_x=transform.a, res_y=-transform.e, width=width, height=height
+        )
+        _burn_canopy(canopy, grid, source)
+    else:
+        west, south, east, north = transform_bounds(crs, "EPSG:4326", *array_bounds(height, width, transform))
+        res = min(abs(transform.a), abs(transform.e)) / METRES_PER_DEGREE
+        grid = GridSpec(
+            west=west,
+            north=north,
+            res_x=res,
+            res_y=res,
+            width=max(1, math.ceil((east - west) / res)),
+            height=max(1, math.ceil((north - south) / res)),
+        )
+        with tempfile.TemporaryDirectory(prefix="hydro_canopy_") as workdir:
+            lonlat = np.lib.format.open_memmap(
+                Path(workdir) / CANOPY, mode="w+", dtype=np.uint16, shape=(grid.height, grid.width)
+            )
+            lonlat[:] = NODATA
+            _burn_canopy(lonlat, grid, source)
+            for tile in iter_tiles(height, width, tile_pixels):
+                rows, cols = np.indices((tile.height, tile.width))
+                xs, ys = transform * (tile.col_off + cols.ravel() + 0.5, tile.row_off + rows.ravel() + 0.5)
+                lons, lats = (np.asarray(values) for values in transform_coords(crs, "EPSG:4326", xs, ys))
+                grid_cols = np.floor((lons - grid.west) / res).astype(np.int64)
+                grid_rows = np.floor((grid.north - lats) / res).astype(np.int64)
+                inside = (grid_cols >= 0) & (grid_cols < grid.width) & (grid_rows >= 0) & (grid_rows < grid.height)
+                values = np.full(len(xs), NODATA, dtype=np.uint16)
+                values[inside] = lonlat[grid_rows[inside], grid_cols[inside]]
+                tile_rows = slice(tile.row_off, tile.row_off + tile.height)
+                canopy[tile_rows, tile.col_off:tile.col_off + tile.width] = values.reshape(tile.height, tile.width)
+            del lonlat
+    canopy.flush()
+    return canopy
+
+
+def forest_totals(
+    direction: np.ndarray,
+    canopy: np.ndarray,
+    area_m2: np.ndarray,
+    outlets: np.ndarray,
+    threshold: float,
+    tile_pixels: int = DEFAULT_TILE_PIXELS,
+) -> np.ndarray:
+    """
+    (canopy-covered m², forest m², canopy-weighted m²) of the catchment of
+    each of ``outlets``, from a tiled accumulation of forest-weighted flow.
+    ``canopy`` is on the DEM grid as written by burn_canopy; ``area_m2`` is
+    the pixel area of each row.
+    """
+    width = direction.shape[1]
+    forest_min = round(threshold * PCT_SCALE)
+    totals = np.zeros((len(outlets), 3))
+    positions = np.arange(len(outlets))
+    outlet_rows, outlet_cols = np.divmod(np.asarray(outlets, dtype=np.int64), width)
+
+    def weights(tile: Tile) -> np.ndarray:
+        values = np.asarray(canopy[tile.row_off:tile.row_off + tile.height, tile.col_off:tile.col_off + tile.width])
+        values = values.ravel()
+        area = np.repeat(area_m2[tile.row_off:tile.row_off + tile.height], tile.width)
+        known = values != NODATA
+        return np.column_stack(
+            (area * known, area * (known & (values >= forest_min)), np.where(known, area * values / PCT_SCALE, 0.0))
+        )
+
+    def collect(tile: Tile, tile_totals: np.ndarray) -> None:
+        inside = (outlet_rows >= tile.row_off) & (outlet_rows < tile.row_off + tile.height)
+        inside &= (outlet_cols >= tile.col_off) & (outlet_cols < tile.col_off + tile.width)
+        local = (outlet_rows[inside] - tile.row_off) * tile.width + outlet_cols[inside] - tile.col_off
+        totals[positions[inside]] = tile_totals[local]
+
+    accumulate_tiles(direction, tile_pixels, weights, collect)
+    return totals
+
+
+def forest_check(totals: np.ndarray, params: ScreeningParameters) -> Dict:
+    covered, forest, weighted = (float(value) for value in totals)
+    share = forest / covered if covered > 0 else 0.0
+    return {
+        "forest_mean_canopy": weighted / covered if covered > 0 else None,
+        "forest_share": share if covered > 0 else None,
+        "forest_warning": covered > 0 and share >= params.forest_warning_share,
+    }
+
+
+def potential(
+    catchment_km2: float, head_m: float, params: ScreeningParameters
+) -> Tuple[Optional[float], Optional[float]]:
+    """
+    Mean flow (m³/s) and power (kW) for the runoff depth, or (None, None).
+    """
+    if params.runoff_mm is None:
+        return None, None
+    flow = params.runoff_mm / 1000 * catchment_km2 * 1e6 / SECONDS_PER_YEAR
+    return flow, WATER_DENSITY * GRAVITY * flow * head_m * params.efficiency / 1000
+
+
+def screen_dem(
+    dem_path: str,
+    name: str,
+    params: ScreeningParameters = ScreeningParameters(),
+    forest_source: Optional[str] = None,
+    tile_pixels: int = DEFAULT_TILE_PIXELS,
+    progress: Callable[[str], None] = lambda message: None,
+) -> HydroScreening:
+    """
+    Computes the flow rasters of ``dem_path``, extracts candidate sites and
+    persists them as screening ``name``, replacing an earlier run of that name.
+    """
+    with rasterio.open(dem_path) as src:
+        if src.crs is None:
+            raise ValueError(f"{dem_path} has no CRS.")
+        crs, transform, bounds = src.crs, src.transform, src.bounds
+        pixels = pixel_geometry(src)
+        progress(f"DEM: {src.width}x{src.height} px, {tile_pixels} px tiles.")
+
+    flow_dir = screening_dir() / name
+    rasters = compute_flow(dem_path, flow_dir, tile_pixels)
+    progress(f"Flow accumulation written to {flow_dir}.")
+
+    sites = find_sites(rasters, pixels, params)
+    progress(f"Found {len(sites.index):,} candidate sites.")
+    height, width = rasters.direction.shape
+    rows, cols = np.divmod(sites.index, width)
+    xs, ys = transform * (cols + 0.5, rows + 0.5)
+    lons, lats = transform_coords(crs, "EPSG:4326", list(xs), list(ys)) if len(xs) else ([], [])
+
+    basins = label_basins(flow_dir, sites.index, tile_pixels)
+    members = catchment_members(rasters.direction, basins.labels, sites.index)
+    forest = np.zeros((len(sites.index), 3))
+    if len(sites.index):
+        canopy = burn_canopy(flow_dir, (height, width), transform, crs, forest_source, tile_pixels)
+        forest = forest_totals(
+            rasters.direction, canopy, pixels.area_m2, sites.index, params.forest_threshold, tile_pixels
+        )
+        del canopy
+    progress(f"Accumulated forest cover of {forest_source or 'all sources'} over {len(sites.index):,} catchments.")
+
+    records = []
+    for position, outlet in enumerate(sites.index):
+        catchment = catchment_outline(basins, members[position], transform, crs)
+        catchment_km2 = float(sites.catchment_km2[position])
+        head_m = float(sites.head_m[position])
+        flow, power = potential(catchment_km2, head_m, params)
+        records.append(
+            HydroCandidateSite(
+                geom=Point(lons[position], lats[position], srid=4326),
+                catchment=catchment,
+                elevation_m=float(sites.elevation_m[position]),
+                head_m=head_m,
+                reach_m=float(sites.reach_m[position]),
+                catchment_km2=catchment_km2,
+                power_index=head_m * catchment_km2,
+                mean_flow_m3s=flow,
+                potential_kw=power,
+                **forest_check(forest[position], params),
+            )
+        )
+
+    with transaction.atomic():
+        screening, _ = HydroScreening.objects.update_or_create(
+            name=name,
+            defaults={
+                "dem_path": str(dem_path),
+                "flow_dir": str(flow_dir),
+                "forest_source": forest_source or "",
+                "parameters": params._asdict(),
+                "extent": Polygon.from_bbox(transform_bounds(crs, "EPSG:4326", *bounds)),
+            },
+        )
+        screening.sites.all().delete()
+        for record in records:
+            record.screening = screening
+        HydroCandidateSite.objects.bulk_create(records)
+    return screening
+
+
+def top_sites(
+    screening: HydroScreening, geometry, limit: int = DEFAULT_TOP_SITES, forest_warning: Optional[bool] = None
+) -> Iterable[HydroCandidateSite]:
+    """
+    Best-ranked sites of ``screening`` inside ``geometry``, optionally only
+    those with (or without) a forest overlap warning.
+    """
+    sites = HydroCandidateSite.objects.filter(screening=screening, geom__intersects=geometry)
+    if forest_warning is not None:
+        sites = sites.filter(forest_warning=forest_warning)
+    return sites.order_by("-power_index", "id")[:limit]
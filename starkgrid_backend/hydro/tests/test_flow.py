@@ -0,0 +1,195 @@
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from django.contrib.gis.geos import Point, Polygon
+from django.test import SimpleTestCase, TestCase, override_settings
+from rasterio.transform import from_origin
+
+from canopy.models import ForestDensityCell
+from canopy.services.grid_snapshot import NODATA, PCT_SCALE
+from hydro.services.flow import (
+    NO_FLOW,
+    OFFSETS,
+    accumulate,
+    compute_flow,
+    d8_directions,
+    label_basins,
+    pixel_geometry,
+)
+from hydro.services.sites import (
+    ScreeningParameters,
+    catchment_members,
+    catchment_outline,
+    downstream_head,
+    find_sites,
+    forest_totals,
+    screen_dem,
+)
+
+
+PIXEL_M = 100.0
+TRANSFORM = from_origin(500000, 9900000, PIXEL_M, PIXEL_M)
+
+
+def valley(height: int = 40, width: int = 21) -> np.ndarray:
+    """
+    A valley falling 5 m per row to the south, with sides rising 10 m per
+    column away from the centre column; the sides drain diagonally into it.
+    """
+    rows, cols = np.indices((height, width))
+    return (1000.0 - 5 * rows + 10 * np.abs(cols - width // 2)).astype(np.float32)
+
+
+def write_dem(path: Path, dem: np.ndarray, crs: str = "EPSG:32750", transform=TRANSFORM) -> str:
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        height=dem.shape[0],
+        width=dem.shape[1],
+        count=1,
+        dtype="float32",
+        crs=crs,
+        transform=transform,
+        nodata=-9999,
+    ) as dst:
+        dst.write(dem, 1)
+    return str(path)
+
+
+class FlowTests(SimpleTestCase):
+    def setUp(self):
+        self.workdir = Path(tempfile.mkdtemp())
+
+    def test_directions_follow_the_steepest_drop(self):
+        dem = valley(5, 5)
+        window = np.pad(dem.astype(np.float64), 1, constant_values=np.nan)
+        codes = d8_directions(window, np.full(5, PIXEL_M), PIXEL_M)
+
+        self.assertEqual(OFFSETS[codes[0, 2]], (1, 0))
+        self.assertEqual(OFFSETS[codes[0, 4]], (1, -1))
+        self.assertEqual(OFFSETS[codes[0, 0]], (1, 1))
+        # Along the bottom edge only the river pixel has no lower neighbour inside the raster.
+        self.assertEqual(OFFSETS[codes[-1, 0]], (0, 1))
+        self.assertEqual(codes[-1, 2], NO_FLOW)
+
+    def test_accumulate_sums_upstream_weights(self):
+        # 0 -> 2 <- 1, 2 -> 3; 4 is isolated.
+        down = np.array([2, 2, 3, -1, -1])
+        totals = accumulate(down, np.array([1.0, 2.0, 3.0, 4.0, 5.0]))
+        np.testing.assert_allclose(totals, [1, 2, 6, 10, 5])
+
+    def test_tiles_do_not_change_the_result(self):
+        rng = np.random.default_rng(7)
+        rows, cols = np.indices((37, 29))
+        dem = (0.4 * rows - 0.3 * cols + rng.normal(0, 2, rows.shape)).astype(np.float32)
+        dem[rng.random(dem.shape) < 0.05] = -9999
+        for crs, transform in (("EPSG:32750", TRANSFORM), ("EPSG:4326", from_origin(110, -1, 0.001, 0.001))):
+            path = write_dem(self.workdir / "noise.tif", dem, crs, transform)
+            whole = compute_flow(path, self.workdir / "whole", tile_pixels=64)
+            for tile_pixels in (1, 4, 10):
+                tiled = compute_flow(path, self.workdir / f"tiled_{tile_pixels}", tile_pixels=tile_pixels)
+                np.testing.assert_array_equal(tiled.direction, whole.direction)
+                np.testing.assert_allclose(tiled.accumulation, whole.accumulation, rtol=1e-9)
+
+    def test_valley_accumulation_head_and_sites(self):
+        height, width = 40, 21
+        path = write_dem(self.workdir / "valley.tif", valley(height, width))
+        rasters = compute_flow(path, self.workdir / "flow", tile_pixels=8)
+        centre = width // 2
+
+        # Everything drains to the bottom of the river; the bottom row runs along the edge into it.
+        self.assertAlmostEqual(rasters.accumulation[-1, centre], height * width * PIXEL_M ** 2)
+        # Higher up, pixel (r, centre + k) only reaches the river k rows further down.
+        expected = sum(max(0, 30 - abs(k)) for k in range(-centre, centre + 1))
+        self.assertAlmostEqual(rasters.accumulation[29, centre], expected * PIXEL_M ** 2)
+
+        with rasterio.open(path) as src:
+            pixels = pixel_geometry(src)
+        outlet = np.array([10 * width + centre])
+        head, travelled = downstream_head(rasters, pixels, outlet, reach_m=1000)
+        self.assertEqual((head[0], travelled[0]), (50.0, 1000.0))
+
+        params = ScreeningParameters(min_catchment_km2=0.5, min_head_m=40, reach_m=1000, spacing_m=10_000)
+        sites = find_sites(rasters, pixels, params)
+        # The lowest site with a full reach below it has the largest catchment.
+        self.assertEqual(sites.index.tolist(), [(height - 11) * width + centre])
+        self.assertEqual(sites.head_m.tolist(), [50.0])
+
+        basins = label_basins(self.workdir / "flow", sites.index, tile_pixels=8)
+        members = catchment_members(rasters.direction, basins.labels, sites.index)
+        self.assertEqual(members[0].tolist(), [1])
+        self.assertAlmostEqual((basins.labels == 1).sum() * PIXEL_M ** 2, sites.catchment_km2[0] * 1e6)
+        outline = catchment_outline(basins, members[0], TRANSFORM, rasterio.crs.CRS.from_epsg(32750))
+        self.assertEqual(outline.srid, 4326)
+        x, y = TRANSFORM * (centre + 0.5, height - 11 - 2.5)
+        with rasterio.Env():
+            lon, lat = rasterio.warp.transform("EPSG:32750", "EPSG:4326", [x], [y])
+        self.assertTrue(outline.contains(Point(lon[0], lat[0], srid=4326)))
+
+    def test_nested_catchments_and_forest_totals(self):
+        height, width = 40, 21
+        path = write_dem(self.workdir / "valley.tif", valley(height, width))
+        rasters = compute_flow(path, self.workdir / "flow", tile_pixels=6)
+        centre = width // 2
+        # Two sites on the river: the lower catchment contains the upper one.
+        outlets = np.array([(height - 1) * width + centre, 15 * width + centre])
+        basins = label_basins(self.workdir / "flow", outlets, tile_pixels=6)
+        members = catchment_members(rasters.direction, basins.labels, outlets)
+        self.assertEqual(sorted(members[0].tolist()), [1, 2])
+        self.assertEqual(members[1].tolist(), [2])
+        self.assertEqual(np.count_nonzero(np.isin(basins.labels, members[0])), height * width)
+        upper = np.count_nonzero(basins.labels == 2) * PIXEL_M ** 2
+        self.assertAlmostEqual(upper, float(rasters.accumulation[15, centre]))
+
+        # Forest (90%) in the west half, open land (20%) in the east half, no data in the top rows.
+        canopy = np.where(np.indices((height, width))[1] < centre, 90 * PCT_SCALE, 20 * PCT_SCALE).astype(np.uint16)
+        canopy[:5] = NODATA
+        area = np.full(height, PIXEL_M ** 2)
+        for tile_pixels in (6, 64):
+            totals = forest_totals(rasters.direction, canopy, area, outlets, threshold=60, tile_pixels=tile_pixels)
+            covered, forest, weighted = totals[0]
+            self.assertAlmostEqual(covered, (height - 5) * width * PIXEL_M ** 2)
+            self.assertAlmostEqual(forest, (height - 5) * centre * PIXEL_M ** 2)
+            self.assertAlmostEqual(weighted, (height - 5) * (90 * centre + 20 * (width - centre)) * PIXEL_M ** 2)
+            in_upper = (basins.labels == 2) & (canopy != NODATA)
+            self.assertAlmostEqual(totals[1][0], np.count_nonzero(in_upper) * PIXEL_M ** 2)
+
+
+class ScreeningTests(TestCase):
+    def test_screen_dem_flags_forested_catchments(self):
+        workdir = Path(tempfile.mkdtemp())
+        path = write_dem(workdir / "valley.tif", valley())
+        with rasterio.open(path) as src:
+            bounds = rasterio.warp.transform_bounds(src.crs, "EPSG:4326", *src.bounds)
+        ForestDensityCell.objects.create(geom=Polygon.from_bbox(bounds), canopy_pct=85, source="hydro_test")
+
+        params = ScreeningParameters(min_catchment_km2=0.5, min_head_m=40, reach_m=1000, spacing_m=1000)
+        with override_settings(HYDRO_SCREENING_DIR=workdir / "screenings"):
+            screening = screen_dem(path, "valley", params, forest_source="hydro_test", tile_pixels=16)
+
+        sites = list(screening.sites.order_by("-power_index"))
+        self.assertGreater(len(sites), 1)
+        self.assertTrue(all(site.forest_warning for site in sites))
+        self.assertAlmostEqual(sites[0].forest_mean_canopy, 85.0)
+        self.assertIsNone(sites[0].potential_kw)
+
+        aoi = Polygon.from_bbox(bounds)
+        aoi.srid = 4326
+        response = self.client.post(
+            "/api/hydro/sites/",
+            {"geometry": aoi.geojson, "screening": "valley", "limit": 2},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        features = response.json()["features"]
+        self.assertEqual(len(features), 2)
+        self.assertEqual(features[0]["id"], sites[0].id)
+        self.assertEqual(response.json()["screening"]["name"], "valley")
+
+        response = self.client.post(
+            "/api/hydro/sites/", {"geometry": aoi.geojson, "screening": "missing"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 404)
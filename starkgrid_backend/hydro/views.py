@@ -0,0 +1,36 @@
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from hydro.models import HydroScreening
+from hydro.serializers import HydroCandidateSiteSerializer, HydroSitesRequestSerializer
+from hydro.services.sites import top_sites
+
+
+class HydroCandidateSitesView(APIView):
+    """
+    Returns the best-ranked run-of-river candidate sites inside a GeoJSON
+    polygon as a FeatureCollection, highest power index first. ``screening``
+    names a screening run; otherwise the most recent one is used.
+    """
+
+    def post(self, request, *args, **kwargs):
+        serializer = HydroSitesRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        screenings = HydroScreening.objects.all()
+        if data.get("screening"):
+            screenings = screenings.filter(name=data["screening"])
+        screening = screenings.order_by("-built_at").first()
+        if screening is None:
+            raise NotFound("No hydro screening matches this request; run screen_hydro_sites.")
+
+        sites = top_sites(screening, data["geometry"], data["limit"], data["forest_warning"])
+        payload = HydroCandidateSiteSerializer(sites, many=True).data
+        payload["screening"] = {
+            "name": screening.name,
+            "forest_source": screening.forest_source or None,
+            "parameters": screening.parameters,
+        }
+        return Response(payload)
@@ -42,6 +42,8 @@ INSTALLED_APPS = [
     'django.contrib.postgres',
     #apps
     'canopy',
+    'wind',
+    'hydro',
     'rest_framework',
     'rest_framework_gis',
 ]
@@ -129,3 +131,30 @@ try:
     from .local_settings import *
 except ImportError:
     pass
+
+# Connection pooling (psycopg_pool). Sync views share a per-process pool via
+# Django's OPTIONS["pool"]; the async stats views use their own async pool.
+# See "Connection pooling" in the README for sizing against worker count.
+DB_POOL_ENABLED = config('DB_POOL_ENABLED', default=True, cast=bool)
+if DB_POOL_ENABLED and 'DATABASES' in globals() and not DATABASES['default'].get('CONN_MAX_AGE'):
+    DATABASES['default'].setdefault('OPTIONS', {}).setdefault(
+        'pool',
+        {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10.0, cast=float),
+        },
+    )
+
+FOREST_DENSITY_ASYNC_POOL = {
+    'min_size': config('DB_ASYNC_POOL_MIN_SIZE', default=1, cast=int),
+    'max_size': config('DB_ASYNC_POOL_MAX_SIZE', default=10, cast=int),
+    'timeout': config('DB_POOL_TIMEOUT', default=10.0, cast=float),
+}
+
+# Default stats engine: 'sql' (PostGIS) or 'snapshot' (memory-mapped grid, see README).
+FOREST_DENSITY_STATS_BACKEND = config('FOREST_DENSITY_STATS_BACKEND', default='sql')
+
+# Cell layout read by stats and vector tiles: 'cells' (ForestDensityCell polygons) or
+# 'grid' (compact ForestDensityGridCell rows, see compact_forest_density).
+FOREST_DENSITY_STORAGE = config('FOREST_DENSITY_STORAGE', default='cells')
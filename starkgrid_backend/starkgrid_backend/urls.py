@@ -18,15 +18,56 @@ from django.contrib import admin
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from canopy.views import ForestDensityLegendView, ForestDensityStatsView
+from canopy.views import (
+    AsyncForestDensityExportView,
+    AsyncForestDensityLegendView,
+    AsyncForestDensityStatsView,
+    ForestDensityBatchStatsView,
+    ForestDensityChangeView,
+    ForestDensityExportView,
+    ForestDensityLegendView,
+    ForestDensityMetricsView,
+    ForestDensityPngTileView,
+    ForestDensityRebinView,
+    ForestDensitySavedAOIViewSet,
+    ForestDensityStatsCacheView,
+    ForestDensityStatsView,
+    ForestDensityTileView,
+)
+from hydro.views import HydroCandidateSitesView
+from wind.views import WindCandidateZonesView
 
-# Empty router placeholder; register viewsets here as they are created.
+# Register viewsets here as they are created.
 router = DefaultRouter()
+router.register('forest-density/aois', ForestDensitySavedAOIViewSet, basename='forest-density-aoi')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
     path('api/forest-density/stats/', ForestDensityStatsView.as_view(), name='forest-density-stats'),
+    path('api/forest-density/stats/batch/', ForestDensityBatchStatsView.as_view(), name='forest-density-stats-batch'),
+    path('api/forest-density/stats/rebin/', ForestDensityRebinView.as_view(), name='forest-density-stats-rebin'),
+    path('api/forest-density/stats/cache/', ForestDensityStatsCacheView.as_view(), name='forest-density-stats-cache'),
+    path('api/forest-density/change/', ForestDensityChangeView.as_view(), name='forest-density-change'),
+    path('api/forest-density/export/', ForestDensityExportView.as_view(), name='forest-density-export'),
+    path(
+        'api/forest-density/tiles/<int:z>/<int:x>/<int:y>.mvt',
+        ForestDensityTileView.as_view(),
+        name='forest-density-tile-mvt',
+    ),
+    path(
+        'api/forest-density/tiles/<int:z>/<int:x>/<int:y>.png',
+        ForestDensityPngTileView.as_view(),
+        name='forest-density-tile-png',
+    ),
     path('api/forest-density/legend/', ForestDensityLegendView.as_view(), name='forest-density-legend'),
+    path('api/forest-density/metrics/', ForestDensityMetricsView.as_view(), name='forest-density-metrics'),
+    path('api/forest-density/async/stats/', AsyncForestDensityStatsView.as_view(), name='forest-density-stats-async'),
+    path(
+        'api/forest-density/async/export/', AsyncForestDensityExportView.as_view(), name='forest-density-export-async'
+    ),
+    path('api/forest-density/async/legend/', AsyncForestDensityLegendView.as_view(), name='forest-density-legend-async'),
+    path('api/wind/zones/', WindCandidateZonesView.as_view(), name='wind-zones'),
+    path('api/hydro/sites/', HydroCandidateSitesView.as_view(), name='hydro-sites'),
     path('api-auth/', include('rest_framework.urls')),
 ]
@@ -0,0 +1,16 @@
+from django.contrib import admin
+from django.contrib.gis.admin import GISModelAdmin
+
+from .models import WindCandidateZone, WindSuitabilityLayer
+
+
+@admin.register(WindSuitabilityLayer)
+class WindSuitabilityLayerAdmin(GISModelAdmin):
+    list_display = ("name", "hub_height_m", "forest_source", "resolution", "built_at")
+    readonly_fields = ("built_at",)
+
+
+@admin.register(WindCandidateZone)
+class WindCandidateZoneAdmin(GISModelAdmin):
+    list_display = ("id", "layer", "score", "label", "mean_wind_speed", "mean_canopy", "protected_fraction")
+    list_filter = ("layer", "label")
@@ -0,0 +1,117 @@
+import time
+from pathlib import Path
+from typing import Dict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from canopy.services.ingest import peak_rss_mib
+from wind.models import HUB_HEIGHTS
+from wind.services.layers import build_layers
+from wind.services.suitability import DEFAULT_CHUNK_PIXELS, DEFAULT_ZONE_PIXELS, SuitabilityWeights
+
+
+class Command(BaseCommand):
+    help = (
+        "Score wind suitability (wind - forest - protected - slope penalties) on a common grid, "
+        "write one score COG per hub height and store ranked candidate zones."
+    )
+
+    def add_arguments(self, parser):
+        defaults = SuitabilityWeights()
+        parser.add_argument(
+            "--wind",
+            action="append",
+            required=True,
+            metavar="HEIGHT=PATH",
+            help="Mean wind speed raster (m/s) for a hub height of 80, 100 or 120 m. Repeat per height.",
+        )
+        parser.add_argument("--slope", default=None, help="Slope raster in degrees. Optional.")
+        parser.add_argument(
+            "--protected", default=None, help="Protected area raster; non-zero pixels are protected. Optional."
+        )
+        parser.add_argument(
+            "--forest-source",
+            default=None,
+            help="ForestDensityCell source for the forest penalty. Defaults to all sources.",
+        )
+        parser.add_argument(
+            "--resolution",
+            type=float,
+            default=None,
+            help="Pixel size in degrees. Defaults to the resolution of the lowest hub height's wind raster.",
+        )
+        parser.add_argument(
+            "--zone-pixels",
+            type=int,
+            default=DEFAULT_ZONE_PIXELS,
+            help=f"Candidate zone edge in pixels. Defaults to {DEFAULT_ZONE_PIXELS}.",
+        )
+        parser.add_argument(
+            "--chunk-pixels",
+            type=int,
+            default=DEFAULT_CHUNK_PIXELS,
+            help=f"Chunk edge in pixels, a multiple of --zone-pixels. Defaults to {DEFAULT_CHUNK_PIXELS}.",
+        )
+        parser.add_argument("--workers", type=int, default=1, help="Worker processes. Defaults to 1.")
+        parser.add_argument(
+            "--min-score",
+            type=float,
+            default=0.0,
+            help="Only store zones scoring above this. Defaults to 0 (every zone with a positive score).",
+        )
+        parser.add_argument("--prefix", default="wind", help="Layer name prefix; layers are <prefix>_<height>m.")
+        for name in SuitabilityWeights._fields:
+            # Penalty weights read --weight-<term>; the normalisation bounds keep their names.
+            flag = name.replace("_", "-") if "_" in name else f"weight-{name}"
+            parser.add_argument(
+                f"--{flag}",
+                type=float,
+                default=getattr(defaults, name),
+                dest=f"weight_{name}",
+                help=f"SuitabilityWeights.{name}. Defaults to {getattr(defaults, name):g}.",
+            )
+
+    def handle(self, *args, **options):
+        wind_paths = self._parse_wind(options["wind"])
+        for flag in ("slope", "protected"):
+            if options[flag] and not Path(options[flag]).exists():
+                raise CommandError(f"--{flag} file not found: {options[flag]}")
+        if options["zone_pixels"] < 1 or options["chunk_pixels"] % options["zone_pixels"]:
+            raise CommandError("--chunk-pixels must be a positive multiple of --zone-pixels.")
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1.")
+        weights = SuitabilityWeights(**{name: options[f"weight_{name}"] for name in SuitabilityWeights._fields})
+        if weights.wind_max <= weights.wind_min:
+            raise CommandError("--wind-max must be greater than --wind-min.")
+
+        started = time.perf_counter()
+        layers = build_layers(
+            wind_paths,
+            slope_path=options["slope"],
+            protected_path=options["protected"],
+            forest_source=options["forest_source"],
+            weights=weights,
+            resolution=options["resolution"],
+            zone_pixels=options["zone_pixels"],
+            chunk_pixels=options["chunk_pixels"],
+            workers=options["workers"],
+            min_score=options["min_score"],
+            prefix=options["prefix"],
+            progress=self.stdout.write,
+        )
+        names = ", ".join(layer.name for layer in layers)
+        self.stdout.write(self.style.SUCCESS(f"Built {names} in {time.perf_counter() - started:.1f}s."))
+        self.stdout.write(f"Peak memory (RSS high-water mark): {peak_rss_mib():.1f} MiB")
+
+    @staticmethod
+    def _parse_wind(values) -> Dict[int, str]:
+        heights = {height for height, _ in HUB_HEIGHTS}
+        paths: Dict[int, str] = {}
+        for value in values:
+            height, sep, path = value.partition("=")
+            if not sep or not height.strip().isdigit() or int(height) not in heights:
+                raise CommandError(f"Invalid --wind value {value!r}; expected HEIGHT=PATH with HEIGHT in 80/100/120.")
+            if not Path(path).exists():
+                raise CommandError(f"--wind file not found: {path}")
+            paths[int(height)] = path
+        return paths
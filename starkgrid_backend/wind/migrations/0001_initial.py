@@ -0,0 +1,53 @@
+# Generated by Django 6.1.2 on 2026-10-17 00:40
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WindSuitabilityLayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.SlugField(max_length=64, unique=True)),
+                ('hub_height_m', models.PositiveSmallIntegerField(choices=[(80, '80 m'), (100, '100 m'), (120, '120 m')])),
+                ('forest_source', models.CharField(blank=True, help_text='ForestDensityCell source used for the forest penalty; blank for all sources.', max_length=64)),
+                ('weights', models.JSONField(help_text='SuitabilityWeights the layer was scored with.')),
+                ('raster_path', models.CharField(help_text='Score COG (uint8 percent, 255 = no data).', max_length=512)),
+                ('extent', django.contrib.gis.db.models.fields.PolygonField(srid=4326)),
+                ('resolution', models.FloatField(help_text='Pixel size in degrees.')),
+                ('zone_pixels', models.PositiveSmallIntegerField(help_text='Zone edge length in pixels.')),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='WindCandidateZone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geom', django.contrib.gis.db.models.fields.PolygonField(srid=4326)),
+                ('score', models.FloatField(help_text="Mean Wind Score (0-1) of the zone's scored pixels.")),
+                ('label', models.CharField(choices=[('high', 'High'), ('medium', 'Medium'), ('low', 'Low')], max_length=8)),
+                ('mean_wind_speed', models.FloatField(help_text="m/s at the layer's hub height.")),
+                ('mean_canopy', models.FloatField(help_text='Mean canopy cover percentage.')),
+                ('protected_fraction', models.FloatField(help_text='Share of scored pixels inside protected areas.')),
+                ('mean_slope', models.FloatField(blank=True, help_text='Degrees; empty when no slope raster was given.', null=True)),
+                ('area_m2', models.FloatField(help_text="Geodesic area of the zone's scored pixels.")),
+                ('layer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='zones', to='wind.windsuitabilitylayer')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GistIndex(fields=['geom'], name='wind_zone_geom_gist'), models.Index(fields=['layer', '-score'], name='wind_zone_layer_score_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+from django.contrib.postgres.indexes import GistIndex
+from django.contrib.gis.db import models
+
+
+HUB_HEIGHTS = [(80, "80 m"), (100, "100 m"), (120, "120 m")]
+SUITABILITY_LABELS = [("high", "High"), ("medium", "Medium"), ("low", "Low")]
+
+
+class WindSuitabilityLayer(models.Model):
+    """
+    One computed Wind Score layer for a hub height: the score raster on disk
+    and the weights and inputs it was built with.
+    """
+
+    name = models.SlugField(max_length=64, unique=True)
+    hub_height_m = models.PositiveSmallIntegerField(choices=HUB_HEIGHTS)
+    forest_source = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="ForestDensityCell source used for the forest penalty; blank for all sources.",
+    )
+    weights = models.JSONField(help_text="SuitabilityWeights the layer was scored with.")
+    raster_path = models.CharField(max_length=512, help_text="Score COG (uint8 percent, 255 = no data).")
+    extent = models.PolygonField(srid=4326)
+    resolution = models.FloatField(help_text="Pixel size in degrees.")
+    zone_pixels = models.PositiveSmallIntegerField(help_text="Zone edge length in pixels.")
+    built_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self) -> str:
+        return f"Wind suitability {self.name} ({self.hub_height_m} m)"
+
+
+class WindCandidateZone(models.Model):
+    """
+    Mean Wind Score and inputs over a square block of layer pixels. Zones
+    are what ranked candidate queries return.
+    """
+
+    layer = models.ForeignKey(WindSuitabilityLayer, on_delete=models.CASCADE, related_name="zones")
+    geom = models.PolygonField(srid=4326)
+    score = models.FloatField(help_text="Mean Wind Score (0-1) of the zone's scored pixels.")
+    label = models.CharField(max_length=8, choices=SUITABILITY_LABELS)
+    mean_wind_speed = models.FloatField(help_text="m/s at the layer's hub height.")
+    mean_canopy = models.FloatField(help_text="Mean canopy cover percentage.")
+    protected_fraction = models.FloatField(help_text="Share of scored pixels inside protected areas.")
+    mean_slope = models.FloatField(null=True, blank=True, help_text="Degrees; empty when no slope raster was given.")
+    area_m2 = models.FloatField(help_text="Geodesic area of the zone's scored pixels.")
+
+    class Meta:
+        indexes = [
+            GistIndex(fields=["geom"], name="wind_zone_geom_gist"),
+            models.Index(fields=["layer", "-score"], name="wind_zone_layer_score_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Wind zone {self.id} ({self.score:.2f}, {self.label})"
@@ -0,0 +1,35 @@
+from rest_framework import serializers
+from rest_framework_gis.fields import GeometryField
+from rest_framework_gis.serializers import GeoFeatureModelSerializer
+
+from canopy.serializers import to_wgs84
+from wind.models import HUB_HEIGHTS, WindCandidateZone
+
+
+MAX_TOP_ZONES = 100
+
+
+class WindZonesRequestSerializer(serializers.Serializer):
+    geometry = GeometryField()
+    layer = serializers.SlugField(max_length=64, required=False)
+    hub_height = serializers.ChoiceField(choices=HUB_HEIGHTS, required=False, default=100)
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_TOP_ZONES, required=False, default=10)
+
+    def validate_geometry(self, value):
+        return to_wgs84(value)
+
+
+class WindCandidateZoneSerializer(GeoFeatureModelSerializer):
+    class Meta:
+        model = WindCandidateZone
+        geo_field = "geom"
+        fields = (
+            "id",
+            "score",
+            "label",
+            "mean_wind_speed",
+            "mean_canopy",
+            "protected_fraction",
+            "mean_slope",
+            "area_m2",
+        )
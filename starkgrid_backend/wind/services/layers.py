@@ -0,0 +1,213 @@
+"""
+Builds persisted wind suitability layers and answers ranked zone queries.
+
+A layer is the score raster (a COG of uint8 percent, written with
+canopy.services.cog.write_cog) plus one WindCandidateZone row per scored
+zone. Zones carry a GiST-indexed polygon, so the top-k zones of an AOI are
+read from the index instead of scanning the country's raster or zone table.
+"""
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.db import connections, transaction
+
+from canopy.services.cog import NODATA, GridSpec, burn_cells, iter_cell_bounds, write_cog
+from canopy.services.parallel_ingest import init_worker
+from wind.models import WindCandidateZone, WindSuitabilityLayer
+from wind.services.suitability import (
+    DEFAULT_CHUNK_PIXELS,
+    DEFAULT_ZONE_PIXELS,
+    ChunkResult,
+    LayerInputs,
+    SuitabilityWeights,
+    chunk_specs,
+    evaluate_chunk,
+    suitability_label,
+    target_grid,
+)
+
+
+DEFAULT_TOP_ZONES = 10
+ZONE_BATCH_SIZE = 5000
+
+
+def layer_dir() -> Path:
+    return Path(getattr(settings, "WIND_LAYER_DIR", Path(settings.BASE_DIR) / "wind_layers"))
+
+
+def layer_name(prefix: str, hub_height_m: int) -> str:
+    return f"{prefix}_{hub_height_m}m"
+
+
+def burn_forest(target: np.ndarray, grid: GridSpec, source: Optional[str]) -> None:
+    """
+    Rasterises canopy cells of ``source`` onto ``grid``, skipping cells outside it.
+    """
+    east = grid.west + grid.width * grid.res_x
+    south = grid.north - grid.height * grid.res_y
+    for cells in iter_cell_bounds(source):
+        inside = (cells[:, 2] > grid.west) & (cells[:, 0] < east) & (cells[:, 3] > south) & (cells[:, 1] < grid.north)
+        if inside.any():
+            burn_cells(target, grid, cells[inside])
+
+
+def _run_chunks(pool: Optional[ProcessPoolExecutor], inputs: LayerInputs, chunk_pixels: int) -> List[ChunkResult]:
+    specs = chunk_specs(inputs.grid, chunk_pixels)
+    if pool is None:
+        return [evaluate_chunk(spec, inputs) for spec in specs]
+    return list(pool.map(evaluate_chunk, specs, [inputs] * len(specs)))
+
+
+def _zone_polygon(grid: GridSpec, zone_pixels: int, zone_row: int, zone_col: int) -> Polygon:
+    west = grid.west + zone_col * zone_pixels * grid.res_x
+    north = grid.north - zone_row * zone_pixels * grid.res_y
+    east = min(west + zone_pixels * grid.res_x, grid.west + grid.width * grid.res_x)
+    south = max(north - zone_pixels * grid.res_y, grid.north - grid.height * grid.res_y)
+    return Polygon.from_bbox((west, south, east, north))
+
+
+def _save_layer(
+    name: str,
+    hub_height_m: int,
+    grid: GridSpec,
+    raster_path: Path,
+    inputs: LayerInputs,
+    forest_source: Optional[str],
+    zones: np.ndarray,
+    min_score: float,
+) -> WindSuitabilityLayer:
+    has_slope = inputs.slope_path is not None
+    with transaction.atomic():
+        layer, _ = WindSuitabilityLayer.objects.update_or_create(
+            name=name,
+            defaults={
+                "hub_height_m": hub_height_m,
+                "forest_source": forest_source or "",
+                "weights": inputs.weights._asdict(),
+                "raster_path": str(raster_path),
+                "extent": Polygon.from_bbox(
+                    (
+                        grid.west,
+                        grid.north - grid.height * grid.res_y,
+                        grid.west + grid.width * grid.res_x,
+                        grid.north,
+                    )
+                ),
+                "resolution": grid.res_x,
+                "zone_pixels": inputs.zone_pixels,
+            },
+        )
+        layer.zones.all().delete()
+        batch: List[WindCandidateZone] = []
+        for zone_row, zone_col, score, wind, canopy, protected, slope, area in zones[zones[:, 2] > min_score]:
+            batch.append(
+                WindCandidateZone(
+                    layer=layer,
+                    geom=_zone_polygon(grid, inputs.zone_pixels, int(zone_row), int(zone_col)),
+                    score=float(score),
+                    label=suitability_label(score),
+                    mean_wind_speed=float(wind),
+                    mean_canopy=float(canopy),
+                    protected_fraction=float(protected),
+                    mean_slope=float(slope) if has_slope else None,
+                    area_m2=float(area),
+                )
+            )
+            if len(batch) >= ZONE_BATCH_SIZE:
+                WindCandidateZone.objects.bulk_create(batch)
+                batch = []
+        WindCandidateZone.objects.bulk_create(batch)
+    return layer
+
+
+def build_layers(
+    wind_paths: Dict[int, str],
+    slope_path: Optional[str] = None,
+    protected_path: Optional[str] = None,
+    forest_source: Optional[str] = None,
+    weights: SuitabilityWeights = SuitabilityWeights(),
+    resolution: Optional[float] = None,
+    zone_pixels: int = DEFAULT_ZONE_PIXELS,
+    chunk_pixels: int = DEFAULT_CHUNK_PIXELS,
+    workers: int = 1,
+    min_score: float = 0.0,
+    prefix: str = "wind",
+    progress: Callable[[str], None] = lambda message: None,
+) -> List[WindSuitabilityLayer]:
+    """
+    Scores every hub height in ``wind_paths`` ({height: raster path}) on the
+    grid of the lowest height's raster and persists one layer per height.
+    Forest canopy is burned once and shared by all heights and workers.
+    """
+    if chunk_pixels % zone_pixels:
+        raise ValueError("chunk_pixels must be a multiple of zone_pixels.")
+    heights = sorted(wind_paths)
+    grid = target_grid(wind_paths[heights[0]], resolution)
+    progress(f"Target grid: {grid.width}x{grid.height} px at {grid.res_x:g}°.")
+
+    layers = []
+    with tempfile.TemporaryDirectory(prefix="wind_suitability_") as workdir:
+        forest_path = Path(workdir) / "forest.u8"
+        forest = np.memmap(forest_path, dtype=np.uint8, mode="w+", shape=(grid.height, grid.width))
+        forest[:] = NODATA
+        burn_forest(forest, grid, forest_source)
+        forest.flush()
+        del forest
+        progress(f"Burned forest canopy for {forest_source or 'all sources'}.")
+
+        pool = None
+        if workers > 1:
+            # Workers open their own connections; never share the parent's socket.
+            connections.close_all()
+            context = multiprocessing.get_context("spawn")
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker)
+        try:
+            for height in heights:
+                score_path = Path(workdir) / f"score_{height}.u8"
+                np.memmap(score_path, dtype=np.uint8, mode="w+", shape=(grid.height, grid.width)).fill(NODATA)
+                inputs = LayerInputs(
+                    wind_path=str(wind_paths[height]),
+                    slope_path=str(slope_path) if slope_path else None,
+                    protected_path=str(protected_path) if protected_path else None,
+                    forest_path=str(forest_path),
+                    score_path=str(score_path),
+                    grid=grid,
+                    weights=weights,
+                    zone_pixels=zone_pixels,
+                )
+                results = _run_chunks(pool, inputs, chunk_pixels)
+                failed = [result for result in results if result.error]
+                if failed:
+                    raise RuntimeError(f"Chunk {failed[0].index} failed: {failed[0].error}")
+
+                name = layer_name(prefix, height)
+                raster_path = layer_dir() / f"{name}.tif"
+                score = np.memmap(score_path, dtype=np.uint8, mode="r", shape=(grid.height, grid.width))
+                write_cog(Path(workdir) / f"score_{height}.tif", grid, score, raster_path)
+                del score
+
+                zones = np.concatenate([result.zones for result in results])
+                layer = _save_layer(name, height, grid, raster_path, inputs, forest_source, zones, min_score)
+                layers.append(layer)
+                progress(
+                    f"{name}: scored {sum(result.pixels for result in results):,} px, "
+                    f"kept {layer.zones.count():,} zones."
+                )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    return layers
+
+
+def top_zones(layer: WindSuitabilityLayer, geometry, limit: int = DEFAULT_TOP_ZONES) -> Iterable[WindCandidateZone]:
+    """
+    Highest-scoring zones of ``layer`` intersecting ``geometry``. The GiST
+    index narrows the scan to the AOI; only those zones are sorted.
+    """
+    return WindCandidateZone.objects.filter(layer=layer, geom__intersects=geometry).order_by("-score", "id")[:limit]
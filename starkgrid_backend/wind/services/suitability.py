@@ -0,0 +1,257 @@
+"""
+Chunked wind suitability scoring on a common lon/lat grid.
+
+Every input raster (wind speed at hub height, slope, protected areas) is read
+through a WarpedVRT onto the target grid, so inputs of any CRS and resolution
+line up pixel for pixel without a full-size reprojected copy on disk. The
+forest canopy grid is burned from ForestDensityCell rows into a disk-backed
+array beforehand (see wind.services.layers). The grid is split into square
+chunks that workers score independently: each opens the inputs itself, reads
+its window, writes the score into a shared memmap and returns per-zone
+aggregates. Chunks are a multiple of the zone size, so no zone straddles two
+workers.
+
+This module is imported by spawned workers, which run
+canopy.services.parallel_ingest.init_worker before any task is unpickled.
+"""
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import calculate_default_transform
+from rasterio.windows import Window
+
+from canopy.services.cog import NODATA, GridSpec
+from canopy.services.grid_snapshot import row_areas
+from canopy.services.raster_ingest import aggregate_window
+
+
+TARGET_CRS = "EPSG:4326"
+DEFAULT_ZONE_PIXELS = 16
+DEFAULT_CHUNK_PIXELS = 1024
+MIN_ZONE_VALID_FRACTION = 0.5
+
+# Suitability labels by minimum score, best first.
+LABELS = (("high", 0.6), ("medium", 0.3), ("low", 0.0))
+
+# Columns of the zone arrays returned by evaluate_chunk.
+ZONE_COLUMNS = (
+    "zone_row",
+    "zone_col",
+    "score",
+    "wind_speed",
+    "canopy_pct",
+    "protected_fraction",
+    "slope_deg",
+    "area_m2",
+)
+
+
+class SuitabilityWeights(NamedTuple):
+    """
+    Wind Score = wind - forest - protected - slope, each term scaled by its
+    weight and clipped to [0, 1] per pixel. Wind speed is normalised
+    linearly between ``wind_min`` and ``wind_max`` (m/s), canopy by 100%,
+    and slope saturates at ``slope_max`` degrees. Protected pixels carry the
+    full ``protected`` penalty, which with the default weight rules them out.
+    """
+
+    wind: float = 1.0
+    forest: float = 0.5
+    protected: float = 1.0
+    slope: float = 0.3
+    wind_min: float = 4.0
+    wind_max: float = 9.0
+    slope_max: float = 15.0
+
+
+class LayerInputs(NamedTuple):
+    wind_path: str
+    slope_path: Optional[str]
+    protected_path: Optional[str]
+    forest_path: str
+    score_path: str
+    grid: GridSpec
+    weights: SuitabilityWeights
+    zone_pixels: int
+
+
+class ChunkSpec(NamedTuple):
+    index: int
+    row_off: int
+    col_off: int
+    height: int
+    width: int
+
+    @property
+    def window(self) -> Window:
+        return Window(self.col_off, self.row_off, self.width, self.height)
+
+
+class ChunkResult(NamedTuple):
+    index: int
+    zones: np.ndarray
+    pixels: int
+    error: str = ""
+
+
+def suitability_label(score: float) -> str:
+    for label, minimum in LABELS:
+        if score >= minimum:
+            return label
+    return LABELS[-1][0]
+
+
+def target_grid(path: str, resolution: Optional[float] = None) -> GridSpec:
+    """
+    EPSG:4326 grid covering the raster at ``path``; the pixel size defaults
+    to GDAL's estimate of the raster's own resolution in degrees.
+    """
+    with rasterio.open(path) as src:
+        transform, width, height = calculate_default_transform(
+            src.crs or TARGET_CRS, TARGET_CRS, src.width, src.height, *src.bounds, resolution=resolution
+        )
+    return GridSpec(
+        west=transform.c, north=transform.f, res_x=transform.a, res_y=-transform.e, width=width, height=height
+    )
+
+
+def chunk_specs(grid: GridSpec, chunk_pixels: int) -> List[ChunkSpec]:
+    specs = []
+    for row_off in range(0, grid.height, chunk_pixels):
+        for col_off in range(0, grid.width, chunk_pixels):
+            specs.append(
+                ChunkSpec(
+                    index=len(specs),
+                    row_off=row_off,
+                    col_off=col_off,
+                    height=min(chunk_pixels, grid.height - row_off),
+                    width=min(chunk_pixels, grid.width - col_off),
+                )
+            )
+    return specs
+
+
+def read_aligned(path: str, grid: GridSpec, window: Window, resampling: Resampling) -> np.ndarray:
+    """
+    Band 1 of ``path`` resampled onto ``window`` of ``grid`` as float32, NaN where nodata.
+    """
+    with rasterio.open(path) as src, WarpedVRT(
+        src,
+        crs=TARGET_CRS,
+        transform=grid.transform,
+        width=grid.width,
+        height=grid.height,
+        resampling=resampling,
+    ) as vrt:
+        data = vrt.read(1, window=window, masked=True)
+    return np.ma.filled(data.astype(np.float32), np.nan)
+
+
+def score_block(
+    wind: np.ndarray, canopy: np.ndarray, protected: np.ndarray, slope: np.ndarray, weights: SuitabilityWeights
+) -> np.ndarray:
+    """
+    Per-pixel Wind Score in [0, 1], NaN where wind speed is missing. Missing
+    canopy, protection or slope carries no penalty.
+    """
+    wind_term = np.clip((wind - weights.wind_min) / (weights.wind_max - weights.wind_min), 0, 1)
+    forest_term = np.nan_to_num(canopy) / 100
+    slope_term = np.clip(np.nan_to_num(slope) / weights.slope_max, 0, 1)
+    score = (
+        weights.wind * wind_term
+        - weights.forest * forest_term
+        - weights.protected * np.nan_to_num(protected)
+        - weights.slope * slope_term
+    )
+    return np.clip(score, 0, 1).astype(np.float32)
+
+
+def _block_sum(values: np.ndarray, factor: int) -> np.ndarray:
+    height, width = values.shape
+    padded = np.zeros((-(-height // factor) * factor, -(-width // factor) * factor), dtype=np.float64)
+    padded[:height, :width] = values
+    return padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor).sum(axis=(1, 3))
+
+
+def zone_stats(
+    spec: ChunkSpec,
+    grid: GridSpec,
+    zone_pixels: int,
+    score: np.ndarray,
+    layers: List[np.ndarray],
+) -> np.ndarray:
+    """
+    Mean score and inputs per ``zone_pixels`` square block of the chunk, for
+    blocks where at least half the pixels have a score. Input means skip the
+    pixels where that input is nodata (0 when all of them are). Returns one
+    row per zone in ZONE_COLUMNS order, with grid-wide zone row/col indexes.
+    """
+    invalid = np.isnan(score)
+    masked_score = np.ma.masked_array(np.nan_to_num(score), mask=invalid)
+    means, keep = aggregate_window(masked_score, zone_pixels, MIN_ZONE_VALID_FRACTION)
+    columns = [means]
+    for layer in layers:
+        masked_layer = np.ma.masked_array(np.nan_to_num(layer), mask=invalid | np.isnan(layer))
+        columns.append(aggregate_window(masked_layer, zone_pixels, 0)[0])
+
+    pixel_area = row_areas(grid)[spec.row_off:spec.row_off + spec.height, np.newaxis]
+    area = _block_sum(np.where(invalid, 0.0, np.broadcast_to(pixel_area, score.shape)), zone_pixels)
+
+    zone_rows, zone_cols = np.nonzero(keep)
+    return np.column_stack(
+        [spec.row_off // zone_pixels + zone_rows, spec.col_off // zone_pixels + zone_cols]
+        + [column[zone_rows, zone_cols] for column in columns]
+        + [area[zone_rows, zone_cols]]
+    )
+
+
+def encode_score(score: np.ndarray) -> np.ndarray:
+    """
+    Score as uint8 percent with canopy.services.cog.NODATA for gaps, the COG encoding.
+    """
+    encoded = np.full(score.shape, NODATA, dtype=np.uint8)
+    valid = ~np.isnan(score)
+    encoded[valid] = np.rint(score[valid] * 100).astype(np.uint8)
+    return encoded
+
+
+def evaluate_chunk(spec: ChunkSpec, inputs: LayerInputs) -> ChunkResult:
+    """
+    Worker entry point: scores one chunk into the shared score memmap and
+    returns its zone aggregates. Errors are returned, not raised, like
+    parallel_ingest.load_shard.
+    """
+    grid = inputs.grid
+    window = spec.window
+    try:
+        wind = read_aligned(inputs.wind_path, grid, window, Resampling.bilinear)
+        shape = wind.shape
+        slope = (
+            read_aligned(inputs.slope_path, grid, window, Resampling.bilinear)
+            if inputs.slope_path
+            else np.full(shape, np.nan, dtype=np.float32)
+        )
+        protected = (
+            (read_aligned(inputs.protected_path, grid, window, Resampling.nearest) > 0).astype(np.float32)
+            if inputs.protected_path
+            else np.zeros(shape, dtype=np.float32)
+        )
+        forest = np.memmap(inputs.forest_path, dtype=np.uint8, mode="r", shape=(grid.height, grid.width))
+        canopy_raw = np.asarray(forest[spec.row_off:spec.row_off + spec.height, spec.col_off:spec.col_off + spec.width])
+        canopy = np.where(canopy_raw == NODATA, np.nan, canopy_raw).astype(np.float32)
+
+        score = score_block(wind, canopy, protected, slope, inputs.weights)
+        score[np.isnan(wind)] = np.nan
+
+        output = np.memmap(inputs.score_path, dtype=np.uint8, mode="r+", shape=(grid.height, grid.width))
+        output[spec.row_off:spec.row_off + spec.height, spec.col_off:spec.col_off + spec.width] = encode_score(score)
+        output.flush()
+        del output
+
+        zones = zone_stats(spec, grid, inputs.zone_pixels, score, [wind, canopy, protected, slope])
+    except Exception as exc:
+        return ChunkResult(spec.index, np.empty((0, len(ZONE_COLUMNS))), 0, error=f"{type(exc).__name__}: {exc}")
+    return ChunkResult(spec.index, zones, int(np.count_nonzero(~np.isnan(score))))
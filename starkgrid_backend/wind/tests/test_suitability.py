@@ -0,0 +1,144 @@
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from django.contrib.gis.geos import Polygon
+from django.test import SimpleTestCase, TestCase, override_settings
+from rasterio.transform import from_origin
+
+from canopy.models import ForestDensityCell
+from canopy.services.cog import NODATA
+from wind.models import WindSuitabilityLayer
+from wind.services.layers import build_layers, top_zones
+from wind.services.suitability import (
+    LayerInputs,
+    SuitabilityWeights,
+    chunk_specs,
+    evaluate_chunk,
+    score_block,
+    suitability_label,
+    target_grid,
+)
+
+
+def write_raster(path: Path, data: np.ndarray, west: float, north: float, res: float, nodata=None) -> str:
+    profile = {
+        "driver": "GTiff",
+        "dtype": str(data.dtype),
+        "count": 1,
+        "width": data.shape[1],
+        "height": data.shape[0],
+        "crs": "EPSG:4326",
+        "transform": from_origin(west, north, res, res),
+        "nodata": nodata,
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data, 1)
+    return str(path)
+
+
+class ScoreBlockTests(SimpleTestCase):
+    def test_penalties_and_clipping(self):
+        weights = SuitabilityWeights()
+        wind = np.array([9.0, 6.5, 3.0, 9.0, np.nan], dtype=np.float32)
+        canopy = np.array([0.0, 0.0, 0.0, 80.0, 0.0], dtype=np.float32)
+        protected = np.array([0.0, 0.0, 0.0, 0.0, 0.0], dtype=np.float32)
+        slope = np.array([0.0, 7.5, 0.0, np.nan, 0.0], dtype=np.float32)
+
+        score = score_block(wind, canopy, protected, slope, weights)
+
+        np.testing.assert_allclose(score[:4], [1.0, 0.5 - 0.15, 0.0, 0.6], rtol=1e-6)
+        self.assertTrue(np.isnan(score[4]))
+        protected[0] = 1
+        self.assertEqual(score_block(wind, canopy, protected, slope, weights)[0], 0.0)
+
+    def test_labels(self):
+        labels = [suitability_label(value) for value in (0.75, 0.6, 0.45, 0.1)]
+        self.assertEqual(labels, ["high", "high", "medium", "low"])
+
+
+class EvaluateChunkTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.workdir = Path(directory.name)
+
+    def test_chunks_align_inputs_and_aggregate_zones(self):
+        # Wind 9 m/s on the west half and 4 m/s on the east half; slope at half the resolution.
+        wind = np.full((64, 64), 9.0, dtype=np.float32)
+        wind[:, 32:] = 4.0
+        wind[:4, :4] = -1
+        wind_path = write_raster(self.workdir / "wind.tif", wind, 100.0, 1.0, 0.01, nodata=-1)
+        slope_path = write_raster(self.workdir / "slope.tif", np.zeros((32, 32), dtype=np.float32), 100.0, 1.0, 0.02)
+
+        grid = target_grid(wind_path)
+        self.assertEqual((grid.width, grid.height), (64, 64))
+        forest = np.memmap(self.workdir / "forest.u8", dtype=np.uint8, mode="w+", shape=(64, 64))
+        forest[:] = NODATA
+        forest[32:, :32] = 100
+        # Canopy nodata in half of zone (2, 0) is left out of its mean, not counted as 0%.
+        forest[32:40, :16] = NODATA
+        forest.flush()
+        np.memmap(self.workdir / "score.u8", dtype=np.uint8, mode="w+", shape=(64, 64)).fill(NODATA)
+        inputs = LayerInputs(
+            wind_path=wind_path,
+            slope_path=slope_path,
+            protected_path=None,
+            forest_path=str(self.workdir / "forest.u8"),
+            score_path=str(self.workdir / "score.u8"),
+            grid=grid,
+            weights=SuitabilityWeights(),
+            zone_pixels=16,
+        )
+
+        results = [evaluate_chunk(spec, inputs) for spec in chunk_specs(grid, 32)]
+
+        self.assertEqual([result.error for result in results], [""] * 4)
+        score = np.memmap(self.workdir / "score.u8", dtype=np.uint8, mode="r", shape=(64, 64))
+        self.assertEqual(score[0, 0], NODATA)
+        self.assertEqual(score[10, 10], 100)
+        self.assertEqual(score[10, 50], 0)
+        self.assertEqual(score[50, 10], 50)
+
+        zones = np.concatenate([result.zones for result in results])
+        self.assertEqual(len(zones), 16)
+        by_key = {(int(row[0]), int(row[1])): row for row in zones}
+        self.assertAlmostEqual(by_key[(0, 0)][2], 1.0)
+        self.assertAlmostEqual(by_key[(3, 0)][2], 0.5)
+        self.assertAlmostEqual(by_key[(3, 0)][4], 100.0)
+        self.assertAlmostEqual(by_key[(2, 0)][4], 100.0)
+        self.assertAlmostEqual(by_key[(0, 3)][3], 4.0, places=5)
+        # The nodata corner shrinks the zone's scored area by 16 of 256 pixels.
+        self.assertAlmostEqual(by_key[(0, 0)][7] / by_key[(0, 1)][7], 240 / 256, places=3)
+
+
+class WindLayerTests(TestCase):
+    def test_build_layer_and_rank_zones(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        workdir = Path(directory.name)
+        wind = np.tile(np.linspace(4.0, 9.0, 64, dtype=np.float32), (64, 1))
+        wind_path = write_raster(workdir / "wind100.tif", wind, 100.0, 1.0, 0.01)
+        ForestDensityCell.objects.create(
+            geom=Polygon.from_bbox((100.48, 0.36, 100.64, 0.52)), canopy_pct=100, source="wind_test"
+        )
+
+        with override_settings(WIND_LAYER_DIR=str(workdir / "layers")):
+            (layer,) = build_layers({100: wind_path}, forest_source="wind_test", zone_pixels=16, chunk_pixels=32)
+
+        self.assertEqual(layer.name, "wind_100m")
+        self.assertTrue(Path(layer.raster_path).exists())
+        aoi = Polygon.from_bbox((100.0, 0.0, 100.64, 1.0), srid=4326)
+        zones = list(top_zones(layer, aoi, limit=3))
+        self.assertEqual(len(zones), 3)
+        self.assertEqual([zone.score for zone in zones], sorted((zone.score for zone in zones), reverse=True))
+        forested = layer.zones.get(geom__contains=Polygon.from_bbox((100.5, 0.4, 100.51, 0.41), srid=4326))
+        self.assertEqual(forested.mean_canopy, 100.0)
+
+        response = self.client.post(
+            "/api/wind/zones/", {"geometry": aoi.geojson, "limit": 2}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["features"]), 2)
+        self.assertEqual(WindSuitabilityLayer.objects.count(), 1)
@@ -0,0 +1,33 @@
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from wind.models import WindSuitabilityLayer
+from wind.serializers import WindCandidateZoneSerializer, WindZonesRequestSerializer
+from wind.services.layers import top_zones
+
+
+class WindCandidateZonesView(APIView):
+    """
+    Returns the top-ranked wind candidate zones intersecting a GeoJSON polygon
+    as a FeatureCollection, best first. ``layer`` names a built layer;
+    otherwise the most recent layer for ``hub_height`` is used.
+    """
+
+    def post(self, request, *args, **kwargs):
+        serializer = WindZonesRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        layers = WindSuitabilityLayer.objects.all()
+        if data.get("layer"):
+            layers = layers.filter(name=data["layer"])
+        else:
+            layers = layers.filter(hub_height_m=data["hub_height"])
+        layer = layers.order_by("-built_at").first()
+        if layer is None:
+            raise NotFound("No wind suitability layer built for this request; run build_wind_suitability.")
+
+        zones = WindCandidateZoneSerializer(top_zones(layer, data["geometry"], data["limit"]), many=True).data
+        zones["layer"] = {"name": layer.name, "hub_height_m": layer.hub_height_m, "weights": layer.weights}
+        return Response(zones)